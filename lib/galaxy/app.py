@@ -31,6 +31,7 @@ from galaxy.tool_util.deps.views import DependencyResolversView
 from galaxy.tool_util.verify import test_data
 from galaxy.tools.cache import (
     ToolCache,
+    ToolDocumentCache,
     ToolShedRepositoryCache
 )
 from galaxy.tools.data_manager.manager import DataManagers
@@ -131,6 +132,9 @@ class UniverseApplication(config.ConfiguresGalaxyMixin):
 
         # Setup a Tool Cache
         self.tool_cache = ToolCache()
+        self.tool_document_cache = None
+        if self.config.enable_tool_document_cache:
+            self.tool_document_cache = ToolDocumentCache(self.config.tool_cache_data_dir)
         self.tool_shed_repository_cache = ToolShedRepositoryCache(self)
         # Watch various config files for immediate reload
         self.watchers = ConfigWatchers(self)
@@ -210,6 +214,16 @@ class UniverseApplication(config.ConfiguresGalaxyMixin):
         from galaxy.jobs import manager
         self.job_manager = manager.JobManager(self)
         self.application_stack.register_postfork_function(self.job_manager.start)
+        # Verify incrementally adjusted disk usage in a single job handler
+        self.disk_usage_reconciler = None
+        if self.config.disk_usage_reconcile_interval > 0 and self.is_job_handler:
+            self.disk_usage_reconciler = galaxy.quota.DiskUsageReconciler(
+                self.model,
+                self.config.disk_usage_reconcile_interval,
+                self.config.disk_usage_reconcile_batch_size,
+                config=self.config,
+                is_reconciler=self._is_disk_usage_reconcile_handler,
+            )
         self.proxy_manager = ProxyManager(self.config)
 
         from galaxy.workflow import scheduling_manager
@@ -277,6 +291,12 @@ class UniverseApplication(config.ConfiguresGalaxyMixin):
         except Exception as e:
             exception = exception or e
             log.exception("Failed to shutdown workflow scheduling manager cleanly")
+        try:
+            if self.disk_usage_reconciler:
+                self.disk_usage_reconciler.shutdown_monitor()
+        except Exception as e:
+            exception = exception or e
+            log.exception("Failed to shutdown disk usage reconciler cleanly")
         try:
             self.job_manager.shutdown()
         except Exception as e:
@@ -327,6 +347,17 @@ class UniverseApplication(config.ConfiguresGalaxyMixin):
     def is_job_handler(self):
         return (self.config.track_jobs_in_database and self.job_config.is_handler) or not self.config.track_jobs_in_database
 
+    def _is_disk_usage_reconcile_handler(self):
+        # Called after forking, once server_name is final
+        handler = self.config.disk_usage_reconcile_handler
+        if handler is None:
+            handlers = self.job_config.handlers.get(self.job_config.default_handler_id)
+            if not handlers:
+                # Without configured handlers the web processes handle jobs, leave it to the first one
+                return self.application_stack.facts['instance_id'] in (None, 1)
+            handler = sorted(handlers)[0]
+        return self.config.server_name == handler
+
 
 class StatsdStructuredExecutionTimer(StructuredExecutionTimer):
 
@@ -1035,7 +1035,7 @@ class ConfiguresGalaxyMixin(object):
         self.container_finder = containers.ContainerFinder(app_info, mulled_resolution_cache=mulled_resolution_cache)
         self._set_enabled_container_types()
         index_help = getattr(self.config, "index_tool_help", True)
-        self.toolbox_search = galaxy.tools.search.ToolBoxSearch(self.toolbox, index_help)
+        self.toolbox_search = galaxy.tools.search.ToolBoxSearch(self.toolbox, index_dir=self.config.tool_search_index_dir, index_help=index_help)
         self.reindex_tool_search()
 
     def reindex_tool_search(self):
@@ -1058,7 +1058,8 @@ class ConfiguresGalaxyMixin(object):
 
         # Initialize tool data tables using the config defined by self.config.tool_data_table_config_path.
         self.tool_data_tables = ToolDataTableManager(tool_data_path=self.config.tool_data_path,
-                                                     config_filename=self.config.tool_data_table_config_path)
+                                                     config_filename=self.config.tool_data_table_config_path,
+                                                     lazy_load=self.config.lazy_load_tool_data_tables)
         # Load additional entries defined by self.config.shed_tool_data_table_config into tool data tables.
         try:
             self.tool_data_tables.load_from_config_file(config_filename=self.config.shed_tool_data_table_config,
@@ -1095,7 +1096,7 @@ class ConfiguresGalaxyMixin(object):
 
     def _configure_security(self):
         from galaxy.security import idencoding
-        self.security = idencoding.IdEncodingHelper(id_secret=self.config.id_secret)
+        self.security = idencoding.IdEncodingHelper(id_secret=self.config.id_secret, id_cache_size=self.config.id_cache_size)
 
     def _configure_tool_shed_registry(self):
         import galaxy.tool_shed.tool_shed_registry
@@ -42,6 +42,7 @@ class Augustus(CompressedArchive):
     file_ext = "augustus"
     edam_data = "data_0950"
     compressed = True
+    sniff_tar = True
 
     def set_peek(self, dataset, is_multi_byte=False):
         if not dataset.dataset.purged:
@@ -262,6 +262,7 @@ class BamNative(CompressedArchive):
     edam_format = "format_2572"
     edam_data = "data_0863"
     file_ext = "unsorted.bam"
+    sniff_magic = util.gzip_magic
     sort_flag = None
 
     MetadataElement(name="bam_version", default=None, desc="BAM Version", param=MetadataParameter, readonly=True, visible=False, optional=True, no_value=None)
@@ -685,6 +686,7 @@ class Bcf(BaseBcf):
 
     """
     file_ext = "bcf"
+    sniff_magic = util.gzip_magic
 
     MetadataElement(name="bcf_index", desc="BCF Index File", param=metadata.FileParameter, file_ext="csi", readonly=True, no_value=None, visible=False, optional=True)
 
@@ -734,6 +736,7 @@ class BcfUncompressed(BaseBcf):
     False
     """
     file_ext = "bcf_uncompressed"
+    sniff_magic = b'BCF'
 
     def sniff(self, filename):
         try:
@@ -759,17 +762,14 @@ class H5(Binary):
     False
     """
     file_ext = "h5"
+    sniff_magic = binascii.unhexlify("894844460d0a1a0a")
     edam_format = "format_3590"
 
-    def __init__(self, **kwd):
-        Binary.__init__(self, **kwd)
-        self._magic = binascii.unhexlify("894844460d0a1a0a")
-
     def sniff(self, filename):
         # The first 8 bytes of any hdf5 file are 0x894844460d0a1a0a
         try:
             header = open(filename, 'rb').read(8)
-            if header == self._magic:
+            if header == self.sniff_magic:
                 return True
             return False
         except Exception:
@@ -1350,6 +1350,7 @@ class SQlite(Binary):
     MetadataElement(name="table_columns", default={}, param=DictParameter, desc="Database Table Columns", readonly=True, visible=True, no_value={})
     MetadataElement(name="table_row_count", default={}, param=DictParameter, desc="Database Table Row Count", readonly=True, visible=True, no_value={})
     file_ext = "sqlite"
+    sniff_magic = b'SQLite format 3\0'
     edam_format = "format_3621"
 
     def init_meta(self, dataset, copy_from=None):
@@ -1748,6 +1749,7 @@ class Xlsx(Binary):
     """Class for Excel 2007 (xlsx) files"""
     file_ext = "xlsx"
     compressed = True
+    sniff_magic = b'PK\x03\x04'
 
     def sniff(self, filename):
         # Xlsx is compressed in zip format and must not be uncompressed in Galaxy.
@@ -1764,6 +1766,8 @@ class Xlsx(Binary):
 class ExcelXls(Binary):
     """Class describing an Excel (xls) file"""
     file_ext = "excel.xls"
+    # OLE2 compound document and the BIFF2-4 worksheet headers of old Excel versions
+    sniff_magic = (binascii.unhexlify("d0cf11e0a1b11ae1"), b'\x09\x00\x04\x00', b'\x09\x02\x06\x00', b'\x09\x04\x06\x00')
     edam_format = "format_3468"
 
     def sniff(self, filename):
@@ -1824,6 +1828,7 @@ class Sra(Binary):
 class RData(Binary):
     """Generic R Data file datatype implementation"""
     file_ext = 'rdata'
+    sniff_magic = (b'RDX2\nX\n', util.gzip_magic)
 
     def sniff(self, filename):
         rdata_header = b'RDX2\nX\n'
@@ -2021,6 +2026,7 @@ class PostgresqlArchive(CompressedArchive):
     MetadataElement(name="version", default=None, param=MetadataParameter, desc="PostgreSQL database version",
                     readonly=True, visible=True, no_value=None)
     file_ext = "postgresql"
+    sniff_tar = True
 
     def set_meta(self, dataset, overwrite=True, **kwd):
         super(PostgresqlArchive, self).set_meta(dataset, overwrite=overwrite, **kwd)
@@ -2065,6 +2071,7 @@ class Fast5Archive(CompressedArchive):
     MetadataElement(name="fast5_count", default='0', param=MetadataParameter, desc="Read Count",
                     readonly=True, visible=True, no_value=None)
     file_ext = "fast5.tar"
+    sniff_tar = True
 
     def set_meta(self, dataset, overwrite=True, **kwd):
         super(Fast5Archive, self).set_meta(dataset, overwrite=overwrite, **kwd)
@@ -2123,6 +2130,7 @@ class Fast5ArchiveGz(Fast5Archive):
     False
     """
     file_ext = "fast5.tar.gz"
+    sniff_magic = util.gzip_magic
 
     def sniff(self, filename):
         if not is_gzip(filename):
@@ -2146,6 +2154,7 @@ class Fast5ArchiveBz2(Fast5Archive):
     False
     """
     file_ext = "fast5.tar.bz2"
+    sniff_magic = util.bz2_magic
 
     def sniff(self, filename):
         if not is_bz2(filename):
@@ -2441,6 +2450,7 @@ class BafTar(CompressedArchive):
     edam_data = "data_2536"  # mass spectrometry data
     edam_format = "format_3712"  # TODO: add more raw formats to EDAM?
     file_ext = "brukerbaf.d.tar"
+    sniff_tar = True
 
     def get_signature_file(self):
         return "analysis.baf"
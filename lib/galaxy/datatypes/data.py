@@ -1,6 +1,7 @@
 from __future__ import absolute_import
 
 import abc
+import io
 import logging
 import mimetypes
 import os
@@ -18,6 +19,7 @@ from markupsafe import escape
 from galaxy import util
 from galaxy.datatypes.metadata import MetadataElement  # import directly to maintain ease of use in Datatype class definitions
 from galaxy.datatypes.sniff import build_sniff_from_prefix
+from galaxy.datatypes.util.dataset_scanner import get_dataset_scanner
 from galaxy.util import (
     compression_utils,
     FILENAME_VALID_CHARS,
@@ -142,6 +144,12 @@ class Data(object):
     # Data sources.
     data_sources = {}
 
+    # Cheap signatures checked before sniffing, files not matching them are never of this datatype.
+    # Byte string (or tuple of byte strings) the file starts with, before decompression.
+    sniff_magic = None
+    # Only (possibly compressed) tar archives can be of this datatype.
+    sniff_tar = False
+
     def __init__(self, **kwd):
         """Initialize the datatype"""
         object.__init__(self, **kwd)
@@ -846,6 +854,10 @@ class Text(Data):
         """
         Perform a rough estimate by extrapolating number of lines from a small read.
         """
+        scanner = get_dataset_scanner(dataset)
+        if scanner.bytes_read and not scanner.compressed_format:
+            # Extrapolate from what was read by the scanner already
+            return int(scanner.lines * (float(dataset.get_size()) / float(scanner.bytes_read)))
         sample_size = 1048576
         with open(dataset.file_name) as dataset_fh:
             dataset_read = dataset_fh.read(sample_size)
@@ -858,19 +870,10 @@ class Text(Data):
         Count the number of lines of data in dataset,
         skipping all blank lines and comments.
         """
-        data_lines = 0
-        with compression_utils.get_fileobj(dataset.file_name) as in_file:
-            # FIXME: Potential encoding issue can prevent the ability to iterate over lines
-            # causing set_meta process to fail otherwise OK jobs. A better solution than
-            # a silent try/except is desirable.
-            try:
-                for line in in_file:
-                    line = line.strip()
-                    if line and not line.startswith('#'):
-                        data_lines += 1
-            except Exception:
-                pass
-        return data_lines
+        # FIXME: Potential encoding issue can prevent the ability to iterate over lines
+        # causing set_meta process to fail otherwise OK jobs. The scanner silently stops
+        # counting at the first invalid byte, a better solution is desirable.
+        return get_dataset_scanner(dataset).finish().data_lines
 
     def set_peek(self, dataset, line_count=None, is_multi_byte=False, WIDTH=256, skipchars=None, line_wrap=True):
         """
@@ -878,7 +881,7 @@ class Text(Data):
         """
         if not dataset.dataset.purged:
             # The file must exist on disk for the get_file_peek() method
-            dataset.peek = get_file_peek(dataset.file_name, WIDTH=WIDTH, skipchars=skipchars, line_wrap=line_wrap)
+            dataset.peek = get_dataset_peek(dataset, WIDTH=WIDTH, skipchars=skipchars, line_wrap=line_wrap)
             if line_count is None:
                 # See if line_count is stored in the metadata
                 if dataset.metadata.data_lines:
@@ -1095,6 +1098,25 @@ def get_file_peek(file_name, is_multi_byte=False, WIDTH=256, LINE_COUNT=5, skipc
     >>> assert_peek_is('4.bed', u'chr22\\t30128507\\t31828507\\tuc003bnx.1_cds_2_0_chr22_29227_f\\t0\\t+\\n', LINE_COUNT=1)
     >>> assert_peek_is('1.bed', u'chr1\\t147962192\\t147962580\\tCCDS989.1_cds_0_0_chr1_147962193_r\\t0\\t-\\nchr1\\t147984545\\t147984630\\tCCDS990.1_cds_0_0_chr1_147984546_f\\t0\\t+\\n', LINE_COUNT=2)
     """
+    with compression_utils.get_fileobj(file_name, "U") as temp:
+        return _get_fileobj_peek(temp, WIDTH=WIDTH, LINE_COUNT=LINE_COUNT, skipchars=skipchars, line_wrap=line_wrap)
+
+
+def get_dataset_peek(dataset, WIDTH=256, LINE_COUNT=5, skipchars=None, line_wrap=True):
+    """
+    Returns the peek of ``dataset`` like ``get_file_peek()``, from the start
+    of the file retained by its scanner when the peek lies within it.
+    """
+    prefix, complete = get_dataset_scanner(dataset).get_prefix()
+    if prefix is not None:
+        temp = io.StringIO(prefix, newline='\n')
+        peek = _get_fileobj_peek(temp, WIDTH=WIDTH, LINE_COUNT=LINE_COUNT, skipchars=skipchars, line_wrap=line_wrap)
+        if complete or temp.tell() < len(prefix):
+            return peek
+    return get_file_peek(dataset.file_name, WIDTH=WIDTH, LINE_COUNT=LINE_COUNT, skipchars=skipchars, line_wrap=line_wrap)
+
+
+def _get_fileobj_peek(temp, WIDTH=256, LINE_COUNT=5, skipchars=None, line_wrap=True):
     # Set size for file.readline() to a negative number to force it to
     # read until either a newline or EOF.  Needed for datasets with very
     # long lines.
@@ -1106,31 +1128,30 @@ def get_file_peek(file_name, is_multi_byte=False, WIDTH=256, LINE_COUNT=5, skipc
     count = 0
 
     last_line_break = False
-    with compression_utils.get_fileobj(file_name, "U") as temp:
-        while count < LINE_COUNT:
-            try:
-                line = temp.readline(WIDTH)
-            except UnicodeDecodeError:
-                return "binary file"
-            if line == "":
-                break
-            last_line_break = False
-            if line.endswith('\n'):
-                line = line[:-1]
-                last_line_break = True
-            elif not line_wrap:
-                while True:
-                    i = temp.read(1)
-                    if i == '\n':
-                        last_line_break = True
-                    if not i or i == '\n':
-                        break
-            skip_line = False
-            for skipchar in skipchars:
-                if line.startswith(skipchar):
-                    skip_line = True
+    while count < LINE_COUNT:
+        try:
+            line = temp.readline(WIDTH)
+        except UnicodeDecodeError:
+            return "binary file"
+        if line == "":
+            break
+        last_line_break = False
+        if line.endswith('\n'):
+            line = line[:-1]
+            last_line_break = True
+        elif not line_wrap:
+            while True:
+                i = temp.read(1)
+                if i == '\n':
+                    last_line_break = True
+                if not i or i == '\n':
                     break
-            if not skip_line:
-                lines.append(line)
-                count += 1
+        skip_line = False
+        for skipchar in skipchars:
+            if line.startswith(skipchar):
+                skip_line = True
+                break
+        if not skip_line:
+            lines.append(line)
+            count += 1
     return '\n'.join(lines) + ('\n' if last_line_break else '')
@@ -19,6 +19,7 @@ from galaxy.datatypes.sniff import (
     iter_headers
 )
 from galaxy.datatypes.tabular import Tabular
+from galaxy.datatypes.util.dataset_scanner import get_dataset_scanner
 from galaxy.datatypes.util.gff_util import parse_gff3_attributes, parse_gff_attributes
 from . import (
     data,
@@ -83,8 +84,7 @@ class Interval(Tabular):
         if dataset.has_data():
             empty_line_count = 0
             num_check_lines = 100  # only check up to this many non empty lines
-            for i, line in enumerate(open(dataset.file_name)):
-                line = line.rstrip('\r\n')
+            for i, line in enumerate(get_dataset_scanner(dataset).head_lines()):
                 if line:
                     if (first_line_is_header or line[0] == '#'):
                         self.init_meta(dataset)
@@ -218,6 +218,7 @@ class UniProtXML(ProteomicsXml):
     root = "uniprot"
 
 
+@build_sniff_from_prefix
 class Mgf(Text):
     """Mascot Generic Format data"""
     edam_data = "data_2536"
@@ -233,19 +234,20 @@ class Mgf(Text):
             dataset.peek = 'file does not exist'
             dataset.blurb = 'file purged from disk'
 
-    def sniff(self, filename):
+    def sniff_prefix(self, file_prefix):
         mgf_begin_ions = "BEGIN IONS"
         max_lines = 100
 
-        with open(filename) as handle:
-            for i, line in enumerate(handle):
-                line = line.rstrip()
-                if line == mgf_begin_ions:
-                    return True
-                if i > max_lines:
-                    return False
+        for i, line in enumerate(file_prefix.line_iterator()):
+            line = line.rstrip()
+            if line == mgf_begin_ions:
+                return True
+            if i > max_lines:
+                return False
+        return False
 
 
+@build_sniff_from_prefix
 class MascotDat(Text):
     """Mascot search results """
     edam_data = "data_2536"
@@ -261,17 +263,17 @@ class MascotDat(Text):
             dataset.peek = 'file does not exist'
             dataset.blurb = 'file purged from disk'
 
-    def sniff(self, filename):
+    def sniff_prefix(self, file_prefix):
         mime_version = "MIME-Version: 1.0 (Generated by Mascot version 1.0)"
         max_lines = 10
 
-        with open(filename) as handle:
-            for i, line in enumerate(handle):
-                line = line.rstrip()
-                if line == mime_version:
-                    return True
-                if i > max_lines:
-                    return False
+        for i, line in enumerate(file_prefix.line_iterator()):
+            line = line.rstrip()
+            if line == mime_version:
+                return True
+            if i > max_lines:
+                return False
+        return False
 
 
 class ThermoRAW(Binary):
@@ -26,6 +26,7 @@ from galaxy.datatypes.sniff import (
     get_headers,
     iter_headers,
 )
+from galaxy.datatypes.util.dataset_scanner import get_dataset_scanner
 from galaxy.util import (
     compression_utils,
     nice_size
@@ -39,6 +40,10 @@ from . import data
 if sys.version_info > (3,):
     long = int
 
+# Lines starting with '#' or '>' once stripped, in blocks of lines
+SEQUENCE_COMMENT_RE = re.compile(r'^[^\S\n]*#', re.MULTILINE | re.UNICODE)
+SEQUENCE_HEADER_RE = re.compile(r'^[^\S\n]*>', re.MULTILINE | re.UNICODE)
+
 log = logging.getLogger(__name__)
 
 
@@ -99,23 +104,16 @@ class Sequence(data.Text):
         """
         data_lines = 0
         sequences = 0
-        with compression_utils.get_fileobj(dataset.file_name) as fh:
-            for line in fh:
-                line = line.strip()
-                if line and line.startswith('#'):
-                    # We don't count comment lines for sequence data types
-                    continue
-                if line and line.startswith('>'):
-                    sequences += 1
-                    data_lines += 1
-                else:
-                    data_lines += 1
-            dataset.metadata.data_lines = data_lines
-            dataset.metadata.sequences = sequences
+        for block in get_dataset_scanner(dataset).blocks():
+            # We don't count comment lines for sequence data types
+            data_lines += block.count('\n') + 1 - len(SEQUENCE_COMMENT_RE.findall(block))
+            sequences += len(SEQUENCE_HEADER_RE.findall(block))
+        dataset.metadata.data_lines = data_lines
+        dataset.metadata.sequences = sequences
 
     def set_peek(self, dataset, is_multi_byte=False):
         if not dataset.dataset.purged:
-            dataset.peek = data.get_file_peek(dataset.file_name)
+            dataset.peek = data.get_dataset_peek(dataset)
             if dataset.metadata.sequences:
                 dataset.blurb = "%s sequences" % util.commaify(str(dataset.metadata.sequences))
             else:
@@ -629,7 +627,7 @@ class Fastg(Sequence):
 
     def set_peek(self, dataset, is_multi_byte=False):
         if not dataset.dataset.purged:
-            dataset.peek = data.get_file_peek(dataset.file_name)
+            dataset.peek = data.get_dataset_peek(dataset)
             if dataset.metadata.sequences:
                 dataset.blurb = "%s sequences" % util.commaify(str(dataset.metadata.sequences))
             else:
@@ -11,6 +11,7 @@ import os
 import re
 import shutil
 import sys
+import tarfile
 import tempfile
 import zipfile
 
@@ -41,6 +42,8 @@ else:
 log = logging.getLogger(__name__)
 
 SNIFF_PREFIX_BYTES = int(os.environ.get("GALAXY_SNIFF_PREFIX_BYTES", None) or 2 ** 20)
+# Number of bytes at the start of the (possibly compressed) file kept for magic number checks
+MAGIC_BYTES = 512
 
 
 def get_test_fname(fname):
@@ -155,9 +158,16 @@ def convert_newlines_sep2tabs(fname, in_place=True, patt=br"[^\S\n]+", tmp_dir=N
 def iter_headers(fname_or_file_prefix, sep, count=60, comment_designator=None):
     idx = 0
     if isinstance(fname_or_file_prefix, FilePrefix):
-        file_iterator = fname_or_file_prefix.line_iterator()
-    else:
-        file_iterator = compression_utils.get_fileobj(fname_or_file_prefix)
+        # Lines of a prefix are split once per separator and shared by all sniffers
+        for line, row in fname_or_file_prefix.split_lines(sep):
+            if comment_designator is not None and comment_designator != '' and line.startswith(comment_designator):
+                continue
+            yield list(row)
+            idx += 1
+            if idx == count:
+                break
+        return
+    file_iterator = compression_utils.get_fileobj(fname_or_file_prefix)
     for line in file_iterator:
         line = line.rstrip('\n\r')
         if comment_designator is not None and comment_designator != '' and line.startswith(comment_designator):
@@ -482,6 +492,8 @@ def run_sniffers_raw(filename_or_file_prefix, sniff_order, is_binary=False):
         successfully discovered.
         """
         try:
+            if not matches_signature(datatype, file_prefix):
+                continue
             if hasattr(datatype, "sniff_prefix"):
                 datatype_compressed = getattr(datatype, "compressed", False)
                 if datatype_compressed and not file_prefix.compressed_format:
@@ -507,6 +519,20 @@ def run_sniffers_raw(filename_or_file_prefix, sniff_order, is_binary=False):
     return file_ext
 
 
+def matches_signature(datatype, file_prefix):
+    """
+    Cheap check whether a file can be of ``datatype`` at all, based on the
+    ``sniff_magic`` and ``sniff_tar`` attributes of the datatype. Used to skip
+    sniffers (in particular ones opening the file again) that cannot match.
+    """
+    sniff_magic = getattr(datatype, "sniff_magic", None)
+    if sniff_magic and not file_prefix.magic_startswith(sniff_magic):
+        return False
+    if getattr(datatype, "sniff_tar", False) and not file_prefix.is_tarfile():
+        return False
+    return True
+
+
 def zip_single_fileobj(path):
     z = zipfile.ZipFile(path)
     for name in z.namelist():
@@ -546,6 +572,11 @@ class FilePrefix(object):
         self.contents_header = contents_header
         self.contents_header_bytes = contents_header_bytes
         self._file_size = None
+        # Views of the prefix shared by all sniffers, computed on first use
+        self._lines = None
+        self._split_lines = {}
+        self._magic = None
+        self._is_tarfile = None
 
     @property
     def file_size(self):
@@ -560,17 +591,59 @@ class FilePrefix(object):
         return rval
 
     def startswith(self, prefix):
-        return self.string_io().read(len(prefix)) == prefix
+        if self.non_utf8_error is not None:
+            raise self.non_utf8_error
+        return self.contents_header.startswith(prefix)
+
+    def lines(self):
+        """Complete lines of the prefix (with line endings), computed once."""
+        if self._lines is None:
+            if self.non_utf8_error is not None:
+                raise self.non_utf8_error
+            lines = self.contents_header.split("\n")
+            last = lines.pop()
+            lines = [line + "\n" for line in lines]
+            # Return the last line only if it wasn't truncated when reading it in.
+            if last and (last.endswith("\r") or not self.truncated):
+                lines.append(last)
+            self._lines = lines
+        return self._lines
 
     def line_iterator(self):
-        s = self.string_io()
-        s_len = len(s.getvalue())
-        for line in s:
-            if line.endswith("\n") or line.endswith("\r"):
-                yield line
-            elif s.tell() == s_len and not self.truncated:
-                # At the end, return the last line if it wasn't truncated when reading it in.
-                yield line
+        for line in self.lines():
+            yield line
+
+    def split_lines(self, sep):
+        """
+        Iterate over (line, columns) pairs of the prefix, where line is
+        stripped of its line ending and columns is the line split by ``sep``.
+        Lines are split lazily and at most once per separator, the column
+        lists are shared and must not be modified.
+        """
+        rows = self._split_lines.setdefault(sep, [])
+        for i, line in enumerate(self.lines()):
+            if i == len(rows):
+                line = line.rstrip("\n\r")
+                rows.append((line, line.split(sep)))
+            yield rows[i]
+
+    def magic_startswith(self, magic):
+        """
+        Whether the file starts with ``magic`` (a byte string or a tuple of
+        byte strings), before decompression.
+        """
+        if self._magic is None:
+            if self.compressed_format is None and self.contents_header_bytes is not None:
+                self._magic = self.contents_header_bytes[:MAGIC_BYTES]
+            else:
+                with open(self.filename, "rb") as fh:
+                    self._magic = fh.read(MAGIC_BYTES)
+        return self._magic.startswith(magic)
+
+    def is_tarfile(self):
+        if self._is_tarfile is None:
+            self._is_tarfile = tarfile.is_tarfile(self.filename)
+        return self._is_tarfile
 
     # Convenience wrappers around contents_header, shielding contents_header means we can
     # potentially do a better job lazy loading this data later on.
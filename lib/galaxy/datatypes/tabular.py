@@ -27,6 +27,16 @@ from galaxy.datatypes.sniff import (
     iter_headers,
     validate_tabular,
 )
+from galaxy.datatypes.util.dataset_scanner import get_dataset_scanner
+from galaxy.datatypes.util.line_index import (
+    find_line,
+    indexed_blocks,
+    LineIndex,
+    MIN_INDEXED_SIZE,
+    read_chunk,
+)
+from galaxy.datatypes.util.line_reader import count_lines
+from galaxy.exceptions import RequestParameterInvalidException
 from galaxy.util import compression_utils
 from . import dataproviders
 
@@ -35,6 +45,13 @@ if sys.version_info > (3,):
 
 log = logging.getLogger(__name__)
 
+# Shortcuts for guessing the type of tabular fields without trying int() and float(), fields
+# matching none of them are guessed the slow way
+INT_FIELD_RE = re.compile(r'\s*[+-]?\d+\s*\Z', re.UNICODE)
+FLOAT_FIELD_RE = re.compile(r'\s*[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?\s*\Z', re.UNICODE)
+# A character that cannot appear in anything int() or float() accept (or in 'na')
+NON_NUMERIC_CHAR_RE = re.compile(r'[^\s\d+\-._eEinftyaINFTYA]', re.UNICODE)
+
 
 @dataproviders.decorators.has_dataproviders
 class TabularData(data.Text):
@@ -42,6 +59,8 @@ class TabularData(data.Text):
     edam_format = "format_3475"
     # All tabular data is chunkable.
     CHUNKABLE = True
+    # get_chunk() can start chunks at a line number
+    LINE_CHUNKABLE = True
 
     """Add metadata elements"""
     MetadataElement(name="comment_lines", default=0, desc="Number of comment lines", readonly=False, optional=True, no_value=0)
@@ -50,11 +69,35 @@ class TabularData(data.Text):
     MetadataElement(name="column_types", default=[], desc="Column types", param=metadata.ColumnTypesParameter, readonly=True, visible=False, no_value=[])
     MetadataElement(name="column_names", default=[], desc="Column names", readonly=True, visible=False, optional=True, no_value=[])
     MetadataElement(name="delimiter", default='\t', desc="Data delimiter", readonly=True, visible=False, optional=True, no_value=[])
+    MetadataElement(name="line_index", desc="Line index file", param=metadata.FileParameter, file_ext="lidx", readonly=True, no_value=None, visible=False, optional=True)
 
     @abc.abstractmethod
     def set_meta(self, dataset, **kwd):
         raise NotImplementedError
 
+    def set_line_index(self, dataset, scanner):
+        """
+        Index the line offsets of large datasets read by the pass of
+        ``scanner`` (see ``DatasetScanner.index_lines``), so that ``get_chunk``
+        reads from any line without reading the lines before it. Nothing is
+        indexed unless the pass has read all of the dataset (e.g. it stopped
+        at invalid bytes), the dataset is not read again for the index.
+        """
+        line_index = scanner.line_index
+        blocks = None
+        if line_index is not None and os.path.getsize(dataset.file_name) >= MIN_INDEXED_SIZE:
+            blocks = indexed_blocks(dataset.file_name)
+        if blocks is None:
+            if dataset.metadata.line_index:
+                # Do not keep an index of previous content
+                dataset.metadata.line_index = None
+            return
+        index_file = dataset.metadata.line_index
+        if not index_file:
+            index_file = dataset.metadata.spec['line_index'].param.new_file(dataset=dataset)
+        line_index.write(index_file.file_name, blocks)
+        dataset.metadata.line_index = index_file
+
     def set_peek(self, dataset, line_count=None, is_multi_byte=False, WIDTH=256, skipchars=None):
         super(TabularData, self).set_peek(dataset, line_count=line_count, WIDTH=WIDTH, skipchars=skipchars, line_wrap=False)
         if dataset.metadata.comment_lines:
@@ -69,21 +112,43 @@ class TabularData(data.Text):
         except Exception:
             return False
 
-    def get_chunk(self, trans, dataset, offset=0, ck_size=None):
-        with compression_utils.get_fileobj(dataset.file_name) as f:
-            f.seek(offset)
-            ck_data = f.read(ck_size or trans.app.config.display_chunk_size)
-            if ck_data and ck_data[-1] != '\n':
-                cursor = f.read(1)
-                while cursor and cursor != '\n':
-                    ck_data += cursor
-                    cursor = f.read(1)
-            last_read = f.tell()
-        return dumps({'ck_data': util.unicodify(ck_data),
+    def get_chunk(self, trans, dataset, offset=0, ck_size=None, line=None):
+        """
+        Return the complete lines of the chunk starting at ``offset``, or at
+        line ``line`` (counted from 0) if given, and the offset of the next chunk.
+        """
+        line_index = None
+        if dataset.metadata.line_index:
+            try:
+                line_index = LineIndex(dataset.metadata.line_index.file_name)
+            except (IOError, ValueError):
+                log.warning("Ignoring unreadable line index of dataset %s", dataset.id)
+        try:
+            if line is not None:
+                offset = find_line(dataset.file_name, line, line_index)
+            ck_data, last_read = read_chunk(dataset.file_name, offset, ck_size or trans.app.config.display_chunk_size, line_index)
+        finally:
+            if line_index is not None:
+                line_index.close()
+        ck_data = util.unicodify(ck_data)
+        if '\r' in ck_data:
+            # Like reading the dataset in text mode did
+            ck_data = ck_data.replace('\r\n', '\n').replace('\r', '\n')
+        return dumps({'ck_data': ck_data,
                       'offset': last_read})
 
-    def display_data(self, trans, dataset, preview=False, filename=None, to_ext=None, offset=None, ck_size=None, **kwd):
+    def display_data(self, trans, dataset, preview=False, filename=None, to_ext=None, offset=None, ck_size=None, line=None, **kwd):
         preview = util.string_as_bool(preview)
+        if line is not None:
+            if not self.LINE_CHUNKABLE:
+                raise RequestParameterInvalidException("line is not supported for datasets of type %s" % self.file_ext)
+            try:
+                line = int(line)
+            except (TypeError, ValueError):
+                line = -1
+            if line < 0:
+                raise RequestParameterInvalidException("line must be a line number (counted from 0)")
+            return self.get_chunk(trans, dataset, ck_size=ck_size, line=line)
         if offset is not None:
             return self.get_chunk(trans, dataset, offset, ck_size)
         elif to_ext or not preview:
@@ -257,7 +322,7 @@ class TabularData(data.Text):
 class Tabular(TabularData):
     """Tab delimited data"""
 
-    def set_meta(self, dataset, overwrite=True, skip=None, max_data_lines=100000, max_guess_type_data_lines=None, **kwd):
+    def set_meta(self, dataset, overwrite=True, skip=None, max_data_lines=100000, max_guess_type_data_lines=None, index_lines=False, **kwd):
         """
         Tries to determine the number of columns as well as those columns that
         contain numerical values in the dataset.  A skip parameter is used
@@ -271,7 +336,8 @@ class Tabular(TabularData):
         non-optional metadata parameters are properly set; if used, optional
         metadata parameters will be set to None, unless the entire file has
         already been read. Using None for max_data_lines will process all data
-        lines.
+        lines. If index_lines is set, the line offsets of large datasets are
+        indexed, continuing to read all of the dataset (see set_line_index).
 
         Items of interest:
 
@@ -333,36 +399,64 @@ class Tabular(TabularData):
             is_column_type[column_type] = locals()["is_%s" % (column_type)]
 
         def guess_column_type(column_text):
+            if not column_text:
+                return None
+            if INT_FIELD_RE.match(column_text):
+                return 'int'
+            if FLOAT_FIELD_RE.match(column_text):
+                return 'float'
+            if NON_NUMERIC_CHAR_RE.search(column_text):
+                return 'list' if is_list(column_text) else 'str'
             for column_type in column_type_set_order:
                 if is_column_type[column_type](column_text):
                     return column_type
             return None
+
+        def guess_column_types(fields, start=0):
+            """Update column_types with the types of fields[start:], returns True if all columns are str now."""
+            became_str = False
+            for field_count in range(start, len(fields)):
+                if field_count >= len(column_types):  # found a previously unknown column, we append None
+                    column_types.append(None)
+                elif column_types[field_count] == default_column_type:
+                    continue  # nothing overrules str
+                column_type = guess_column_type(fields[field_count])
+                if type_overrules_type(column_type, column_types[field_count]):
+                    column_types[field_count] = column_type
+                    became_str = became_str or column_type == default_column_type
+            return became_str and all(column_type == default_column_type for column_type in column_types)
         data_lines = 0
         comment_lines = 0
         column_types = []
         first_line_column_types = [default_column_type]  # default value is one column of type str
         if dataset.has_data():
             # NOTE: if skip > num_check_lines, we won't detect any metadata, and will use default
-            with compression_utils.get_fileobj(dataset.file_name) as dataset_fh:
-                i = 0
-                while True:
-                    line = dataset_fh.readline()
-                    if not line:
-                        break
-                    line = line.rstrip('\r\n')
+            scanner = get_dataset_scanner(dataset)
+            if index_lines:
+                scanner.index_lines()
+            i = 0
+            all_str = False  # once all columns are str only lines with more columns need to be looked at
+            blocks = scanner.blocks()
+            for block in blocks:
+                if max_data_lines is None and 0 < i and skip <= i and max_guess_type_data_lines is not None and data_lines >= max_guess_type_data_lines:
+                    # Nothing but the line counts left to determine
+                    block_lines, block_comment_lines = count_lines(block)
+                    data_lines += block_lines - block_comment_lines
+                    comment_lines += block_comment_lines
+                    i += block_lines
+                    continue
+                lines = block.split('\n')
+                for line_index, line in enumerate(lines):
                     if i < skip or not line or line.startswith('#'):
                         # We'll call blank lines comments
                         comment_lines += 1
                     else:
                         data_lines += 1
                         if max_guess_type_data_lines is None or data_lines <= max_guess_type_data_lines:
-                            fields = line.split('\t')
-                            for field_count, field in enumerate(fields):
-                                if field_count >= len(column_types):  # found a previously unknown column, we append None
-                                    column_types.append(None)
-                                column_type = guess_column_type(field)
-                                if type_overrules_type(column_type, column_types[field_count]):
-                                    column_types[field_count] = column_type
+                            if not all_str:
+                                all_str = guess_column_types(line.split('\t'))
+                            elif line.count('\t') >= len(column_types):
+                                all_str = guess_column_types(line.split('\t'), start=len(column_types))
                         if i == 0 and requested_skip is None:
                             # This is our first line, people seem to like to upload files that have a header line, but do not
                             # start with '#' (i.e. all column types would then most likely be detected as str).  We will assume
@@ -379,12 +473,23 @@ class Tabular(TabularData):
                             # "column_types": ["int", "int", "str", "list"]
                             first_line_column_types = column_types
                             column_types = [None for col in first_line_column_types]
+                            all_str = False
                     if max_data_lines is not None and data_lines >= max_data_lines:
-                        if dataset_fh.tell() != dataset.get_size():
+                        # The read position of a compressed file is never equal to its size
+                        more = scanner.compressed_format or line_index < len(lines) - 1
+                        if not more:
+                            try:
+                                more = next(blocks, None) is not None
+                            except UnicodeDecodeError:
+                                more = True
+                        if more:
                             data_lines = None  # Clear optional data_lines metadata value
                             comment_lines = None  # Clear optional comment_lines metadata value; additional comment lines could appear below this point
                         break
                     i += 1
+                else:
+                    continue
+                break
 
         # we error on the larger number of columns
         # first we pad our column_types by using data from first line
@@ -404,6 +509,9 @@ class Tabular(TabularData):
         dataset.metadata.column_types = column_types
         dataset.metadata.columns = len(column_types)
         dataset.metadata.delimiter = '\t'
+        if index_lines and dataset.has_data():
+            # Continue the pass that stopped at max_data_lines to the end of the dataset
+            self.set_line_index(dataset, scanner.finish())
 
     def as_gbrowse_display_file(self, dataset, **kwd):
         return open(dataset.file_name, 'rb')
@@ -773,6 +881,7 @@ class VcfGz(BaseVcf, binary.Binary):
     file_ext = 'vcf_bgzip'
     compressed = True
     compressed_format = "gzip"
+    sniff_magic = util.gzip_magic
 
     MetadataElement(name="tabix_index", desc="Vcf Index File", param=metadata.FileParameter, file_ext="tbi", readonly=True, no_value=None, visible=False, optional=True)
 
@@ -937,6 +1046,7 @@ class FeatureLocationIndex(Tabular):
 
 
 @dataproviders.decorators.has_dataproviders
+@build_sniff_from_prefix
 class BaseCSV(TabularData):
     """
     Delimiter-separated table data.
@@ -973,11 +1083,25 @@ class BaseCSV(TabularData):
         else:
             return 'str'
 
-    def sniff(self, filename):
+    def _sniff_lines(self, file_prefix):
+        """
+        Lines to check the dialect on.  With strict_width all rows must have
+        the same width, so these are the lines of the whole file rather than
+        of the prefix when the prefix is truncated.
+        """
+        if self.strict_width and file_prefix.truncated:
+            with compression_utils.get_fileobj(file_prefix.filename) as fh:
+                for line in fh:
+                    yield line
+        else:
+            for line in file_prefix.line_iterator():
+                yield line
+
+    def sniff_prefix(self, file_prefix):
         """ Return True if if recognizes dialect and header. """
         try:
             # check the dialect works
-            reader = csv.reader(open(filename, 'r'), self.dialect)
+            reader = csv.reader(self._sniff_lines(file_prefix), self.dialect)
             # Check we can read header and get columns
             header_row = next(reader)
             if len(header_row) < 2:
@@ -1006,7 +1130,8 @@ class BaseCSV(TabularData):
                     pass
 
             # Optional: Check Python's csv comes up with a similar dialect
-            auto_dialect = csv.Sniffer().sniff(open(filename, 'r').read(self.big_peek_size))
+            big_peek = file_prefix.contents_header[:2 * self.big_peek_size].replace('\r\n', '\n').replace('\r', '\n')[:self.big_peek_size]
+            auto_dialect = csv.Sniffer().sniff(big_peek)
             if (auto_dialect.delimiter != self.dialect.delimiter):
                 return False
             if (auto_dialect.quotechar != self.dialect.quotechar):
@@ -1021,7 +1146,7 @@ class BaseCSV(TabularData):
             Note Without checking the dialect returned by sniff
                   this test may be checking the wrong dialect.
             """
-            if not csv.Sniffer().has_header(open(filename, 'r').read(self.big_peek_size)):
+            if not csv.Sniffer().has_header(big_peek):
                 return False
             return True
         except Exception:
@@ -1096,6 +1221,8 @@ class TSV(BaseCSV):
 class ConnectivityTable(Tabular):
     edam_format = "format_3309"
     file_ext = "ct"
+    # get_chunk() reads chunks by index
+    LINE_CHUNKABLE = False
 
     header_regexp = re.compile("^[0-9]+" + "(?:\t|[ ]+)" + ".*?" + "(?:ENERGY|energy|dG)" + "[ \t].*?=")
     structure_regexp = re.compile("^[0-9]+" + "(?:\t|[ ]+)" + "[ACGTURYKMSWBDHVN]+" + "(?:\t|[ ]+)" + "[^\t]+" + "(?:\t|[ ]+)" + "[^\t]+" + "(?:\t|[ ]+)" + "[^\t]+" + "(?:\t|[ ]+)" + "[^\t]+")
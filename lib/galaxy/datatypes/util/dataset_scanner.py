@@ -0,0 +1,279 @@
+"""
+Read a text dataset once for everything that sets its metadata and peek.
+"""
+import codecs
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+from galaxy.util import compression_utils
+from .line_index import LineIndexBuilder
+from .line_reader import (
+    BLOCK_SIZE,
+    count_lines,
+    iter_line_blocks,
+)
+
+# Number of bytes from the start of a dataset retained for peeks and headers
+PREFIX_SIZE = 2 ** 16
+
+# Lines that are blank or start with '#' once stripped
+STRIPPED_COMMENT_RE = re.compile(r'^[^\S\n]*(?:#|$)', re.MULTILINE | re.UNICODE)
+
+# Scanners shared within shared_dataset_scan() contexts of the current thread
+_shared_scans = threading.local()
+
+
+class _PrefixRecorder(object):
+    """Binary file object wrapper keeping the first ``size`` bytes read and indexing their lines if requested."""
+
+    def __init__(self, fh, size, index_lines=False):
+        self.fh = fh
+        self.size = size
+        self.prefix = b''
+        self.bytes_read = 0
+        self.eof = False
+        self.line_index = LineIndexBuilder() if index_lines else None
+
+    def read(self, size=-1):
+        data = self.fh.read(size)
+        if len(self.prefix) < self.size:
+            self.prefix += data[:self.size - len(self.prefix)]
+        self.bytes_read += len(data)
+        if self.line_index is not None:
+            self.line_index.update(data)
+        if not data:
+            self.eof = True
+        return data
+
+
+class DatasetScanner(object):
+    """
+    A single pass over a (possibly compressed) text dataset shared by the
+    consumers that need its lines.
+
+    ``blocks()`` yields blocks of complete lines (see ``iter_line_blocks``)
+    while the lines, comment lines and data lines read are counted and the
+    first ``prefix_size`` bytes are retained. A consumer may stop early;
+    ``finish()`` then continues reading where it stopped to complete the
+    counts, and ``get_prefix()`` serves peeks and header lines without
+    reading the file again. Only the first call to ``blocks()`` shares the
+    pass, later calls read the file again from the start. ``close()`` stops
+    the pass and closes the file. The line offsets read by the pass are
+    indexed if ``index_lines()`` is called before it starts.
+    """
+
+    def __init__(self, file_name, block_size=BLOCK_SIZE, prefix_size=PREFIX_SIZE):
+        self.file_name = file_name
+        self.stat_key = _stat_key(file_name)
+        self.block_size = block_size
+        self.prefix_size = prefix_size
+        self.compressed_format = None
+        self.lines = 0
+        # Blank lines and lines starting with '#', as counted by Tabular
+        self.comment_lines = 0
+        # Lines that are neither blank nor start with '#' once stripped, as counted by Text
+        self.data_lines = 0
+        self.finished = False
+        self.decode_error = None
+        self._recorder = None
+        self._pass = None
+        self._shared = False
+        self._index_lines = False
+
+    @property
+    def bytes_read(self):
+        return self._recorder.bytes_read if self._recorder is not None else 0
+
+    def index_lines(self):
+        """Index the line offsets read by the shared pass, return False if it has already started."""
+        if self._recorder is None:
+            self._index_lines = True
+        return self._index_lines
+
+    @property
+    def line_index(self):
+        """
+        The ``LineIndexBuilder`` of the dataset once the shared pass has read
+        all of it, if its lines are indexed, else ``None``.
+        """
+        if self._recorder is not None and self._recorder.eof:
+            return self._recorder.line_index
+        return None
+
+    def _open(self):
+        self.compressed_format, fh = compression_utils.get_fileobj_raw(self.file_name, 'rb')
+        return fh
+
+    def _read(self):
+        with self._open() as fh:
+            self._recorder = _PrefixRecorder(fh, self.prefix_size, index_lines=self._index_lines)
+            try:
+                for block in iter_line_blocks(self._recorder, self.block_size):
+                    lines, comment_lines = count_lines(block)
+                    self.lines += lines
+                    self.comment_lines += comment_lines
+                    self.data_lines += lines - len(STRIPPED_COMMENT_RE.findall(block))
+                    yield block
+            except UnicodeDecodeError as e:
+                self.decode_error = e
+                raise
+            finally:
+                self.finished = True
+
+    def _next_block(self):
+        if self._pass is None:
+            if self.finished:
+                return None
+            self._pass = self._read()
+        return next(self._pass, None)
+
+    def blocks(self):
+        """
+        Yield the blocks of lines of the dataset, raising ``UnicodeDecodeError``
+        after the lines before an invalid byte.
+        """
+        if self._shared or self._pass is not None:
+            return self._reread()
+        self._shared = True
+        return self._shared_blocks()
+
+    def _shared_blocks(self):
+        while True:
+            block = self._next_block()
+            if block is None:
+                return
+            yield block
+
+    def _reread(self):
+        with self._open() as fh:
+            for block in iter_line_blocks(fh, self.block_size):
+                yield block
+
+    def close(self):
+        if self._pass is not None:
+            self._pass.close()
+
+    def finish(self):
+        """Read the rest of the shared pass, ignoring invalid bytes, so the line counts are complete."""
+        self._shared = True
+        try:
+            while self._next_block() is not None:
+                pass
+        except UnicodeDecodeError:
+            pass
+        return self
+
+    def get_prefix(self):
+        """
+        Return the start of the dataset as text with ``'\\n'`` line endings
+        and whether that is the whole dataset, or ``None`` and ``False`` if it
+        cannot be decoded. Read separately if the shared pass has not started.
+        """
+        if self._recorder is not None:
+            prefix, eof = self._recorder.prefix, self._recorder.eof and self._recorder.bytes_read <= self.prefix_size
+        else:
+            with self._open() as fh:
+                prefix = fh.read(self.prefix_size + 1)
+            eof = len(prefix) <= self.prefix_size
+            prefix = prefix[:self.prefix_size]
+        try:
+            text = codecs.getincrementaldecoder('utf-8')().decode(prefix, final=eof)
+        except UnicodeDecodeError:
+            return None, False
+        if not eof and text.endswith('\r'):
+            text = text[:-1]
+        return text.replace('\r\n', '\n').replace('\r', '\n'), eof
+
+    def head_lines(self):
+        """Yield the lines of the dataset from the start, taken from the prefix as far as it goes."""
+        text, complete = self.get_prefix()
+        lines = text.split('\n') if text else []
+        if lines and (not complete or text.endswith('\n')):
+            # Drop the last line, which is either incomplete or empty
+            lines.pop()
+        for line in lines:
+            yield line
+        if complete:
+            return
+        skip = len(lines)
+        for block in self._reread():
+            block_lines = block.split('\n')
+            if skip >= len(block_lines):
+                skip -= len(block_lines)
+                continue
+            for line in block_lines[skip:]:
+                yield line
+            skip = 0
+
+
+def _scans():
+    scans = getattr(_shared_scans, 'scans', None)
+    if scans is None:
+        scans = _shared_scans.scans = {}
+    return scans
+
+
+@contextmanager
+def shared_dataset_scan(dataset):
+    """
+    Share one scanner of the file of ``dataset`` between every datatype
+    method called in this context, e.g. to set its metadata and then its
+    peek. The scanner (and the file it reads) is closed on exit.
+    """
+    if not start_shared_dataset_scan(dataset):
+        # The outermost context closes the scanner
+        yield
+        return
+    try:
+        yield
+    finally:
+        end_shared_dataset_scan(dataset)
+
+
+def start_shared_dataset_scan(dataset):
+    """
+    Share one scanner of the file of ``dataset`` like ``shared_dataset_scan``
+    until ``end_shared_dataset_scan(dataset)`` is called. Return False if it
+    is already shared, the scanner is then closed by the code that shares it.
+    """
+    scans = _scans()
+    key = id(dataset)
+    if key in scans:
+        return False
+    scans[key] = None
+    return True
+
+
+def end_shared_dataset_scan(dataset):
+    """Close the scanner shared by ``start_shared_dataset_scan(dataset)``, if any."""
+    scanner = _scans().pop(id(dataset), None)
+    if scanner is not None:
+        scanner.close()
+
+
+def get_dataset_scanner(dataset):
+    """
+    Return the scanner of the file of ``dataset``, shared while the file is
+    unchanged within ``shared_dataset_scan(dataset)``, a new one otherwise.
+    """
+    file_name = dataset.file_name
+    scans = _scans()
+    key = id(dataset)
+    if key not in scans:
+        return DatasetScanner(file_name)
+    scanner = scans[key]
+    if scanner is None or scanner.file_name != file_name or scanner.stat_key != _stat_key(file_name):
+        if scanner is not None:
+            scanner.close()
+        scanner = scans[key] = DatasetScanner(file_name)
+    return scanner
+
+
+def _stat_key(file_name):
+    try:
+        stat = os.stat(file_name)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
@@ -0,0 +1,269 @@
+"""
+Index the line offsets of text datasets to read chunks of them from any line.
+
+A line index records the line number and byte offset of a line start about
+every ``INDEX_SPACING`` bytes of (uncompressed) content, so reading from line
+N only needs a lookup and skipping the lines following the closest indexed
+line. Offsets of BGZF compressed datasets are mapped to the compressed blocks
+containing them, which are decompressed on their own instead of everything
+before them.
+"""
+import bisect
+import gzip
+import struct
+from contextlib import contextmanager
+from functools import partial
+
+from galaxy.util import compression_utils
+from galaxy.util.checkers import (
+    is_bz2,
+    is_gzip,
+    is_zip,
+)
+from .line_reader import BLOCK_SIZE
+
+# Datasets smaller than this are read from the start quickly enough
+MIN_INDEXED_SIZE = 2 ** 24
+INDEX_SPACING = 2 ** 18
+
+MAGIC = b'GXLIDX01'
+# magic, spacing, lines, number of line entries, number of BGZF block entries
+HEADER = struct.Struct('<8sQQQQ')
+# line number and offset of a line start, or uncompressed and compressed offset of a BGZF block
+ENTRY = struct.Struct('<QQ')
+
+BGZF_MAGIC = b'\x1f\x8b\x08\x04'
+# gzip header up to and including XLEN
+BGZF_HEADER = struct.Struct('<4sIBBH')
+BGZF_SUBFIELD = struct.Struct('<2sH')
+BGZF_ISIZE = struct.Struct('<I')
+
+
+class LineIndexBuilder(object):
+    """
+    Build a line index from the uncompressed content of a dataset fed, in
+    order, to ``update()``.
+
+    >>> builder = LineIndexBuilder(spacing=4)
+    >>> for data in (b'ab\\ncd', b'e\\nf\\n', b'ghij\\nk'):
+    ...     builder.update(data)
+    >>> builder.entries
+    [(0, 0), (2, 7), (4, 14)]
+    >>> builder.lines
+    4
+    """
+
+    def __init__(self, spacing=INDEX_SPACING):
+        self.spacing = spacing
+        self.offset = 0
+        self.lines = 0
+        self.entries = [(0, 0)]
+        self._next_entry = spacing
+
+    def update(self, data):
+        start = 0
+        end = self.offset + len(data)
+        while self._next_entry < end:
+            newline = data.find(b'\n', max(self._next_entry - self.offset, start))
+            if newline == -1:
+                break
+            self.lines += data.count(b'\n', start, newline + 1)
+            start = newline + 1
+            self.entries.append((self.lines, self.offset + start))
+            self._next_entry = self.offset + start + self.spacing
+        self.lines += data.count(b'\n', start)
+        self.offset = end
+
+    def write(self, path, blocks=None):
+        """Write the index to ``path``, with the BGZF ``blocks`` of the dataset if it is compressed."""
+        blocks = blocks or []
+        with open(path, 'wb') as fh:
+            fh.write(HEADER.pack(MAGIC, self.spacing, self.lines, len(self.entries), len(blocks)))
+            for entry in self.entries:
+                fh.write(ENTRY.pack(*entry))
+            for block in blocks:
+                fh.write(ENTRY.pack(*block))
+
+
+class _Entries(object):
+    """Sequence of one field of the entries of an index file, read on access for bisecting."""
+
+    def __init__(self, fh, start, count, field):
+        self.fh = fh
+        self.start = start
+        self.count = count
+        self.field = field
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return self.entry(i)[self.field]
+
+    def entry(self, i):
+        self.fh.seek(self.start + i * ENTRY.size)
+        return ENTRY.unpack(self.fh.read(ENTRY.size))
+
+
+class LineIndex(object):
+    """
+    A line index written by ``LineIndexBuilder``, looked up without loading
+    it. Raises ``ValueError`` if ``path`` is not a line index.
+    """
+
+    def __init__(self, path):
+        self.fh = open(path, 'rb')
+        try:
+            magic, self.spacing, self.lines, entry_count, block_count = HEADER.unpack(self.fh.read(HEADER.size))
+        except struct.error:
+            magic = None
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("%s is not a line index" % path)
+        self._lines = _Entries(self.fh, HEADER.size, entry_count, 0)
+        self._blocks = _Entries(self.fh, HEADER.size + entry_count * ENTRY.size, block_count, 0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.fh.close()
+
+    def line_entry(self, line):
+        """Return the line number and offset of the closest indexed line start not after ``line``."""
+        return self._lines.entry(bisect.bisect_right(self._lines, line) - 1)
+
+    def block(self, offset):
+        """
+        Return the uncompressed and compressed offset of the BGZF block
+        containing ``offset``, or ``None`` if the dataset is not compressed.
+        """
+        if not self._blocks:
+            return None
+        return self._blocks.entry(max(bisect.bisect_right(self._blocks, offset) - 1, 0))
+
+
+def build_line_index(file_name, spacing=INDEX_SPACING):
+    """Return a ``LineIndexBuilder`` that has read all of (possibly compressed) ``file_name``."""
+    builder = LineIndexBuilder(spacing)
+    with compression_utils.get_fileobj(file_name, 'rb') as fh:
+        for data in iter(partial(fh.read, BLOCK_SIZE), b''):
+            builder.update(data)
+    return builder
+
+
+def indexed_blocks(file_name):
+    """
+    Return the BGZF blocks to index with the lines of ``file_name``, ``[]`` if
+    it is not compressed or ``None`` if it is compressed otherwise, as it then
+    cannot be read from an offset without decompressing everything before it.
+    """
+    if is_gzip(file_name):
+        return bgzf_blocks(file_name)
+    if is_bz2(file_name) or is_zip(file_name):
+        return None
+    return []
+
+
+def bgzf_blocks(file_name):
+    """
+    Return the uncompressed and compressed offsets of the non-empty blocks of
+    BGZF compressed ``file_name``, or ``None`` if it is not BGZF compressed.
+    Only the block headers and sizes are read.
+    """
+    blocks = []
+    offset = compressed_offset = 0
+    with open(file_name, 'rb') as fh:
+        while True:
+            header = fh.read(BGZF_HEADER.size)
+            if not header:
+                return blocks
+            if len(header) < BGZF_HEADER.size:
+                return None
+            magic, _, _, _, extra_length = BGZF_HEADER.unpack(header)
+            block_size = _bgzf_block_size(fh.read(extra_length)) if magic == BGZF_MAGIC else None
+            if block_size is None:
+                return None
+            # ISIZE, the uncompressed size of the block, ends the block
+            fh.seek(compressed_offset + block_size - BGZF_ISIZE.size)
+            size = fh.read(BGZF_ISIZE.size)
+            if len(size) < BGZF_ISIZE.size:
+                return None
+            size = BGZF_ISIZE.unpack(size)[0]
+            if size:
+                blocks.append((offset, compressed_offset))
+            offset += size
+            compressed_offset += block_size
+
+
+def _bgzf_block_size(extra):
+    while len(extra) >= BGZF_SUBFIELD.size:
+        identifier, length = BGZF_SUBFIELD.unpack(extra[:BGZF_SUBFIELD.size])
+        if identifier == b'BC' and length == 2:
+            return struct.unpack('<H', extra[BGZF_SUBFIELD.size:BGZF_SUBFIELD.size + 2])[0] + 1
+        extra = extra[BGZF_SUBFIELD.size + length:]
+    return None
+
+
+@contextmanager
+def open_at(file_name, offset, line_index=None):
+    """
+    Open (possibly compressed) ``file_name`` for reading bytes from the
+    uncompressed ``offset``, decompressing only from the BGZF block containing
+    it if ``line_index`` has the blocks of the file.
+    """
+    block = line_index.block(offset) if line_index is not None else None
+    if block is None:
+        with compression_utils.get_fileobj(file_name, 'rb') as fh:
+            fh.seek(offset)
+            yield fh
+    else:
+        block_offset, compressed_offset = block
+        with open(file_name, 'rb') as compressed_fh:
+            compressed_fh.seek(compressed_offset)
+            with gzip.GzipFile(fileobj=compressed_fh, mode='rb') as fh:
+                fh.read(offset - block_offset)
+                yield fh
+
+
+def find_line(file_name, line, line_index=None):
+    """
+    Return the offset of line ``line`` (counted from 0) of ``file_name``, or
+    of its end if it has fewer lines.
+    """
+    current_line, offset = line_index.line_entry(line) if line_index is not None else (0, 0)
+    if current_line == line:
+        return offset
+    with open_at(file_name, offset, line_index) as fh:
+        for data in iter(partial(fh.read, BLOCK_SIZE), b''):
+            newlines = data.count(b'\n')
+            if current_line + newlines >= line:
+                newline = -1
+                for _ in range(line - current_line):
+                    newline = data.find(b'\n', newline + 1)
+                return offset + newline + 1
+            current_line += newlines
+            offset += len(data)
+    return offset
+
+
+def read_chunk(file_name, offset, size, line_index=None):
+    """
+    Return at least ``size`` bytes of ``file_name`` from ``offset``, up to the
+    end of a line, and the offset following them.
+    """
+    with open_at(file_name, offset, line_index) as fh:
+        chunk = fh.read(size)
+        if chunk and not chunk.endswith(b'\n'):
+            rest = []
+            for data in iter(partial(fh.read, 4096), b''):
+                newline = data.find(b'\n')
+                if newline != -1:
+                    rest.append(data[:newline + 1])
+                    break
+                rest.append(data)
+            chunk += b''.join(rest)
+    return chunk, offset + len(chunk)
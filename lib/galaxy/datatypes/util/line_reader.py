@@ -0,0 +1,82 @@
+"""
+Read text datasets in large blocks of complete lines instead of line by line.
+"""
+import codecs
+
+BLOCK_SIZE = 2 ** 20
+
+
+def iter_line_blocks(fh, block_size=BLOCK_SIZE):
+    """
+    Yield the content of binary file object ``fh`` as strings of complete
+    lines joined by (and without a trailing) ``'\\n'``, so that
+    ``block.split('\\n')`` returns the lines of a block.
+
+    Content is decoded as UTF-8 with universal newlines, like a file opened in
+    text mode, and the lines are the ones ``readline()`` would return without
+    their line endings. A ``UnicodeDecodeError`` is raised only after all
+    lines before the invalid byte have been yielded.
+
+    >>> from io import BytesIO
+    >>> blocks = iter_line_blocks(BytesIO(b'a\\tb\\r\\n\\n#c\\rd'), block_size=4)
+    >>> '\\n'.join(blocks).split('\\n')
+    ['a\\tb', '', '#c', 'd']
+    >>> list(iter_line_blocks(BytesIO(b'a\\nb\\n')))
+    ['a\\nb']
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    remainder = ''
+    pending_cr = ''
+    while True:
+        chunk = fh.read(block_size)
+        error = None
+        try:
+            text = decoder.decode(chunk, final=not chunk)
+        except UnicodeDecodeError as e:
+            error = e
+            text = e.object[:e.start].decode('utf-8')
+        text = pending_cr + text
+        pending_cr = ''
+        if chunk and not error and text.endswith('\r'):
+            # Might be the first half of a \r\n split between two chunks
+            text, pending_cr = text[:-1], '\r'
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        text = remainder + text
+        if error is not None:
+            end = text.rfind('\n')
+            if end != -1:
+                yield text[:end]
+            raise error
+        if not chunk:
+            if text:
+                yield text[:-1] if text.endswith('\n') else text
+            return
+        end = text.rfind('\n')
+        if end == -1:
+            remainder = text
+        else:
+            remainder = text[end + 1:]
+            yield text[:end]
+
+
+def count_lines(block):
+    """
+    Return the number of lines in ``block`` (as yielded by
+    ``iter_line_blocks``) and how many of them are empty or start with '#'.
+
+    >>> count_lines('#x\\n\\na\\n\\n\\n#y')
+    (6, 5)
+    >>> count_lines('')
+    (1, 1)
+    """
+    if not block:
+        return 1, 1
+    lines = block.count('\n') + 1
+    comments = block.count('\n#') + block.startswith('#')
+    empty = block.startswith('\n') + block.endswith('\n')
+    while '\n\n' in block:
+        shorter = block.replace('\n\n', '\n')
+        empty += len(block) - len(shorter)
+        block = shorter
+    return lines, comments + empty
@@ -8,6 +8,7 @@ from collections import OrderedDict
 from tempfile import NamedTemporaryFile
 
 import galaxy.model
+from galaxy.datatypes.util.dataset_scanner import shared_dataset_scan
 from galaxy.model.dataset_collections import builder
 from galaxy.model.dataset_collections.structure import UninitializedTree
 from galaxy.model.dataset_collections.type_description import COLLECTION_TYPE_DESCRIPTION_FACTORY
@@ -439,8 +440,9 @@ def collect_primary_datasets(job_context, output, input_ext):
         if primary_output_assigned:
             outdata.name = new_outdata_name
             outdata.init_meta()
-            outdata.set_meta()
-            outdata.set_peek()
+            with shared_dataset_scan(outdata):
+                outdata.set_meta()
+                outdata.set_peek()
             sa_session = job_context.sa_session
             if sa_session:
                 sa_session.add(outdata)
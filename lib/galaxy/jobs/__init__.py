@@ -33,6 +33,7 @@ from galaxy import (
     util,
 )
 from galaxy.datatypes import sniff
+from galaxy.datatypes.util.dataset_scanner import shared_dataset_scan
 from galaxy.exceptions import (
     ObjectInvalid,
     ObjectNotFound,
@@ -83,6 +84,9 @@ DEFAULT_LOCAL_WORKERS = 4
 
 DEFAULT_CLEANUP_JOB = "always"
 
+# States of jobs included in the running job counts of the job handlers
+COUNTED_JOB_STATES = (model.Job.states.QUEUED, model.Job.states.RUNNING, model.Job.states.RESUBMITTED)
+
 
 class JobDestination(Bunch):
     """
@@ -1083,6 +1087,7 @@ class JobWrapper(HasResourceParameters):
             os.mkdir(self.working_directory)
 
         job = self._load_job()
+        self._pin_inputs(job)
 
         def get_special():
             special = self.sa_session.query(model.JobExportHistoryArchive).filter_by(job=job).first()
@@ -1199,6 +1204,21 @@ class JobWrapper(HasResourceParameters):
             job = self.get_job()
         return SharedComputeEnvironment(self, job)
 
+    @property
+    def _input_pin_owner(self):
+        # Not bound to a process, the job may finish in another one
+        return "job:%s" % self.job_id
+
+    def _pin_inputs(self, job):
+        """Keep the input datasets of the job in the object store cache until the job is cleaned up."""
+        for da in job.input_datasets + job.input_library_datasets:  # da is JobToInputDatasetAssociation object
+            if da.dataset:
+                self.object_store.pin(da.dataset.dataset, self._input_pin_owner)
+
+    def unpin_inputs(self):
+        """Allow the object store to evict the cached input datasets of the job again."""
+        self.object_store.unpin_owner(self._input_pin_owner)
+
     def _load_job(self):
         # Load job from database and verify it has user or session.
         # Restore parameters from the database
@@ -1233,6 +1253,7 @@ class JobWrapper(HasResourceParameters):
         """
         job = self.get_job()
         self.sa_session.refresh(job)
+        active = job.state in COUNTED_JOB_STATES
 
         # If this fail method is being called because a dynamic rule raised JobMappingException, the call to
         # self.get_destination_configuration() below accesses self.job_destination and will just cause
@@ -1302,6 +1323,7 @@ class JobWrapper(HasResourceParameters):
                 # Any reason for clean_only here? We should probably be more consistent and transfer
                 # the partial files to the object store regardless of whether job.state == DELETED
                 self.__update_output(job, dataset, clean_only=True)
+        self.app.job_manager.job_handler.job_queue.decrease_running_job_count(job.user_id, job.destination_id, job.id, active)
 
         if working_directory_exists:
             self._fix_output_permissions()
@@ -1432,7 +1454,7 @@ class JobWrapper(HasResourceParameters):
             dest_params, self.app.config, key, default
         )
 
-    def enqueue(self):
+    def enqueue(self, flush=True):
         job = self.get_job()
         # Change to queued state before handing to worker thread so the runner won't pick it up again
         self.change_state(model.Job.states.QUEUED, flush=False, job=job)
@@ -1440,7 +1462,8 @@ class JobWrapper(HasResourceParameters):
         self.set_job_destination(self.job_destination, None, flush=False, job=job)
         # Set object store after job destination so can leverage parameters...
         self._set_object_store_ids(job)
-        self.sa_session.flush()
+        if flush:
+            self.sa_session.flush()
 
     def _set_object_store_ids(self, job):
         if job.object_store_id:
@@ -1522,7 +1545,7 @@ class JobWrapper(HasResourceParameters):
                     dataset.extension = extension
 
                 # call datatype.set_meta directly for the initial set_meta call during dataset creation
-                dataset.datatype.set_meta(dataset, overwrite=False)
+                dataset.datatype.set_meta(dataset, overwrite=False, index_lines=self.app.config.tabular_line_index)
             elif (job.states.ERROR != final_job_state and not metadata_set_successfully):
                 dataset._state = model.Dataset.states.FAILED_METADATA
             else:
@@ -1571,6 +1594,7 @@ class JobWrapper(HasResourceParameters):
         # default post job setup
         self.sa_session.expunge_all()
         job = self.get_job()
+        active = job.state in COUNTED_JOB_STATES
 
         def fail():
             return self.fail(job.info, tool_stdout=tool_stdout, tool_stderr=tool_stderr, exit_code=tool_exit_code, job_stdout=job_stdout, job_stderr=job_stderr)
@@ -1664,9 +1688,11 @@ class JobWrapper(HasResourceParameters):
 
                 if standard_job_finish:
                     # Handles retry internally on error for instance...
-                    self._finish_dataset(
-                        output_name, dataset, job, context, final_job_state, remote_metadata_directory
-                    )
+                    # Setting the metadata and peek of the dataset read its file once
+                    with shared_dataset_scan(dataset):
+                        self._finish_dataset(
+                            output_name, dataset, job, context, final_job_state, remote_metadata_directory
+                        )
 
         for dataset_assoc in output_dataset_associations:
             if job.states.ERROR == final_job_state:
@@ -1715,15 +1741,17 @@ class JobWrapper(HasResourceParameters):
                             tool=self.tool, stdout=job.stdout, stderr=job.stderr)
         job.command_line = unicodify(self.command_line)
 
-        collected_bytes = 0
+        collected_bytes = {}
         # Once datasets are collected, set the total dataset size (includes extra files)
         for dataset_assoc in job.output_datasets:
-            if not dataset_assoc.dataset.dataset.purged:
-                dataset_assoc.dataset.dataset.set_total_size()
-                collected_bytes += dataset_assoc.dataset.dataset.get_total_size()
+            dataset = dataset_assoc.dataset.dataset
+            if not dataset.purged:
+                dataset.set_total_size()
+                collected_bytes[dataset.object_store_id] = collected_bytes.get(dataset.object_store_id, 0) + dataset.get_total_size()
 
         if job.user:
-            job.user.adjust_total_disk_usage(collected_bytes)
+            for object_store_id, amount in collected_bytes.items():
+                job.user.adjust_total_disk_usage(amount, object_store_id)
 
         # Empirically, we need to update job.user and
         # job.workflow_invocation_step.workflow_invocation in separate
@@ -1740,6 +1768,7 @@ class JobWrapper(HasResourceParameters):
         # Finally set the job state.  This should only happen *after* all
         # dataset creation, and will allow us to eliminate force_history_refresh.
         job.set_final_state(final_job_state)
+        self.app.job_manager.job_handler.job_queue.decrease_running_job_count(job.user_id, job.destination_id, job.id, active)
         if not job.tasks:
             # If job was composed of tasks, don't attempt to recollect statisitcs
             self._collect_metrics(job, job_metrics_directory)
@@ -1805,6 +1834,7 @@ class JobWrapper(HasResourceParameters):
         # for the tool to work properly, that is why one might want to run
         # cleanup but not delete files.
         try:
+            self.unpin_inputs()
             if delete_files:
                 for fname in self.extra_filenames:
                     try:
@@ -2064,6 +2094,8 @@ class JobWrapper(HasResourceParameters):
         inp_data, out_data, out_collections = job.io_dicts()
         job_metadata = os.path.join(self.tool_working_directory, self.tool.provided_metadata_file)
         object_store_conf = self.object_store.to_dict()
+        # keyword arguments of set_meta()
+        kwds['kwds'] = dict(kwds.get('kwds') or {}, index_lines=self.app.config.tabular_line_index)
         command = self.external_output_metadata.setup_external_metadata(out_data,
                                                                         out_collections,
                                                                         self.sa_session,
@@ -2616,5 +2648,8 @@ class NoopQueue(object):
     def put_stop(self, *args):
         return
 
+    def decrease_running_job_count(self, *args):
+        return
+
     def shutdown(self):
         return
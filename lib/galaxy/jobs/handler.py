@@ -3,6 +3,7 @@ Galaxy job handler, prepares, runs, tracks, and finishes Galaxy jobs
 """
 import datetime
 import os
+import threading
 import time
 from collections import defaultdict
 
@@ -77,7 +78,14 @@ class JobHandlerQueue(Monitors):
         self.sa_session = app.model.context
         self.track_jobs_in_database = self.app.config.track_jobs_in_database
 
-        # Initialize structures for handling job limits
+        # Initialize structures for handling job limits. If a reconcile
+        # interval is set, counts are kept across iterations of the queue,
+        # updated as jobs are dispatched and finished, and only recounted from
+        # the database once the interval has passed.
+        self.job_count_reconcile_interval = self.app.config.job_count_cache_reconcile_interval
+        self.cache_user_job_count = self.app.config.cache_user_job_count or bool(self.job_count_reconcile_interval)
+        self.__job_count_lock = threading.Lock()
+        self.__last_job_count_reconcile = 0
         self.__clear_job_count()
 
         # Keep track of the pid that started the job manager, only it
@@ -89,6 +97,11 @@ class JobHandlerQueue(Monitors):
         self.waiting_jobs = []
         # Contains wrappers of jobs that are limited or ready (so they aren't created unnecessarily/multiple times)
         self.job_wrappers = {}
+        # Tracks which input datasets NEW jobs are waiting on, so only jobs
+        # whose inputs changed state need to be re-evaluated.
+        self.track_job_dependencies = self.track_jobs_in_database and app.config.job_handler_dependency_tracking
+        self.dependency_index = JobInputDependencyIndex()
+        self.__last_dependency_sweep = 0
         name = "JobHandlerQueue.monitor_thread"
         self._init_monitor_thread(name, target=self.__monitor, config=app.config)
         self.__grab_query = None
@@ -288,38 +301,17 @@ class JobHandlerQueue(Monitors):
         # Pull all new jobs from the queue at once
         jobs_to_check = []
         resubmit_jobs = []
+        query_timer = self.app.execution_timer_factory.get_timer(
+            'internal.galaxy.jobs.handlers.waiting_jobs_query',
+            'Job handler queried ${job_count} new jobs to check.'
+        )
         if self.track_jobs_in_database:
             # Clear the session so we get fresh states for job and all datasets
             self.sa_session.expunge_all()
-            # Fetch all new jobs
-            hda_not_ready = self.sa_session.query(model.Job.id).enable_eagerloads(False) \
-                .join(model.JobToInputDatasetAssociation) \
-                .join(model.HistoryDatasetAssociation) \
-                .join(model.Dataset) \
-                .filter(and_(model.Job.state == model.Job.states.NEW,
-                             model.Dataset.state.in_(model.Dataset.non_ready_states))).subquery()
-            ldda_not_ready = self.sa_session.query(model.Job.id).enable_eagerloads(False) \
-                .join(model.JobToInputLibraryDatasetAssociation) \
-                .join(model.LibraryDatasetDatasetAssociation) \
-                .join(model.Dataset) \
-                .filter(and_(model.Job.state == model.Job.states.NEW,
-                             model.Dataset.state.in_(model.Dataset.non_ready_states))).subquery()
-            if self.app.config.user_activation_on:
-                jobs_to_check = self.sa_session.query(model.Job).enable_eagerloads(False) \
-                    .outerjoin(model.User) \
-                    .filter(and_((model.Job.state == model.Job.states.NEW),
-                                 or_((model.Job.user_id == null()), (model.User.active == true())),
-                                 (model.Job.handler == self.app.config.server_name),
-                                 ~model.Job.table.c.id.in_(hda_not_ready),
-                                 ~model.Job.table.c.id.in_(ldda_not_ready))) \
-                    .order_by(model.Job.id).all()
+            if self.track_job_dependencies:
+                jobs_to_check = self.__get_new_jobs_by_dependencies()
             else:
-                jobs_to_check = self.sa_session.query(model.Job).enable_eagerloads(False) \
-                    .filter(and_((model.Job.state == model.Job.states.NEW),
-                                 (model.Job.handler == self.app.config.server_name),
-                                 ~model.Job.table.c.id.in_(hda_not_ready),
-                                 ~model.Job.table.c.id.in_(ldda_not_ready))) \
-                    .order_by(model.Job.id).all()
+                jobs_to_check = self.__get_new_jobs()
             # Filter jobs with invalid input states
             jobs_to_check = self.__filter_jobs_with_invalid_input_states(jobs_to_check)
             # Fetch all "resubmit" jobs
@@ -343,6 +335,11 @@ class JobHandlerQueue(Monitors):
                     jobs_to_check.append(self.sa_session.query(model.Job).get(job_id))
             except Empty:
                 pass
+        log.trace(query_timer.to_str(job_count=len(jobs_to_check)))
+        evaluation_timer = self.app.execution_timer_factory.get_timer(
+            'internal.galaxy.jobs.handlers.waiting_jobs_evaluation',
+            'Job handler evaluated ${job_count} new jobs.'
+        )
         # Ensure that we get new job counts on each iteration
         self.__clear_job_count()
         # Check resubmit jobs first so that limits of new jobs will still be enforced
@@ -351,11 +348,12 @@ class JobHandlerQueue(Monitors):
             # Reassemble resubmit job destination from persisted value
             jw = self.__recover_job_wrapper(job)
             if jw.is_ready_for_resubmission(job):
-                self.increase_running_job_count(job.user_id, jw.job_destination.id)
+                self.increase_running_job_count(job.user_id, jw.job_destination.id, job.id)
                 self.dispatcher.put(jw)
         # Iterate over new and waiting jobs and look for any that are
         # ready to run
         new_waiting_jobs = []
+        ready_job_wrappers = []
         for job in jobs_to_check:
             try:
                 # Check the job's dependencies, requeue if they're not done.
@@ -385,8 +383,7 @@ class JobHandlerQueue(Monitors):
                 elif job_state == JOB_INPUT_DELETED:
                     log.info("(%d) Job unable to run: one or more inputs deleted" % job.id)
                 elif job_state == JOB_READY:
-                    self.dispatcher.put(self.job_wrappers.pop(job.id))
-                    log.info("(%d) Job dispatched" % job.id)
+                    ready_job_wrappers.append(self.job_wrappers.pop(job.id))
                 elif job_state == JOB_DELETED:
                     log.info("(%d) Job deleted by user while still queued" % job.id)
                 elif job_state == JOB_ADMIN_DELETED:
@@ -411,6 +408,12 @@ class JobHandlerQueue(Monitors):
                     new_waiting_jobs.append(job.id)
             except Exception:
                 log.exception("failure running job %d", job.id)
+        # Hand all ready jobs to their runners at once
+        if ready_job_wrappers:
+            dispatched = self.dispatcher.put_many(ready_job_wrappers)
+            for job_wrapper in dispatched:
+                log.info("(%d) Job dispatched" % job_wrapper.job_id)
+            self.__keep_undispatched_jobs(ready_job_wrappers, dispatched, new_waiting_jobs)
         # Update the waiting list
         if not self.track_jobs_in_database:
             self.waiting_jobs = new_waiting_jobs
@@ -418,11 +421,117 @@ class JobHandlerQueue(Monitors):
         for id in list(self.job_wrappers.keys()):
             if id not in new_waiting_jobs:
                 del self.job_wrappers[id]
+        log.trace(evaluation_timer.to_str(job_count=len(jobs_to_check)))
         # Flush, if we updated the state
         self.sa_session.flush()
         # Done with the session
         self.sa_session.remove()
 
+    def __keep_undispatched_jobs(self, job_wrappers, dispatched, new_waiting_jobs):
+        """
+        Keep the jobs that were neither dispatched nor failed (e.g. because
+        their runner raised) waiting, so they are dispatched again on the next
+        iteration instead of being dropped.
+        """
+        dispatched_ids = set(job_wrapper.job_id for job_wrapper in dispatched)
+        for job_wrapper in job_wrappers:
+            if job_wrapper.job_id in dispatched_ids:
+                continue
+            try:
+                state = job_wrapper.get_state()
+            except Exception:
+                log.exception("(%d) Unable to get the state of the job that was not dispatched" % job_wrapper.job_id)
+                continue
+            if state == model.Job.states.NEW:
+                log.debug("(%d) Job was not dispatched, trying again" % job_wrapper.job_id)
+                new_waiting_jobs.append(job_wrapper.job_id)
+                self.job_wrappers[job_wrapper.job_id] = job_wrapper
+
+    def __get_new_jobs(self):
+        """
+        Fetch all NEW jobs assigned to this handler whose inputs are all
+        ready, using anti-joins against the not ready input datasets.
+        """
+        hda_not_ready = self.sa_session.query(model.Job.id).enable_eagerloads(False) \
+            .join(model.JobToInputDatasetAssociation) \
+            .join(model.HistoryDatasetAssociation) \
+            .join(model.Dataset) \
+            .filter(and_(model.Job.state == model.Job.states.NEW,
+                         model.Dataset.state.in_(model.Dataset.non_ready_states))).subquery()
+        ldda_not_ready = self.sa_session.query(model.Job.id).enable_eagerloads(False) \
+            .join(model.JobToInputLibraryDatasetAssociation) \
+            .join(model.LibraryDatasetDatasetAssociation) \
+            .join(model.Dataset) \
+            .filter(and_(model.Job.state == model.Job.states.NEW,
+                         model.Dataset.state.in_(model.Dataset.non_ready_states))).subquery()
+        if self.app.config.user_activation_on:
+            return self.sa_session.query(model.Job).enable_eagerloads(False) \
+                .outerjoin(model.User) \
+                .filter(and_((model.Job.state == model.Job.states.NEW),
+                             or_((model.Job.user_id == null()), (model.User.active == true())),
+                             (model.Job.handler == self.app.config.server_name),
+                             ~model.Job.table.c.id.in_(hda_not_ready),
+                             ~model.Job.table.c.id.in_(ldda_not_ready))) \
+                .order_by(model.Job.id).all()
+        else:
+            return self.sa_session.query(model.Job).enable_eagerloads(False) \
+                .filter(and_((model.Job.state == model.Job.states.NEW),
+                             (model.Job.handler == self.app.config.server_name),
+                             ~model.Job.table.c.id.in_(hda_not_ready),
+                             ~model.Job.table.c.id.in_(ldda_not_ready))) \
+                .order_by(model.Job.id).all()
+
+    def __get_new_jobs_by_dependencies(self):
+        """
+        Fetch NEW jobs assigned to this handler that may be ready to run,
+        consulting ``self.dependency_index`` so that jobs known to be waiting
+        on input datasets are only re-evaluated once one of those datasets
+        leaves the non-ready states. The index is discarded and rebuilt from
+        the database every ``job_handler_dependency_sweep_interval`` seconds
+        to catch anything the incremental updates missed.
+        """
+        now = time.time()
+        if now - self.__last_dependency_sweep >= self.app.config.job_handler_dependency_sweep_interval:
+            self.dependency_index.clear()
+            self.__last_dependency_sweep = now
+        # Only job ids are fetched here, the expensive per-input queries below
+        # are restricted to jobs that are not already known to be waiting.
+        new_job_ids_query = self.sa_session.query(model.Job.id).enable_eagerloads(False)
+        if self.app.config.user_activation_on:
+            new_job_ids_query = new_job_ids_query.outerjoin(model.User) \
+                .filter(or_((model.Job.user_id == null()), (model.User.active == true())))
+        new_job_ids = [row[0] for row in new_job_ids_query.filter(and_(
+            (model.Job.state == model.Job.states.NEW),
+            (model.Job.handler == self.app.config.server_name)))]
+        self.dependency_index.retain_jobs(new_job_ids)
+        watched_dataset_ids = self.dependency_index.dataset_ids
+        if watched_dataset_ids:
+            changed_dataset_ids = [row[0] for row in self.sa_session.query(model.Dataset.id).enable_eagerloads(False)
+                                   .filter(and_(model.Dataset.id.in_(watched_dataset_ids),
+                                                ~model.Dataset.state.in_(model.Dataset.non_ready_states)))]
+            woken_job_ids = self.dependency_index.datasets_changed(changed_dataset_ids)
+            if woken_job_ids:
+                log.debug("Inputs of waiting jobs %s are no longer pending, checking them again", woken_job_ids)
+        candidate_job_ids = [job_id for job_id in new_job_ids if not self.dependency_index.is_waiting(job_id)]
+        if not candidate_job_ids:
+            return []
+        for job_to_input, input_association in [(model.JobToInputDatasetAssociation, model.HistoryDatasetAssociation),
+                                                (model.JobToInputLibraryDatasetAssociation, model.LibraryDatasetDatasetAssociation)]:
+            not_ready = self.sa_session.query(model.Job.id, model.Dataset.id).enable_eagerloads(False) \
+                .join(job_to_input) \
+                .join(input_association) \
+                .join(model.Dataset) \
+                .filter(and_(model.Job.id.in_(candidate_job_ids),
+                             model.Dataset.state.in_(model.Dataset.non_ready_states)))
+            for job_id, dataset_id in not_ready:
+                self.dependency_index.add(job_id, dataset_id)
+        candidate_job_ids = [job_id for job_id in candidate_job_ids if not self.dependency_index.is_waiting(job_id)]
+        if not candidate_job_ids:
+            return []
+        return self.sa_session.query(model.Job).enable_eagerloads(False) \
+            .filter(model.Job.id.in_(candidate_job_ids)) \
+            .order_by(model.Job.id).all()
+
     def __filter_jobs_with_invalid_input_states(self, jobs):
         """
         Takes  list of jobs and filters out jobs whose input datasets are in invalid state and
@@ -519,7 +628,7 @@ class JobHandlerQueue(Monitors):
 
         if state == JOB_READY:
             # PASS.  increase usage by one job (if caching) so that multiple jobs aren't dispatched on this queue iteration
-            self.increase_running_job_count(job.user_id, job_destination.id)
+            self.increase_running_job_count(job.user_id, job_destination.id, job.id)
             for job_to_input_dataset_association in job.input_datasets:
                 # We record the input dataset version, now that we know the inputs are ready
                 if job_to_input_dataset_association.dataset:
@@ -629,15 +738,23 @@ class JobHandlerQueue(Monitors):
         return None
 
     def __clear_job_count(self):
-        self.user_job_count = None
-        self.user_job_count_per_destination = None
-        self.total_job_count_per_destination = None
+        if self.job_count_reconcile_interval:
+            now = time.time()
+            if now - self.__last_job_count_reconcile < self.job_count_reconcile_interval:
+                return
+            self.__last_job_count_reconcile = now
+        with self.__job_count_lock:
+            self.user_job_count = None
+            self.user_job_count_per_destination = None
+            self.total_job_count_per_destination = None
+            # Jobs counted by increase_running_job_count() since the counts were loaded
+            self.counted_job_ids = set()
 
     def get_user_job_count(self, user_id):
         self.__cache_user_job_count()
         # This could have been incremented by a previous job dispatched on this iteration, even if we're not caching
         rval = self.user_job_count.get(user_id, 0)
-        if not self.app.config.cache_user_job_count:
+        if not self.cache_user_job_count:
             result = self.sa_session.execute(select([func.count(model.Job.table.c.id)])
                                              .where(and_(model.Job.table.c.state.in_((model.Job.states.QUEUED,
                                                          model.Job.states.RUNNING,
@@ -650,7 +767,7 @@ class JobHandlerQueue(Monitors):
 
     def __cache_user_job_count(self):
         # Cache the job count if necessary
-        if self.user_job_count is None and self.app.config.cache_user_job_count:
+        if self.user_job_count is None and self.cache_user_job_count:
             self.user_job_count = {}
             query = self.sa_session.execute(select([model.Job.table.c.user_id, func.count(model.Job.table.c.user_id)])
                                             .where(and_(model.Job.table.c.state.in_((model.Job.states.QUEUED,
@@ -666,7 +783,7 @@ class JobHandlerQueue(Monitors):
     def get_user_job_count_per_destination(self, user_id):
         self.__cache_user_job_count_per_destination()
         cached = self.user_job_count_per_destination.get(user_id, {})
-        if self.app.config.cache_user_job_count:
+        if self.cache_user_job_count:
             rval = cached
         else:
             # The cached count is still used even when we're not caching, it is
@@ -685,7 +802,7 @@ class JobHandlerQueue(Monitors):
 
     def __cache_user_job_count_per_destination(self):
         # Cache the job count if necessary
-        if self.user_job_count_per_destination is None and self.app.config.cache_user_job_count:
+        if self.user_job_count_per_destination is None and self.cache_user_job_count:
             self.user_job_count_per_destination = {}
             result = self.sa_session.execute(select([model.Job.table.c.user_id, model.Job.table.c.destination_id, func.count(model.Job.table.c.user_id).label('job_count')])
                                              .where(and_(model.Job.table.c.state.in_((model.Job.states.QUEUED, model.Job.states.RUNNING))))
@@ -697,22 +814,58 @@ class JobHandlerQueue(Monitors):
         elif self.user_job_count_per_destination is None:
             self.user_job_count_per_destination = {}
 
-    def increase_running_job_count(self, user_id, destination_id):
-        if self.app.job_config.limits.registered_user_concurrent_jobs or \
-           self.app.job_config.limits.anonymous_user_concurrent_jobs or \
-           self.app.job_config.limits.destination_user_concurrent_jobs:
-            if self.user_job_count is None:
-                self.user_job_count = {}
-            if self.user_job_count_per_destination is None:
-                self.user_job_count_per_destination = {}
-            self.user_job_count[user_id] = self.user_job_count.get(user_id, 0) + 1
-            if user_id not in self.user_job_count_per_destination:
-                self.user_job_count_per_destination[user_id] = {}
-            self.user_job_count_per_destination[user_id][destination_id] = self.user_job_count_per_destination[user_id].get(destination_id, 0) + 1
-        if self.app.job_config.limits.destination_total_concurrent_jobs:
-            if self.total_job_count_per_destination is None:
-                self.total_job_count_per_destination = {}
-            self.total_job_count_per_destination[destination_id] = self.total_job_count_per_destination.get(destination_id, 0) + 1
+    def increase_running_job_count(self, user_id, destination_id, job_id=None):
+        with self.__job_count_lock:
+            if job_id is not None:
+                self.counted_job_ids.add(job_id)
+            if self.app.job_config.limits.registered_user_concurrent_jobs or \
+               self.app.job_config.limits.anonymous_user_concurrent_jobs or \
+               self.app.job_config.limits.destination_user_concurrent_jobs:
+                if self.cache_user_job_count:
+                    # Load the counts from the database before incrementing
+                    # them, else a reconciliation would be skipped
+                    self.__cache_user_job_count()
+                    self.__cache_user_job_count_per_destination()
+                if self.user_job_count is None:
+                    self.user_job_count = {}
+                if self.user_job_count_per_destination is None:
+                    self.user_job_count_per_destination = {}
+                self.user_job_count[user_id] = self.user_job_count.get(user_id, 0) + 1
+                if user_id not in self.user_job_count_per_destination:
+                    self.user_job_count_per_destination[user_id] = {}
+                self.user_job_count_per_destination[user_id][destination_id] = self.user_job_count_per_destination[user_id].get(destination_id, 0) + 1
+            if self.app.job_config.limits.destination_total_concurrent_jobs:
+                self.__cache_total_job_count_per_destination()
+                self.total_job_count_per_destination[destination_id] = self.total_job_count_per_destination.get(destination_id, 0) + 1
+
+    def decrease_running_job_count(self, user_id, destination_id, job_id=None, active=True):
+        """
+        Called when a job handled here reaches a terminal state. Only has an
+        effect if job counts are kept across iterations of the queue (i.e.
+        ``job_count_cache_reconcile_interval`` is set), otherwise the counts
+        are recalculated on the next iteration anyway. Jobs finished by other
+        handlers are only accounted for on the next reconciliation.
+
+        Only jobs that were counted are subtracted: jobs counted when they
+        were dispatched by this handler, or jobs that were ``active`` (queued,
+        running or resubmitted) and thus counted when loading the counts.
+        Jobs failing before ever being dispatched are neither.
+        """
+        if not self.job_count_reconcile_interval:
+            return
+        with self.__job_count_lock:
+            dispatched = job_id in self.counted_job_ids
+            self.counted_job_ids.discard(job_id)
+            if not (dispatched or active):
+                return
+            if self.user_job_count and self.user_job_count.get(user_id, 0) > 0:
+                self.user_job_count[user_id] -= 1
+            if self.user_job_count_per_destination:
+                per_destination = self.user_job_count_per_destination.get(user_id, {})
+                if per_destination.get(destination_id, 0) > 0:
+                    per_destination[destination_id] -= 1
+            if self.total_job_count_per_destination and self.total_job_count_per_destination.get(destination_id, 0) > 0:
+                self.total_job_count_per_destination[destination_id] -= 1
 
     def __check_user_jobs(self, job, job_wrapper):
         # TODO: Update output datasets' _state = LIMITED or some such new
@@ -833,6 +986,62 @@ class JobHandlerQueue(Monitors):
             self.dispatcher.shutdown()
 
 
+class JobInputDependencyIndex(object):
+    """
+    In-memory mapping between NEW jobs and the input datasets (by
+    ``Dataset.id``) that are preventing them from running.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.jobs_by_dataset = defaultdict(set)
+        self.datasets_by_job = defaultdict(set)
+
+    @property
+    def dataset_ids(self):
+        return list(self.jobs_by_dataset.keys())
+
+    def add(self, job_id, dataset_id):
+        self.jobs_by_dataset[dataset_id].add(job_id)
+        self.datasets_by_job[job_id].add(dataset_id)
+
+    def is_waiting(self, job_id):
+        return job_id in self.datasets_by_job
+
+    def discard_job(self, job_id):
+        for dataset_id in self.datasets_by_job.pop(job_id, ()):
+            job_ids = self.jobs_by_dataset.get(dataset_id)
+            if job_ids is not None:
+                job_ids.discard(job_id)
+                if not job_ids:
+                    del self.jobs_by_dataset[dataset_id]
+
+    def retain_jobs(self, job_ids):
+        """Forget any job not in ``job_ids`` (e.g. no longer NEW or reassigned)."""
+        job_ids = set(job_ids)
+        for job_id in [j for j in self.datasets_by_job if j not in job_ids]:
+            self.discard_job(job_id)
+
+    def datasets_changed(self, dataset_ids):
+        """
+        Stop tracking datasets that are no longer in a non-ready state and
+        return the ids of jobs that are not waiting on anything else.
+        """
+        woken = []
+        for dataset_id in dataset_ids:
+            for job_id in self.jobs_by_dataset.pop(dataset_id, ()):
+                waiting_on = self.datasets_by_job.get(job_id)
+                if waiting_on is None:
+                    continue
+                waiting_on.discard(dataset_id)
+                if not waiting_on:
+                    del self.datasets_by_job[job_id]
+                    woken.append(job_id)
+        return woken
+
+
 class JobHandlerStopQueue(Monitors):
     """
     A queue for jobs which need to be terminated prematurely.
@@ -926,6 +1135,7 @@ class JobHandlerStopQueue(Monitors):
                 # tell the dispatcher to stop the job
                 job_wrapper = JobWrapper(job, self, use_persisted_destination=True)
                 self.dispatcher.stop(job, job_wrapper)
+                job_wrapper.unpin_inputs()
 
     def put(self, job_id, error_msg=None):
         if not self.app.config.track_jobs_in_database:
@@ -989,6 +1199,32 @@ class DefaultJobDispatcher(object):
             log.error('put(): (%s) Invalid job runner: %s' % (job_wrapper.job_id, runner_name))
             job_wrapper.fail(DEFAULT_JOB_PUT_FAILURE_MESSAGE)
 
+    def put_many(self, job_wrappers):
+        """
+        Dispatch several jobs, passing all jobs for the same runner in a
+        single call so runners can queue (and possibly submit) them together.
+        """
+        job_wrappers_by_runner = defaultdict(list)
+        for job_wrapper in job_wrappers:
+            try:
+                runner_name = self.__get_runner_name(job_wrapper)
+                if runner_name not in self.job_runners:
+                    log.error('put_many(): (%s) Invalid job runner: %s' % (job_wrapper.job_id, runner_name))
+                    job_wrapper.fail(DEFAULT_JOB_PUT_FAILURE_MESSAGE)
+                    continue
+            except Exception:
+                log.exception('put_many(): (%s) Unable to dispatch job' % job_wrapper.job_id)
+                continue
+            job_wrappers_by_runner[runner_name].append(job_wrapper)
+        dispatched = []
+        for runner_name, runner_job_wrappers in job_wrappers_by_runner.items():
+            log.debug("(%s) Dispatching to %s runner" % (','.join(str(job_wrapper.job_id) for job_wrapper in runner_job_wrappers), runner_name))
+            try:
+                dispatched.extend(self.job_runners[runner_name].put_many(runner_job_wrappers))
+            except Exception:
+                log.exception('put_many(): (%s) Unable to dispatch jobs to %s runner' % (','.join(str(job_wrapper.job_id) for job_wrapper in runner_job_wrappers), runner_name))
+        return dispatched
+
     def stop(self, job, job_wrapper):
         """
         Stop the given job. The input variable job may be either a Job or a Task.
@@ -51,6 +51,10 @@ JOB_RUNNER_PARAMETER_UNKNOWN_MESSAGE = "Invalid job runner parameter for this pl
 JOB_RUNNER_PARAMETER_MAP_PROBLEM_MESSAGE = "Job runner parameter '%s' value '%s' could not be converted to the correct type"
 JOB_RUNNER_PARAMETER_VALIDATION_FAILED_MESSAGE = "Job runner parameter %s failed validation"
 
+# With adaptive polling, jobs are checked at an interval of this fraction of
+# the time they have been watched
+WATCHED_ITEM_POLL_INTERVAL_AGE_RATIO = 0.1
+
 GALAXY_LIB_ADJUST_TEMPLATE = """GALAXY_LIB="%s"; if [ "$GALAXY_LIB" != "None" ]; then if [ -n "$PYTHONPATH" ]; then PYTHONPATH="$GALAXY_LIB:$PYTHONPATH"; else PYTHONPATH="$GALAXY_LIB"; fi; export PYTHONPATH; fi;"""
 GALAXY_VENV_TEMPLATE = """GALAXY_VIRTUAL_ENV="%s"; if [ "$GALAXY_VIRTUAL_ENV" != "None" -a -z "$VIRTUAL_ENV" -a -f "$GALAXY_VIRTUAL_ENV/bin/activate" ]; then . "$GALAXY_VIRTUAL_ENV/bin/activate"; fi;"""
 
@@ -68,7 +72,10 @@ class RunnerParams(ParamsWithSpecs):
 
 
 class BaseJobRunner(object):
-    DEFAULT_SPECS = dict(recheck_missing_job_retries=dict(map=int, valid=lambda x: int(x) >= 0, default=0))
+    DEFAULT_SPECS = dict(
+        recheck_missing_job_retries=dict(map=int, valid=lambda x: int(x) >= 0, default=0),
+        watched_item_max_poll_interval=dict(map=int, valid=lambda x: int(x) >= 0, default=0),
+    )
 
     def __init__(self, app, nworkers, **kwargs):
         """Start the job runner
@@ -119,6 +126,9 @@ class BaseJobRunner(object):
             try:
                 if isinstance(arg, AsynchronousJobState):
                     job_id = arg.job_wrapper.get_id_tag()
+                elif isinstance(arg, list):
+                    # a batch of JobWrappers/TaskWrappers, see put_many()
+                    job_id = ','.join(job_wrapper.get_id_tag() for job_wrapper in arg)
                 else:
                     # arg should be a JobWrapper/TaskWrapper
                     job_id = arg.get_id_tag()
@@ -138,12 +148,26 @@ class BaseJobRunner(object):
                 log.trace(action_timer.to_str(job_id=job_id))
             except Exception:
                 log.exception("(%s) Unhandled exception calling %s" % (job_id, name))
+                if isinstance(arg, list):
+                    for job_wrapper in arg:
+                        if self._submitted(job_wrapper):
+                            # Failing it would leave it running unmonitored
+                            continue
+                        self.work_queue.put((self.fail_job, JobState(job_wrapper=job_wrapper, job_destination={})))
+                    continue
                 if not isinstance(arg, JobState):
                     job_state = JobState(job_wrapper=arg, job_destination={})
                 else:
                     job_state = arg
                 self.work_queue.put((self.fail_job, job_state))
 
+    def _submitted(self, job_wrapper):
+        """Return True if the job of a batch was handed to the external system already."""
+        try:
+            return job_wrapper.get_job().job_runner_external_id is not None
+        except Exception:
+            return False
+
     # Causes a runner's `queue_job` method to be called from a worker thread
     def put(self, job_wrapper):
         """Add a job to the queue (by job identifier), indicate that the job is ready to run.
@@ -156,6 +180,73 @@ class BaseJobRunner(object):
     def mark_as_queued(self, job_wrapper):
         self.work_queue.put((self.queue_job, job_wrapper))
 
+    def put_many(self, job_wrappers):
+        """Add several jobs that are ready to run to the queue, persisting
+        their queued state with a single flush of the session. Jobs that
+        cannot be queued are failed without affecting the others, the jobs
+        queued are returned. If the single flush fails, the jobs are queued
+        (and flushed) one at a time instead.
+        """
+        put_timer = ExecutionTimer()
+        queued_job_wrappers = []
+        for job_wrapper in job_wrappers:
+            try:
+                job_wrapper.enqueue(flush=False)
+            except Exception as e:
+                log.exception("(%s) Unable to queue job" % job_wrapper.get_id_tag())
+                self._fail_unqueued_job(job_wrapper, e)
+                continue
+            queued_job_wrappers.append(job_wrapper)
+        try:
+            self.sa_session.flush()
+        except Exception:
+            log.exception("(%s) Unable to persist the queued state of the jobs, queuing them one at a time"
+                          % ','.join(job_wrapper.get_id_tag() for job_wrapper in queued_job_wrappers))
+            self.sa_session.rollback()
+            queued_job_wrappers = self._enqueue_individually(queued_job_wrappers)
+        self.mark_many_as_queued(queued_job_wrappers)
+        log.debug("Jobs [%s] queued %s" % (','.join(str(job_wrapper.job_id) for job_wrapper in queued_job_wrappers), put_timer))
+        return queued_job_wrappers
+
+    def _enqueue_individually(self, job_wrappers):
+        queued_job_wrappers = []
+        for job_wrapper in job_wrappers:
+            try:
+                job_wrapper.enqueue()
+            except Exception as e:
+                log.exception("(%s) Unable to queue job" % job_wrapper.get_id_tag())
+                self.sa_session.rollback()
+                self._fail_unqueued_job(job_wrapper, e)
+                continue
+            queued_job_wrappers.append(job_wrapper)
+        return queued_job_wrappers
+
+    def _fail_unqueued_job(self, job_wrapper, exception):
+        try:
+            job_wrapper.fail(unicodify(exception) or "Unable to queue job", exception=True)
+        except Exception:
+            log.exception("(%s) Unable to fail job that could not be queued" % job_wrapper.get_id_tag())
+
+    def mark_many_as_queued(self, job_wrappers):
+        """Hand jobs queued by put_many() to the worker threads.
+
+        By default every job is queued on its own, runners able to submit
+        several jobs at once should override this to queue (batches of) the
+        jobs for ``queue_jobs``.
+        """
+        for job_wrapper in job_wrappers:
+            self.mark_as_queued(job_wrapper)
+
+    def queue_jobs(self, job_wrappers):
+        """Submit a batch of jobs, falls back to submitting them one at a time.
+        """
+        for job_wrapper in job_wrappers:
+            try:
+                self.queue_job(job_wrapper)
+            except Exception:
+                log.exception("(%s) Unhandled exception calling queue_job" % job_wrapper.get_id_tag())
+                self.work_queue.put((self.fail_job, JobState(job_wrapper=job_wrapper, job_destination={})))
+
     def shutdown(self):
         """Attempts to gracefully shut down the worker threads
         """
@@ -617,6 +708,9 @@ class AsynchronousJobState(JobState):
         self._running = False
         self.check_count = 0
         self.start_time = None
+        # Used by the monitor thread for adaptive polling
+        self.watch_start_time = None
+        self.last_check_time = None
 
         # job_id is the DRM's job id, not the Galaxy job id
         self.job_id = job_id
@@ -667,9 +761,14 @@ class AsynchronousJobRunner(BaseJobRunner, Monitors):
     thread to monitor the state of asynchronous jobs and submitting those jobs
     to the correct methods (queue, finish, cleanup) at appropriate times..
     """
+    # Runners overriding check_watched_items without get_due_watched_items
+    # check all of their jobs every cycle and should set this to False
+    honors_watched_item_max_poll_interval = True
 
     def __init__(self, app, nworkers, **kwargs):
         super(AsynchronousJobRunner, self).__init__(app, nworkers, **kwargs)
+        if self.runner_params.watched_item_max_poll_interval and not self.honors_watched_item_max_poll_interval:
+            log.warning("%s: the watched_item_max_poll_interval param is not supported by this runner and will be ignored", self.runner_name)
         # 'watched' and 'queue' are both used to keep track of jobs to watch.
         # 'queue' is used to add new watched jobs, and can be called from
         # any thread (usually by the 'queue_job' method). 'watched' must only
@@ -704,10 +803,16 @@ class AsynchronousJobRunner(BaseJobRunner, Monitors):
             except Empty:
                 pass
             # Iterate over the list of watched jobs and check state
+            check_timer = self.app.execution_timer_factory.get_timer(
+                'internals.galaxy.jobs.runners.%s.check_watched_items' % self.__class__.__name__.lower(),
+                '%s checked ${watched_count} watched jobs' % self.runner_name
+            )
+            watched_count = len(self.watched)
             try:
                 self.check_watched_items()
             except Exception:
                 log.exception('Unhandled exception checking active jobs')
+            log.trace(check_timer.to_str(watched_count=watched_count))
             # Sleep a bit before the next state check
             time.sleep(1)
 
@@ -730,8 +835,8 @@ class AsynchronousJobRunner(BaseJobRunner, Monitors):
         initially) or just override check_watched_item and allow the list processing to
         reuse the logic here.
         """
-        new_watched = []
-        for async_job_state in self.watched:
+        due_watched, new_watched = self.get_due_watched_items()
+        for async_job_state in due_watched:
             new_async_job_state = self.check_watched_item(async_job_state)
             if new_async_job_state:
                 new_watched.append(new_async_job_state)
@@ -741,6 +846,42 @@ class AsynchronousJobRunner(BaseJobRunner, Monitors):
     def check_watched_item(self, job_state):
         raise NotImplementedError()
 
+    def get_watched_item_states(self, job_states):
+        """
+        Runners that can query the DRM for the state of many jobs at once
+        should override this to return a dict mapping the external job ids of
+        ``job_states`` to the state reported by the DRM, checking the state of
+        all watched jobs with a single call per monitor cycle. Jobs missing from
+        the dict (or all jobs, if None is returned) are checked individually.
+        """
+        return None
+
+    def get_due_watched_items(self):
+        """
+        Split ``self.watched`` into the jobs that should be checked in this
+        monitor cycle and those that should not. If the
+        ``watched_item_max_poll_interval`` runner param is set, jobs are checked
+        less often the longer they have been watched, up to once every
+        ``watched_item_max_poll_interval`` seconds, otherwise all jobs are
+        checked every cycle.
+        """
+        max_interval = self.runner_params.watched_item_max_poll_interval
+        if not max_interval:
+            return list(self.watched), []
+        now = time.time()
+        due_watched = []
+        not_due_watched = []
+        for async_job_state in self.watched:
+            if async_job_state.watch_start_time is None:
+                async_job_state.watch_start_time = now
+            interval = min(max_interval, (now - async_job_state.watch_start_time) * WATCHED_ITEM_POLL_INTERVAL_AGE_RATIO)
+            if async_job_state.last_check_time is None or now - async_job_state.last_check_time >= interval:
+                async_job_state.last_check_time = now
+                due_watched.append(async_job_state)
+            else:
+                not_due_watched.append(async_job_state)
+        return due_watched, not_due_watched
+
     def finish_job(self, job_state):
         """
         Get the output/error for a finished job, pass to `job_wrapper.finish`
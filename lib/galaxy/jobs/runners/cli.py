@@ -4,6 +4,7 @@ Job control via a command line interface (e.g. qsub/qstat), possibly over a remo
 
 import logging
 import time
+from collections import OrderedDict
 
 from galaxy import model
 from galaxy.jobs import JobDestination
@@ -20,6 +21,9 @@ __all__ = ('ShellJobRunner', )
 
 DEFAULT_EMBED_METADATA_IN_JOB = True
 MAX_SUBMIT_RETRY = 3
+# Maximum number of jobs submitted with a single shell command
+MAX_SUBMIT_BATCH_SIZE = 50
+SUBMIT_RESULT_MARKER = "__GALAXY_SUBMIT_RESULT__"
 
 
 class ShellJobRunner(AsynchronousJobRunner):
@@ -27,6 +31,7 @@ class ShellJobRunner(AsynchronousJobRunner):
     Job runner backed by a finite pool of worker threads. FIFO scheduling
     """
     runner_name = "ShellRunner"
+    honors_watched_item_max_poll_interval = False
 
     def __init__(self, app, nworkers):
         """Start the job runner """
@@ -56,10 +61,87 @@ class ShellJobRunner(AsynchronousJobRunner):
 
     def queue_job(self, job_wrapper):
         """Create job script and submit it to the DRM"""
+        submission = self._prepare_submission(job_wrapper)
+        if submission is None:
+            return
+        ajs, shell, job_interface = submission
+        returncode, stdout = self.submit(shell, job_interface, ajs.job_file, job_wrapper.get_id_tag(), retry=MAX_SUBMIT_RETRY)
+        self._handle_submission(ajs, returncode, stdout)
+
+    def mark_many_as_queued(self, job_wrappers):
+        # Jobs for the same destination share shell and job plugins and can
+        # be submitted together, see queue_jobs()
+        job_wrappers_by_destination = OrderedDict()
+        for job_wrapper in job_wrappers:
+            job_destination = job_wrapper.job_destination
+            key = (job_destination.id, str(sorted(job_destination.params.items())))
+            job_wrappers_by_destination.setdefault(key, []).append(job_wrapper)
+        for destination_job_wrappers in job_wrappers_by_destination.values():
+            for i in range(0, len(destination_job_wrappers), MAX_SUBMIT_BATCH_SIZE):
+                self.work_queue.put((self.queue_jobs, destination_job_wrappers[i:i + MAX_SUBMIT_BATCH_SIZE]))
+
+    def queue_jobs(self, job_wrappers):
+        """Create job scripts for several jobs (with the same destination) and
+        submit them to the DRM with a single shell command.
+        """
+        submissions = []
+        for job_wrapper in job_wrappers:
+            try:
+                submission = self._prepare_submission(job_wrapper)
+            except Exception:
+                # Only this job is failed, the others are still submitted
+                log.exception("(%s) Unhandled exception preparing job" % job_wrapper.get_id_tag())
+                self.work_queue.put((self.fail_job, JobState(job_wrapper=job_wrapper, job_destination={})))
+                continue
+            if submission is not None:
+                submissions.append(submission)
+        if not submissions:
+            return
+        _, shell, job_interface = submissions[0]
+        cmd = '; '.join('%s; echo "%s $?"' % (job_interface.submit(ajs.job_file), SUBMIT_RESULT_MARKER) for ajs, _, _ in submissions)
+        try:
+            cmd_out = shell.execute(cmd, timeout=60 + len(submissions))
+        except Exception:
+            # Handled below like a batch that did not report any result
+            log.exception("(%s) Unhandled exception submitting batch"
+                          % ','.join(ajs.job_wrapper.get_id_tag() for ajs, _, _ in submissions))
+            cmd_out = None
+        results = []
+        stdout_lines = []
+        for line in ((cmd_out and cmd_out.stdout) or '').splitlines():
+            if line.startswith(SUBMIT_RESULT_MARKER):
+                results.append((int(line.split()[-1]), '\n'.join(stdout_lines)))
+                stdout_lines = []
+            else:
+                stdout_lines.append(line)
+        for i, (ajs, shell, job_interface) in enumerate(submissions):
+            galaxy_id_tag = ajs.job_wrapper.get_id_tag()
+            if i >= len(results):
+                # The batch ended (e.g. timed out) before reporting the result
+                # of this job, which may have been submitted already and would
+                # run twice if it was submitted again
+                log.error("(%s) batch submission did not report whether the job was submitted, failing job" % galaxy_id_tag)
+                ajs.job_wrapper.fail("failure submitting job, the submission could not be confirmed")
+                continue
+            returncode, stdout = results[i]
+            try:
+                if returncode != 0:
+                    log.debug("(%s) batch submission failed, submitting individually" % galaxy_id_tag)
+                    returncode, stdout = self.submit(shell, job_interface, ajs.job_file, galaxy_id_tag, retry=MAX_SUBMIT_RETRY)
+                self._handle_submission(ajs, returncode, stdout)
+            except Exception:
+                log.exception("(%s) Unhandled exception handling the submission of job" % galaxy_id_tag)
+                self.work_queue.put((self.fail_job, JobState(job_wrapper=ajs.job_wrapper, job_destination={})))
+
+    def _prepare_submission(self, job_wrapper):
+        """Prepare the job and write its job script, returns the job state and
+        the shell and job plugins to submit it with or None if the job should
+        not be submitted.
+        """
         # prepare the job
         include_metadata = asbool(job_wrapper.job_destination.params.get("embed_metadata_in_job", DEFAULT_EMBED_METADATA_IN_JOB))
         if not self.prepare_job(job_wrapper, include_metadata=include_metadata):
-            return
+            return None
 
         # Get shell and job execution interface
         job_destination = job_wrapper.job_destination
@@ -85,24 +167,27 @@ class ShellJobRunner(AsynchronousJobRunner):
         except Exception:
             log.exception("(%s) failure writing job script" % galaxy_id_tag)
             job_wrapper.fail("failure preparing job script", exception=True)
-            return
+            return None
 
         # job was deleted while we were preparing it
         if job_wrapper.get_state() == model.Job.states.DELETED:
             log.info("(%s) Job deleted by user before it entered the queue" % galaxy_id_tag)
             if job_wrapper.cleanup_job in ("always", "onsuccess"):
                 job_wrapper.cleanup()
-            return
+            return None
 
         log.debug("(%s) submitting file: %s" % (galaxy_id_tag, ajs.job_file))
+        return ajs, shell, job_interface
 
-        returncode, stdout = self.submit(shell, job_interface, ajs.job_file, galaxy_id_tag, retry=MAX_SUBMIT_RETRY)
+    def _handle_submission(self, ajs, returncode, stdout):
+        job_wrapper = ajs.job_wrapper
+        galaxy_id_tag = job_wrapper.get_id_tag()
         if returncode != 0:
             job_wrapper.fail("failure submitting job")
             return
         # Some job runners return something like 'Submitted batch job XXXX'
         # Strip and split to get job ID.
-        external_job_id = stdout.strip().split()[-1]
+        external_job_id = stdout.strip().split()[-1] if stdout.strip() else None
         if not external_job_id:
             log.error('(%s) submission did not return a job identifier, failing job' % galaxy_id_tag)
             job_wrapper.fail("failure submitting job")
@@ -111,6 +196,7 @@ class ShellJobRunner(AsynchronousJobRunner):
         log.info("(%s) queued with identifier: %s" % (galaxy_id_tag, external_job_id))
 
         # store runner information for tracking if Galaxy restarts
+        job_destination = job_wrapper.job_destination
         job_wrapper.set_job_destination(job_destination, external_job_id)
 
         # Store state information for job
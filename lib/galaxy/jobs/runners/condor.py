@@ -50,6 +50,7 @@ class CondorJobRunner(AsynchronousJobRunner):
     Job runner backed by a finite pool of worker threads. FIFO scheduling
     """
     runner_name = "CondorRunner"
+    honors_watched_item_max_poll_interval = False
 
     def __init__(self, app, nworkers):
         """Initialize this job runner and start the monitor thread"""
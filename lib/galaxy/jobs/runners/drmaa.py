@@ -277,9 +277,7 @@ class DRMAAJobRunner(AsynchronousJobRunner):
         try:
             assert external_job_id not in (None, 'None'), '(%s/%s) Invalid job id' % (galaxy_id_tag, external_job_id)
             state = self.ds.job_status(external_job_id)
-            # Reset exception retries
-            for retry_exception in RETRY_EXCEPTIONS_LOWER:
-                setattr(ajs, retry_exception + '_retries', 0)
+            self._reset_exception_retries(ajs)
         except (drmaa.InternalException, drmaa.InvalidJobException) as e:
             ecn = type(e).__name__
             retry_param = ecn.lower() + '_retries'
@@ -314,17 +312,31 @@ class DRMAAJobRunner(AsynchronousJobRunner):
             return None
         return state
 
+    def _reset_exception_retries(self, ajs):
+        for retry_exception in RETRY_EXCEPTIONS_LOWER:
+            setattr(ajs, retry_exception + '_retries', 0)
+
     def check_watched_items(self):
         """
         Called by the monitor thread to look at each watched job and deal
         with state changes.
+
+        The DRMAA API only reports the status of one job at a time, so
+        ``get_watched_item_states`` is left to subclasses for DRMs with a
+        command listing many jobs (e.g. squeue for Slurm). Other DRMs are
+        polled job by job, only for the jobs due in this cycle.
         """
-        new_watched = []
-        for ajs in self.watched:
+        due_watched, new_watched = self.get_due_watched_items()
+        job_states = self.get_watched_item_states(due_watched) or {}
+        for ajs in due_watched:
             external_job_id = ajs.job_id
             galaxy_id_tag = ajs.job_wrapper.get_id_tag()
             old_state = ajs.old_state
-            state = self.check_watched_item(ajs, new_watched)
+            if external_job_id in job_states:
+                state = job_states[external_job_id]
+                self._reset_exception_retries(ajs)
+            else:
+                state = self.check_watched_item(ajs, new_watched)
             if state is None:
                 continue
             if state != old_state:
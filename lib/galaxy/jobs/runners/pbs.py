@@ -90,6 +90,7 @@ class PBSJobRunner(AsynchronousJobRunner):
     Job runner backed by a finite pool of worker threads. FIFO scheduling
     """
     runner_name = "PBSRunner"
+    honors_watched_item_max_poll_interval = False
 
     def __init__(self, app, nworkers):
         """Start the job runner """
@@ -9,6 +9,7 @@ import tempfile
 import time
 
 from galaxy import model
+from galaxy.jobs.runners import drmaa as drmaa_runner
 from galaxy.jobs.runners.drmaa import DRMAAJobRunner
 from galaxy.util import unicodify
 from galaxy.util.logging import get_logger
@@ -43,6 +44,55 @@ class SlurmJobRunner(DRMAAJobRunner):
     runner_name = "SlurmRunner"
     restrict_job_name_length = False
 
+    def get_watched_item_states(self, job_states):
+        """
+        Get the states of all queued and running jobs with a single ``squeue``
+        call per cluster. Jobs that are no longer listed by squeue (e.g.
+        because they are finished) are left to the individual DRMAA check.
+        """
+        drmaa_job_state = drmaa_runner.drmaa.JobState
+        squeue_states = {
+            'PD': drmaa_job_state.QUEUED_ACTIVE,
+            'CF': drmaa_job_state.QUEUED_ACTIVE,
+            'R': drmaa_job_state.RUNNING,
+            'CG': drmaa_job_state.RUNNING,
+            'S': drmaa_job_state.SYSTEM_SUSPENDED,
+        }
+        job_ids_by_cluster = {}
+        for ajs in job_states:
+            if ajs.job_id in (None, 'None'):
+                continue
+            if '.' in ajs.job_id:
+                # custom slurm-drmaa-with-cluster-support job id syntax
+                job_id, cluster = ajs.job_id.split('.', 1)
+            else:
+                job_id, cluster = ajs.job_id, None
+            job_ids_by_cluster.setdefault(cluster, {})[job_id] = ajs.job_id
+        rval = {}
+        for cluster, external_job_ids in job_ids_by_cluster.items():
+            cmd = ['squeue', '-h', '-o', '%i %t']
+            if cluster:
+                cmd.extend(['-M', cluster])
+            cmd.extend(['-j', ','.join(external_job_ids)])
+            try:
+                p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                stdout, stderr = p.communicate()
+            except Exception:
+                log.exception('Unable to run `%s`, checking jobs individually', cmd[0])
+                return rval
+            if p.returncode != 0:
+                log.debug('`squeue` returned %s, checking jobs individually, stderr: %s', p.returncode, unicodify(stderr).strip())
+                continue
+            for line in unicodify(stdout).splitlines():
+                fields = line.split()
+                # with -M a 'CLUSTER: name' header line is printed first
+                if len(fields) != 2 or fields[0] not in external_job_ids:
+                    continue
+                state = squeue_states.get(fields[1])
+                if state is not None:
+                    rval[external_job_ids[fields[0]]] = state
+        return rval
+
     def _complete_terminal_job(self, ajs, drmaa_state, **kwargs):
         def _get_slurm_state_with_sacct(job_id, cluster):
             cmd = ['sacct', '-n', '-o', 'state%-32']
@@ -8,6 +8,8 @@ import gettext
 import logging
 import os
 
+from sqlalchemy import inspect
+
 from galaxy import (
     datatypes,
     exceptions,
@@ -144,7 +146,7 @@ class HDAManager(datasets.DatasetAssociationManager,
         super(HDAManager, self).purge(hda, flush=flush)
         # decrease the user's space used
         if quota_amount_reduction:
-            user.adjust_total_disk_usage(-quota_amount_reduction)
+            user.adjust_total_disk_usage(-quota_amount_reduction, hda.dataset.object_store_id)
         return hda
 
     # .... states
@@ -162,6 +164,11 @@ class HDAManager(datasets.DatasetAssociationManager,
         Return True if the hda's job was resubmitted at any point.
         """
         job_states = model.Job.states
+        if 'creating_job_associations' not in inspect(hda).unloaded:
+            # the creating jobs were loaded along with the hda (e.g. by the history contents manager)
+            return any(state_history.state == job_states.RESUBMITTED
+                       for job_association in hda.creating_job_associations
+                       for state_history in job_association.job.state_history)
         query = (self._job_state_history_query(hda)
                  .filter(model.JobStateHistory.state == job_states.RESUBMITTED))
         return self.app.model.context.query(query.exists()).scalar()
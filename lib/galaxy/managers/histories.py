@@ -251,12 +251,11 @@ class HistorySerializer(sharable.SharableModelSerializer, deletable.PurgableSeri
 
             'empty'         : lambda i, k, **c: (len(i.datasets) + len(i.dataset_collections)) <= 0,
             'count'         : lambda i, k, **c: len(i.datasets),
-            'hdas'          : lambda i, k, **c: [self.app.security.encode_id(hda.id) for hda in i.datasets],
+            'hdas'          : lambda i, k, **c: self.app.security.encode_ids([hda.id for hda in i.datasets]),
             'state_details' : self.serialize_state_counts,
             'state_ids'     : self.serialize_state_ids,
             'contents'      : self.serialize_contents,
-            'non_ready_jobs': lambda i, k, **c: [self.app.security.encode_id(job.id) for job
-                                                 in self.manager.non_ready_jobs(i)],
+            'non_ready_jobs': lambda i, k, **c: self.app.security.encode_ids([job.id for job in self.manager.non_ready_jobs(i)]),
 
             'contents_states': self.serialize_contents_states,
             'contents_active': self.serialize_contents_active,
@@ -276,9 +275,10 @@ class HistorySerializer(sharable.SharableModelSerializer, deletable.PurgableSeri
             state_ids[state] = []
 
         # TODO:?? collections and coll. states?
-        for hda in history.datasets:
-            # TODO: do not encode ids at this layer
-            encoded_id = self.app.security.encode_id(hda.id)
+        hdas = history.datasets
+        # TODO: do not encode ids at this layer
+        encoded_ids = self.app.security.encode_ids([hda.id for hda in hdas])
+        for hda, encoded_id in zip(hdas, encoded_ids):
             state_ids[hda.state].append(encoded_id)
         return state_ids
 
@@ -2,7 +2,10 @@
 Heterogenous lists/contents are difficult to query properly since unions are
 not easily made.
 """
+import datetime
 import logging
+import threading
+from collections import OrderedDict
 
 from sqlalchemy import (
     asc,
@@ -10,11 +13,13 @@ from sqlalchemy import (
     false,
     func,
     literal,
+    or_,
     sql,
     true
 )
 from sqlalchemy.orm import (
     eagerload,
+    selectinload,
     undefer
 )
 
@@ -32,9 +37,16 @@ from galaxy.managers import (
     taggable,
     tools
 )
+from galaxy.model.orm.now import now
 
 log = logging.getLogger(__name__)
 
+#: how far back before the start of a changes poll the next poll looks for changes, so
+#  that changes flushed just before but committed after the poll are not missed
+CHANGES_OVERLAP = datetime.timedelta(seconds=5)
+#: the number of histories the aggregate counts are cached for
+COUNTS_CACHE_SIZE = 1000
+
 
 # into its own class to have it's own filters, etc.
 # TODO: but can't inherit from model manager (which assumes only one model)
@@ -76,6 +88,9 @@ class HistoryContentsManager(containers.ContainerManagerMixin):
         self.app = app
         self.contained_manager = self.contained_class_manager_class(app)
         self.subcontainer_manager = self.subcontainer_class_manager_class(app)
+        # history id -> (contents version, state counts, active counts)
+        self._counts = OrderedDict()
+        self._counts_lock = threading.Lock()
 
     # ---- interface
     def contained(self, container, filters=None, limit=None, offset=None, order_by=None, **kwargs):
@@ -99,6 +114,13 @@ class HistoryContentsManager(containers.ContainerManagerMixin):
     def contents(self, container, filters=None, limit=None, offset=None, order_by=None, **kwargs):
         """
         Returns a list of both/all types of contents, filtered and in some order.
+
+        Pass `expand_details=True` to also load what the detailed views of the
+        contents serializers need, so that serializing the contents doesn't
+        query the database for every item.
+
+        Pass `since` (a datetime) to only return the contents updated since
+        then.
         """
         # TODO?: we could branch here based on 'if limit is None and offset is None' - to a simpler (non-union) query
         # for now, I'm just using this (even for non-limited/offset queries) to reduce code paths
@@ -182,6 +204,65 @@ class HistoryContentsManager(containers.ContainerManagerMixin):
                 returned['active'] += count
         return returned
 
+    def changes_token(self, history):
+        """
+        Return the latest update time of the contents of `history` (None if
+        it has no contents), to tell whether its contents changed.
+        """
+        session = self._session()
+        contained_class = self.contained_class
+        subcontainer_class = self.subcontainer_class
+        update_times = [session.query(func.max(contained_class.update_time))
+            .filter(contained_class.history_id == history.id).scalar()]
+        update_times.extend(session.query(func.max(subcontainer_class.update_time), func.max(model.DatasetCollection.update_time))
+            .join(model.DatasetCollection, model.DatasetCollection.id == subcontainer_class.collection_id)
+            .filter(subcontainer_class.history_id == history.id).one())
+        update_times = [update_time for update_time in update_times if update_time is not None]
+        return max(update_times) if update_times else None
+
+    def next_since(self):
+        """
+        Return the `since` for the poll following the current one, to be
+        called before looking for changes.
+
+        This is `CHANGES_OVERLAP` before the current time, so contents changed
+        shortly before a poll are returned again by the next poll and pollers
+        may receive the same contents twice.  Update times are set by the
+        clocks of the Galaxy processes, which is also used here.
+        """
+        return now() - CHANGES_OVERLAP
+
+    def changed_since(self, history, since, **kwargs):
+        """
+        Return the contents of `history` that changed since `since`, a value
+        returned by `next_since` for a previous poll.
+
+        Uses the same kwargs as `contents` above.
+        """
+        return self.contents(history, since=since, **kwargs)
+
+    def cached_counts(self, history, changes_token):
+        """
+        Return the `state_counts` and `active_counts` of `history`.
+
+        These are only counted again when the update time of `history` or
+        the `changes_token` of its contents changed since they were last
+        counted.
+        """
+        version = (history.update_time, changes_token)
+        with self._counts_lock:
+            cached = self._counts.pop(history.id, None)
+            if cached is not None and cached[0] == version:
+                self._counts[history.id] = cached
+                return cached[1], cached[2]
+        state_counts = self.state_counts(history)
+        active_counts = self.active_counts(history)
+        with self._counts_lock:
+            self._counts[history.id] = (version, state_counts, active_counts)
+            while len(self._counts) > COUNTS_CACHE_SIZE:
+                self._counts.popitem(last=False)
+        return state_counts, active_counts
+
     def map_datasets(self, history, fn, **kwargs):
         """
         Iterate over the datasets of a given history, recursing into collections, and
@@ -213,10 +294,14 @@ class HistoryContentsManager(containers.ContainerManagerMixin):
     def _get_filter_for_contained(self, container, content_class):
         return content_class.history == container
 
-    def _union_of_contents(self, container, expand_models=True, **kwargs):
+    def _union_of_contents(self, container, expand_models=True, expand_details=False, **kwargs):
         """
         Returns a limited and offset list of both types of contents, filtered
         and in some order.
+
+        The number of queries is fixed, whatever the number of contents: one
+        for the union, one for each content class and one for each of the
+        collections eager loaded with them.
         """
         contents_results = self._union_of_contents_query(container, **kwargs).all()
         if not expand_models:
@@ -234,9 +319,9 @@ class HistoryContentsManager(containers.ContainerManagerMixin):
 
         # query 2 & 3: use the ids to query each component_class, returning an id->full component model map
         contained_ids = id_map[self.contained_class_type_name]
-        id_map[self.contained_class_type_name] = self._contained_id_map(contained_ids)
+        id_map[self.contained_class_type_name] = self._contained_id_map(contained_ids, expand_details=expand_details)
         subcontainer_ids = id_map[self.subcontainer_class_type_name]
-        id_map[self.subcontainer_class_type_name] = self._subcontainer_id_map(subcontainer_ids)
+        id_map[self.subcontainer_class_type_name] = self._subcontainer_id_map(subcontainer_ids, expand_details=expand_details)
 
         # cycle back over the union query to create an ordered list of the objects returned in queries 2 & 3 above
         contents = []
@@ -265,6 +350,7 @@ class HistoryContentsManager(containers.ContainerManagerMixin):
                                  offset=None,
                                  order_by=None,
                                  user_id=None,
+                                 since=None,
                                  **kwargs):
         """
         Returns a query for a limited and offset list of both types of contents,
@@ -284,9 +370,9 @@ class HistoryContentsManager(containers.ContainerManagerMixin):
 
         # query 1: create a union of common columns for which the component_classes can be filtered/limited
         contained_query = self._contents_common_query_for_contained(history_id=container.id if container else None,
-                                                                    user_id=user_id)
+                                                                    user_id=user_id, since=since)
         subcontainer_query = self._contents_common_query_for_subcontainer(history_id=container.id if container else None,
-                                                                          user_id=user_id)
+                                                                          user_id=user_id, since=since)
 
         filters = filters or []
         # Apply filters that are specific to a model
@@ -322,7 +408,7 @@ class HistoryContentsManager(containers.ContainerManagerMixin):
             columns.append(column)
         return columns
 
-    def _contents_common_query_for_contained(self, history_id, user_id):
+    def _contents_common_query_for_contained(self, history_id, user_id, since=None):
         component_class = self.contained_class
         # TODO: and now a join with Dataset - this is getting sad
         columns = self._contents_common_columns(component_class,
@@ -342,9 +428,12 @@ class HistoryContentsManager(containers.ContainerManagerMixin):
             # TODO: move into filter mixin, and implement accessible logic as SQL query
             subquery = subquery.filter(component_class.history_id == model.History.table.c.id,
                                        model.History.table.c.user_id == user_id)
+        if since is not None:
+            # filtered here rather than on the union to use the (history_id, update_time) index
+            subquery = subquery.filter(component_class.update_time >= since)
         return subquery
 
-    def _contents_common_query_for_subcontainer(self, history_id, user_id):
+    def _contents_common_query_for_subcontainer(self, history_id, user_id, since=None):
         component_class = self.subcontainer_class
         columns = self._contents_common_columns(component_class,
             history_content_type=literal('dataset_collection'),
@@ -367,6 +456,10 @@ class HistoryContentsManager(containers.ContainerManagerMixin):
         else:
             subquery = subquery.filter(component_class.history_id == model.History.table.c.id,
                                        model.History.table.c.user_id == user_id)
+        if since is not None:
+            # the populated state of collections is updated on the inner collection
+            subquery = subquery.filter(or_(component_class.update_time >= since,
+                                           model.DatasetCollection.update_time >= since))
         return subquery
 
     def _get_union_type(self, union):
@@ -377,7 +470,7 @@ class HistoryContentsManager(containers.ContainerManagerMixin):
         """Return the id for this row in the union results"""
         return union[2]
 
-    def _contained_id_map(self, id_list):
+    def _contained_id_map(self, id_list, expand_details=False):
         """Return an id to model map of all contained-type models in the id_list."""
         if not id_list:
             return []
@@ -388,9 +481,12 @@ class HistoryContentsManager(containers.ContainerManagerMixin):
             .options(eagerload('dataset.actions'))
             .options(eagerload('tags'))
             .options(eagerload('annotations')))
+        if expand_details:
+            # creating_job, rerunnable and resubmitted
+            query = query.options(selectinload('creating_job_associations').joinedload('job').selectinload('state_history'))
         return dict((row.id, row) for row in query.all())
 
-    def _subcontainer_id_map(self, id_list):
+    def _subcontainer_id_map(self, id_list, expand_details=False):
         """Return an id to model map of all subcontainer-type models in the id_list."""
         if not id_list:
             return []
@@ -400,6 +496,11 @@ class HistoryContentsManager(containers.ContainerManagerMixin):
             .options(eagerload('collection'))
             .options(eagerload('tags'))
             .options(eagerload('annotations')))
+        if expand_details:
+            # the elements and their datasets, only the first level of nested collections is loaded eagerly
+            elements = eagerload('collection').selectinload('elements')
+            query = query.options(elements.joinedload('hda').selectinload('tags'))
+            query = query.options(elements.joinedload('child_collection'))
         return dict((row.id, row) for row in query.all())
 
 
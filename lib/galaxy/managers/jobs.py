@@ -1,10 +1,10 @@
+import hashlib
 import json
 import logging
 
 from boltons.iterutils import remap
 from six import string_types
 from sqlalchemy import and_, false, func, or_
-from sqlalchemy.orm import aliased
 from sqlalchemy.sql import select
 
 from galaxy import model
@@ -18,31 +18,90 @@ from galaxy.managers.datasets import DatasetManager
 from galaxy.managers.hdas import HDAManager
 from galaxy.managers.lddas import LDDAManager
 from galaxy.util import (
-    defaultdict,
     ExecutionTimer,
     listify,
 )
 
 log = logging.getLogger(__name__)
 
+# Parameters tool actions record for jobs next to the tool's own parameters
+FINGERPRINT_IGNORED_PARAMETERS = {'chromInfo', 'dbkey'}
 
-def get_path_key(path_tuple):
-    path_key = ""
-    tuple_elements = len(path_tuple)
-    for i, p in enumerate(path_tuple):
-        if isinstance(p, int):
-            sep = '_'
-        else:
-            sep = '|'
-        if i == (tuple_elements - 2) and p == 'values':
-            # dataset inputs are always wrapped in lists. To avoid 'rep_factorName_0|rep_factorLevel_2|countsFile|values_0',
-            # we remove the last 2 items of the path tuple (values and list index)
-            return path_key
-        if path_key:
-            path_key = "%s%s%s" % (path_key, sep, p)
-        else:
-            path_key = p
-    return path_key
+
+def get_input_identity(sa_session, src, id):
+    """
+    Return what identifies the data behind the input reference ``src``/``id``
+    of a job, so that jobs run on copies of the same data can be matched, or
+    ``None`` if the reference cannot be identified.
+    """
+    if src == 'hda':
+        hda = sa_session.query(model.HistoryDatasetAssociation).get(id)
+        if hda is not None:
+            return ['dataset', hda.dataset_id]
+    elif src == 'hdca':
+        hdca = sa_session.query(model.HistoryDatasetCollectionAssociation).get(id)
+        if hdca is not None:
+            return ['hdca', _original_hdca(hdca).id]
+    elif src == 'ldda':
+        return ['ldda', id]
+    return None
+
+
+def _original_hdca(hdca):
+    while hdca.copied_from_history_dataset_collection_association is not None:
+        hdca = hdca.copied_from_history_dataset_collection_association
+    return hdca
+
+
+def job_fingerprint(sa_session, tool_id, tool_version, param_dump, identifiers=()):
+    """
+    Return a digest of running ``tool_id`` at ``tool_version`` with the
+    parameters ``param_dump`` (as returned by ``params_to_strings`` with
+    ``nested=True``) on inputs with the element ``identifiers``, or ``None``
+    if an input cannot be identified.
+
+    Input references are replaced by the identity of their data (see
+    ``get_input_identity``), so that jobs run on copies of the same data
+    share a fingerprint. Parameters starting with ``__`` (e.g. job resource
+    selections) do not change the results of jobs and are left out.
+    """
+    unidentified = []
+
+    def canonical(value):
+        if isinstance(value, dict):
+            if 'src' in value and 'id' in value:
+                identity = get_input_identity(sa_session, value['src'], value['id'])
+                if identity is None:
+                    unidentified.append(value)
+                return identity
+            return {k: canonical(v) for k, v in value.items()}
+        elif isinstance(value, (list, tuple)):
+            return [canonical(v) for v in value]
+        return value
+
+    params = canonical({k: v for k, v in param_dump.items() if not k.startswith('__')})
+    if unidentified:
+        return None
+    key = json.dumps([tool_id, str(tool_version), params, sorted(set(identifiers))], sort_keys=True)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def fingerprint_job(sa_session, job):
+    """
+    Return the fingerprint (see ``job_fingerprint``) of ``job`` computed
+    from its recorded parameters, or ``None`` if it cannot be computed.
+    """
+    param_dump = {}
+    identifiers = []
+    try:
+        for parameter in job.parameters:
+            if parameter.name.endswith('|__identifier__'):
+                identifiers.append(json.loads(parameter.value))
+            elif parameter.name not in FINGERPRINT_IGNORED_PARAMETERS:
+                param_dump[parameter.name] = json.loads(parameter.value)
+    except (TypeError, ValueError):
+        return None
+    return job_fingerprint(sa_session, job.tool_id, job.tool_version, param_dump, identifiers)
 
 
 class JobManager(object):
@@ -89,12 +148,11 @@ class JobSearch(object):
     def by_tool_input(self, trans, tool_id, tool_version, param=None, param_dump=None, job_state='ok'):
         """Search for jobs producing same results using the 'inputs' part of a tool POST."""
         user = trans.user
-        input_data = defaultdict(list)
+        input_data = []
 
         def populate_input_data_input_id(path, key, value):
             """Traverses expanded incoming using remap and collects input_ids and input_data."""
             if key == 'id':
-                path_key = get_path_key(path[:-2])
                 current_case = param_dump
                 for p in path:
                     current_case = current_case[p]
@@ -106,42 +164,29 @@ class JobSearch(object):
                     if isinstance(current_case, (list, dict)):
                         current_case = current_case[p]
                 identifier = getattr(current_case, "element_identifier", None)
-                input_data[path_key].append({'src': src,
-                                             'id': value,
-                                             'identifier': identifier,
-                                             })
-                return key, "__id_wildcard__"
+                input_data.append({'src': src,
+                                   'id': value,
+                                   'identifier': identifier,
+                                   })
             return key, value
 
-        wildcard_param_dump = remap(param_dump, visit=populate_input_data_input_id)
-        return self.__search(tool_id=tool_id,
-                             tool_version=tool_version,
+        remap(param_dump, visit=populate_input_data_input_id)
+        identifiers = [i['identifier'] for i in input_data if i['identifier'] is not None]
+        fingerprint = job_fingerprint(self.sa_session, tool_id, tool_version, param_dump, identifiers)
+        if fingerprint is None:
+            return None
+        return self.__search(fingerprint=fingerprint,
                              user=user,
                              input_data=input_data,
-                             job_state=job_state,
-                             param_dump=param_dump,
-                             wildcard_param_dump=wildcard_param_dump)
+                             job_state=job_state)
 
-    def __search(self, tool_id, tool_version, user, input_data, job_state=None, param_dump=None, wildcard_param_dump=None):
+    def __search(self, fingerprint, user, input_data, job_state=None):
         search_timer = ExecutionTimer()
-
-        def replace_dataset_ids(path, key, value):
-            """Exchanges dataset_ids (HDA, LDA, HDCA, not Dataset) in param_dump with dataset ids used in job."""
-            if key == 'id':
-                current_case = param_dump
-                for p in path:
-                    current_case = current_case[p]
-                src = current_case['src']
-                value = job_input_ids[src][value]
-                return key, value
-            return key, value
-
-        conditions = [and_(model.Job.tool_id == tool_id,
+        # The fingerprint covers the tool, its parameters and the identity of
+        # the input data, see ``job_fingerprint``.
+        conditions = [and_(model.Job.fingerprint == fingerprint,
                            model.Job.user == user)]
 
-        if tool_version:
-            conditions.append(model.Job.tool_version == str(tool_version))
-
         if job_state is None:
             conditions.append(
                 model.Job.state.in_([model.Job.states.NEW,
@@ -161,150 +206,65 @@ class JobSearch(object):
                     or_(*o)
                 )
 
-        # We now build the query filters that relate to the input datasets
-        # that this job uses. We keep track of the requested dataset id in `requested_ids`,
-        # the type (hda, hdca or lda) in `data_types`
-        # and the ids that have been used in the job that has already been run in `used_ids`.
-        requested_ids = []
-        data_types = []
-        used_ids = []
-        for k, input_list in input_data.items():
-            for type_values in input_list:
-                t = type_values['src']
-                v = type_values['id']
-                requested_ids.append(v)
-                data_types.append(t)
-                identifier = type_values['identifier']
-                if t == 'hda':
-                    a = aliased(model.JobToInputDatasetAssociation)
-                    b = aliased(model.HistoryDatasetAssociation)
-                    c = aliased(model.HistoryDatasetAssociation)
-                    d = aliased(model.JobParameter)
-                    e = aliased(model.HistoryDatasetAssociationHistory)
-                    conditions.append(and_(
-                        model.Job.id == a.job_id,
-                        a.name == k,
-                        a.dataset_id == b.id,  # b is the HDA use for the job
-                        c.dataset_id == b.dataset_id,
-                        c.id == v,  # c is the requested job input HDA
-                        # We need to make sure that the job we are looking for has been run with identical inputs.
-                        # Here we deal with 3 requirements:
-                        #  - the jobs' input dataset (=b) version is 0, meaning the job's input dataset is not yet ready
-                        #  - b's update_time is older than the job create time, meaning no changes occurred
-                        #  - the job has a dataset_version recorded, and that versions' metadata matches c's metadata.
-                        or_(
-                            and_(or_(a.dataset_version.in_([0, b.version]),
-                                     b.update_time < model.Job.create_time),
-                                 b.name == c.name,
-                                 b.extension == c.extension,
-                                 b.metadata == c.metadata,
-                                 ),
-                            and_(b.id == e.history_dataset_association_id,
-                                 a.dataset_version == e.version,
-                                 e.name == c.name,
-                                 e.extension == c.extension,
-                                 e._metadata == c._metadata,
-                                 ),
-                        ),
-                        or_(b.deleted == false(), c.deleted == false())
-                    ))
-                    if identifier:
-                        conditions.append(and_(model.Job.id == d.job_id,
-                                             d.name == "%s|__identifier__" % k,
-                                             d.value == json.dumps(identifier)))
-                    used_ids.append(a.dataset_id)
-                elif t == 'ldda':
-                    a = aliased(model.JobToInputLibraryDatasetAssociation)
-                    conditions.append(and_(
-                        model.Job.id == a.job_id,
-                        a.name == k,
-                        a.ldda_id == v
-                    ))
-                    used_ids.append(a.ldda_id)
-                elif t == 'hdca':
-                    a = aliased(model.JobToInputDatasetCollectionAssociation)
-                    b = aliased(model.HistoryDatasetCollectionAssociation)
-                    c = aliased(model.HistoryDatasetCollectionAssociation)
-                    conditions.append(and_(
-                        model.Job.id == a.job_id,
-                        a.name == k,
-                        b.id == a.dataset_collection_id,
-                        c.id == v,
-                        b.name == c.name,
-                        or_(and_(b.deleted == false(), b.id == v),
-                            and_(or_(c.copied_from_history_dataset_collection_association_id == b.id,
-                                     b.copied_from_history_dataset_collection_association_id == c.id),
-                                 c.deleted == false(),
-                                 )
-                            )
-                    ))
-                    used_ids.append(a.dataset_collection_id)
-                else:
-                    return []
-
-        for k, v in wildcard_param_dump.items():
-            wildcard_value = json.dumps(v, sort_keys=True).replace('"id": "__id_wildcard__"', '"id": %')
-            a = aliased(model.JobParameter)
-            conditions.append(and_(
-                model.Job.id == a.job_id,
-                a.name == k,
-                a.value.like(wildcard_value)
-            ))
-
         conditions.append(and_(
             model.Job.any_output_dataset_collection_instances_deleted == false(),
             model.Job.any_output_dataset_deleted == false()
         ))
 
-        query = self.sa_session.query(model.Job.id, *used_ids).filter(and_(*conditions))
+        query = self.sa_session.query(model.Job).filter(and_(*conditions))
         for job in query.all():
-            # We found a job that is equal in terms of tool_id, user, state and input datasets,
-            # but to be able to verify that the parameters match we need to modify all instances of
-            # dataset_ids (HDA, LDDA, HDCA) in the incoming param_dump to point to those used by the
-            # possibly equivalent job, which may have been run on copies of the original input data.
-            job_input_ids = {}
-            if len(job) > 1:
-                # We do have datasets to check
-                job_id, current_jobs_data_ids = job[0], job[1:]
-                job_parameter_conditions = [model.Job.id == job_id]
-                for src, requested_id, used_id in zip(data_types, requested_ids, current_jobs_data_ids):
-                    if src not in job_input_ids:
-                        job_input_ids[src] = {requested_id: used_id}
-                    else:
-                        job_input_ids[src][requested_id] = used_id
-                new_param_dump = remap(param_dump, visit=replace_dataset_ids)
-                # new_param_dump has its dataset ids remapped to those used by the job.
-                # We now ask if the remapped job parameters match the current job.
-                for k, v in new_param_dump.items():
-                    a = aliased(model.JobParameter)
-                    job_parameter_conditions.append(and_(
-                        a.name == k,
-                        a.value == json.dumps(v, sort_keys=True)
-                    ))
-            else:
-                job_parameter_conditions = [model.Job.id == job]
-            query = self.sa_session.query(model.Job).filter(*job_parameter_conditions)
-            job = query.first()
-            if job is None:
-                continue
-            n_parameters = 0
-            # Verify that equivalent jobs had the same number of job parameters
-            # We skip chrominfo, dbkey, __workflow_invocation_uuid__ and identifer
-            # parameter as these are not passed along when expanding tool parameters
-            # and they can differ without affecting the resulting dataset.
-            for parameter in job.parameters:
-                if parameter.name.startswith("__"):
-                    continue
-                if parameter.name in {'chromInfo', 'dbkey'} or parameter.name.endswith('|__identifier__'):
-                    continue
-                n_parameters += 1
-            if not n_parameters == len(param_dump):
+            # We found a job that ran the same tool with the same parameters on
+            # the same data, but the requested inputs may since have been changed
+            # (e.g. renamed, converted or had their metadata set) or deleted.
+            if not self.__inputs_unchanged(job, input_data):
                 continue
             log.info("Found equivalent job %s", search_timer)
             return job
         log.info("No equivalent jobs found %s", search_timer)
         return None
 
+    def __inputs_unchanged(self, job, input_data):
+        for type_values in input_data:
+            t = type_values['src']
+            v = type_values['id']
+            if t == 'hda':
+                c = self.sa_session.query(model.HistoryDatasetAssociation).get(v)
+                if not any(self.__dataset_unchanged(job, a, c) for a in job.input_datasets
+                           if a.dataset is not None and a.dataset.dataset_id == c.dataset_id):
+                    return False
+            elif t == 'hdca':
+                c = self.sa_session.query(model.HistoryDatasetCollectionAssociation).get(v)
+                if c.deleted:
+                    return False
+                original = _original_hdca(c)
+                if not any(a.dataset_collection.name == c.name and _original_hdca(a.dataset_collection) is original
+                           for a in job.input_dataset_collections
+                           if isinstance(a.dataset_collection, model.HistoryDatasetCollectionAssociation)):
+                    return False
+        return True
+
+    def __dataset_unchanged(self, job, a, c):
+        """
+        Check that the HDA ``c`` looks like the job input HDA of the
+        association ``a`` did when the job ran.
+        """
+        b = a.dataset
+        if b.deleted and c.deleted:
+            return False
+        # We need to make sure that the job we are looking for has been run with identical inputs.
+        # Here we deal with 3 requirements:
+        #  - the jobs' input dataset (=b) version is 0, meaning the job's input dataset is not yet ready
+        #  - b's update_time is older than the job create time, meaning no changes occurred
+        #  - the job has a dataset_version recorded, and that versions' metadata matches c's metadata.
+        if a.dataset_version in [0, b.version] or b.update_time < job.create_time:
+            if (b.name, b.extension, b._metadata) == (c.name, c.extension, c._metadata):
+                return True
+        e = self.sa_session.query(model.HistoryDatasetAssociationHistory).filter_by(
+            history_dataset_association_id=b.id,
+            version=a.dataset_version,
+        ).first()
+        return e is not None and (e.name, e.extension, e._metadata) == (c.name, c.extension, c._metadata)
+
 
 def invocation_job_source_iter(sa_session, invocation_id):
     # TODO: Handle subworkflows.
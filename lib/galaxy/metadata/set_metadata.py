@@ -20,6 +20,10 @@ from six.moves import cPickle
 from sqlalchemy.orm import clear_mappers
 
 import galaxy.model.mapping  # need to load this before we unpickle, in order to setup properties assigned by the mappers
+from galaxy.datatypes.util.dataset_scanner import (
+    end_shared_dataset_scan,
+    start_shared_dataset_scan,
+)
 from galaxy.model import store
 from galaxy.model.custom_types import total_size
 from galaxy.tool_util.provided_metadata import parse_tool_provided_metadata
@@ -212,6 +216,7 @@ def set_metadata_portable():
                 setattr(dataset.metadata, metadata_name, metadata_file_override)
             if output_dict.get("validate", False):
                 set_validated_state(dataset)
+            start_shared_dataset_scan(dataset)
             set_meta(dataset, file_dict)
 
             if extended_metadata_collection:
@@ -276,6 +281,8 @@ def set_metadata_portable():
             json.dump((True, 'Metadata has been set successfully'), open(filename_results_code, 'wt+'))  # setting metadata has succeeded
         except Exception:
             json.dump((False, traceback.format_exc()), open(filename_results_code, 'wt+'))  # setting metadata has failed somehow
+        # Close the file read by set_meta and set_peek
+        end_shared_dataset_scan(dataset)
 
     if extended_metadata_collection:
         # discover extra outputs...
@@ -35,6 +35,7 @@ from sqlalchemy import (
     true,
     type_coerce,
     types)
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext import hybrid
 from sqlalchemy.orm import (
     aliased,
@@ -42,6 +43,7 @@ from sqlalchemy.orm import (
     object_session,
 )
 from sqlalchemy.schema import UniqueConstraint
+from sqlalchemy.sql.expression import ClauseElement
 
 import galaxy.exceptions
 import galaxy.model.metadata
@@ -492,9 +494,71 @@ class User(Dictifiable, RepresentById):
 
     total_disk_usage = property(get_disk_usage, set_disk_usage)
 
-    def adjust_total_disk_usage(self, amount):
+    def adjust_total_disk_usage(self, amount, object_store_id=None):
+        """
+        Adjust the disk space used by the user by `amount` bytes without
+        recalculating it, `object_store_id` is the object store holding them.
+        """
+        if amount != 0:
+            self.disk_usage = _adjusted_disk_usage(self, 'disk_usage', self.table.c.disk_usage, amount)
+            self._adjust_object_store_disk_usage(amount, object_store_id)
+
+    def _adjust_object_store_disk_usage(self, amount, object_store_id):
+        for usage in self.object_store_usages:
+            if usage.object_store_id == object_store_id:
+                break
+        else:
+            sa_session = object_session(self)
+            if self.id is None or sa_session is None:
+                self.object_store_usages.append(UserObjectStoreUsage(object_store_id=object_store_id, total_disk_usage=amount))
+                return
+            # Another process may be creating the row too, insert it unless it
+            # exists and only adjust it by amount (as an existing row)
+            usage = _get_or_insert_object_store_usage(sa_session, self.id, object_store_id)
+            self.object_store_usages.append(usage)
+        usage.total_disk_usage = _adjusted_disk_usage(usage, 'total_disk_usage', usage.table.c.total_disk_usage, amount)
+
+    def correct_disk_usage(self, usage_by_object_store, read_usage, read_usage_by_object_store):
+        """
+        Correct the disk usage of the user, previously read as `read_usage` and
+        `read_usage_by_object_store`, to the calculated `usage_by_object_store`.
+        Only the differences are applied, so adjustments made concurrently by
+        `adjust_total_disk_usage` since the usage was read are kept.
+        """
+        amount = sum(usage_by_object_store.values()) - read_usage
         if amount != 0:
-            self.disk_usage = func.coalesce(self.table.c.disk_usage, 0) + amount
+            self.disk_usage = _adjusted_disk_usage(self, 'disk_usage', self.table.c.disk_usage, amount)
+        for object_store_id in set(usage_by_object_store) | set(read_usage_by_object_store):
+            amount = usage_by_object_store.get(object_store_id, 0) - read_usage_by_object_store.get(object_store_id, 0)
+            if amount != 0:
+                self._adjust_object_store_disk_usage(amount, object_store_id)
+
+    def get_disk_usage_by_object_store(self):
+        """
+        Return a dictionary of the byte count of disk space used by the user
+        in each object store, as tracked by `adjust_total_disk_usage`.
+        """
+        rval = {}
+        for usage in self.object_store_usages:
+            rval[usage.object_store_id] = rval.get(usage.object_store_id, 0) + int(usage.total_disk_usage or 0)
+        return dict((object_store_id, amount) for object_store_id, amount in rval.items() if amount)
+
+    def set_disk_usage_by_object_store(self, usage_by_object_store):
+        """
+        Manually set the disk space used by the user in each object store.
+        """
+        # Existing rows are updated in place, replacing them would insert the
+        # new rows before deleting the old ones and break their unique constraint
+        remaining = dict(usage_by_object_store)
+        for usage in list(self.object_store_usages):
+            amount = remaining.pop(usage.object_store_id, 0)
+            if amount:
+                usage.total_disk_usage = amount
+            else:
+                self.object_store_usages.remove(usage)
+        for object_store_id, amount in remaining.items():
+            if amount:
+                self.object_store_usages.append(UserObjectStoreUsage(object_store_id=object_store_id, total_disk_usage=amount))
 
     @property
     def nice_total_disk_usage(self):
@@ -517,10 +581,10 @@ class User(Dictifiable, RepresentById):
         """
         self._calculate_or_set_disk_usage(dryrun=False)
 
-    def _calculate_or_set_disk_usage(self, dryrun=True):
+    def calculate_disk_usage_by_object_store(self):
         """
-        Utility to calculate and return the disk usage.  If dryrun is False,
-        the new value is set immediately.
+        Return a dictionary of the byte count of disk space used in each
+        object store by all non-purged, non-library HDAs in non-purged histories.
         """
         sql_calc = """
             WITH per_user_histories AS
@@ -536,17 +600,28 @@ class User(Dictifiable, RepresentById):
                 WHERE NOT purged
                     AND history_id IN (SELECT id FROM per_user_histories)
             )
-            SELECT SUM(COALESCE(dataset.total_size, dataset.file_size, 0))
+            SELECT dataset.object_store_id, SUM(COALESCE(dataset.total_size, dataset.file_size, 0))
             FROM dataset
             LEFT OUTER JOIN library_dataset_dataset_association ON dataset.id = library_dataset_dataset_association.dataset_id
             WHERE dataset.id IN (SELECT dataset_id FROM per_hist_hdas)
                 AND library_dataset_dataset_association.id IS NULL
+            GROUP BY dataset.object_store_id
         """
         sa_session = object_session(self)
-        usage = sa_session.scalar(sql_calc, {'id': self.id})
+        rows = sa_session.execute(sql_calc, {'id': self.id})
+        return dict((object_store_id, int(amount)) for object_store_id, amount in rows if amount)
+
+    def _calculate_or_set_disk_usage(self, dryrun=True):
+        """
+        Utility to calculate and return the disk usage.  If dryrun is False,
+        the new value is set immediately.
+        """
+        usage_by_object_store = self.calculate_disk_usage_by_object_store()
+        usage = sum(usage_by_object_store.values())
         if not dryrun:
             self.set_disk_usage(usage)
-            sa_session.flush()
+            self.set_disk_usage_by_object_store(usage_by_object_store)
+            object_session(self).flush()
         return usage
 
     @staticmethod
@@ -700,6 +775,7 @@ class Job(JobLike, UsesCreateAndUpdateTime, Dictifiable, RepresentById):
         self.tool_id = None
         self.tool_version = None
         self.copied_from_job_id = None
+        self.fingerprint = None
         self.command_line = None
         self.dependencies = []
         self.param_filename = None
@@ -786,6 +862,9 @@ class Job(JobLike, UsesCreateAndUpdateTime, Dictifiable, RepresentById):
     def get_copied_from_job_id(self):
         return self.copied_from_job_id
 
+    def get_fingerprint(self):
+        return self.fingerprint
+
     def get_input_datasets(self):
         return self.input_datasets
 
@@ -868,6 +947,9 @@ class Job(JobLike, UsesCreateAndUpdateTime, Dictifiable, RepresentById):
     def set_copied_from_job_id(self, job_id):
         self.copied_from_job_id = job_id
 
+    def set_fingerprint(self, fingerprint):
+        self.fingerprint = fingerprint
+
     def set_input_datasets(self, input_datasets):
         self.input_datasets = input_datasets
 
@@ -1658,7 +1740,7 @@ class History(HasTags, Dictifiable, UsesAnnotations, HasName, RepresentById):
             if set_hid:
                 dataset.hid = self._next_hid()
         if quota and self.user:
-            self.user.adjust_total_disk_usage(dataset.quota_amount(self.user))
+            self.user.adjust_total_disk_usage(dataset.quota_amount(self.user), dataset.dataset.object_store_id)
         dataset.history = self
         if genome_build not in [None, '?']:
             self.genome_build = genome_build
@@ -1674,8 +1756,12 @@ class History(HasTags, Dictifiable, UsesAnnotations, HasName, RepresentById):
         if optimize:
             self.__add_datasets_optimized(datasets, genome_build=genome_build)
             if quota and self.user:
-                disk_usage = sum([d.get_total_size() for d in datasets])
-                self.user.adjust_total_disk_usage(disk_usage)
+                disk_usage = {}
+                for d in datasets:
+                    object_store_id = d.dataset.object_store_id
+                    disk_usage[object_store_id] = disk_usage.get(object_store_id, 0) + d.get_total_size()
+                for object_store_id, amount in disk_usage.items():
+                    self.user.adjust_total_disk_usage(amount, object_store_id)
             sa_session.add_all(datasets)
             if flush:
                 sa_session.flush()
@@ -2007,6 +2093,52 @@ class Role(Dictifiable, RepresentById):
         self.deleted = deleted
 
 
+class UserObjectStoreUsage(RepresentById):
+    """Disk space used by a user in one object store."""
+
+    def __init__(self, user=None, object_store_id=None, total_disk_usage=0):
+        self.user = user
+        self.object_store_id = object_store_id
+        self.total_disk_usage = total_disk_usage
+
+
+def _get_or_insert_object_store_usage(sa_session, user_id, object_store_id):
+    """
+    Return the `UserObjectStoreUsage` of `user_id` in `object_store_id`,
+    inserting it with no usage unless it exists. Concurrent calls insert a
+    single row.
+    """
+    table = UserObjectStoreUsage.table
+    values = dict(user_id=user_id, object_store_id=object_store_id, total_disk_usage=0)
+    dialect_name = sa_session.get_bind().dialect.name
+    if object_store_id is None:
+        # NULL object store ids are not covered by the unique constraint, rows
+        # inserted twice are summed up by get_disk_usage_by_object_store()
+        if not sa_session.query(table.c.id).filter(and_(table.c.user_id == user_id, table.c.object_store_id.is_(None))).first():
+            sa_session.execute(table.insert().values(**values))
+    elif dialect_name == 'postgresql':
+        sa_session.execute(postgresql.insert(table).values(**values).on_conflict_do_nothing(index_elements=['user_id', 'object_store_id']))
+    elif dialect_name == 'mysql':
+        sa_session.execute(table.insert().values(**values).prefix_with('IGNORE'))
+    else:
+        sa_session.execute(table.insert().values(**values).prefix_with('OR IGNORE'))
+    return sa_session.query(UserObjectStoreUsage).filter_by(user_id=user_id, object_store_id=object_store_id) \
+        .order_by(UserObjectStoreUsage.table.c.id).first()
+
+
+def _adjusted_disk_usage(obj, attribute, column, amount):
+    """Return the value adjusting the disk usage `attribute` of `obj` by `amount` bytes."""
+    # Only look at values already loaded, to not query the current usage.
+    current = obj.__dict__.get(attribute)
+    if isinstance(current, ClauseElement):
+        # Adjusted again before the previous adjustment was flushed
+        return current + amount
+    if obj.id is None:
+        return (current or 0) + amount
+    # Adjust the stored value in the database, concurrent adjustments are not lost
+    return func.coalesce(column, 0) + amount
+
+
 class UserQuotaAssociation(Dictifiable, RepresentById):
     dict_element_visible_keys = ['user']
 
@@ -5028,6 +5160,34 @@ class WorkflowInvocation(UsesCreateAndUpdateTime, Dictifiable, RepresentById):
         scheduler=None,
         handler=None
     ):
+        query = WorkflowInvocation._active_workflows_query(
+            sa_session.query(WorkflowInvocation.id),
+            scheduler=scheduler,
+            handler=handler,
+        )
+        # Immediately just load all ids into memory so time slicing logic
+        # is relatively intutitive.
+        return [wid for wid in query.all()]
+
+    @staticmethod
+    def poll_active_workflows(
+        sa_session,
+        scheduler=None,
+        handler=None
+    ):
+        """
+        Like ``poll_active_workflow_ids`` but return ``(id, history_id, user_id)``
+        tuples, with the id of the user owning the history of the invocation.
+        """
+        query = WorkflowInvocation._active_workflows_query(
+            sa_session.query(WorkflowInvocation.id, WorkflowInvocation.history_id, History.user_id).join(History),
+            scheduler=scheduler,
+            handler=handler,
+        )
+        return [tuple(row) for row in query.all()]
+
+    @staticmethod
+    def _active_workflows_query(query, scheduler=None, handler=None):
         and_conditions = [
             or_(
                 WorkflowInvocation.state == WorkflowInvocation.states.NEW,
@@ -5038,13 +5198,7 @@ class WorkflowInvocation(UsesCreateAndUpdateTime, Dictifiable, RepresentById):
             and_conditions.append(WorkflowInvocation.scheduler == scheduler)
         if handler is not None:
             and_conditions.append(WorkflowInvocation.handler == handler)
-
-        query = sa_session.query(
-            WorkflowInvocation.id
-        ).filter(and_(*and_conditions)).order_by(WorkflowInvocation.table.c.id.asc())
-        # Immediately just load all ids into memory so time slicing logic
-        # is relatively intutitive.
-        return [wid for wid in query.all()]
+        return query.filter(and_(*and_conditions)).order_by(WorkflowInvocation.table.c.id.asc())
 
     def add_output(self, workflow_output, step, output_object):
         if not hasattr(output_object, "history_content_type"):
@@ -242,7 +242,8 @@ model.HistoryDatasetAssociation.table = Table(
     Column("validated_state", TrimmedString(64), default='unvalidated', nullable=False),
     Column("validated_state_message", TEXT),
     Column("hidden_beneath_collection_instance_id",
-           ForeignKey("history_dataset_collection_association.id"), nullable=True))
+           ForeignKey("history_dataset_collection_association.id"), nullable=True),
+    Index('ix_hda_history_id_update_time', 'history_id', 'update_time'))
 
 
 model.HistoryDatasetAssociationHistory.table = Table(
@@ -381,6 +382,14 @@ model.Role.table = Table(
     Column("type", String(40), index=True),
     Column("deleted", Boolean, index=True, default=False))
 
+model.UserObjectStoreUsage.table = Table(
+    "user_object_store_usage", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("galaxy_user.id"), index=True),
+    Column("object_store_id", TrimmedString(255), index=True),
+    Column("total_disk_usage", Numeric(15, 0)),
+    UniqueConstraint("user_id", "object_store_id"))
+
 model.UserQuotaAssociation.table = Table(
     "user_quota_association", metadata,
     Column("id", Integer, primary_key=True),
@@ -609,6 +618,7 @@ model.Job.table = Table(
     Column("state", String(64), index=True),
     Column("info", TrimmedString(255)),
     Column("copied_from_job_id", Integer, nullable=True),
+    Column("fingerprint", String(64), index=True, nullable=True),
     Column("command_line", TEXT),
     Column("dependencies", JSONType, nullable=True),
     Column("job_messages", JSONType, nullable=True),
@@ -909,7 +919,8 @@ model.HistoryDatasetCollectionAssociation.table = Table(
     Column("job_id", ForeignKey("job.id"), index=True, nullable=True),
     Column("implicit_collection_jobs_id", ForeignKey("implicit_collection_jobs.id"), index=True, nullable=True),
     Column("create_time", DateTime, default=now),
-    Column("update_time", DateTime, default=now, onupdate=now))
+    Column("update_time", DateTime, default=now, onupdate=now),
+    Index('ix_hdca_history_id_update_time', 'history_id', 'update_time'))
 
 model.LibraryDatasetCollectionAssociation.table = Table(
     "library_dataset_collection_association", metadata,
@@ -1926,6 +1937,9 @@ mapper(model.User, model.User.table, properties=dict(
         order_by=desc(model.APIKeys.table.c.create_time)),
     cloudauthzs=relation(model.CloudAuthz,
                          primaryjoin=model.CloudAuthz.table.c.user_id == model.User.table.c.id),
+    object_store_usages=relation(model.UserObjectStoreUsage,
+        backref="user",
+        cascade="all, delete-orphan"),
 ))
 
 mapper(model.PasswordResetToken, model.PasswordResetToken.table,
@@ -1983,6 +1997,8 @@ mapper(model.Quota, model.Quota.table, properties=dict(
     groups=relation(model.GroupQuotaAssociation)
 ))
 
+mapper(model.UserObjectStoreUsage, model.UserObjectStoreUsage.table)
+
 mapper(model.UserQuotaAssociation, model.UserQuotaAssociation.table, properties=dict(
     user=relation(model.User, backref="quotas"),
     quota=relation(model.Quota)
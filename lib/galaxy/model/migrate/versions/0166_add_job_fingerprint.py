@@ -0,0 +1,33 @@
+"""
+Migration script to add an indexed 'fingerprint' column to the 'job' table,
+used to find jobs that can be reused. Existing jobs can be fingerprinted
+with scripts/set_job_fingerprints.py.
+"""
+from __future__ import print_function
+
+import logging
+
+from sqlalchemy import Column, MetaData, String
+
+from galaxy.model.migrate.versions.util import add_column, drop_column
+
+log = logging.getLogger(__name__)
+metadata = MetaData()
+
+# Column to add.
+fingerprint_col = Column("fingerprint", String(64), index=True, nullable=True)
+
+
+def upgrade(migrate_engine):
+    print(__doc__)
+    metadata.bind = migrate_engine
+    metadata.reflect()
+
+    add_column(fingerprint_col, 'job', metadata, index_name="ix_job_fingerprint")
+
+
+def downgrade(migrate_engine):
+    metadata.bind = migrate_engine
+    metadata.reflect()
+
+    drop_column('fingerprint', 'job', metadata)
@@ -0,0 +1,39 @@
+"""
+Migration script to add the 'user_object_store_usage' table, tracking the
+disk space used by users in each object store. It is filled in as disk usage
+is adjusted or recalculated (e.g. with scripts/set_user_disk_usage.py).
+"""
+from __future__ import print_function
+
+import logging
+
+from sqlalchemy import Column, ForeignKey, Integer, MetaData, Numeric, Table, UniqueConstraint
+
+from galaxy.model.custom_types import TrimmedString
+from galaxy.model.migrate.versions.util import create_table, drop_table
+
+log = logging.getLogger(__name__)
+metadata = MetaData()
+
+UserObjectStoreUsage_table = Table(
+    "user_object_store_usage", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("galaxy_user.id"), index=True),
+    Column("object_store_id", TrimmedString(255), index=True),
+    Column("total_disk_usage", Numeric(15, 0)),
+    UniqueConstraint("user_id", "object_store_id"))
+
+
+def upgrade(migrate_engine):
+    print(__doc__)
+    metadata.bind = migrate_engine
+    metadata.reflect()
+
+    create_table(UserObjectStoreUsage_table)
+
+
+def downgrade(migrate_engine):
+    metadata.bind = migrate_engine
+    metadata.reflect()
+
+    drop_table(UserObjectStoreUsage_table)
@@ -0,0 +1,43 @@
+"""
+Add (history_id, update_time) indexes to the hda and hdca tables, to find the
+contents of a history changed since some time.
+"""
+from __future__ import print_function
+
+import logging
+
+from sqlalchemy import Index, MetaData, Table
+
+log = logging.getLogger(__name__)
+metadata = MetaData()
+
+INDEXES = (
+    ('ix_hda_history_id_update_time', 'history_dataset_association'),
+    ('ix_hdca_history_id_update_time', 'history_dataset_collection_association'),
+)
+
+
+def upgrade(migrate_engine):
+    print(__doc__)
+    metadata.bind = migrate_engine
+    metadata.reflect()
+    for index_name, table_name in INDEXES:
+        table = Table(table_name, metadata, autoload=True)
+        if index_name in [ix.name for ix in table.indexes]:
+            log.debug("Index '%s' in table '%s' already exists.", index_name, table_name)
+            continue
+        try:
+            Index(index_name, table.c.history_id, table.c.update_time).create()
+        except Exception:
+            log.exception("Adding index '%s' to table '%s' failed.", index_name, table_name)
+
+
+def downgrade(migrate_engine):
+    metadata.bind = migrate_engine
+    metadata.reflect()
+    for index_name, table_name in INDEXES:
+        table = Table(table_name, metadata, autoload=True)
+        try:
+            Index(index_name, table.c.history_id, table.c.update_time).drop()
+        except Exception:
+            log.exception("Dropping index '%s' from table '%s' failed.", index_name, table_name)
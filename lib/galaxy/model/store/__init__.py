@@ -1,11 +1,15 @@
 import abc
 import contextlib
 import datetime
+import errno
+import logging
 import os
 import shutil
+import subprocess
 import tarfile
 import tempfile
 from json import dump, dumps, load
+from multiprocessing.pool import ThreadPool
 from uuid import uuid4
 
 import six
@@ -15,9 +19,11 @@ from sqlalchemy.orm import eagerload_all
 from sqlalchemy.sql import expression
 
 from galaxy.exceptions import MalformedContents, ObjectNotFound
+from galaxy.objectstore.caching import process_pin_owner
 from galaxy.security.idencoding import IdEncodingHelper
 from galaxy.util import FILENAME_VALID_CHARS
 from galaxy.util import in_directory
+from galaxy.util import which
 from galaxy.util.bunch import Bunch
 from galaxy.util.path import safe_walk
 from ..item_attrs import add_item_annotation, get_item_annotation_str
@@ -31,6 +37,9 @@ ATTRS_FILENAME_COLLECTIONS = 'collections_attrs.txt'
 ATTRS_FILENAME_EXPORT = 'export_attrs.txt'
 ATTRS_FILENAME_LIBRARIES = 'libraries_attrs.txt'
 GALAXY_EXPORT_VERSION = "2"
+DEFAULT_IMPORT_BATCH_SIZE = 1000
+
+log = logging.getLogger(__name__)
 
 
 class ImportOptions(object):
@@ -68,7 +77,7 @@ class SessionlessContext(object):
 @six.add_metaclass(abc.ABCMeta)
 class ModelImportStore(object):
 
-    def __init__(self, import_options=None, app=None, user=None, object_store=None):
+    def __init__(self, import_options=None, app=None, user=None, object_store=None, batch_size=DEFAULT_IMPORT_BATCH_SIZE, copy_threads=1):
         if object_store is None:
             if app is not None:
                 object_store = app.object_store
@@ -83,6 +92,10 @@ class ModelImportStore(object):
         self.user = user
         self.import_options = import_options or ImportOptions()
         self.dataset_state_serialized = True
+        # Number of new datasets and jobs flushed at once.
+        self.batch_size = max(batch_size, 1)
+        # Number of threads copying dataset files into the object store.
+        self.copy_threads = max(copy_threads, 1)
 
     @abc.abstractmethod
     def defines_new_history(self):
@@ -182,42 +195,14 @@ class ModelImportStore(object):
 
     def _import_datasets(self, object_import_tracker, datasets_attrs, history, new_history, job):
         object_key = self.object_key
+        # New dataset instances waiting to be flushed and have their files imported.
+        pending = []
 
         for dataset_attrs in datasets_attrs:
 
             if 'state' not in dataset_attrs:
                 self.dataset_state_serialized = False
 
-            def handle_dataset_object_edit(dataset_instance):
-                if "dataset" in dataset_attrs:
-                    assert self.import_options.allow_dataset_object_edit
-                    dataset_attributes = [
-                        "state",
-                        "deleted",
-                        "purged",
-                        "external_filename",
-                        "_extra_files_path",
-                        "file_size",
-                        "object_store_id",
-                        "total_size",
-                        "created_from_basename",
-                        "uuid"
-                    ]
-
-                    for attribute in dataset_attributes:
-                        if attribute in dataset_attrs["dataset"]:
-                            setattr(dataset_instance.dataset, attribute, dataset_attrs["dataset"][attribute])
-                    if "hashes" in dataset_attrs["dataset"]:
-                        for hash_attrs in dataset_attrs["dataset"]["hashes"]:
-                            hash_obj = model.DatasetHash()
-                            hash_obj.hash_value = hash_attrs["hash_value"]
-                            hash_obj.hash_function = hash_attrs["hash_function"]
-                            hash_obj.extra_files_path = hash_attrs["extra_files_path"]
-                            dataset_instance.dataset.hashes.append(hash_obj)
-
-                    if 'id' in dataset_attrs["dataset"] and self.import_options.allow_edit:
-                        dataset_instance.dataset.id = dataset_attrs["dataset"]['id']
-
             if 'id' in dataset_attrs and self.import_options.allow_edit and not self.sessionless:
                 hda = self.sa_session.query(model.HistoryDatasetAssociation).get(dataset_attrs["id"])
                 attributes = [
@@ -243,7 +228,7 @@ class ModelImportStore(object):
 
                         setattr(hda, attribute, value)
 
-                handle_dataset_object_edit(hda)
+                self._edit_dataset_object(hda, dataset_attrs)
                 self._flush()
             else:
                 metadata = dataset_attrs['metadata']
@@ -290,7 +275,6 @@ class ModelImportStore(object):
                     dataset_instance.dataset.uuid = dataset_attrs["dataset_uuid"]
 
                 self._session_add(dataset_instance)
-                self._flush()
 
                 if model_class == "HistoryDatasetAssociation":
                     # don't use add_history to manage HID handling across full import to try to preserve
@@ -301,65 +285,10 @@ class ModelImportStore(object):
                     else:
                         object_import_tracker.requires_hid.append(dataset_instance)
 
-                self._flush()
-                if 'dataset' in dataset_attrs:
-                    handle_dataset_object_edit(dataset_instance)
-                else:
-                    file_name = dataset_attrs.get('file_name')
-                    if file_name:
-                        # Do security check and move/copy dataset data.
-                        archive_path = os.path.abspath(os.path.join(self.archive_dir, file_name))
-                        if os.path.islink(archive_path):
-                            raise MalformedContents("Invalid dataset path: %s" % archive_path)
-
-                        temp_dataset_file_name = \
-                            os.path.realpath(archive_path)
-
-                        if not in_directory(temp_dataset_file_name, self.archive_dir):
-                            raise MalformedContents("Invalid dataset path: %s" % temp_dataset_file_name)
-
-                    if not file_name or not os.path.exists(temp_dataset_file_name):
-                        dataset_instance.state = dataset_instance.states.DISCARDED
-                        dataset_instance.deleted = True
-                        dataset_instance.purged = True
-                        dataset_instance.dataset.deleted = True
-                        dataset_instance.dataset.purged = True
-                    else:
-                        dataset_instance.state = dataset_attrs.get('state', dataset_instance.states.OK)
-                        self.object_store.update_from_file(dataset_instance.dataset, file_name=temp_dataset_file_name, create=True)
-
-                        # Import additional files if present. Histories exported previously might not have this attribute set.
-                        dataset_extra_files_path = dataset_attrs.get('extra_files_path', None)
-                        if dataset_extra_files_path:
-                            dir_name = dataset_instance.dataset.extra_files_path_name
-                            dataset_extra_files_path = os.path.join(self.archive_dir, dataset_extra_files_path)
-                            for root, dirs, files in safe_walk(dataset_extra_files_path):
-                                extra_dir = os.path.join(dir_name, root.replace(dataset_extra_files_path, '', 1).lstrip(os.path.sep))
-                                extra_dir = os.path.normpath(extra_dir)
-                                for extra_file in files:
-                                    source = os.path.join(root, extra_file)
-                                    if not in_directory(source, self.archive_dir):
-                                        raise MalformedContents("Invalid dataset path: %s" % source)
-                                    self.object_store.update_from_file(
-                                        dataset_instance.dataset, extra_dir=extra_dir,
-                                        alt_name=extra_file, file_name=source,
-                                        create=True)
-                        dataset_instance.dataset.set_total_size()  # update the filesize record in the database
-
-                    if dataset_instance.deleted:
-                        dataset_instance.dataset.deleted = True
-
-                if model_class == "HistoryDatasetAssociation" and self.user:
-                    add_item_annotation(self.sa_session, self.user, dataset_instance, dataset_attrs['annotation'])
-                    tag_list = dataset_attrs.get('tags')
-                    if tag_list:
-                        tag_handler = model.tags.GalaxyTagHandler(sa_session=self.sa_session)
-                        tag_handler.set_tags_from_list(user=self.user, item=dataset_instance, new_tags_list=tag_list)
-
-                if self.app:
-                    self.app.datatypes_registry.set_external_metadata_tool.regenerate_imported_metadata_if_needed(
-                        dataset_instance, history, job
-                    )
+                pending.append((dataset_instance, dataset_attrs))
+                if len(pending) >= self.batch_size:
+                    self._finish_datasets(pending, history, job)
+                    pending = []
 
                 if model_class == "HistoryDatasetAssociation":
                     if object_key in dataset_attrs:
@@ -370,6 +299,141 @@ class ModelImportStore(object):
                 else:
                     object_import_tracker.lddas_by_key[dataset_attrs[object_key]] = dataset_instance
 
+        self._finish_datasets(pending, history, job)
+
+    def _finish_datasets(self, pending, history, job):
+        """Flush a batch of new dataset instances and import their files.
+
+        Files are copied into the object store by up to ``copy_threads`` threads,
+        the database is only updated from the calling thread.
+        """
+        if not pending:
+            return
+        self._flush()
+        copies = []
+        for dataset_instance, dataset_attrs in pending:
+            if 'dataset' in dataset_attrs:
+                self._edit_dataset_object(dataset_instance, dataset_attrs)
+            else:
+                dataset_copies = self._dataset_file_copies(dataset_instance, dataset_attrs)
+                if dataset_copies is None:
+                    dataset_instance.state = dataset_instance.states.DISCARDED
+                    dataset_instance.deleted = True
+                    dataset_instance.purged = True
+                    dataset_instance.dataset.deleted = True
+                    dataset_instance.dataset.purged = True
+                else:
+                    dataset_instance.state = dataset_attrs.get('state', dataset_instance.states.OK)
+                    copies.append((dataset_instance.dataset, dataset_copies))
+
+        self._copy_dataset_files(copies)
+        for dataset, _ in copies:
+            dataset.set_total_size()  # update the filesize record in the database
+
+        for dataset_instance, dataset_attrs in pending:
+            if 'dataset' not in dataset_attrs and dataset_instance.deleted:
+                dataset_instance.dataset.deleted = True
+
+            is_hda = isinstance(dataset_instance, model.HistoryDatasetAssociation)
+            if is_hda and self.user:
+                add_item_annotation(self.sa_session, self.user, dataset_instance, dataset_attrs['annotation'])
+                tag_list = dataset_attrs.get('tags')
+                if tag_list:
+                    tag_handler = model.tags.GalaxyTagHandler(sa_session=self.sa_session)
+                    tag_handler.set_tags_from_list(user=self.user, item=dataset_instance, new_tags_list=tag_list)
+
+            if self.app:
+                self.app.datatypes_registry.set_external_metadata_tool.regenerate_imported_metadata_if_needed(
+                    dataset_instance, history, job
+                )
+        self._flush()
+
+    def _dataset_file_copies(self, dataset_instance, dataset_attrs):
+        """Return the ``update_from_file`` arguments importing the files of a dataset.
+
+        Returns ``None`` if the archive does not contain the dataset's file.
+        """
+        file_name = dataset_attrs.get('file_name')
+        if file_name:
+            # Do security check and move/copy dataset data.
+            archive_path = os.path.abspath(os.path.join(self.archive_dir, file_name))
+            if os.path.islink(archive_path):
+                raise MalformedContents("Invalid dataset path: %s" % archive_path)
+
+            temp_dataset_file_name = \
+                os.path.realpath(archive_path)
+
+            if not in_directory(temp_dataset_file_name, self.archive_dir):
+                raise MalformedContents("Invalid dataset path: %s" % temp_dataset_file_name)
+
+        if not file_name or not os.path.exists(temp_dataset_file_name):
+            return None
+
+        copies = [dict(file_name=temp_dataset_file_name, create=True)]
+        # Import additional files if present. Histories exported previously might not have this attribute set.
+        dataset_extra_files_path = dataset_attrs.get('extra_files_path', None)
+        if dataset_extra_files_path:
+            dir_name = dataset_instance.dataset.extra_files_path_name
+            dataset_extra_files_path = os.path.join(self.archive_dir, dataset_extra_files_path)
+            for root, dirs, files in safe_walk(dataset_extra_files_path):
+                extra_dir = os.path.join(dir_name, root.replace(dataset_extra_files_path, '', 1).lstrip(os.path.sep))
+                extra_dir = os.path.normpath(extra_dir)
+                for extra_file in files:
+                    source = os.path.join(root, extra_file)
+                    if not in_directory(source, self.archive_dir):
+                        raise MalformedContents("Invalid dataset path: %s" % source)
+                    copies.append(dict(extra_dir=extra_dir, alt_name=extra_file, file_name=source, create=True))
+        return copies
+
+    def _copy_dataset_files(self, copies):
+        def copy_files(copy):
+            dataset, dataset_copies = copy
+            for kwds in dataset_copies:
+                self.object_store.update_from_file(dataset, **kwds)
+
+        threads = min(self.copy_threads, len(copies))
+        if threads > 1:
+            pool = ThreadPool(threads)
+            try:
+                # Raises the first exception of a failed copy.
+                pool.map(copy_files, copies)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for copy in copies:
+                copy_files(copy)
+
+    def _edit_dataset_object(self, dataset_instance, dataset_attrs):
+        if "dataset" in dataset_attrs:
+            assert self.import_options.allow_dataset_object_edit
+            dataset_attributes = [
+                "state",
+                "deleted",
+                "purged",
+                "external_filename",
+                "_extra_files_path",
+                "file_size",
+                "object_store_id",
+                "total_size",
+                "created_from_basename",
+                "uuid"
+            ]
+
+            for attribute in dataset_attributes:
+                if attribute in dataset_attrs["dataset"]:
+                    setattr(dataset_instance.dataset, attribute, dataset_attrs["dataset"][attribute])
+            if "hashes" in dataset_attrs["dataset"]:
+                for hash_attrs in dataset_attrs["dataset"]["hashes"]:
+                    hash_obj = model.DatasetHash()
+                    hash_obj.hash_value = hash_attrs["hash_value"]
+                    hash_obj.hash_function = hash_attrs["hash_function"]
+                    hash_obj.extra_files_path = hash_attrs["extra_files_path"]
+                    dataset_instance.dataset.hashes.append(hash_obj)
+
+            if 'id' in dataset_attrs["dataset"] and self.import_options.allow_edit:
+                dataset_instance.dataset.id = dataset_attrs["dataset"]['id']
+
     def _import_libraries(self, object_import_tracker):
         object_key = self.object_key
 
@@ -629,7 +693,8 @@ class ModelImportStore(object):
         # Create jobs.
         #
         jobs_attrs = self.jobs_properties()
-        # Create each job.
+        # Create each job, new jobs are flushed in batches.
+        unflushed_jobs = 0
         for job_attrs in jobs_attrs:
             if 'id' in job_attrs:
                 # only thing we allow editing currently is associations for incoming jobs.
@@ -671,7 +736,6 @@ class ModelImportStore(object):
             except Exception:
                 pass
             self._session_add(imported_job)
-            self._flush()
 
             # Connect jobs to input and output datasets.
             params = self._normalize_job_parameters(imported_job, job_attrs, _find_hda, _find_hdca)
@@ -680,10 +744,14 @@ class ModelImportStore(object):
                 imported_job.add_parameter(name, dumps(value))
 
             self._connect_job_io(imported_job, job_attrs, _find_hda, _find_hdca)
-            self._flush()
+            unflushed_jobs += 1
+            if unflushed_jobs >= self.batch_size:
+                self._flush()
+                unflushed_jobs = 0
 
             if object_key in job_attrs:
                 object_import_tracker.jobs_by_key[job_attrs[object_key]] = imported_job
+        self._flush()
 
     def _import_implicit_collection_jobs(self, object_import_tracker):
         implicit_collection_jobs_attrs = self.implicit_collection_jobs_properties()
@@ -977,14 +1045,17 @@ class ModelExportStore(object):
 
 class DirectoryModelExportStore(ModelExportStore):
 
-    def __init__(self, export_directory, app=None, for_edit=False, serialize_dataset_objects=None, export_files=None, strip_metadata_files=True):
+    def __init__(self, export_directory, app=None, for_edit=False, serialize_dataset_objects=None, export_files=None, strip_metadata_files=True, resume=False):
         """
         :param export_directory: path to export directory. Will be created if it does not exist.
         :param app: Galaxy App or app-like object. Must be provided if `for_edit` and/or `serialize_dataset_objects` are True
         :param for_edit: Allow modifying existing HDA and dataset metadata during import.
         :param serialize_dataset_objects: If True will encode IDs using the host secret. Defaults `for_edit`.
-        :param export_files: How files should be exported, can be 'symlink', 'copy' or None, in which case files
-                             will not be serialized.
+        :param export_files: How files should be exported, can be 'symlink', 'copy', 'hardlink' (falling back
+                             to copying files that cannot be linked, e.g. across file systems) or None, in
+                             which case files will not be serialized.
+        :param resume: Resume an interrupted export to the same directory, keeping files already copied or
+                       linked completely (same size and not older than their source) instead of failing on them.
         """
         if not os.path.exists(export_directory):
             os.makedirs(export_directory)
@@ -999,8 +1070,12 @@ class DirectoryModelExportStore(ModelExportStore):
 
         self.sessionless = sessionless
         self.security = security
+        self.object_store = getattr(app, 'object_store', None)
+        # Exported datasets are kept in object store caches until the export is done
+        self.pin_owner = process_pin_owner("export-%s" % uuid4().hex)
 
         self.export_directory = export_directory
+        self.resume = resume
         self.serialization_options = model.SerializationOptions(
             for_edit=for_edit,
             serialize_dataset_objects=serialize_dataset_objects,
@@ -1018,25 +1093,29 @@ class DirectoryModelExportStore(ModelExportStore):
 
         self.job_output_dataset_associations = {}
 
+    def _add_file(self, src, arcname):
+        """Add the file or directory ``src`` to the export as ``arcname``."""
+        dest = os.path.join(self.export_directory, arcname)
+        if not os.path.exists(os.path.dirname(dest)):
+            os.makedirs(os.path.dirname(dest))
+        if self.export_files == "symlink":
+            if self.resume and os.path.lexists(dest):
+                os.unlink(dest)
+            os.symlink(src, dest)
+        else:
+            copy_tree(src, dest, link=self.export_files == "hardlink", resume=self.resume)
+
     def serialize_files(self, dataset, as_dict):
         if self.export_files is None:
             return None
-        elif self.export_files == "symlink":
-            add = os.symlink
-        elif self.export_files == "copy":
-            def add(src, dest):
-                if os.path.isdir(src):
-                    shutil.copytree(src, dest)
-                else:
-                    shutil.copyfile(src, dest)
-
-        export_directory = self.export_directory
 
         _, include_files = self.included_datasets[dataset.id]
         if not include_files:
             return
 
         file_name, extra_files_path = None, None
+        if self.object_store is not None:
+            self.object_store.pin(dataset.dataset, self.pin_owner)
         try:
             _file_name = dataset.file_name
             if os.path.exists(_file_name):
@@ -1050,7 +1129,6 @@ class DirectoryModelExportStore(ModelExportStore):
             pass
 
         dir_name = 'datasets'
-        dir_path = os.path.join(export_directory, dir_name)
         dataset_hid = as_dict['hid']
         assert dataset_hid, as_dict
 
@@ -1063,15 +1141,9 @@ class DirectoryModelExportStore(ModelExportStore):
             return
 
         if file_name:
-            if not os.path.exists(dir_path):
-                os.makedirs(dir_path)
-
             target_filename = get_export_dataset_filename(as_dict['name'], as_dict['extension'], dataset_hid)
             arcname = os.path.join(dir_name, target_filename)
-
-            src = file_name
-            dest = os.path.join(export_directory, arcname)
-            add(src, dest)
+            self._add_file(file_name, arcname)
             as_dict['file_name'] = arcname
 
         if extra_files_path:
@@ -1082,7 +1154,7 @@ class DirectoryModelExportStore(ModelExportStore):
 
             if len(file_list):
                 arcname = os.path.join(dir_name, 'extra_files_path_%s' % dataset_hid)
-                add(extra_files_path, os.path.join(export_directory, arcname))
+                self._add_file(extra_files_path, arcname)
                 as_dict['extra_files_path'] = arcname
             else:
                 as_dict['extra_files_path'] = ''
@@ -1346,24 +1418,50 @@ class DirectoryModelExportStore(ModelExportStore):
             dump({"galaxy_export_version": GALAXY_EXPORT_VERSION}, export_attrs_out)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if exc_type is None:
-            self._finalize()
+        try:
+            if exc_type is None:
+                self._finalize()
+        finally:
+            if self.object_store is not None:
+                self.object_store.unpin_owner(self.pin_owner)
         # http://effbot.org/zone/python-with-statement.htm
         # Ignores TypeError exceptions
         return isinstance(exc_val, TypeError)
 
 
 class TarModelExportStore(DirectoryModelExportStore):
+    """
+    Export to a tar archive. Dataset files are streamed into the archive from
+    where they are stored instead of being staged in the export directory, so
+    any ``export_files`` value other than None includes them. They are pinned
+    in object store caches until then, extra files directories (whose files
+    cannot be pinned) are copied to the export directory right away.
+    """
 
-    def __init__(self, out_file, gzip=True, **kwds):
+    def __init__(self, out_file, gzip=True, compress_threads=1, resume=False, **kwds):
+        """
+        :param compress_threads: Number of threads compressing the archive, see `tar_export_directory`.
+        :param resume: Keep the dataset files of a partially written, uncompressed `out_file`.
+        """
         self.gzip = gzip
         self.out_file = out_file
+        self.compress_threads = compress_threads
+        self.streamed_files = []
         temp_output_dir = tempfile.mkdtemp()
-        super(TarModelExportStore, self).__init__(temp_output_dir, **kwds)
+        super(TarModelExportStore, self).__init__(temp_output_dir, resume=resume, **kwds)
+
+    def _add_file(self, src, arcname):
+        if os.path.isdir(src):
+            copy_tree(src, os.path.join(self.export_directory, arcname))
+        else:
+            self.streamed_files.append((src, arcname))
 
     def _finalize(self):
         super(TarModelExportStore, self)._finalize()
-        tar_export_directory(self.export_directory, self.out_file, self.gzip)
+        tar_export_directory(self.export_directory, self.out_file, self.gzip,
+                             files=self.streamed_files,
+                             compress_threads=self.compress_threads,
+                             resume=self.resume)
         shutil.rmtree(self.export_directory)
 
 
@@ -1394,14 +1492,137 @@ class BagArchiveModelExportStore(BagDirectoryModelExportStore):
         shutil.rmtree(self.export_directory)
 
 
-def tar_export_directory(export_directory, out_file, gzip):
-    tarfile_mode = "w"
+def tar_export_directory(export_directory, out_file, gzip, files=None, compress_threads=1, resume=False):
+    """
+    Write the contents of ``export_directory``, following symlinks, and the
+    files or directories ``files`` (a list of ``(path, arcname)`` pairs) to
+    the tar archive ``out_file``, gzip compressed if ``gzip`` is set.
+
+    With ``compress_threads`` greater than one the archive is compressed by
+    that many threads if pigz is available. With ``resume`` an uncompressed
+    ``out_file`` left by an interrupted export is truncated after its last
+    complete member and completed: members for ``files`` and for symlinks in
+    ``export_directory`` found with the same size are not written again.
+    """
+    written = {}
+    if resume and os.path.exists(out_file):
+        if gzip:
+            log.warning("Cannot resume writing compressed archive [%s], writing it again", out_file)
+        else:
+            written = _resume_tar_archive(out_file)
+
+    def add_members(history_archive):
+        for path, arcname, reference in _iter_tar_members(export_directory, files or []):
+            if reference and not os.path.isdir(path) and written.get(arcname) == os.path.getsize(path):
+                continue
+            history_archive.add(path, arcname=arcname, recursive=False)
+
+    pigz = which("pigz") if gzip and compress_threads > 1 else None
+    if pigz:
+        with open(out_file, "wb") as out:
+            compress = subprocess.Popen([pigz, "-p", str(compress_threads), "-c"], stdin=subprocess.PIPE, stdout=out)
+            try:
+                with tarfile.open(fileobj=compress.stdin, mode="w|", dereference=True) as history_archive:
+                    add_members(history_archive)
+            finally:
+                compress.stdin.close()
+                returncode = compress.wait()
+        if returncode != 0:
+            raise Exception("Compressing archive [%s] failed with exit code %d" % (out_file, returncode))
+        return
+
+    tarfile_mode = "a" if written else "w"
     if gzip:
         tarfile_mode += ":gz"
 
     with tarfile.open(out_file, tarfile_mode, dereference=True) as history_archive:
-        for export_path in os.listdir(export_directory):
-            history_archive.add(os.path.join(export_directory, export_path), arcname=export_path)
+        add_members(history_archive)
+
+
+def _iter_tar_members(export_directory, files):
+    """
+    Yield the path, archive name and whether it references data stored
+    elsewhere (as opposed to a file written for the export) of every file
+    and directory to archive, references first.
+    """
+    for src, arcname in files:
+        for path, name, _ in _iter_tree(src, arcname):
+            yield path, name, True
+    for export_path in sorted(os.listdir(export_directory)):
+        path = os.path.join(export_directory, export_path)
+        for member in _iter_tree(path, export_path, os.path.islink(path)):
+            yield member
+
+
+def _iter_tree(path, arcname, reference=False):
+    yield path, arcname, reference
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            child = os.path.join(path, name)
+            for member in _iter_tree(child, os.path.join(arcname, name), reference or os.path.islink(child)):
+                yield member
+
+
+def _resume_tar_archive(out_file):
+    """
+    Truncate the uncompressed tar archive ``out_file`` after its last
+    complete member and return the sizes of the regular files it contains
+    by name.
+    """
+    file_size = os.path.getsize(out_file)
+    end = 0
+    members = {}
+    try:
+        with tarfile.open(out_file, "r:") as history_archive:
+            for member in history_archive:
+                member_end = member.offset_data + -(-member.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+                if member_end > file_size:
+                    break
+                end = member_end
+                if member.isfile():
+                    members[member.name] = member.size
+    except (EnvironmentError, tarfile.TarError):
+        # Stop at the first incomplete or invalid header
+        pass
+    with open(out_file, "r+b") as fh:
+        fh.truncate(end)
+        # Terminate the archive so that it can be opened for appending
+        fh.seek(end)
+        fh.write(tarfile.NUL * tarfile.BLOCKSIZE * 2)
+    return members if end else {}
+
+
+def copy_tree(src, dest, link=False, resume=False):
+    """
+    Copy (or hardlink if ``link`` is set and possible) the file or directory
+    ``src`` to ``dest``. Existing files in ``dest`` are an error unless
+    ``resume`` is set, in which case files already copied completely (with
+    the size of their source and not older than it) are kept and others
+    replaced.
+    """
+    if os.path.isdir(src):
+        if not (resume and os.path.isdir(dest)):
+            os.makedirs(dest)
+        for name in os.listdir(src):
+            copy_tree(os.path.join(src, name), os.path.join(dest, name), link=link, resume=resume)
+        return
+    if resume and os.path.exists(dest):
+        if os.path.samefile(src, dest):
+            return
+        src_stat, dest_stat = os.stat(src), os.stat(dest)
+        if src_stat.st_size == dest_stat.st_size and dest_stat.st_mtime >= src_stat.st_mtime:
+            return
+        os.unlink(dest)
+    elif os.path.lexists(dest):
+        raise OSError(errno.EEXIST, "File exists", dest)
+    if link:
+        try:
+            os.link(src, dest)
+            return
+        except OSError:
+            # e.g. src is on another file system
+            pass
+    shutil.copyfile(src, dest)
 
 
 def get_export_dataset_filename(name, ext, hid):
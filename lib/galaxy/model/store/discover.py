@@ -17,6 +17,10 @@ import six
 
 import galaxy.model
 from galaxy import util
+from galaxy.datatypes.util.dataset_scanner import (
+    end_shared_dataset_scan,
+    start_shared_dataset_scan,
+)
 from galaxy.exceptions import (
     RequestParameterInvalidException
 )
@@ -166,6 +170,8 @@ class ModelPersistenceContext(object):
                 dataset_att_name = dataset_att_by_name.get(att_set, att_set)
                 setattr(primary_data, dataset_att_name, dataset_attributes.get(att_set, getattr(primary_data, dataset_att_name)))
 
+        # Setting the metadata and peek of the dataset read its file once
+        start_shared_dataset_scan(primary_data)
         try:
             metadata_dict = dataset_attributes.get('metadata', None)
             if metadata_dict:
@@ -184,6 +190,7 @@ class ModelPersistenceContext(object):
             primary_data.set_peek()
         except Exception:
             log.exception("Exception occured while setting dataset peek")
+        end_shared_dataset_scan(primary_data)
 
         return primary_data
 
@@ -24,6 +24,7 @@ from galaxy.exceptions import ObjectInvalid, ObjectNotFound
 from galaxy.util import (
     directory_hash_id,
     force_symlink,
+    string_as_bool,
     umask_fix_perms,
 )
 from galaxy.util.bunch import Bunch
@@ -32,6 +33,8 @@ from galaxy.util.path import (
     safe_relpath,
 )
 from galaxy.util.sleeper import Sleeper
+from .location_cache import ObjectLocationCache
+from .placement import BackendPlacement
 
 NO_SESSION_ERROR_MESSAGE = "Attempted to 'create' object store entity in configuration with no database session present."
 
@@ -212,6 +215,21 @@ class ObjectStore(object):
         """Return the percentage indicating how full the store is."""
         raise NotImplementedError()
 
+    def get_store_space(self):
+        """Return the total and the available size of the store in bytes."""
+        raise NotImplementedError()
+
+    def pin(self, obj, owner, **kwargs):
+        """
+        Keep the cached copy of `obj` (for object stores that cache objects
+        locally) from being evicted until the pins of `owner` are released.
+        """
+        pass
+
+    def unpin_owner(self, owner):
+        """Release all pins of `owner`."""
+        pass
+
     def get_store_by(self, obj):
         """Return how object is stored (by 'uuid', 'id', or None if not yet saved).
 
@@ -547,6 +565,11 @@ class DiskObjectStore(ConcreteObjectStore):
         st = os.statvfs(self.file_path)
         return (float(st.f_blocks - st.f_bavail) / st.f_blocks) * 100
 
+    def get_store_space(self):
+        """Override `ObjectStore`'s stub by returning total and available bytes."""
+        st = os.statvfs(self.file_path)
+        return st.f_blocks * st.f_frsize, st.f_bavail * st.f_frsize
+
 
 class NestedObjectStore(ObjectStore):
 
@@ -555,18 +578,30 @@ class NestedObjectStore(ObjectStore):
 
     Example: DistributedObjectStore, HierarchicalObjectStore
     """
+    # Whether the backend an object was found in is remembered and probed
+    # first, stores that must check their backends in order only remember
+    # the objects that are missing
+    remember_locations = True
 
-    def __init__(self, config, config_xml=None):
+    def __init__(self, config, config_dict=None):
         """Extend `ObjectStore`'s constructor."""
         super(NestedObjectStore, self).__init__(config)
         self.backends = {}
+        self.location_cache_config = (config_dict or {}).get('location_cache', {})
+        self.location_cache = ObjectLocationCache(**self.location_cache_config)
 
     def shutdown(self):
         """For each backend, shuts them down."""
         for store in self.backends.values():
             store.shutdown()
+        self.location_cache.shutdown()
         super(NestedObjectStore, self).shutdown()
 
+    def to_dict(self):
+        as_dict = super(NestedObjectStore, self).to_dict()
+        as_dict["location_cache"] = self.location_cache_config
+        return as_dict
+
     def exists(self, obj, **kwargs):
         """Determine if the `obj` exists in any of the backends."""
         return self._call_method('exists', obj, False, False, **kwargs)
@@ -578,6 +613,7 @@ class NestedObjectStore(ObjectStore):
     def create(self, obj, **kwargs):
         """Create a backing file in a random backend."""
         random.choice(list(self.backends.values())).create(obj, **kwargs)
+        self._invalidate_location(obj)
 
     def empty(self, obj, **kwargs):
         """For the first backend that has this `obj`, determine if it is empty."""
@@ -589,7 +625,10 @@ class NestedObjectStore(ObjectStore):
 
     def delete(self, obj, **kwargs):
         """For the first backend that has this `obj`, delete it."""
-        return self._call_method('delete', obj, False, False, **kwargs)
+        try:
+            return self._call_method('delete', obj, False, False, **kwargs)
+        finally:
+            self._invalidate_location(obj)
 
     def get_data(self, obj, **kwargs):
         """For the first backend that has this `obj`, get data from it."""
@@ -604,12 +643,26 @@ class NestedObjectStore(ObjectStore):
         if kwargs.get('create', False):
             self.create(obj, **kwargs)
             kwargs['create'] = False
+        else:
+            # May create files the location cache remembers as missing
+            self._invalidate_location(obj)
         return self._call_method('update_from_file', obj, ObjectNotFound, True, **kwargs)
 
     def get_object_url(self, obj, **kwargs):
         """For the first backend that has this `obj`, get its URL."""
         return self._call_method('get_object_url', obj, None, False, **kwargs)
 
+    def pin(self, obj, owner, **kwargs):
+        """For the first backend that has this `obj`, pin it."""
+        key = self._find_backend_id(obj, **kwargs)
+        if key is not None:
+            self.backends[key].pin(obj, owner, **kwargs)
+
+    def unpin_owner(self, owner):
+        """Release the pins of `owner` in all backends."""
+        for store in self.backends.values():
+            store.unpin_owner(owner)
+
     def get_store_by(self, obj):
         return self._call_method('get_store_by', obj, None, False)
 
@@ -621,12 +674,56 @@ class NestedObjectStore(ObjectStore):
         except AttributeError:
             return str(obj)
 
+    def _location_key(self, obj):
+        obj_id = getattr(obj, 'id', None)
+        if obj_id is None:
+            return None
+        return '%s:%s' % (obj.__class__.__name__, obj_id)
+
+    def _invalidate_location(self, obj):
+        object_key = self._location_key(obj)
+        if object_key is not None:
+            self.location_cache.invalidate(object_key)
+
+    def _find_backend_id(self, obj, **kwargs):
+        """
+        Return the key of the first backend where `obj` exists (or `None`),
+        probing the backend remembered in the location cache first.
+        """
+        object_key = self._location_key(obj)
+        if object_key is not None and not self.remember_locations:
+            if self.location_cache.is_missing(object_key, kwargs):
+                return None
+            for key, store in self.backends.items():
+                if store.exists(obj, **kwargs):
+                    return key
+            self.location_cache.set_missing(object_key, kwargs)
+            return None
+        if object_key is None:
+            for key, store in self.backends.items():
+                if store.exists(obj, **kwargs):
+                    return key
+            return None
+        if self.location_cache.is_missing(object_key, kwargs):
+            return None
+        cached_id = self.location_cache.get(object_key)
+        backend_ids = dict((str(key), key) for key in self.backends)
+        cached_key = backend_ids.get(cached_id)
+        if cached_key is not None and self.backends[cached_key].exists(obj, **kwargs):
+            return cached_key
+        for key, store in self.backends.items():
+            if key != cached_key and store.exists(obj, **kwargs):
+                self.location_cache.set(object_key, key)
+                return key
+        self.location_cache.set_missing(object_key, kwargs)
+        return None
+
     def _call_method(self, method, obj, default, default_is_exception,
             **kwargs):
         """Check all children object stores for the first one with the dataset."""
-        for key, store in self.backends.items():
-            if store.exists(obj, **kwargs):
-                return store.__getattribute__(method)(obj, **kwargs)
+        key = self._find_backend_id(obj, **kwargs)
+        if key is not None:
+            return self.backends[key].__getattribute__(method)(obj, **kwargs)
         if default_is_exception:
             raise default('objectstore, _call_method failed: %s on %s, kwargs: %s'
                           % (method, self._repr_object_for_exception(obj), str(kwargs)))
@@ -667,6 +764,8 @@ class DistributedObjectStore(NestedObjectStore):
         self.original_weighted_backend_ids = []
         self.max_percent_full = {}
         self.global_max_percent_full = config_dict.get("global_max_percent_full", 0)
+        self.balance_by_free_space = config_dict.get("balance_by_free_space", False)
+        self.monitor_interval = config_dict.get("monitor_interval", 120)
         random.seed()
 
         backends_def = config_dict["backends"]
@@ -690,9 +789,14 @@ class DistributedObjectStore(NestedObjectStore):
                 # choose a backend from that sequence at creation
                 self.weighted_backend_ids.append(backened_id)
         self.original_weighted_backend_ids = self.weighted_backend_ids
+        self.placement = BackendPlacement(self.backends,
+                                          dict((id, self.original_weighted_backend_ids.count(id)) for id in self.backends),
+                                          self.max_percent_full,
+                                          self.global_max_percent_full,
+                                          self.balance_by_free_space)
 
         self.sleeper = None
-        if fsmon and (self.global_max_percent_full or [_ for _ in self.max_percent_full.values() if _ != 0.0]):
+        if fsmon and (self.global_max_percent_full or self.balance_by_free_space or [_ for _ in self.max_percent_full.values() if _ != 0.0]):
             self.sleeper = Sleeper()
             self.filesystem_monitor_thread = threading.Thread(target=self.__filesystem_monitor)
             self.filesystem_monitor_thread.setDaemon(True)
@@ -709,7 +813,10 @@ class DistributedObjectStore(NestedObjectStore):
         backends = []
         config_dict = {
             'global_max_percent_full': float(backends_root.get('maxpctfull', 0)),
+            'balance_by_free_space': string_as_bool(backends_root.get('balance_by_free_space', 'False')),
+            'monitor_interval': int(backends_root.get('monitor_interval', 120)),
             'backends': backends,
+            'location_cache': parse_location_cache_xml(config_xml),
         }
 
         for elem in [e for e in backends_root if e.tag == 'backend']:
@@ -764,6 +871,8 @@ class DistributedObjectStore(NestedObjectStore):
     def to_dict(self):
         as_dict = super(DistributedObjectStore, self).to_dict()
         as_dict["global_max_percent_full"] = self.global_max_percent_full
+        as_dict["balance_by_free_space"] = self.balance_by_free_space
+        as_dict["monitor_interval"] = self.monitor_interval
         backends = []
         for backend_id, backend in self.backends.items():
             backend_as_dict = backend.to_dict()
@@ -779,25 +888,20 @@ class DistributedObjectStore(NestedObjectStore):
         super(DistributedObjectStore, self).shutdown()
         if self.sleeper is not None:
             self.sleeper.wake()
+        self.placement.shutdown()
 
     def __filesystem_monitor(self):
         while self.running:
-            new_weighted_backend_ids = self.original_weighted_backend_ids
-            for id, backend in self.backends.items():
-                maxpct = self.max_percent_full[id] or self.global_max_percent_full
-                pct = backend.get_store_usage_percent()
-                if pct > maxpct:
-                    new_weighted_backend_ids = [_ for _ in new_weighted_backend_ids if _ != id]
-            self.weighted_backend_ids = new_weighted_backend_ids
-            self.sleeper.sleep(120)  # Test free space every 2 minutes
+            self.placement.refresh()
+            self.weighted_backend_ids = [_ for _ in self.original_weighted_backend_ids if not self.placement.is_full(_)]
+            self.sleeper.sleep(self.monitor_interval)
 
     def create(self, obj, **kwargs):
         """The only method in which obj.object_store_id may be None."""
         if obj.object_store_id is None or not self.exists(obj, **kwargs):
             if obj.object_store_id is None or obj.object_store_id not in self.backends:
-                try:
-                    obj.object_store_id = random.choice(self.weighted_backend_ids)
-                except IndexError:
+                obj.object_store_id = self.placement.choose()
+                if obj.object_store_id is None:
                     raise ObjectInvalid('objectstore.create, could not generate '
                                         'obj.object_store_id: %s, kwargs: %s'
                                         % (str(obj), str(kwargs)))
@@ -808,6 +912,8 @@ class DistributedObjectStore(NestedObjectStore):
                 log.debug("Using preferred backend '%s' for creation of %s %s"
                           % (obj.object_store_id, obj.__class__.__name__, obj.id))
             self.backends[obj.object_store_id].create(obj, **kwargs)
+            self.placement.record_create(obj.object_store_id)
+            self._invalidate_location(obj)
 
     def _call_method(self, method, obj, default, default_is_exception, **kwargs):
         object_store_id = self.__get_store_id_for(obj, **kwargs)
@@ -829,14 +935,13 @@ class DistributedObjectStore(NestedObjectStore):
         # if this instance has been switched from a non-distributed to a
         # distributed object store, or if the object's store id is invalid,
         # try to locate the object
-        for id, store in self.backends.items():
-            if store.exists(obj, **kwargs):
-                log.warning('%s object with ID %s found in backend object store with ID %s'
-                            % (obj.__class__.__name__, obj.id, id))
-                obj.object_store_id = id
-                _create_object_in_session(obj)
-                return id
-        return None
+        id = self._find_backend_id(obj, **kwargs)
+        if id is not None:
+            log.warning('%s object with ID %s found in backend object store with ID %s'
+                        % (obj.__class__.__name__, obj.id, id))
+            obj.object_store_id = id
+            _create_object_in_session(obj)
+        return id
 
 
 class HierarchicalObjectStore(NestedObjectStore):
@@ -848,6 +953,8 @@ class HierarchicalObjectStore(NestedObjectStore):
     When creating objects only the first store is used.
     """
     store_type = 'hierarchical'
+    # An object found in a backend may be put into a preceding one later
+    remember_locations = False
 
     def __init__(self, config, config_dict, fsmon=False):
         """The default contructor. Extends `NestedObjectStore`."""
@@ -869,7 +976,7 @@ class HierarchicalObjectStore(NestedObjectStore):
             backend_config_dict["type"] = store_type
             backends_list.append(backend_config_dict)
 
-        return {"backends": backends_list}
+        return {"backends": backends_list, "location_cache": parse_location_cache_xml(config_xml)}
 
     def to_dict(self):
         as_dict = super(HierarchicalObjectStore, self).to_dict()
@@ -882,14 +989,12 @@ class HierarchicalObjectStore(NestedObjectStore):
 
     def exists(self, obj, **kwargs):
         """Check all child object stores."""
-        for store in self.backends.values():
-            if store.exists(obj, **kwargs):
-                return True
-        return False
+        return self._find_backend_id(obj, **kwargs) is not None
 
     def create(self, obj, **kwargs):
         """Call the primary object store."""
         self.backends[0].create(obj, **kwargs)
+        self._invalidate_location(obj)
 
 
 def type_to_object_store_class(store, fsmon=False):
@@ -980,6 +1085,20 @@ def build_object_store_from_config(config, fsmon=False, config_xml=None, config_
         return objectstore_class(config=config, config_dict=config_dict, **objectstore_constructor_kwds)
 
 
+def parse_location_cache_xml(config_xml):
+    """Parse the optional <location_cache> element of a nested object store."""
+    location_cache = {}
+    elem = config_xml.find('location_cache')
+    if elem is not None:
+        if elem.get('size') is not None:
+            location_cache['max_size'] = int(elem.get('size'))
+        if elem.get('negative_ttl') is not None:
+            location_cache['negative_ttl'] = float(elem.get('negative_ttl'))
+        if elem.get('path') is not None:
+            location_cache['path'] = elem.get('path')
+    return location_cache
+
+
 def local_extra_dirs(func):
     """Non-local plugin decorator using local directories for the extra_dirs (job_work and temp)."""
 
@@ -0,0 +1,377 @@
+"""
+Cache management for object stores that stage files in a local cache
+directory (e.g. S3, cloud and Azure object stores).
+"""
+import errno
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from galaxy.util.sleeper import Sleeper
+from ..objectstore import convert_bytes
+
+log = logging.getLogger(__name__)
+
+# Files below the cache directory that are used by Galaxy itself and are
+# never indexed or evicted
+INTERNAL_FILE_PREFIX = '.galaxy_'
+CACHE_INDEX_FILENAME = INTERNAL_FILE_PREFIX + 'cache_index.sqlite'
+DEFAULT_HIGH_WATERMARK = 0.9
+DEFAULT_LOW_WATERMARK = 0.8
+DEFAULT_MONITOR_INTERVAL = 30
+# Full rescans of the cache directory pick up files that were added or
+# removed without going through the object store
+DEFAULT_RESCAN_INTERVAL = 86400
+EVICTION_BATCH_SIZE = 1000
+# Uploads waiting to be written behind (see galaxy.objectstore.write_behind),
+# kept in the cache index so every process sees them and they are not evicted
+PENDING_UPLOAD_TABLE = ("CREATE TABLE IF NOT EXISTS pending_upload (rel_path TEXT PRIMARY KEY, source_file TEXT NOT NULL, "
+                        "enqueue_time REAL NOT NULL, owner TEXT NOT NULL)")
+
+
+def process_pin_owner(tag):
+    """
+    Return an owner for pins (see ``CacheManager.pin``) held by this process
+    for ``tag``, they are released with the other pins of the process once
+    it is gone.
+    """
+    return "%s:%d:%s" % (socket.gethostname(), os.getpid(), tag)
+
+
+def like_prefix(prefix):
+    """Return a pattern for ``LIKE ... ESCAPE '\\'`` matching strings starting with ``prefix``."""
+    return prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+class NullCacheManager(object):
+    """
+    Implements the CacheManager interface but does nothing, used when no
+    cache size is configured for an object store.
+    """
+
+    def start(self):
+        pass
+
+    def shutdown(self):
+        pass
+
+    def file_added(self, cache_path):
+        pass
+
+    def file_accessed(self, cache_path):
+        pass
+
+    def file_removed(self, cache_path):
+        pass
+
+    def dir_removed(self, cache_path):
+        pass
+
+    def pin(self, cache_path, owner=None):
+        pass
+
+    def unpin(self, cache_path, owner=None):
+        pass
+
+    def unpin_owner(self, owner):
+        pass
+
+    @contextmanager
+    def pinned(self, cache_path):
+        yield
+
+
+class CacheManager(object):
+    """
+    Keeps an index (in an sqlite database inside the cache directory) of all
+    files in an object store cache with their size and last access time, so
+    the cache size is known without walking the cache directory and the
+    least recently used files can be evicted with an indexed query.
+
+    Object stores report files they put into the cache, read from it and
+    delete from it. Once the total size of the cache goes beyond
+    ``high_watermark`` (a fraction of ``cache_size``), least recently used
+    files are deleted until it is below ``low_watermark``. Files can be pinned
+    (e.g. while they are being downloaded or used as inputs of running jobs)
+    to prevent their eviction, files waiting to be uploaded are never evicted.
+
+    The total size, the pins and the pending uploads are kept in the index
+    too, so all Galaxy processes sharing a cache directory see the same cache.
+    The index is an sqlite database in WAL mode, which needs shared memory
+    between the processes using it: the cache directory must be on a local
+    filesystem of the host these processes run on, not on NFS or another
+    network filesystem shared between hosts.
+    """
+
+    def __init__(self, staging_path, cache_size, high_watermark=DEFAULT_HIGH_WATERMARK,
+                 low_watermark=DEFAULT_LOW_WATERMARK, monitor_interval=DEFAULT_MONITOR_INTERVAL,
+                 rescan_interval=DEFAULT_RESCAN_INTERVAL, index_path=None):
+        if not 0 < low_watermark <= high_watermark <= 1:
+            raise Exception("Object store cache watermarks must satisfy 0 < low_watermark <= high_watermark <= 1")
+        self.staging_path = os.path.abspath(staging_path)
+        self.cache_size = cache_size
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.monitor_interval = monitor_interval
+        self.rescan_interval = rescan_interval
+        self.index_path = index_path or os.path.join(self.staging_path, CACHE_INDEX_FILENAME)
+        self._lock = threading.RLock()
+        self._last_rescan = 0
+        self.running = False
+        self.sleeper = Sleeper()
+        self.monitor_thread = None
+        self._init_index()
+
+    def _init_index(self):
+        if not os.path.exists(os.path.dirname(self.index_path)):
+            os.makedirs(os.path.dirname(self.index_path))
+        new_index = not os.path.exists(self.index_path)
+        self._conn = sqlite3.connect(self.index_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # Needed for the prefix matching in dir_removed()
+        self._conn.execute("PRAGMA case_sensitive_like=ON")
+        # Rows replaced by INSERT OR REPLACE fire the delete trigger
+        self._conn.execute("PRAGMA recursive_triggers=ON")
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache_entry (path TEXT PRIMARY KEY, size INTEGER NOT NULL, atime REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entry_atime ON cache_entry (atime)")
+        # Pins of each process, so the evicting process sees the pins of all of them
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache_pin (path TEXT NOT NULL, owner TEXT NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (path, owner))")
+        # Total size of all entries, updated in the same transaction as the entries
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache_total (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO cache_total (id, size) SELECT 0, COALESCE(SUM(size), 0) FROM cache_entry")
+        self._conn.execute(PENDING_UPLOAD_TABLE)
+        self._conn.execute("CREATE TRIGGER IF NOT EXISTS cache_entry_insert AFTER INSERT ON cache_entry "
+                           "BEGIN UPDATE cache_total SET size = size + NEW.size; END")
+        self._conn.execute("CREATE TRIGGER IF NOT EXISTS cache_entry_delete AFTER DELETE ON cache_entry "
+                           "BEGIN UPDATE cache_total SET size = size - OLD.size; END")
+        self._conn.execute("CREATE TRIGGER IF NOT EXISTS cache_entry_update AFTER UPDATE OF size ON cache_entry "
+                           "BEGIN UPDATE cache_total SET size = size + NEW.size - OLD.size; END")
+        self._conn.execute("COMMIT")
+        if not new_index:
+            # The index of a previous run is trusted until the first rescan
+            self._last_rescan = time.time()
+
+    def start(self):
+        self.running = True
+        self.monitor_thread = threading.Thread(target=self._monitor, name="ObjectStoreCacheManager.monitor_thread")
+        self.monitor_thread.daemon = True
+        self.monitor_thread.start()
+        log.info("Cache cleaner manager started")
+
+    def shutdown(self):
+        self.running = False
+        if self.monitor_thread:
+            self.sleeper.wake()
+            self.monitor_thread.join(5)
+        with self._lock:
+            self._conn.close()
+
+    def _monitor(self):
+        while self.running:
+            try:
+                if self.rescan_interval and time.time() - self._last_rescan >= self.rescan_interval:
+                    self.rescan()
+                self.evict()
+            except Exception:
+                log.exception("Exception in object store cache monitor")
+            self.sleeper.sleep(self.monitor_interval)
+
+    def _relpath(self, cache_path):
+        return os.path.relpath(os.path.abspath(cache_path), self.staging_path)
+
+    @property
+    def total_size(self):
+        """Total size of the files in the cache, as recorded by all processes using it."""
+        with self._lock:
+            return self._conn.execute("SELECT size FROM cache_total").fetchone()[0]
+
+    def file_added(self, cache_path):
+        """Record a file put into the cache (or rewritten) by the object store."""
+        if not os.path.isfile(cache_path):
+            return
+        try:
+            size = os.path.getsize(cache_path)
+        except OSError:
+            return
+        path = self._relpath(cache_path)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO cache_entry (path, size, atime) VALUES (?, ?, ?)", (path, size, time.time()))
+        if self.total_size > self.cache_size * self.high_watermark:
+            self.sleeper.wake()
+
+    def file_accessed(self, cache_path):
+        """Record a read of a file in the cache."""
+        with self._lock:
+            cursor = self._conn.execute("UPDATE cache_entry SET atime = ? WHERE path = ?", (time.time(), self._relpath(cache_path)))
+        if cursor.rowcount == 0:
+            self.file_added(cache_path)
+
+    def file_removed(self, cache_path):
+        """Record the deletion of a file from the cache."""
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_entry WHERE path = ?", (self._relpath(cache_path),))
+
+    def dir_removed(self, cache_path):
+        """Record the deletion of a directory (and all files below it) from the cache."""
+        pattern = like_prefix(self._relpath(cache_path).rstrip(os.sep) + os.sep)
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_entry WHERE path LIKE ? ESCAPE '\\'", (pattern,))
+
+    def _owner(self):
+        # Forked processes pin files under their own name
+        return "%s:%d" % (socket.gethostname(), os.getpid())
+
+    def pin(self, cache_path, owner=None):
+        """
+        Prevent eviction of ``cache_path`` until it is unpinned by ``owner``
+        (this process by default).
+        """
+        path = self._relpath(cache_path)
+        owner = owner or self._owner()
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO cache_pin (path, owner, count) VALUES (?, ?, 0)", (path, owner))
+            self._conn.execute("UPDATE cache_pin SET count = count + 1 WHERE path = ? AND owner = ?", (path, owner))
+
+    def unpin(self, cache_path, owner=None):
+        path = self._relpath(cache_path)
+        owner = owner or self._owner()
+        with self._lock:
+            self._conn.execute("UPDATE cache_pin SET count = count - 1 WHERE path = ? AND owner = ?", (path, owner))
+            self._conn.execute("DELETE FROM cache_pin WHERE path = ? AND owner = ? AND count <= 0", (path, owner))
+
+    def unpin_owner(self, owner):
+        """Release all pins of ``owner``."""
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_pin WHERE owner = ?", (owner,))
+
+    @contextmanager
+    def pinned(self, cache_path):
+        """Prevent eviction of ``cache_path`` while in this context."""
+        self.pin(cache_path)
+        try:
+            yield
+        finally:
+            self.unpin(cache_path)
+
+    def evict(self):
+        """
+        If the cache is above the high watermark, delete least recently used
+        files until it is below the low watermark, skipping pinned files and
+        files waiting to be uploaded. Returns the number of bytes freed.
+        """
+        total_size = self.total_size
+        if total_size <= self.cache_size * self.high_watermark:
+            return 0
+        target = self.cache_size * self.low_watermark
+        log.info("Initiating cache cleaning: current cache size: %s; clean until smaller than: %s",
+                 convert_bytes(total_size), convert_bytes(target))
+        freed = 0
+        while total_size > target:
+            with self._lock:
+                # Files cannot be pinned by any process while a batch is chosen,
+                # the files are only removed once their entries are gone
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    rows = self._conn.execute("SELECT path, size FROM cache_entry WHERE path NOT IN (SELECT path FROM cache_pin) "
+                                              "AND path NOT IN (SELECT rel_path FROM pending_upload) "
+                                              "ORDER BY atime LIMIT ?", (EVICTION_BATCH_SIZE,)).fetchall()
+                    removed = []
+                    for path, size in rows:
+                        if total_size <= target:
+                            break
+                        removed.append(path)
+                        total_size -= size
+                        freed += size
+                    self._conn.executemany("DELETE FROM cache_entry WHERE path = ?", [(path,) for path in removed])
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            for path in removed:
+                if self._in_use(path):
+                    # Pinned or put back into the cache since the batch was chosen
+                    continue
+                try:
+                    os.remove(os.path.join(self.staging_path, path))
+                except OSError as e:
+                    log.debug("Could not remove cached file '%s': %s", path, e)
+            if not removed:
+                break
+            # Other processes may have added or removed files meanwhile
+            total_size = self.total_size
+        log.debug("Cache cleaning done. Total space freed: %s", convert_bytes(freed))
+        return freed
+
+    def _in_use(self, path):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM cache_entry WHERE path = ? UNION ALL SELECT 1 FROM cache_pin WHERE path = ?",
+                                      (path, path)).fetchone() is not None
+
+    def rescan(self):
+        """
+        Walk the cache directory and bring the index in line with it, adding
+        files that are not indexed yet and dropping entries for files that no
+        longer exist.
+        """
+        log.debug("Rescanning object store cache directory %s", self.staging_path)
+        start = time.time()
+        with self._lock:
+            self._conn.execute("CREATE TEMPORARY TABLE IF NOT EXISTS seen_path (path TEXT PRIMARY KEY)")
+            self._conn.execute("DELETE FROM seen_path")
+        for dirpath, _, filenames in os.walk(self.staging_path):
+            batch = []
+            for filename in filenames:
+                filepath = os.path.join(dirpath, filename)
+                if filename.startswith(INTERNAL_FILE_PREFIX) or filepath.startswith(self.index_path):
+                    continue
+                try:
+                    stat = os.stat(filepath)
+                except OSError:
+                    continue
+                batch.append((self._relpath(filepath), stat.st_size, stat.st_atime))
+            if batch:
+                with self._lock:
+                    self._conn.execute("BEGIN")
+                    self._conn.executemany("INSERT OR IGNORE INTO cache_entry (path, size, atime) VALUES (?, ?, ?)", batch)
+                    self._conn.executemany("INSERT OR IGNORE INTO seen_path (path) VALUES (?)", [(b[0],) for b in batch])
+                    self._conn.execute("COMMIT")
+        with self._lock:
+            # Files added while scanning were recorded after ``start``
+            self._conn.execute("DELETE FROM cache_entry WHERE atime < ? AND path NOT IN (SELECT path FROM seen_path)", (start,))
+            self._conn.execute("DELETE FROM seen_path")
+        self._drop_stale_pins()
+        self._last_rescan = time.time()
+        log.debug("Rescanned object store cache in %.2f seconds, cache size: %s", time.time() - start, convert_bytes(self.total_size))
+
+    def _drop_stale_pins(self):
+        """
+        Drop the pins left by processes on this host that are gone (e.g.
+        killed while downloading). Pins of other owners (e.g. the inputs of
+        running jobs) are kept until they are released.
+        """
+        hostname = socket.gethostname()
+        with self._lock:
+            owners = [row[0] for row in self._conn.execute("SELECT DISTINCT owner FROM cache_pin")]
+        for owner in owners:
+            # host:pid, optionally followed by :tag (see process_pin_owner)
+            host, _, pid = owner.partition(':')
+            pid = pid.partition(':')[0]
+            if host != hostname or not pid.isdigit() or _process_exists(int(pid)):
+                continue
+            log.debug("Dropping pins of process %s that no longer exists", owner)
+            with self._lock:
+                self._conn.execute("DELETE FROM cache_pin WHERE owner = ?", (owner,))
+
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
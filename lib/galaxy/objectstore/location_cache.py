@@ -0,0 +1,113 @@
+"""
+Remember which backend of a nested object store holds an object, so the
+backends do not have to be probed with ``exists()`` on every access.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 100000
+DEFAULT_NEGATIVE_TTL = 0
+
+
+class ObjectLocationCache(object):
+    """
+    Keeps the backend found for an object (an LRU of at most ``max_size``
+    entries in memory and, if ``path`` is set, all entries in an sqlite
+    database that survives restarts).
+
+    Found locations are used as a hint: the remembered backend is probed
+    first, and all backends are probed again if the object is not there.
+    Objects not found in any backend are remembered for ``negative_ttl``
+    seconds, separately for every combination of object store method
+    arguments since e.g. the extra files directory of a dataset may not
+    exist while the dataset itself does.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, negative_ttl=DEFAULT_NEGATIVE_TTL, path=None):
+        self.max_size = max_size
+        self.negative_ttl = negative_ttl
+        self.path = path
+        self._locations = OrderedDict()
+        # object_key -> {kwargs key: expiration time}
+        self._missing = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            if not os.path.exists(os.path.dirname(os.path.abspath(path))):
+                os.makedirs(os.path.dirname(os.path.abspath(path)))
+            self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS object_location (object_key TEXT PRIMARY KEY, backend_id TEXT NOT NULL)")
+
+    def get(self, object_key):
+        """Return the backend id remembered for ``object_key`` or ``None``."""
+        with self._lock:
+            backend_id = self._locations.pop(object_key, None)
+            if backend_id is None and self._conn is not None:
+                row = self._conn.execute("SELECT backend_id FROM object_location WHERE object_key = ?", (object_key,)).fetchone()
+                backend_id = row and row[0]
+            if backend_id is not None:
+                self._remember(self._locations, object_key, backend_id)
+            return backend_id
+
+    def set(self, object_key, backend_id):
+        backend_id = str(backend_id)
+        with self._lock:
+            if self._locations.get(object_key) == backend_id:
+                return
+            self._locations.pop(object_key, None)
+            self._remember(self._locations, object_key, backend_id)
+            self._missing.pop(object_key, None)
+            if self._conn is not None:
+                self._conn.execute("INSERT OR REPLACE INTO object_location (object_key, backend_id) VALUES (?, ?)", (object_key, backend_id))
+
+    def is_missing(self, object_key, kwargs):
+        """Whether the object was recently not found in any backend."""
+        if not self.negative_ttl:
+            return False
+        kwargs_key = self._kwargs_key(kwargs)
+        with self._lock:
+            expires = self._missing.get(object_key, {}).get(kwargs_key)
+            if expires is None:
+                return False
+            if expires < time.time():
+                del self._missing[object_key][kwargs_key]
+                return False
+            return True
+
+    def set_missing(self, object_key, kwargs):
+        if not self.negative_ttl:
+            return
+        with self._lock:
+            missing = self._missing.pop(object_key, {})
+            missing[self._kwargs_key(kwargs)] = time.time() + self.negative_ttl
+            self._remember(self._missing, object_key, missing)
+
+    def invalidate(self, object_key):
+        """Forget everything about ``object_key``, e.g. after it was created or deleted."""
+        with self._lock:
+            self._locations.pop(object_key, None)
+            self._missing.pop(object_key, None)
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM object_location WHERE object_key = ?", (object_key,))
+
+    def shutdown(self):
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+                self._conn = None
+
+    def _remember(self, entries, key, value):
+        entries[key] = value
+        while len(entries) > self.max_size:
+            entries.popitem(last=False)
+
+    @staticmethod
+    def _kwargs_key(kwargs):
+        return tuple(sorted((k, v) for k, v in kwargs.items() if v is not None and not isinstance(v, (list, dict))))
@@ -0,0 +1,189 @@
+"""
+Choose the backend of a distributed object store new objects are created in.
+"""
+import logging
+import random
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+log = logging.getLogger(__name__)
+
+# Weight of the newest measurement in the moving averages of write rate and
+# object size
+SMOOTHING_FACTOR = 0.3
+
+
+class BackendStats(object):
+    """
+    Capacity of a backend as last measured, plus an estimate of what was
+    written to it since. Backends that only report how full they are are
+    measured in percent instead of bytes (``in_bytes`` is then ``False``).
+
+    The sizes of objects being written are not known until they are
+    finished, so ``estimated_growth`` counts every object created since the
+    last measurement at the average size of recent objects. It is not space
+    reserved by running jobs: it is discarded by the next measurement, which
+    includes what was actually written.
+    """
+
+    def __init__(self, total, free, in_bytes=True):
+        self.total = total
+        self.free = free
+        self.in_bytes = in_bytes
+        self.measure_time = time.time()
+        self.write_rate = 0.0
+        self.object_size = 0.0
+        self.created = 0
+        self.estimated_growth = 0.0
+
+    def projected_free(self, now=None):
+        """
+        Estimated free space now, assuming objects created since the last
+        measurement grow to the average object size and other objects keep
+        growing at the recent write rate.
+        """
+        elapsed = (now or time.time()) - self.measure_time
+        return self.free - max(self.estimated_growth, self.write_rate * elapsed)
+
+    def projected_percent_used(self, now=None):
+        if not self.total:
+            return 100.0
+        return 100.0 * (self.total - self.projected_free(now)) / self.total
+
+    def update(self, total, free, in_bytes=True):
+        now = time.time()
+        elapsed = now - self.measure_time
+        written = max(self.free - free, 0)
+        if elapsed > 0:
+            self.write_rate = _smooth(self.write_rate, written / elapsed)
+        if self.created:
+            self.object_size = _smooth(self.object_size, float(written) / self.created)
+        self.total = total
+        self.free = free
+        self.in_bytes = in_bytes
+        self.measure_time = now
+        self.created = 0
+        self.estimated_growth = 0.0
+
+
+class BackendPlacement(object):
+    """
+    Weighted random choice of a backend for new objects, skipping backends
+    whose projected usage is above their ``max_percent_full``.
+
+    Backend capacity is measured by ``refresh()`` (for all backends
+    concurrently) and projected forward between refreshes using the objects
+    created since and the recent write rate of each backend. With
+    ``balance_by_free_space`` the configured weights are further scaled by
+    the projected free space of each backend; backends whose free space is
+    not known in bytes are given the mean free space of the others.
+    """
+
+    def __init__(self, backends, weights, max_percent_full, global_max_percent_full=0, balance_by_free_space=False):
+        self.backends = backends
+        self.weights = weights
+        self.max_percent_full = max_percent_full
+        self.global_max_percent_full = global_max_percent_full
+        self.balance_by_free_space = balance_by_free_space
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def refresh(self):
+        """Measure the capacity of all backends."""
+        if self._pool is None:
+            self._pool = ThreadPool(len(self.backends))
+        backend_ids = list(self.backends.keys())
+        measurements = self._pool.map(self._measure, backend_ids)
+        with self._lock:
+            for backend_id, measurement in zip(backend_ids, measurements):
+                if measurement is None:
+                    continue
+                stats = self.stats.get(backend_id)
+                if stats is None:
+                    self.stats[backend_id] = BackendStats(*measurement)
+                else:
+                    stats.update(*measurement)
+
+    def _measure(self, backend_id):
+        backend = self.backends[backend_id]
+        try:
+            total, free = backend.get_store_space()
+            return total, free, True
+        except NotImplementedError:
+            pass
+        except Exception:
+            log.exception("Failed to measure free space of object store backend '%s'", backend_id)
+            return None
+        # Most backends only report how full they are
+        try:
+            percent_used = backend.get_store_usage_percent()
+        except NotImplementedError:
+            return None
+        except Exception:
+            log.exception("Failed to measure usage of object store backend '%s'", backend_id)
+            return None
+        return 100.0, 100.0 - percent_used, False
+
+    def is_full(self, backend_id):
+        with self._lock:
+            return self._is_full(backend_id, time.time())
+
+    def _is_full(self, backend_id, now):
+        stats = self.stats.get(backend_id)
+        max_percent_full = self.max_percent_full.get(backend_id) or self.global_max_percent_full
+        if stats is None or not max_percent_full:
+            return False
+        return stats.projected_percent_used(now) > max_percent_full
+
+    def choose(self):
+        """Return the id of the backend to create a new object in, or ``None`` if all are full."""
+        now = time.time()
+        with self._lock:
+            candidates = [(backend_id, weight) for backend_id, weight in self.weights.items()
+                          if weight and not self._is_full(backend_id, now)]
+            if self.balance_by_free_space:
+                candidates = self._balance_by_free_space(candidates, now)
+        candidates = [(backend_id, weight) for backend_id, weight in candidates if weight > 0]
+        if not candidates:
+            return None
+        choice = random.uniform(0, sum(weight for _, weight in candidates))
+        for backend_id, weight in candidates:
+            choice -= weight
+            if choice <= 0:
+                return backend_id
+        return candidates[-1][0]
+
+    def _balance_by_free_space(self, candidates, now):
+        free = {}
+        for backend_id, _ in candidates:
+            stats = self.stats.get(backend_id)
+            if stats is not None and stats.in_bytes:
+                free[backend_id] = max(stats.projected_free(now), 0)
+        # Backends without a free space in bytes would otherwise be weighted
+        # by about 1 byte against gigabytes for the others
+        mean_free = float(sum(free.values())) / len(free) if free else 0
+        return [(backend_id, weight * free.get(backend_id, mean_free or 1)) for backend_id, weight in candidates]
+
+    def record_create(self, backend_id):
+        """
+        Count a new object in ``backend_id``, at the average object size, in
+        its estimated growth until the next refresh.
+        """
+        with self._lock:
+            stats = self.stats.get(backend_id)
+            if stats is not None:
+                stats.created += 1
+                stats.estimated_growth += stats.object_size
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+
+def _smooth(average, value):
+    if not average:
+        return value
+    return SMOOTHING_FACTOR * value + (1 - SMOOTHING_FACTOR) * average
@@ -1,14 +1,15 @@
 """
 Object Store plugin for the Amazon Simple Storage Service (S3)
 """
+import codecs
 import logging
 import multiprocessing
 import os
 import shutil
 import subprocess
-import threading
 import time
 from datetime import datetime
+from functools import partial
 
 try:
     # Imports are done this way to allow objectstore code to be used outside of Galaxy.
@@ -27,9 +28,24 @@ from galaxy.util import (
     which,
 )
 from galaxy.util.path import safe_relpath
-from galaxy.util.sleeper import Sleeper
+from .caching import (
+    CacheManager,
+    DEFAULT_HIGH_WATERMARK,
+    DEFAULT_LOW_WATERMARK,
+    NullCacheManager
+)
+from .s3_multipart_download import (
+    key_from_ids,
+    multipart_download,
+    range_header,
+    staged_download,
+)
 from .s3_multipart_upload import multipart_upload
-from ..objectstore import ConcreteObjectStore, convert_bytes
+from .write_behind import (
+    NullUploader,
+    WriteBehindUploader,
+)
+from ..objectstore import ConcreteObjectStore
 
 NO_BOTO_ERROR_MESSAGE = ("S3/Swift object store configured, but no boto dependency available."
                          "Please install and properly configure boto or modify object store configuration.")
@@ -60,11 +76,20 @@ def parse_config_xml(config_xml):
         multipart = string_as_bool(cn_xml.get('multipart', 'True'))
         is_secure = string_as_bool(cn_xml.get('is_secure', 'True'))
         conn_path = cn_xml.get('conn_path', '/')
+        download_part_size = int(cn_xml.get('download_part_size', 100))
+        download_threads = int(cn_xml.get('download_threads', 4))
+        range_read_max_size = float(cn_xml.get('range_read_max_size', 0))
 
         c_xml = config_xml.findall('cache')[0]
         cache_size = float(c_xml.get('size', -1))
 
         staging_path = c_xml.get('path', None)
+        high_watermark = float(c_xml.get('high_watermark', DEFAULT_HIGH_WATERMARK))
+        low_watermark = float(c_xml.get('low_watermark', DEFAULT_LOW_WATERMARK))
+        index_path = c_xml.get('index_path', None)
+        write_behind = string_as_bool(c_xml.get('write_behind', 'False'))
+        write_behind_threads = int(c_xml.get('write_behind_threads', 4))
+        write_behind_max_retries = int(c_xml.get('write_behind_max_retries', 5))
 
         tag, attrs = 'extra_dir', ('type', 'path')
         extra_dirs = config_xml.findall(tag)
@@ -90,10 +115,19 @@ def parse_config_xml(config_xml):
                 'multipart': multipart,
                 'is_secure': is_secure,
                 'conn_path': conn_path,
+                'download_part_size': download_part_size,
+                'download_threads': download_threads,
+                'range_read_max_size': range_read_max_size,
             },
             'cache': {
                 'size': cache_size,
                 'path': staging_path,
+                'high_watermark': high_watermark,
+                'low_watermark': low_watermark,
+                'index_path': index_path,
+                'write_behind': write_behind,
+                'write_behind_threads': write_behind_threads,
+                'write_behind_max_retries': write_behind_max_retries,
             },
             'extra_dirs': extra_dirs,
         }
@@ -103,6 +137,22 @@ def parse_config_xml(config_xml):
         raise
 
 
+def decode_byte_range(content, start):
+    """
+    Decode ``content``, read at byte offset ``start`` of an object, as UTF-8.
+    Multibyte characters cut by the start or the end of the range are dropped
+    rather than decoded into replacement characters.
+    """
+    if start > 0:
+        # Skip the continuation bytes of a character starting before the range
+        lead = bytearray(content[:3])
+        skip = 0
+        while skip < len(lead) and 0x80 <= lead[skip] < 0xC0:
+            skip += 1
+        content = content[skip:]
+    return codecs.getincrementaldecoder('utf-8')(errors='replace').decode(content)
+
+
 class CloudConfigMixin(object):
 
     def _config_to_dict(self):
@@ -121,10 +171,19 @@ class CloudConfigMixin(object):
                 'multipart': self.multipart,
                 'is_secure': self.is_secure,
                 'conn_path': self.conn_path,
+                'download_part_size': self.download_part_size,
+                'download_threads': self.download_threads,
+                'range_read_max_size': self.range_read_max_size,
             },
             'cache': {
                 'size': self.cache_size,
                 'path': self.staging_path,
+                'high_watermark': self.cache_high_watermark,
+                'low_watermark': self.cache_low_watermark,
+                'index_path': self.cache_index_path,
+                # Processes built from this dict (e.g. for setting metadata)
+                # exit without waiting for background uploads
+                'write_behind': False,
             },
             'enable_cache_monitor': False,
         }
@@ -161,9 +220,28 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
         self.multipart = connection_dict.get('multipart', True)
         self.is_secure = connection_dict.get('is_secure', True)
         self.conn_path = connection_dict.get('conn_path', '/')
+        # Objects larger than download_part_size (in MB) are fetched as that
+        # many parts, download_threads at a time
+        self.download_part_size = connection_dict.get('download_part_size', 100)
+        self.download_threads = connection_dict.get('download_threads', 4)
+        # get_data() requests for at most range_read_max_size MB of an object
+        # not in the cache are served directly from S3, 0 (the default)
+        # always pulls the object into the cache
+        self.range_read_max_size = connection_dict.get('range_read_max_size', 0)
 
         self.cache_size = cache_dict.get('size', -1)
         self.staging_path = cache_dict.get('path') or self.config.object_store_cache_path
+        # Fractions of the cache size: once the cache grows beyond the high
+        # watermark, files are evicted until it is below the low watermark
+        self.cache_high_watermark = cache_dict.get('high_watermark', DEFAULT_HIGH_WATERMARK)
+        self.cache_low_watermark = cache_dict.get('low_watermark', DEFAULT_LOW_WATERMARK)
+        # The sqlite index of the cache (by default inside the cache directory)
+        # must be on a filesystem local to the processes using it
+        self.cache_index_path = cache_dict.get('index_path')
+        # Upload files to S3 in the background once they are in the cache
+        self.write_behind = cache_dict.get('write_behind', False)
+        self.write_behind_threads = cache_dict.get('write_behind_threads', 4)
+        self.write_behind_max_retries = cache_dict.get('write_behind_max_retries', 5)
 
         extra_dirs = dict(
             (e['type'], e['path']) for e in config_dict.get('extra_dirs', []))
@@ -188,6 +266,7 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
         self._configure_connection()
         self._bucket = self._get_bucket(self.bucket)
         self.start_cache_monitor()
+        self.start_uploader()
         # Test if 'axel' is available for parallel download and pull the key into cache
         if which('axel'):
             self.use_axel = True
@@ -196,14 +275,30 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
 
     def start_cache_monitor(self):
         # Clean cache only if value is set in galaxy.ini
+        # Processes without the monitor (e.g. setting metadata on compute
+        # nodes) do not open the cache index
         if self.cache_size != -1 and self.enable_cache_monitor:
-            # Convert GBs to bytes for comparison
-            self.cache_size = self.cache_size * 1073741824
-            # Helper for interruptable sleep
-            self.sleeper = Sleeper()
-            self.cache_monitor_thread = threading.Thread(target=self.__cache_monitor)
-            self.cache_monitor_thread.start()
-            log.info("Cache cleaner manager started")
+            # Convert GBs to bytes for comparison, the configured size is kept
+            # for processes built from _config_to_dict()
+            self.cache_manager = CacheManager(self.staging_path, self.cache_size * 1073741824,
+                                              high_watermark=self.cache_high_watermark,
+                                              low_watermark=self.cache_low_watermark,
+                                              index_path=self.cache_index_path)
+            self.cache_manager.start()
+        else:
+            self.cache_manager = NullCacheManager()
+
+    def start_uploader(self):
+        if self.write_behind:
+            self.uploader = WriteBehindUploader(self._push_to_os,
+                                                self.staging_path,
+                                                server_name=getattr(self.config, 'server_name', 'main'),
+                                                threads=self.write_behind_threads,
+                                                max_retries=self.write_behind_max_retries,
+                                                journal_path=self.cache_index_path)
+            self.uploader.start()
+        else:
+            self.uploader = NullUploader()
 
     def _configure_connection(self):
         log.debug("Configuring S3 Connection")
@@ -218,70 +313,6 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
         as_dict.update(self._config_to_dict())
         return as_dict
 
-    def __cache_monitor(self):
-        time.sleep(2)  # Wait for things to load before starting the monitor
-        while self.running:
-            total_size = 0
-            # Is this going to be too expensive of an operation to be done frequently?
-            file_list = []
-            for dirpath, _, filenames in os.walk(self.staging_path):
-                for filename in filenames:
-                    filepath = os.path.join(dirpath, filename)
-                    file_size = os.path.getsize(filepath)
-                    total_size += file_size
-                    # Get the time given file was last accessed
-                    last_access_time = time.localtime(os.stat(filepath)[7])
-                    # Compose a tuple of the access time and the file path
-                    file_tuple = last_access_time, filepath, file_size
-                    file_list.append(file_tuple)
-            # Sort the file list (based on access time)
-            file_list.sort()
-            # Initiate cleaning once within 10% of the defined cache size?
-            cache_limit = self.cache_size * 0.9
-            if total_size > cache_limit:
-                log.info("Initiating cache cleaning: current cache size: %s; clean until smaller than: %s",
-                         convert_bytes(total_size), convert_bytes(cache_limit))
-                # How much to delete? If simply deleting up to the cache-10% limit,
-                # is likely to be deleting frequently and may run the risk of hitting
-                # the limit - maybe delete additional #%?
-                # For now, delete enough to leave at least 10% of the total cache free
-                delete_this_much = total_size - cache_limit
-                self.__clean_cache(file_list, delete_this_much)
-            self.sleeper.sleep(30)  # Test cache size every 30 seconds?
-
-    def __clean_cache(self, file_list, delete_this_much):
-        """ Keep deleting files from the file_list until the size of the deleted
-        files is greater than the value in delete_this_much parameter.
-
-        :type file_list: list
-        :param file_list: List of candidate files that can be deleted. This method
-            will start deleting files from the beginning of the list so the list
-            should be sorted accordingly. The list must contains 3-element tuples,
-            positioned as follows: position 0 holds file last accessed timestamp
-            (as time.struct_time), position 1 holds file path, and position 2 has
-            file size (e.g., (<access time>, /mnt/data/dataset_1.dat), 472394)
-
-        :type delete_this_much: int
-        :param delete_this_much: Total size of files, in bytes, that should be deleted.
-        """
-        # Keep deleting datasets from file_list until deleted_amount does not
-        # exceed delete_this_much; start deleting from the front of the file list,
-        # which assumes the oldest files come first on the list.
-        deleted_amount = 0
-        for entry in file_list:
-            if deleted_amount < delete_this_much:
-                deleted_amount += entry[2]
-                os.remove(entry[1])
-                # Debugging code for printing deleted files' stats
-                # folder, file_name = os.path.split(f[1])
-                # file_date = time.strftime("%m/%d/%y %H:%M:%S", f[0])
-                # log.debug("%s. %-25s %s, size %s (deleted %s/%s)" \
-                #     % (i, file_name, convert_bytes(f[2]), file_date, \
-                #     convert_bytes(deleted_amount), convert_bytes(delete_this_much)))
-            else:
-                log.debug("Cache cleaning done. Total space freed: %s", convert_bytes(deleted_amount))
-                return
-
     def _get_bucket(self, bucket_name):
         """ Sometimes a handle to a bucket is not established right away so try
         it a few times. Raise error is connection is not established. """
@@ -416,9 +447,12 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
         rel_path_dir = os.path.dirname(rel_path)
         if not os.path.exists(self._get_cache_path(rel_path_dir)):
             os.makedirs(self._get_cache_path(rel_path_dir))
-        # Now pull in the file
-        file_ok = self._download(rel_path)
+        # Now pull in the file, making sure it is not evicted while downloading
+        with self.cache_manager.pinned(self._get_cache_path(rel_path)):
+            file_ok = self._download(rel_path)
         self._fix_permissions(self._get_cache_path(rel_path_dir))
+        if file_ok:
+            self.cache_manager.file_added(self._get_cache_path(rel_path))
         return file_ok
 
     def _transfer_cb(self, complete, total):
@@ -429,8 +463,8 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
             log.debug("Pulling key '%s' into cache to %s", rel_path, self._get_cache_path(rel_path))
             key = self._bucket.get_key(rel_path)
             # Test if cache is large enough to hold the new file
-            if self.cache_size > 0 and key.size > self.cache_size:
-                log.critical("File %s is larger (%s) than the cache size (%s). Cannot download.",
+            if self.cache_size > 0 and key.size > self.cache_size * 1073741824:
+                log.critical("File %s is larger (%s) than the cache size (%s GB). Cannot download.",
                              rel_path, key.size, self.cache_size)
                 return False
             if self.use_axel:
@@ -440,10 +474,19 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
                 ret_code = subprocess.call(['axel', '-a', '-n', ncores, url])
                 if ret_code == 0:
                     return True
+            elif self.download_threads > 1 and key.size > self.download_part_size * 1048576:
+                log.debug("Pulling key '%s' into cache to %s in parts", rel_path, self._get_cache_path(rel_path))
+                multipart_download(partial(key_from_ids, self.s3server, self._bucket.name, rel_path),
+                                   key.size,
+                                   self._get_cache_path(rel_path),
+                                   self.download_part_size * 1048576,
+                                   self.download_threads)
+                return True
             else:
                 log.debug("Pulled key '%s' into cache to %s", rel_path, self._get_cache_path(rel_path))
                 self.transfer_progress = 0  # Reset transfer progress counter
-                key.get_contents_to_filename(self._get_cache_path(rel_path), cb=self._transfer_cb, num_cb=10)
+                with staged_download(self._get_cache_path(rel_path)) as tmp_path:
+                    key.get_contents_to_filename(tmp_path, cb=self._transfer_cb, num_cb=10)
                 return True
         except S3ResponseError:
             log.exception("Problem downloading key '%s' from S3 bucket '%s'", rel_path, self._bucket.name)
@@ -498,6 +541,9 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
         rel_path = self._construct_path(obj, **kwargs)
         # Make sure the size in cache is available in its entirety
         if self._in_cache(rel_path):
+            # Files waiting to be uploaded are complete in the cache only
+            if self.uploader.is_pending(rel_path):
+                return True
             if os.path.getsize(self._get_cache_path(rel_path)) == self._get_size_in_s3(rel_path):
                 return True
             log.debug("Waiting for dataset %s to transfer from OS: %s/%s", rel_path,
@@ -511,6 +557,8 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
         # Check cache
         if self._in_cache(rel_path):
             in_cache = True
+            if self.uploader.is_pending(rel_path):
+                return True
         # Check S3
         in_s3 = self._key_exists(rel_path)
         # log.debug("~~~~~~ File '%s' exists in cache: %s; in s3: %s" % (rel_path, in_cache, in_s3))
@@ -570,6 +618,7 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
             if not dir_only:
                 rel_path = os.path.join(rel_path, alt_name if alt_name else "dataset_%s.dat" % self._get_object_id(obj))
                 open(os.path.join(self.staging_path, rel_path), 'w').close()
+                self.cache_manager.file_added(os.path.join(self.staging_path, rel_path))
                 self._push_to_os(rel_path, from_string='')
 
     def empty(self, obj, **kwargs):
@@ -608,7 +657,9 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
             # with all the files in it. This is easy for the local file system,
             # but requires iterating through each individual key in S3 and deleing it.
             if entire_dir and extra_dir:
+                self.uploader.cancel_prefix(rel_path)
                 shutil.rmtree(self._get_cache_path(rel_path))
+                self.cache_manager.dir_removed(self._get_cache_path(rel_path))
                 results = self._bucket.get_all_keys(prefix=rel_path)
                 for key in results:
                     log.debug("Deleting key %s", key.name)
@@ -616,30 +667,55 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
                 return True
             else:
                 # Delete from cache first
+                upload_cancelled = self.uploader.cancel(rel_path)
                 os.unlink(self._get_cache_path(rel_path))
+                self.cache_manager.file_removed(self._get_cache_path(rel_path))
                 # Delete from S3 as well
                 if self._key_exists(rel_path):
                     key = Key(self._bucket, rel_path)
                     log.debug("Deleting key %s", key.name)
                     key.delete()
                     return True
+                return upload_cancelled
         except S3ResponseError:
             log.exception("Could not delete key '%s' from S3", rel_path)
         except OSError:
             log.exception('%s delete error', self.get_filename(obj, **kwargs))
         return False
 
+    def _get_range(self, rel_path, start, count):
+        """
+        Read ``count`` bytes at offset ``start`` of a key without pulling it
+        into cache, decoded like ``get_data`` decodes the bytes read from the
+        cache.
+        """
+        try:
+            key = self._bucket.get_key(rel_path)
+            if key is None:
+                return None
+            content = key.get_contents_as_string(headers=range_header(start, start + count - 1))
+            return decode_byte_range(content, start)
+        except S3ResponseError:
+            log.debug("Could not read range %s-%s of key '%s', pulling it into cache", start, start + count - 1, rel_path)
+        return None
+
     def get_data(self, obj, start=0, count=-1, **kwargs):
         rel_path = self._construct_path(obj, **kwargs)
+        # Small slices of files not in the cache are read directly from S3
+        if 0 < count <= self.range_read_max_size * 1048576 and not self._in_cache(rel_path):
+            content = self._get_range(rel_path, start, count)
+            if content is not None:
+                return content
         # Check cache first and get file if not there
         if not self._in_cache(rel_path):
             self._pull_into_cache(rel_path)
+        else:
+            self.cache_manager.file_accessed(self._get_cache_path(rel_path))
         # Read the file content from cache
-        data_file = open(self._get_cache_path(rel_path), 'r')
-        data_file.seek(start)
-        content = data_file.read(count)
-        data_file.close()
-        return content
+        with open(self._get_cache_path(rel_path), 'rb') as data_file:
+            data_file.seek(start)
+            content = data_file.read(count)
+        return decode_byte_range(content, start)
 
     def get_filename(self, obj, **kwargs):
         base_dir = kwargs.get('base_dir', None)
@@ -662,6 +738,8 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
         #     return cache_path
         # Check if the file exists in the cache first
         if self._in_cache(rel_path):
+            if not dir_only:
+                self.cache_manager.file_accessed(cache_path)
             return cache_path
         # Check if the file exists in persistent storage and, if it does, pull it into cache
         elif self.exists(obj, **kwargs):
@@ -693,12 +771,17 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
                         # FIXME? Should this be a `move`?
                         shutil.copy2(source_file, cache_file)
                     self._fix_permissions(cache_file)
+                    self.cache_manager.file_added(cache_file)
+                    source_file = cache_file
                 except OSError:
                     log.exception("Trouble copying source file '%s' to cache '%s'", source_file, cache_file)
             else:
                 source_file = self._get_cache_path(rel_path)
-            # Update the file on S3
-            self._push_to_os(rel_path, source_file)
+            # Update the file on S3, files in the cache can be uploaded later
+            if self.write_behind and source_file == self._get_cache_path(rel_path):
+                self.uploader.enqueue(rel_path, source_file)
+            else:
+                self._push_to_os(rel_path, source_file)
         else:
             raise ObjectNotFound('objectstore.update_from_file, object does not exist: %s, kwargs: %s'
                                  % (str(obj), str(kwargs)))
@@ -713,16 +796,19 @@ class S3ObjectStore(ConcreteObjectStore, CloudConfigMixin):
                 log.exception("Trouble generating URL for dataset '%s'", rel_path)
         return None
 
+    def pin(self, obj, owner, **kwargs):
+        self.cache_manager.pin(self._get_cache_path(self._construct_path(obj, **kwargs)), owner=owner)
+
+    def unpin_owner(self, owner):
+        self.cache_manager.unpin_owner(owner)
+
     def get_store_usage_percent(self):
         return 0.0
 
     def shutdown(self):
-        self.running = False
-        thread = getattr(self, 'cache_monitor_thread', None)
-        if thread:
-            log.debug("Shutting down thread")
-            self.sleeper.wake()
-            thread.join(5)
+        super(S3ObjectStore, self).shutdown()
+        self.uploader.shutdown()
+        self.cache_manager.shutdown()
 
 
 class SwiftObjectStore(S3ObjectStore):
@@ -0,0 +1,99 @@
+"""
+Download large objects from S3 as a set of byte ranges fetched in parallel.
+"""
+import functools
+import os
+import tempfile
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
+try:
+    import boto
+    from boto.s3.connection import S3Connection
+except ImportError:
+    boto = None
+
+from .caching import INTERNAL_FILE_PREFIX
+
+
+def key_from_ids(s3server, bucket_name, key_name):
+    """Get a key over a fresh connection.
+
+    boto connections should not be shared between threads, so every part of
+    a parallel download opens its own.
+    """
+    if s3server['host']:
+        conn = boto.connect_s3(aws_access_key_id=s3server['access_key'],
+                               aws_secret_access_key=s3server['secret_key'],
+                               is_secure=s3server['is_secure'],
+                               host=s3server['host'],
+                               port=s3server['port'],
+                               calling_format=boto.s3.connection.OrdinaryCallingFormat(),
+                               path=s3server['conn_path'])
+    else:
+        conn = S3Connection(s3server['access_key'], s3server['secret_key'])
+    return conn.get_bucket(bucket_name, validate=False).get_key(key_name)
+
+
+def byte_ranges(size, part_size):
+    """Split ``size`` bytes into inclusive (start, end) ranges of at most ``part_size`` bytes.
+
+    >>> byte_ranges(10, 4)
+    [(0, 3), (4, 7), (8, 9)]
+    >>> byte_ranges(0, 4)
+    []
+    """
+    return [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+
+
+def range_header(start, end):
+    return {'Range': 'bytes=%d-%d' % (start, end)}
+
+
+@contextmanager
+def staged_download(local_path):
+    """Yield a temporary path next to ``local_path`` to download to.
+
+    The download is moved to ``local_path`` only once it is complete, so a
+    partial download is never seen there, and removed if it fails. The
+    temporary name is ignored by the cache index.
+    """
+    dirname, basename = os.path.split(local_path)
+    fd, tmp_path = tempfile.mkstemp(prefix='%sdownload_%s.' % (INTERNAL_FILE_PREFIX, basename), dir=dirname)
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.rename(tmp_path, local_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def download_part(key_factory, local_path, byte_range):
+    """Fetch one byte range of a key into its place in ``local_path``. Designed to be run in parallel."""
+    start, end = byte_range
+    key = key_factory()
+    with open(local_path, 'r+b') as fh:
+        fh.seek(start)
+        key.get_contents_to_file(fh, headers=range_header(start, end))
+
+
+def multipart_download(key_factory, size, local_path, part_size, threads):
+    """Download an object of ``size`` bytes to ``local_path`` in parts of
+    ``part_size`` bytes using up to ``threads`` concurrent ranged GETs.
+
+    ``key_factory`` is called once per part and must return a key that is
+    safe to use from the calling thread (see ``key_from_ids``).
+    """
+    with staged_download(local_path) as tmp_path:
+        # Create the file at its final size so parts can be written in any order
+        with open(tmp_path, 'wb') as fh:
+            fh.truncate(size)
+        ranges = byte_ranges(size, part_size)
+        pool = ThreadPool(min(threads, len(ranges)) or 1)
+        try:
+            pool.map(functools.partial(download_part, key_factory, tmp_path), ranges)
+        finally:
+            pool.close()
+            pool.join()
@@ -0,0 +1,295 @@
+"""
+Write-behind uploads for object stores that stage files in a local cache.
+
+Files are committed to the cache right away and pushed to the backend by a
+pool of background workers. Pending uploads are journaled in the sqlite
+index of the cache directory so they survive a restart, are seen by every
+process sharing the cache and are not evicted from it.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from six.moves.queue import (
+    Empty,
+    Queue,
+)
+
+from .caching import (
+    CACHE_INDEX_FILENAME,
+    like_prefix,
+    PENDING_UPLOAD_TABLE,
+)
+from ..objectstore import convert_bytes
+
+log = logging.getLogger(__name__)
+
+DEFAULT_UPLOAD_THREADS = 4
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_RETRY_DELAY = 30
+# The status of the uploads is logged at most this often (in seconds)
+DEFAULT_STATUS_INTERVAL = 300
+
+
+class NullUploader(object):
+    """
+    Implements the WriteBehindUploader interface for object stores that
+    upload synchronously.
+    """
+
+    def start(self):
+        pass
+
+    def shutdown(self):
+        pass
+
+    def is_pending(self, rel_path):
+        return False
+
+    def cancel(self, rel_path):
+        return False
+
+    def cancel_prefix(self, prefix):
+        pass
+
+    def status(self):
+        return {}
+
+
+class WriteBehindUploader(object):
+    """
+    Upload files to an object store backend in the background.
+
+    ``push`` is called as ``push(rel_path, source_file)`` from a worker thread
+    and must return ``True`` once the file is stored in the backend. Failed
+    uploads (including those for which ``push`` raises) are retried
+    ``max_retries`` times with a growing delay. Uploads that still fail are
+    logged as errors and keep being retried in the background every
+    ``retry_delay * (max_retries + 1)`` seconds (and after a restart), so a
+    file reported as pending is always on its way to the backend.
+
+    The journal is shared by all processes using the cache directory, so
+    ``is_pending`` also reports uploads of other processes. Each Galaxy
+    server (``server_name``) uploads and resumes only the files it enqueued.
+    """
+
+    def __init__(self, push, staging_path, server_name='main', threads=DEFAULT_UPLOAD_THREADS,
+                 max_retries=DEFAULT_MAX_RETRIES, retry_delay=DEFAULT_RETRY_DELAY,
+                 status_interval=DEFAULT_STATUS_INTERVAL, journal_path=None):
+        self.push = push
+        self.owner = server_name
+        self.threads = threads
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.status_interval = status_interval
+        # The journal is the index of the cache manager of the object store
+        self.journal_path = journal_path or os.path.join(staging_path, CACHE_INDEX_FILENAME)
+        self.queue = Queue()
+        # rel_path -> (source_file, generation), a new generation for every enqueue
+        self._pending = {}
+        self._generation = 0
+        # rel_path -> time of the next background retry of a failing upload
+        self._retry_at = {}
+        self._in_progress = 0
+        self._last_status_log = time.time()
+        self._logged_status = None
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self.workers = []
+        self.uploaded = 0
+        self.failed = 0
+        self.bytes_uploaded = 0
+        self.upload_time = 0.0
+        self._init_journal()
+
+    def _init_journal(self):
+        if not os.path.exists(os.path.dirname(self.journal_path)):
+            os.makedirs(os.path.dirname(self.journal_path))
+        self._conn = sqlite3.connect(self.journal_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Needed for the prefix matching in cancel_prefix()
+        self._conn.execute("PRAGMA case_sensitive_like=ON")
+        self._conn.execute(PENDING_UPLOAD_TABLE)
+
+    def start(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT rel_path, source_file FROM pending_upload WHERE owner = ? ORDER BY enqueue_time",
+                                      (self.owner,)).fetchall()
+        if rows:
+            log.info("Resuming %d uploads from journal %s", len(rows), self.journal_path)
+        for rel_path, source_file in rows:
+            self._enqueue(rel_path, source_file, journal=False)
+        for i in range(self.threads):
+            worker = threading.Thread(target=self._run, name="WriteBehindUploader.worker_thread-%d" % i)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+        log.info("Write-behind uploader started with %d workers", self.threads)
+
+    def shutdown(self):
+        """Stop the workers, pending uploads remain in the journal."""
+        self._stop.set()
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join(5)
+        with self._lock:
+            self._conn.close()
+
+    def enqueue(self, rel_path, source_file):
+        self._enqueue(rel_path, source_file, journal=True)
+
+    def _enqueue(self, rel_path, source_file, journal):
+        with self._lock:
+            if journal:
+                self._conn.execute("INSERT OR REPLACE INTO pending_upload (rel_path, source_file, enqueue_time, owner) VALUES (?, ?, ?, ?)",
+                                   (rel_path, source_file, time.time(), self.owner))
+            # A new version of a failing upload is tried right away
+            queued = rel_path in self._pending and self._retry_at.pop(rel_path, None) is None
+            self._generation += 1
+            self._pending[rel_path] = (source_file, self._generation)
+        if not queued:
+            self.queue.put(rel_path)
+
+    def is_pending(self, rel_path):
+        """Return ``True`` if ``rel_path`` waits to be uploaded by any process sharing the cache."""
+        return self._journaled(rel_path)
+
+    def _journaled(self, rel_path):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM pending_upload WHERE rel_path = ?", (rel_path,)).fetchone() is not None
+
+    def cancel(self, rel_path):
+        """Drop a pending upload, returns ``True`` if there was one."""
+        with self._lock:
+            entry = self._pending.pop(rel_path, None)
+            self._retry_at.pop(rel_path, None)
+            cursor = self._conn.execute("DELETE FROM pending_upload WHERE rel_path = ?", (rel_path,))
+        return entry is not None or cursor.rowcount > 0
+
+    def cancel_prefix(self, prefix):
+        with self._lock:
+            for rel_path in [p for p in self._pending if p.startswith(prefix)]:
+                del self._pending[rel_path]
+                self._retry_at.pop(rel_path, None)
+            self._conn.execute("DELETE FROM pending_upload WHERE rel_path LIKE ? ESCAPE '\\'", (like_prefix(prefix),))
+
+    def status(self):
+        """Return the counts of pending, running and failing uploads of this process and the upload throughput."""
+        with self._lock:
+            return {
+                'queue_depth': len(self._pending),
+                'in_progress': self._in_progress,
+                'retrying': len(self._retry_at),
+                'uploaded': self.uploaded,
+                'failed': self.failed,
+                'bytes_uploaded': self.bytes_uploaded,
+                'throughput': self.bytes_uploaded / self.upload_time if self.upload_time else 0.0,
+            }
+
+    def _log_status(self):
+        """Log the status every ``status_interval`` seconds if uploads are pending or finished since the last time."""
+        with self._lock:
+            if time.time() - self._last_status_log < self.status_interval:
+                return
+            self._last_status_log = time.time()
+            status = self.status()
+            if not status['queue_depth'] and status == self._logged_status:
+                return
+            self._logged_status = status
+        log.info("Write-behind uploads: %d pending (%d in progress, %d retrying), %d uploaded (%s at %s/s), %d failed attempts",
+                 status['queue_depth'], status['in_progress'], status['retrying'], status['uploaded'],
+                 convert_bytes(status['bytes_uploaded']), convert_bytes(status['throughput']), status['failed'])
+
+    def _requeue_failing(self):
+        now = time.time()
+        with self._lock:
+            due = [rel_path for rel_path, retry_at in self._retry_at.items() if retry_at <= now]
+            for rel_path in due:
+                del self._retry_at[rel_path]
+        for rel_path in due:
+            self.queue.put(rel_path)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._requeue_failing()
+            self._log_status()
+            try:
+                rel_path = self.queue.get(timeout=1)
+            except Empty:
+                continue
+            if rel_path is None:
+                break
+            try:
+                self._upload(rel_path)
+            except Exception:
+                log.exception("Exception uploading '%s'", rel_path)
+
+    def _upload(self, rel_path):
+        with self._lock:
+            entry = self._pending.get(rel_path)
+            if entry is None:
+                # Cancelled while queued
+                return
+            self._in_progress += 1
+        source_file, generation = entry
+        try:
+            size = os.path.getsize(source_file) if os.path.exists(source_file) else 0
+            for attempt in range(self.max_retries + 1):
+                if not self._journaled(rel_path):
+                    # Cancelled, possibly by another process sharing the cache
+                    self._forget(rel_path, generation)
+                    return
+                start = time.time()
+                try:
+                    pushed = self.push(rel_path, source_file)
+                except Exception:
+                    log.exception("Exception uploading '%s' (attempt %d of %d)", rel_path, attempt + 1, self.max_retries + 1)
+                    pushed = False
+                if pushed:
+                    self._uploaded(rel_path, generation, size, time.time() - start)
+                    return
+                if attempt == self.max_retries:
+                    break
+                if self._stop.wait(self.retry_delay * (attempt + 1)):
+                    return
+            retry_delay = self.retry_delay * (self.max_retries + 1)
+            with self._lock:
+                self.failed += 1
+                current = self._pending.get(rel_path)
+                if current is not None and current[1] == generation:
+                    self._retry_at[rel_path] = time.time() + retry_delay
+                elif current is not None:
+                    # Updated while uploading, try the new version
+                    self.queue.put(rel_path)
+            log.error("Failed to upload '%s' after %d attempts, retrying in %d seconds", rel_path, self.max_retries + 1, retry_delay)
+        finally:
+            with self._lock:
+                self._in_progress -= 1
+
+    def _forget(self, rel_path, generation):
+        with self._lock:
+            current = self._pending.get(rel_path)
+            if current is not None and current[1] == generation:
+                del self._pending[rel_path]
+
+    def _uploaded(self, rel_path, generation, size, elapsed):
+        with self._lock:
+            self.uploaded += 1
+            self.bytes_uploaded += size
+            self.upload_time += elapsed
+            current = self._pending.get(rel_path)
+            if current is not None and current[1] == generation:
+                del self._pending[rel_path]
+                # Another server may have enqueued a newer version meanwhile
+                self._conn.execute("DELETE FROM pending_upload WHERE rel_path = ? AND owner = ?", (rel_path, self.owner))
+                requeue = False
+            else:
+                # Updated (or cancelled) while uploading
+                requeue = current is not None
+            queue_depth = len(self._pending)
+        if requeue:
+            self.queue.put(rel_path)
+        log.debug("Uploaded '%s' (%s) in %.2f seconds, %d uploads pending", rel_path, convert_bytes(size), elapsed, queue_depth)
@@ -4,6 +4,7 @@ Galaxy Quotas
 import logging
 
 import galaxy.util
+from galaxy.util.monitors import Monitors
 
 log = logging.getLogger(__name__)
 
@@ -191,3 +192,75 @@ class QuotaAgent(NoQuotaAgent):
                 for gqa in group.quotas:
                     rval.append(gqa.quota)
         return rval
+
+
+class DiskUsageReconciler(Monitors):
+    """Verify the incrementally adjusted disk usage of users in the background.
+
+    Every `interval` seconds the disk usage of the next `batch_size` users is
+    recalculated and corrected if it drifted from the tracked usage, cycling
+    through all users. If `is_reconciler` is given, it is called once the
+    monitor thread starts (after forking) and the thread exits unless it
+    returns True, so that a single process reconciles disk usage.
+    """
+
+    def __init__(self, model, interval, batch_size, config=None, is_reconciler=None):
+        self.model = model
+        self.interval = interval
+        self.batch_size = batch_size
+        self.is_reconciler = is_reconciler
+        self.last_user_id = 0
+        self._init_monitor_thread(name="DiskUsageReconciler.monitor_thread", target=self.__monitor, start=True, config=config)
+
+    def __monitor(self):
+        if self.is_reconciler is not None and not self.is_reconciler():
+            log.debug("Disk usage is reconciled by another job handler")
+            return
+        while self.monitor_running:
+            self._monitor_sleep(self.interval)
+            if not self.monitor_running:
+                return
+            try:
+                self.reconcile_batch()
+            except Exception:
+                log.exception("Failed to reconcile user disk usage")
+
+    def reconcile_batch(self):
+        """Reconcile the disk usage of the next batch of users, return the users corrected."""
+        sa_session = self.model.context
+        User = self.model.User
+        users = sa_session.query(User).filter(User.table.c.id > self.last_user_id) \
+            .order_by(User.table.c.id).limit(self.batch_size).all()
+        if not users:
+            # Start over with the first users
+            self.last_user_id = 0
+            return []
+        corrected = []
+        for user in users:
+            # Calculating the usage can take minutes for users with many
+            # datasets, so the user is only locked to re-read and correct it.
+            # Adjustments committed while calculating may be undone by the
+            # correction, the drift is corrected by a later run.
+            usage_by_object_store = user.calculate_disk_usage_by_object_store()
+            usage = sum(usage_by_object_store.values())
+            trans = sa_session.begin()
+            try:
+                # Concurrent adjustments wait for the correction
+                sa_session.refresh(user, with_for_update=True)
+                sa_session.query(self.model.UserObjectStoreUsage).filter_by(user_id=user.id) \
+                    .with_for_update().populate_existing().all()
+                read_usage = user.get_disk_usage()
+                read_usage_by_object_store = user.get_disk_usage_by_object_store()
+                if usage != read_usage or usage_by_object_store != read_usage_by_object_store:
+                    log.info("Correcting disk usage of user %s from %s to %s", user.id, read_usage, usage)
+                    user.correct_disk_usage(usage_by_object_store, read_usage, read_usage_by_object_store)
+                    corrected.append(user)
+                sa_session.flush()
+                trans.commit()
+            except Exception:
+                trans.rollback()
+                raise
+        self.last_user_id = users[-1].id
+        # Do not keep the users of past batches around
+        sa_session.expunge_all()
+        return corrected
@@ -1,7 +1,9 @@
 import codecs
 import collections
 import logging
+import threading
 
+import six
 from Crypto.Cipher import Blowfish
 from Crypto.Random import get_random_bytes
 
@@ -16,6 +18,8 @@ log = logging.getLogger(__name__)
 MAXIMUM_ID_SECRET_BITS = 448
 MAXIMUM_ID_SECRET_LENGTH = int(MAXIMUM_ID_SECRET_BITS / 8)
 KIND_TOO_LONG_MESSAGE = "Galaxy coding error, keep encryption 'kinds' smaller to utilize more bites of randomness from id_secret values."
+# Number of decoded ids remembered per kind
+DEFAULT_ID_CACHE_SIZE = 10000
 
 
 class IdEncodingHelper(object):
@@ -28,16 +32,27 @@ class IdEncodingHelper(object):
         per_kind_id_secret_base = config.get('per_kind_id_secret_base', self.id_secret)
         self.id_ciphers_for_kind = _cipher_cache(per_kind_id_secret_base)
 
+        id_cache_size = config.get('id_cache_size')
+        self.id_cache_size = DEFAULT_ID_CACHE_SIZE if id_cache_size is None else int(id_cache_size)
+        self._decoded_ids = {}
+
     def encode_id(self, obj_id, kind=None):
         if obj_id is None:
             raise galaxy.exceptions.MalformedId("Attempted to encode None id")
         id_cipher = self.__id_cipher(kind)
-        # Convert to bytes
-        s = smart_str(obj_id)
-        # Pad to a multiple of 8 with leading "!"
-        s = (b"!" * (8 - len(s) % 8)) + s
-        # Encrypt
-        return unicodify(codecs.encode(id_cipher.encrypt(s), 'hex'))
+        return _encrypt_ids(id_cipher, [obj_id])[0]
+
+    def encode_ids(self, obj_ids, kind=None):
+        """
+        Encode a list of ids like ``encode_id()``, encrypting all of them
+        with a single cipher call.
+        """
+        if None in obj_ids:
+            raise galaxy.exceptions.MalformedId("Attempted to encode None id")
+        if not obj_ids:
+            return []
+        id_cipher = self.__id_cipher(kind)
+        return _encrypt_ids(id_cipher, obj_ids)
 
     def encode_dict_ids(self, a_dict, kind=None, skip_startswith=None):
         """
@@ -58,30 +73,51 @@ class IdEncodingHelper(object):
         """
         if not isinstance(rval, dict):
             return rval
-        for k, v in rval.items():
-            if (k == 'id' or k.endswith('_id')) and v is not None and k not in ['tool_id', 'external_id']:
-                try:
-                    rval[k] = self.encode_id(v)
-                except Exception:
-                    pass  # probably already encoded
-            if (k.endswith("_ids") and isinstance(v, list)):
-                try:
-                    o = []
-                    for i in v:
-                        o.append(self.encode_id(i))
-                    rval[k] = o
-                except Exception:
-                    pass
-            else:
-                if recursive and isinstance(v, dict):
-                    rval[k] = self.encode_all_ids(v, recursive)
-                elif recursive and isinstance(v, list):
-                    rval[k] = [self.encode_all_ids(el, True) for el in v]
+        # Collect the values to encode in the whole structure first, so they can be encoded in one go
+        targets = []
+        self.__collect_ids(rval, recursive, targets)
+        if targets:
+            obj_ids = []
+            for container, key, is_list in targets:
+                if is_list:
+                    obj_ids.extend(container[key])
+                else:
+                    obj_ids.append(container[key])
+            encoded_ids = iter(self.encode_ids(obj_ids))
+            for container, key, is_list in targets:
+                if is_list:
+                    container[key] = [next(encoded_ids) for _ in container[key]]
+                else:
+                    container[key] = next(encoded_ids)
         return rval
 
+    def __collect_ids(self, rval, recursive, targets):
+        for k, v in rval.items():
+            # Dictionaries and lists under an id key are recursed into below
+            if (k == 'id' or k.endswith('_id')) and isinstance(v, six.integer_types + six.string_types) and k not in ['tool_id', 'external_id']:
+                targets.append((rval, k, False))
+            if k.endswith("_ids") and isinstance(v, list):
+                # Lists with missing ids are left as they are
+                if None not in v:
+                    targets.append((rval, k, True))
+            elif recursive and isinstance(v, dict):
+                self.__collect_ids(v, recursive, targets)
+            elif recursive and isinstance(v, list):
+                for el in v:
+                    if isinstance(el, dict):
+                        self.__collect_ids(el, recursive, targets)
+
     def decode_id(self, obj_id, kind=None):
         id_cipher = self.__id_cipher(kind)
-        return int(unicodify(id_cipher.decrypt(codecs.decode(obj_id, 'hex'))).lstrip("!"))
+        cache = self.__id_cache(self._decoded_ids, kind) if isinstance(obj_id, (six.string_types, bytes)) else None
+        if cache is not None:
+            decoded_id = cache.get(obj_id)
+            if decoded_id is not None:
+                return decoded_id
+        decoded_id = int(unicodify(id_cipher.decrypt(codecs.decode(obj_id, 'hex'))).lstrip("!"))
+        if cache is not None:
+            cache.set(obj_id, decoded_id)
+        return decoded_id
 
     def encode_guid(self, session_key):
         # Session keys are strings
@@ -107,6 +143,37 @@ class IdEncodingHelper(object):
             id_cipher = self.id_ciphers_for_kind[kind]
         return id_cipher
 
+    def __id_cache(self, caches, kind):
+        if not self.id_cache_size:
+            return None
+        cache = caches.get(kind)
+        if cache is None:
+            cache = caches.setdefault(kind, _IdCache(self.id_cache_size))
+        return cache
+
+
+class _IdCache(object):
+    """Least recently used encoded ids and their decoded values."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._values = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._values.pop(key, None)
+            if value is not None:
+                self._values[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._values.pop(key, None)
+            self._values[key] = value
+            if len(self._values) > self.max_size:
+                self._values.popitem(last=False)
+
 
 class _cipher_cache(collections.defaultdict):
 
@@ -119,6 +186,24 @@ class _cipher_cache(collections.defaultdict):
         return Blowfish.new(_last_bits(secret), mode=Blowfish.MODE_ECB)
 
 
+def _encrypt_ids(id_cipher, obj_ids):
+    """
+    Encrypt ids padded to a multiple of 8 with leading "!", all with one call
+    as ECB mode encrypts every 8 byte block independently.
+    """
+    padded = []
+    for obj_id in obj_ids:
+        s = smart_str(obj_id)
+        padded.append((b"!" * (8 - len(s) % 8)) + s)
+    encrypted = unicodify(codecs.encode(id_cipher.encrypt(b"".join(padded)), 'hex'))
+    encoded_ids = []
+    offset = 0
+    for s in padded:
+        encoded_ids.append(encrypted[offset:offset + 2 * len(s)])
+        offset += 2 * len(s)
+    return encoded_ids
+
+
 def _last_bits(secret):
     """We append the kind at the end, so just use the bits at the end.
     """
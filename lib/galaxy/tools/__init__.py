@@ -4,6 +4,7 @@ Classes encapsulating galaxy tools and tool configuration.
 import itertools
 import json
 import logging
+import multiprocessing
 import os
 import re
 import tarfile
@@ -11,6 +12,7 @@ import tempfile
 import threading
 from collections import OrderedDict
 from datetime import datetime
+from functools import partial
 try:
     from pathlib import Path
 except ImportError:
@@ -57,6 +59,7 @@ from galaxy.tools.actions import DefaultToolAction
 from galaxy.tools.actions.data_manager import DataManagerToolAction
 from galaxy.tools.actions.data_source import DataSourceToolAction
 from galaxy.tools.actions.model_operations import ModelOperationToolAction
+from galaxy.tools.cache import cache_tool_document
 from galaxy.tools.parameters import (
     check_param,
     params_from_strings,
@@ -86,6 +89,7 @@ from galaxy.tools.parameters.wrapped_json import json_wrap
 from galaxy.tools.test import parse_tests
 from galaxy.tools.toolbox import BaseGalaxyToolBox
 from galaxy.util import (
+    ExecutionTimer,
     in_directory,
     listify,
     Params,
@@ -284,17 +288,58 @@ class ToolBox(BaseGalaxyToolBox):
 
     def create_tool(self, config_file, **kwds):
         try:
-            tool_source = get_tool_source(
-                config_file,
-                enable_beta_formats=getattr(self.app.config, "enable_beta_tool_formats", False),
-                tool_location_fetcher=self.tool_location_fetcher,
-            )
+            tool_document = self._get_tool_document(config_file)
+            if tool_document:
+                tool_path, tree, macro_paths = tool_document
+                tool_source = get_tool_source(tool_path, xml_tree=tree, macro_paths=macro_paths)
+            else:
+                tool_source = get_tool_source(
+                    config_file,
+                    enable_beta_formats=getattr(self.app.config, "enable_beta_tool_formats", False),
+                    tool_location_fetcher=self.tool_location_fetcher,
+                )
         except Exception as e:
             # capture and log parsing errors
             global_tool_errors.add_error(config_file, "Tool XML parsing", e)
             raise e
         return self._create_tool_from_source(tool_source, config_file=config_file, **kwds)
 
+    def _get_tool_document(self, config_file):
+        """
+        Return the resolved path, macro expanded XML tree and macro paths of
+        the tool at `config_file` from the tool document cache, caching them
+        if needed. Tool locations are resolved with the tool location fetcher
+        first, so the cache is keyed on the same file get_tool_source reads.
+
+        Returns None if the cache is disabled or the tool is not an XML tool.
+        """
+        tool_document_cache = getattr(self.app, 'tool_document_cache', None)
+        if not tool_document_cache:
+            return None
+        tool_path = self.tool_location_fetcher.to_tool_path(config_file)
+        if not tool_path.endswith(".xml"):
+            return None
+        tree, macro_paths = tool_document_cache.get_tool_document(tool_path) or tool_document_cache.cache_tool_document(tool_path)
+        return tool_path, tree, macro_paths
+
+    def _preload_tool_documents(self, paths):
+        tool_document_cache = getattr(self.app, 'tool_document_cache', None)
+        processes = getattr(self.app.config, "tool_parse_processes", 1)
+        if not tool_document_cache or processes < 2:
+            return
+        # Tool locations that need the fetcher are left to be cached on load
+        paths = [path for path in set(paths) if "://" not in path and path.endswith(".xml") and not tool_document_cache.has_tool_document(path)]
+        if not paths:
+            return
+        execution_timer = ExecutionTimer()
+        pool = multiprocessing.Pool(processes=processes)
+        try:
+            parsed = sum(pool.imap_unordered(partial(cache_tool_document, tool_document_cache.cache_dir), paths))
+        finally:
+            pool.close()
+            pool.join()
+        log.debug("Parsed %d of %d uncached tools with %d processes %s", parsed, len(paths), processes, execution_timer)
+
     def _create_tool_from_source(self, tool_source, **kwds):
         return create_tool_from_source(self.app, tool_source, **kwds)
 
@@ -9,6 +9,7 @@ from six import string_types
 
 from galaxy import model
 from galaxy.jobs.actions.post import ActionBox
+from galaxy.managers.jobs import fingerprint_job
 from galaxy.model import LibraryDatasetDatasetAssociation, WorkflowRequestInputParameter
 from galaxy.model.dataset_collections.builder import CollectionBuilder
 from galaxy.model.none_like import NoneDataset
@@ -540,6 +541,7 @@ class DefaultToolAction(object):
         job, galaxy_session = self._new_job_for_session(trans, tool, history)
         self._record_inputs(trans, tool, job, incoming, inp_data, inp_dataset_collections)
         self._record_outputs(job, out_data, output_collections)
+        job.set_fingerprint(fingerprint_job(trans.sa_session, job))
         job.object_store_id = object_store_populator.object_store_id
         if job_params:
             job.params = dumps(job_params)
@@ -104,7 +104,7 @@ class SetMetadataToolAction(ToolAction):
                                                                      include_command=False,
                                                                      validate_outputs=validate_outputs,
                                                                      max_metadata_value_size=app.config.max_metadata_value_size,
-                                                                     kwds={'overwrite': overwrite})
+                                                                     kwds={'overwrite': overwrite, 'index_lines': app.config.tabular_line_index})
         incoming['__SET_EXTERNAL_METADATA_COMMAND_LINE__'] = cmd_line
         for name, value in tool.params_to_strings(incoming, app).items():
             job.add_parameter(name, value)
@@ -1,15 +1,24 @@
+import json
 import logging
 import os
+import tempfile
 from collections import defaultdict
 from threading import Lock
+from xml.etree import ElementTree
 
 from sqlalchemy.orm import (
     defer,
     joinedload,
 )
 
-from galaxy.util import unicodify
-from galaxy.util.hash_util import md5_hash_file
+from galaxy.tool_util.loader import load_tool_with_refereces
+from galaxy.util import (
+    smart_str,
+    unicodify,
+    xml_to_string,
+)
+from galaxy.util.hash_util import md5_hash_file, new_secure_hash
+from galaxy.util.path import safe_makedirs
 
 log = logging.getLogger(__name__)
 
@@ -130,6 +139,102 @@ class ToolCache(object):
             self._removed_tools_by_path = {}
 
 
+class ToolDocumentCache(object):
+    """
+    Persistent cache of macro expanded tool XML documents.
+
+    The cache is a directory shared by all Galaxy processes and kept across
+    restarts. Each tool is stored in its own file, named after its path, that
+    starts with a line describing the tool and macro files the document was
+    expanded from followed by the document. An entry is only used while the
+    modification times of these files are unchanged.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        safe_makedirs(cache_dir)
+
+    def _cache_path(self, config_file):
+        return os.path.join(self.cache_dir, "%s.xml" % new_secure_hash(config_file))
+
+    def _read(self, config_file, header_only=False):
+        try:
+            with open(self._cache_path(config_file), "rb") as fh:
+                header = json.loads(unicodify(fh.readline()))
+                if header.get("path") != config_file or header.get("mtimes") != _mtimes(header["paths"]):
+                    return None
+                if header_only:
+                    return header
+                return header, fh.read()
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+    def has_tool_document(self, config_file):
+        """Return True if an up to date document of the tool at `config_file` is cached."""
+        return self._read(config_file, header_only=True) is not None
+
+    def get_tool_document(self, config_file):
+        """
+        Return the cached macro expanded XML tree and macro paths of the tool at
+        `config_file`, or None if the tool is not cached or has changed.
+        """
+        entry = self._read(config_file)
+        if entry is None:
+            return None
+        header, document = entry
+        return ElementTree.ElementTree(ElementTree.fromstring(document)), header["macro_paths"]
+
+    def cache_tool_document(self, config_file):
+        """
+        Load the tool at `config_file`, expanding its macros, and cache its document.
+
+        Returns the XML tree and macro paths of the tool, also if the document
+        could not be written to the cache (e.g. it is read-only or full).
+        """
+        header, tree = self._load(config_file)
+        try:
+            self._write(config_file, header, tree)
+        except Exception as e:
+            log.warning("Failed to cache the document of tool [%s] in [%s]: %s", config_file, self.cache_dir, unicodify(e))
+        return tree, header["macro_paths"]
+
+    def _load(self, config_file):
+        # Record the modification time first, changes made while loading invalidate the entry
+        mtimes = _mtimes([config_file])
+        tree, macro_paths = load_tool_with_refereces(config_file)
+        macro_paths = list(macro_paths or [])
+        mtimes.extend(_mtimes(macro_paths))
+        header = dict(path=config_file, macro_paths=macro_paths, paths=[config_file] + macro_paths, mtimes=mtimes)
+        return header, tree
+
+    def _write(self, config_file, header, tree):
+        # Write to a temporary file first so that other processes never read partial entries
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, prefix="tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(smart_str(json.dumps(header)) + b"\n")
+                fh.write(smart_str(xml_to_string(tree.getroot())))
+            os.rename(temp_path, self._cache_path(config_file))
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+
+def _mtimes(paths):
+    return [os.path.getmtime(path) for path in paths]
+
+
+def cache_tool_document(cache_dir, config_file):
+    """Cache the document of the tool at `config_file`, for use in worker processes."""
+    try:
+        tool_document_cache = ToolDocumentCache(cache_dir)
+        tool_document_cache._write(config_file, *tool_document_cache._load(config_file))
+        return True
+    except Exception:
+        # The tool is reported when Galaxy loads it
+        return False
+
+
 class ToolShedRepositoryCache(object):
     """
     Cache installed ToolShedRepository objects.
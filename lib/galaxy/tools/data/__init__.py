@@ -13,6 +13,7 @@ import os
 import os.path
 import re
 import string
+import threading
 import time
 from collections import OrderedDict
 from glob import glob
@@ -68,8 +69,10 @@ class ToolDataPathFiles(object):
 class ToolDataTableManager(object):
     """Manages a collection of tool data tables"""
 
-    def __init__(self, tool_data_path, config_filename=None, tool_data_table_config_path_set=None):
+    def __init__(self, tool_data_path, config_filename=None, tool_data_table_config_path_set=None, lazy_load=False):
         self.tool_data_path = tool_data_path
+        # Whether tables read their files on first access instead of when loaded
+        self.lazy_load = lazy_load
         # This stores all defined data table entries from both the tool_data_table_conf.xml file and the shed_tool_data_table_conf.xml file
         # at server startup. If tool shed repositories are installed that contain a valid file named tool_data_table_conf.xml.sample, entries
         # from that file are inserted into this dict at the time of installation.
@@ -118,7 +121,7 @@ class ToolDataTableManager(object):
             tree = util.parse_xml(filename)
             root = tree.getroot()
             for table_elem in root.findall('table'):
-                table = ToolDataTable.from_elem(table_elem, tool_data_path, from_shed_config, filename=filename, tool_data_path_files=self.tool_data_path_files)
+                table = ToolDataTable.from_elem(table_elem, tool_data_path, from_shed_config, filename=filename, tool_data_path_files=self.tool_data_path_files, lazy_load=self.lazy_load)
                 table_elems.append(table_elem)
                 if table.name not in self.data_tables:
                     self.data_tables[table.name] = table
@@ -240,12 +243,12 @@ class ToolDataTableManager(object):
 class ToolDataTable(object):
 
     @classmethod
-    def from_elem(cls, table_elem, tool_data_path, from_shed_config, filename, tool_data_path_files):
+    def from_elem(cls, table_elem, tool_data_path, from_shed_config, filename, tool_data_path_files, lazy_load=False):
         table_type = table_elem.get('type', 'tabular')
         assert table_type in tool_data_table_types, "Unknown data table type '%s'" % type
-        return tool_data_table_types[table_type](table_elem, tool_data_path, from_shed_config=from_shed_config, filename=filename, tool_data_path_files=tool_data_path_files)
+        return tool_data_table_types[table_type](table_elem, tool_data_path, from_shed_config=from_shed_config, filename=filename, tool_data_path_files=tool_data_path_files, lazy_load=lazy_load)
 
-    def __init__(self, config_element, tool_data_path, from_shed_config=False, filename=None, tool_data_path_files=None):
+    def __init__(self, config_element, tool_data_path, from_shed_config=False, filename=None, tool_data_path_files=None, lazy_load=False):
         self.name = config_element.get('name')
         self.comment_char = config_element.get('comment_char')
         self.empty_field_value = config_element.get('empty_field_value', '')
@@ -256,10 +259,11 @@ class ToolDataTable(object):
         self.tool_data_path = tool_data_path
         self.tool_data_path_files = tool_data_path_files
         self.missing_index_file = None
+        self.lazy_load = lazy_load
         # increment this variable any time a new entry is added, or when the table is totally reloaded
         # This value has no external meaning, and does not represent an abstract version of the underlying data
         self._loaded_content_version = 1
-        self._load_info = ([config_element, tool_data_path], {'from_shed_config': from_shed_config, 'tool_data_path_files': self.tool_data_path_files})
+        self._load_info = ([config_element, tool_data_path], {'from_shed_config': from_shed_config, 'tool_data_path_files': self.tool_data_path_files, 'lazy_load': lazy_load})
         self._merged_load_info = []
 
     def _update_version(self, version=None):
@@ -323,12 +327,64 @@ class TabularToolDataTable(ToolDataTable, Dictifiable):
 
     type_key = 'tabular'
 
-    def __init__(self, config_element, tool_data_path, from_shed_config=False, filename=None, tool_data_path_files=None):
-        super(TabularToolDataTable, self).__init__(config_element, tool_data_path, from_shed_config, filename, tool_data_path_files)
+    def __init__(self, config_element, tool_data_path, from_shed_config=False, filename=None, tool_data_path_files=None, lazy_load=False):
+        super(TabularToolDataTable, self).__init__(config_element, tool_data_path, from_shed_config, filename, tool_data_path_files, lazy_load=lazy_load)
         self.config_element = config_element
-        self.data = []
+        self._data = []
+        # Files found but not read yet when loading lazily, with their errors lists
+        self._pending_files = []
+        self._loading = False
+        self._load_lock = threading.RLock()
+        # column index -> {value: [row numbers]}, built on demand
+        self._indexes = {}
         self.configure_and_load(config_element, tool_data_path, from_shed_config)
 
+    @property
+    def data(self):
+        if self._pending_files:
+            self._load_pending_files()
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self._invalidate_indexes()
+
+    def _load_pending_files(self):
+        with self._load_lock:
+            # Other threads wait for the files to be read, this thread may access the data being read
+            if not self._pending_files or self._loading:
+                return
+            self._loading = True
+            try:
+                for pending_file in list(self._pending_files):
+                    filename, errors = pending_file
+                    try:
+                        self.extend_data_with(filename, errors=errors)
+                    except Exception:
+                        # Keep the file pending, reading it is retried on the next access
+                        log.exception("Error loading file '%s' of tool data table '%s'", filename, self.name)
+                    else:
+                        self._pending_files.remove(pending_file)
+            finally:
+                self._loading = False
+
+    def _invalidate_indexes(self):
+        self._indexes = {}
+
+    def _get_index(self, column):
+        """Return a mapping of the values of ``column`` to the numbers of the rows they are in."""
+        data = self.data
+        index = self._indexes.get(column)
+        if index is None or index[0] is not data or index[1] != len(data):
+            # (Re)build the index, the length check catches rows appended to the data directly
+            rows = {}
+            for row, fields in enumerate(data):
+                rows.setdefault(fields[column], []).append(row)
+            index = (data, len(data), rows)
+            self._indexes[column] = index
+        return index[2]
+
     def configure_and_load(self, config_element, tool_data_path, from_shed_config=False, url_timeout=10):
         """
         Configure and load table from an XML element.
@@ -401,7 +457,11 @@ class TabularToolDataTable(ToolDataTable, Dictifiable):
 
             errors = []
             if found:
-                self.extend_data_with(filename, errors=errors)
+                # Downloaded URLs are read right away, their temporary file is removed below
+                if self.lazy_load and tmp_file is None:
+                    self._pending_files.append((filename, errors))
+                else:
+                    self.extend_data_with(filename, errors=errors)
                 self._update_version()
             else:
                 self.missing_index_file = filename
@@ -446,26 +506,26 @@ class TabularToolDataTable(ToolDataTable, Dictifiable):
         return self.data
 
     def get_field(self, value):
-        rval = None
-        for i in self.get_named_fields_list():
-            if i['value'] == value:
-                rval = TabularToolDataField(i)
-        return rval
+        rows = self._get_index(self.columns['value']).get(value)
+        if not rows:
+            return None
+        # The last matching entry wins
+        return TabularToolDataField(self._get_named_fields(self.get_fields()[rows[-1]], self.get_column_name_list()))
 
     def get_named_fields_list(self):
-        rval = []
         named_columns = self.get_column_name_list()
-        for fields in self.get_fields():
-            field_dict = {}
-            for i, field in enumerate(fields):
-                if i == len(named_columns):
-                    break
-                field_name = named_columns[i]
-                if field_name is None:
-                    field_name = i  # check that this is supposed to be 0 based.
-                field_dict[field_name] = field
-            rval.append(field_dict)
-        return rval
+        return [self._get_named_fields(fields, named_columns) for fields in self.get_fields()]
+
+    def _get_named_fields(self, fields, named_columns):
+        field_dict = {}
+        for i, field in enumerate(fields):
+            if i == len(named_columns):
+                break
+            field_name = named_columns[i]
+            if field_name is None:
+                field_name = i  # check that this is supposed to be 0 based.
+            field_dict[field_name] = field
+        return field_dict
 
     def get_version_fields(self):
         return (self._loaded_content_version, self.get_fields())
@@ -507,6 +567,7 @@ class TabularToolDataTable(ToolDataTable, Dictifiable):
     def extend_data_with(self, filename, errors=None):
         here = os.path.dirname(os.path.abspath(filename))
         self.data.extend(self.parse_file_fields(open(filename), errors=errors, here=here))
+        self._invalidate_indexes()
         if not self.allow_duplicate_entries:
             self._deduplicate_data()
 
@@ -574,18 +635,26 @@ class TabularToolDataTable(ToolDataTable, Dictifiable):
             if return_col is None:
                 return default
         rval = []
+        data = self.get_fields()
         # Look for table entry.
-        for fields in self.get_fields():
-            if fields[query_col] == query_val:
-                if return_attr is None:
-                    field_dict = {}
-                    for i, col_name in enumerate(self.get_column_name_list()):
-                        field_dict[col_name or i] = fields[i]
-                    rval.append(field_dict)
-                else:
-                    rval.append(fields[return_col])
-                if limit is not None and len(rval) == limit:
-                    break
+        try:
+            rows = self._get_index(query_col).get(query_val, [])
+        except TypeError:
+            # Unhashable query value
+            rows = [row for row, fields in enumerate(data) if fields[query_col] == query_val]
+        if limit is not None:
+            rows = rows[:limit]
+        if return_attr is None:
+            column_names = self.get_column_name_list()
+        for row in rows:
+            fields = data[row]
+            if return_attr is None:
+                field_dict = {}
+                for i, col_name in enumerate(column_names):
+                    field_dict[col_name or i] = fields[i]
+                rval.append(field_dict)
+            else:
+                rval.append(fields[return_col])
         return rval or default
 
     def get_filename_for_source(self, source, default=None):
@@ -623,6 +692,7 @@ class TabularToolDataTable(ToolDataTable, Dictifiable):
             fields = self._replace_field_separators(fields)
             if (allow_duplicates and self.allow_duplicate_entries) or fields not in self.get_fields():
                 self.data.append(fields)
+                self._invalidate_indexes()
             else:
                 log.debug("Attempted to add fields (%s) to data table '%s', but this entry already exists and allow_duplicates is False.", fields, self.name)
                 is_error = True
@@ -721,6 +791,8 @@ class TabularToolDataTable(ToolDataTable, Dictifiable):
                 hash_set.add(fields_hash)
         for i in reversed(dup_lines):
             self.data.pop(i)
+        if dup_lines:
+            self._invalidate_indexes()
 
     @property
     def xml_string(self):
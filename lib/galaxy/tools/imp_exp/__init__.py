@@ -40,7 +40,8 @@ class JobImportHistoryArchiveWrapper:
         new_history = None
         try:
             archive_dir = jiha.archive_dir
-            model_store = store.get_import_model_store_for_directory(archive_dir, app=self.app, user=user)
+            copy_threads = self.app.config.history_import_copy_threads
+            model_store = store.get_import_model_store_for_directory(archive_dir, app=self.app, user=user, copy_threads=copy_threads)
             job = jiha.job
             with model_store.target_history(default_history=job.history) as new_history:
 
@@ -4,6 +4,8 @@ Export a history to an archive file using attribute files.
 
 usage: %prog history_attrs dataset_attrs job_attrs out_file
     -G, --gzip: gzip archive file
+    --compress-threads: number of threads compressing the archive (requires pigz)
+    --resume: complete a partially written, uncompressed archive file
 """
 from __future__ import print_function
 
@@ -16,10 +18,10 @@ from galaxy.model.store import tar_export_directory
 from galaxy.util import unicodify
 
 
-def create_archive(export_directory, out_file, gzip=False):
+def create_archive(export_directory, out_file, gzip=False, compress_threads=1, resume=False):
     """Create archive from the given attribute/metadata files and save it to out_file."""
     try:
-        tar_export_directory(export_directory, out_file, gzip)
+        tar_export_directory(export_directory, out_file, gzip, compress_threads=compress_threads, resume=resume)
         # Status.
         print('Created history archive.')
         return 0
@@ -32,6 +34,8 @@ def main(argv=None):
     # Parse command line.
     parser = optparse.OptionParser()
     parser.add_option('-G', '--gzip', dest='gzip', action="store_true", help='Compress archive using gzip.')
+    parser.add_option('--compress-threads', dest='compress_threads', type="int", default=1, help='Number of threads compressing the archive, requires pigz.')
+    parser.add_option('--resume', dest='resume', action="store_true", help='Complete a partially written, uncompressed archive.')
     parser.add_option('--galaxy-version', dest='galaxy_version', help='Galaxy version that initiated the command.', default=None)
     (options, args) = parser.parse_args(argv)
     galaxy_version = options.galaxy_version
@@ -62,7 +66,7 @@ def main(argv=None):
         shutil.move(args[2], job_attrs)
 
     # Create archive.
-    return create_archive(temp_directory, out_file, gzip=gzip)
+    return create_archive(temp_directory, out_file, gzip=gzip, compress_threads=options.compress_threads, resume=bool(options.resume))
 
 
 if __name__ == "__main__":
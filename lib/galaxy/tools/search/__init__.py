@@ -3,7 +3,13 @@ Module for building and searching the index of tools
 installed within this Galaxy. Before changing index-building
 or searching related parts it is deeply recommended to read
 through the library docs at https://whoosh.readthedocs.io.
+
+If an index directory is configured, the index is kept on disk and shared
+by all Galaxy processes. Every document records a stamp of its content, so
+that tools are only (re)indexed if they are new or have changed since they
+were indexed by any of the processes.
 """
+import json
 import logging
 import re
 import tempfile
@@ -11,6 +17,7 @@ import tempfile
 from whoosh import analysis
 from whoosh.analysis import StandardAnalyzer
 from whoosh.fields import (
+    ID,
     KEYWORD,
     Schema,
     STORED,
@@ -20,15 +27,23 @@ from whoosh.filedb.filestore import (
     FileStorage,
     RamStorage
 )
+from whoosh.index import LockError
 from whoosh.qparser import MultifieldParser
 from whoosh.qparser import OrGroup
 from whoosh.scoring import BM25F
 
 from galaxy.util import ExecutionTimer
+from galaxy.util.hash_util import new_secure_hash
+from galaxy.util.path import safe_makedirs
 from galaxy.web.framework.helpers import to_unicode
 
 log = logging.getLogger(__name__)
 
+# Increment when the indexed documents change, to reindex all tools
+INDEX_VERSION = 1
+# Seconds to wait for another process updating the shared index
+INDEX_WRITER_TIMEOUT = 600
+
 
 class ToolBoxSearch(object):
     """
@@ -36,8 +51,9 @@ class ToolBoxSearch(object):
     the Whoosh search library.
     """
 
-    def __init__(self, toolbox, index_help=True):
-        self.schema = Schema(id=STORED,
+    def __init__(self, toolbox, index_dir=None, index_help=True):
+        self.schema = Schema(id=ID(stored=True, unique=True),
+                             stamp=STORED,
                              stub=KEYWORD,
                              name=TEXT(analyzer=analysis.SimpleAnalyzer()),
                              description=TEXT,
@@ -46,6 +62,8 @@ class ToolBoxSearch(object):
                              labels=KEYWORD)
         self.rex = analysis.RegexTokenizer()
         self.toolbox = toolbox
+        self.index_dir = index_dir
+        self.index_help = index_help
         self.storage, self.index = self._index_setup()
         # We keep track of how many times the tool index has been rebuilt.
         # We start at -1, so that after the first index the count is at 0,
@@ -54,30 +72,98 @@ class ToolBoxSearch(object):
         self.index_count = -1
 
     def _index_setup(self):
+        if self.index_dir:
+            safe_makedirs(self.index_dir)
+            storage = FileStorage(self.index_dir)
+            if storage.index_exists():
+                index = storage.open_index()
+                if index.schema == self.schema:
+                    return storage, index
+                log.info("Recreating toolbox search index in %s, its schema has changed", self.index_dir)
+            return storage, storage.create_index(self.schema)
         RamStorage.temp_storage = _temp_storage
         # Works around https://bitbucket.org/mchaput/whoosh/issues/391/race-conditions-with-temp-storage
         storage = RamStorage()
         index = storage.create_index(self.schema)
         return storage, index
 
-    def build_index(self, tool_cache, index_help=True):
+    def build_index(self, tool_cache, index_help=None):
         """
         Prepare search index for tools loaded in toolbox.
         Use `tool_cache` to determine which tools need indexing and which tools should be expired.
+
+        The first time the index is built, all tools in `tool_cache` are
+        considered. Tools are only indexed if their document differs from the
+        indexed one, which allows reusing an index built by another process.
         """
         log.debug('Starting to build toolbox index.')
+        if index_help is None:
+            index_help = self.index_help
         self.index_count += 1
         execution_timer = ExecutionTimer()
-        writer = self.index.writer()
-        for tool_id in tool_cache._removed_tool_ids:
-            writer.delete_by_term('id', tool_id)
-        for tool_id in tool_cache._new_tool_ids:
+        if self.index_count == 0:
+            tool_ids = set(tool_cache._tool_paths_by_id)
+        else:
+            tool_ids = set(tool_cache._new_tool_ids)
+        removed_tool_ids = set(tool_cache._removed_tool_ids)
+        docs = {}
+        for tool_id in tool_ids:
             tool = tool_cache.get_tool_by_id(tool_id)
             if tool and tool.is_latest_version:
                 add_doc_kwds = self._create_doc(tool_id=tool_id, tool=tool, index_help=index_help)
-                writer.add_document(**add_doc_kwds)
+                if add_doc_kwds:
+                    add_doc_kwds['stamp'] = self._stamp(add_doc_kwds)
+                    docs[tool_id] = add_doc_kwds
+                    continue
+            removed_tool_ids.add(tool_id)
+        with self.index.reader() as reader:
+            stamps = self._indexed_stamps(reader)
+        if self.index_count == 0:
+            # Tools indexed by an earlier Galaxy process that are no longer installed
+            removed_tool_ids.update(tool_id for tool_id in stamps if tool_id not in tool_ids)
+        if not self._index_changes(stamps, docs, removed_tool_ids):
+            log.debug("Toolbox index is up to date, checked %d tools %s", len(docs), execution_timer)
+            return
+        try:
+            writer = self.index.writer(timeout=INDEX_WRITER_TIMEOUT)
+        except LockError:
+            log.warning("Toolbox index is locked by another process, not updating it")
+            return
+        try:
+            # Another process may have updated the index while waiting for the lock
+            changes = self._index_changes(self._indexed_stamps(writer.reader()), docs, removed_tool_ids)
+            if not changes:
+                writer.cancel()
+                log.debug("Toolbox index was updated by another process %s", execution_timer)
+                return
+            removed, updated = changes
+            for tool_id in removed:
+                writer.delete_by_term('id', tool_id)
+            for tool_id in updated:
+                writer.update_document(**docs[tool_id])
+        except Exception:
+            writer.cancel()
+            raise
         writer.commit()
-        log.debug("Toolbox index finished %s", execution_timer)
+        log.debug("Toolbox index finished, indexed %d and removed %d tools %s", len(updated), len(removed), execution_timer)
+
+    def _indexed_stamps(self, reader):
+        return {fields['id']: fields.get('stamp') for fields in reader.all_stored_fields()}
+
+    def _index_changes(self, stamps, docs, removed_tool_ids):
+        """
+        Return the ids of the tools that have to be removed from and (re)indexed
+        in an index containing documents with `stamps`, or None if the index is
+        up to date.
+        """
+        removed = [tool_id for tool_id in removed_tool_ids if tool_id in stamps and tool_id not in docs]
+        updated = [tool_id for tool_id, doc in docs.items() if stamps.get(tool_id) != doc['stamp']]
+        if removed or updated:
+            return removed, updated
+        return None
+
+    def _stamp(self, add_doc_kwds):
+        return new_secure_hash("%d:%s" % (INDEX_VERSION, json.dumps(add_doc_kwds, sort_keys=True)))
 
     def _create_doc(self, tool_id, tool, index_help=True):
         #  Do not add data managers to the public index
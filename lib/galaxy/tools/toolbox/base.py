@@ -182,6 +182,7 @@ class AbstractToolBox(Dictifiable, ManagesIntegratedToolPanelMixin):
 
         """
         log.info("Parsing the tool configuration %s" % config_filename)
+        execution_timer = ExecutionTimer()
         try:
             tool_conf_source = get_toolbox_parser(config_filename)
         except (OSError, IOError) as exc:
@@ -204,9 +205,15 @@ class AbstractToolBox(Dictifiable, ManagesIntegratedToolPanelMixin):
         tool_conf_type = 'shed tool' if parsing_shed_tool_conf else 'tool'
         log.debug("Tool path for %s configuration %s is %s", tool_conf_type, config_filename, tool_path)
         tool_path = self.__resolve_tool_path(tool_path, config_filename)
+        items = tool_conf_source.parse_items()
+        log.debug("Parsing the tool configuration %s finished %s", config_filename, execution_timer)
+        execution_timer = ExecutionTimer()
+        self._preload_tool_documents(self._get_tool_item_paths(items, tool_path))
+        log.debug("Preloading tools of %s finished %s", config_filename, execution_timer)
+        execution_timer = ExecutionTimer()
         # Only load the panel_dict under certain conditions.
         load_panel_dict = not self._integrated_tool_panel_config_has_contents
-        for item in tool_conf_source.parse_items():
+        for item in items:
             index = self._index
             self._index += 1
             if parsing_shed_tool_conf:
@@ -220,12 +227,29 @@ class AbstractToolBox(Dictifiable, ManagesIntegratedToolPanelMixin):
                 internal=True
             )
 
+        log.debug("Loading tools of %s finished %s", config_filename, execution_timer)
+
         if parsing_shed_tool_conf:
             shed_tool_conf_dict = dict(config_filename=config_filename,
                                        tool_path=tool_path,
                                        config_elems=config_elems)
             self._dynamic_tool_confs.append(shed_tool_conf_dict)
 
+    def _get_tool_item_paths(self, items, tool_path):
+        paths = []
+        for item in items:
+            if item.type == "tool" and item.get("file"):
+                paths.append(self._get_tool_item_path(item, tool_path))
+            elif item.type == "section":
+                paths.extend(self._get_tool_item_paths(item.items, tool_path))
+        return paths
+
+    def _preload_tool_documents(self, paths):
+        """
+        Hook to prepare the loading of the tools at `paths` of a tool
+        configuration before they are loaded one after another.
+        """
+
     def _get_tool_by_uuid(self, tool_uuid):
         if tool_uuid in self._tools_by_uuid:
             return self._tools_by_uuid[tool_uuid]
@@ -638,12 +662,17 @@ class AbstractToolBox(Dictifiable, ManagesIntegratedToolPanelMixin):
     def _path_template_kwds(self):
         return {}
 
+    def _get_tool_item_path(self, item, tool_path):
+        path_template = item.get("file")
+        template_kwds = self._path_template_kwds()
+        path = string.Template(path_template).safe_substitute(**template_kwds)
+        return os.path.join(tool_path, path)
+
     def _load_tool_tag_set(self, item, panel_dict, integrated_panel_dict, tool_path, load_panel_dict, guid=None, index=None, internal=False):
+        # Logged as is if the path cannot be built
+        concrete_path = item.get("file")
         try:
-            path_template = item.get("file")
-            template_kwds = self._path_template_kwds()
-            path = string.Template(path_template).safe_substitute(**template_kwds)
-            concrete_path = os.path.join(tool_path, path)
+            concrete_path = self._get_tool_item_path(item, tool_path)
             if not os.path.exists(concrete_path):
                 # This is a lot faster than attempting to load a non-existing tool
                 raise IOError(ENOENT, os.strerror(ENOENT))
@@ -689,9 +718,9 @@ class AbstractToolBox(Dictifiable, ManagesIntegratedToolPanelMixin):
             if labels is not None:
                 tool.labels = labels
         except (IOError, OSError) as exc:
-            log.error("Error reading tool configuration file from path '%s': %s", path, unicodify(exc))
+            log.error("Error reading tool configuration file from path '%s': %s", concrete_path, unicodify(exc))
         except Exception:
-            log.exception("Error reading tool from path: %s", path)
+            log.exception("Error reading tool from path: %s", concrete_path)
 
     def get_tool_repository_from_xml_item(self, elem, path):
         tool_shed = elem.find("tool_shed").text
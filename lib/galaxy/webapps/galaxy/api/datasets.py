@@ -413,6 +413,8 @@ class DatasetsController(BaseAPIController, UsesVisualizationMixin):
                 if 'key' in display_kwd:
                     del display_kwd["key"]
                 rval = hda.datatype.display_data(trans, hda, preview, filename, to_ext, **display_kwd)
+        except galaxy_exceptions.MessageException:
+            raise
         except Exception as e:
             log.exception("Error getting display data for dataset (%s) from history (%s)",
                           history_content_id, history_id)
@@ -1,10 +1,13 @@
 """
 API operations on the contents of a history.
 """
+import datetime
 import logging
 import os
 import re
 
+from sqlalchemy import sql
+
 from galaxy import (
     exceptions,
     util
@@ -22,6 +25,7 @@ from galaxy.managers.collections_util import (
     get_hda_and_element_identifiers
 )
 from galaxy.managers.jobs import fetch_job_states, summarize_jobs_to_dict
+from galaxy.model import MAX_IN_FILTER_LENGTH
 from galaxy.util.json import safe_dumps
 from galaxy.util.streamball import StreamBall
 from galaxy.web import (
@@ -39,6 +43,8 @@ from galaxy.webapps.base.controller import (
 
 log = logging.getLogger(__name__)
 
+CHANGES_TOKEN_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
 
 class HistoryContentsController(BaseAPIController, UsesLibraryMixin, UsesLibraryMixinItems, UsesTagsMixin):
 
@@ -94,15 +100,21 @@ class HistoryContentsController(BaseAPIController, UsesLibraryMixin, UsesLibrary
         else:
             types = ['dataset', "dataset_collection"]
 
-        contents_kwds = {'types': types}
+        parsed_filter = self.history_contents_filters.parsed_filter
+        filters = [parsed_filter('orm', sql.column('history_content_type').in_(types))]
         if ids:
             ids = [self.decode_id(id) for id in ids.split(',')]
-            contents_kwds['ids'] = ids
+            if len(ids) < MAX_IN_FILTER_LENGTH:
+                filters.append(parsed_filter('orm', sql.column('id').in_(ids)))
+            else:
+                filters.append(parsed_filter('function', lambda content: content.id in ids))
             # If explicit ids given, always used detailed result.
             details = 'all'
         else:
-            contents_kwds['deleted'] = kwd.get('deleted', None)
-            contents_kwds['visible'] = kwd.get('visible', None)
+            for attr in ('deleted', 'visible'):
+                value = util.string_as_bool_or_none(kwd.get(attr, None))
+                if value is not None:
+                    filters.append(parsed_filter('orm', sql.column(attr) == value))
             # details param allows a mixed set of summary and detailed hdas
             # Ever more convoluted due to backwards compat..., details
             # should be considered deprecated in favor of more specific
@@ -111,7 +123,8 @@ class HistoryContentsController(BaseAPIController, UsesLibraryMixin, UsesLibrary
             if details and details != 'all':
                 details = util.listify(details)
 
-        for content in history.contents_iter(**contents_kwds):
+        contents = self.history_contents_manager.contents(history, filters=filters, expand_details=bool(details))
+        for content in contents:
             encoded_content_id = trans.security.encode_id(content.id)
             detailed = details == 'all' or (encoded_content_id in details)
 
@@ -881,8 +894,6 @@ class HistoryContentsController(BaseAPIController, UsesLibraryMixin, UsesLibrary
 
         'order' defaults to 'hid-asc'
         """
-        rval = []
-
         history = self.history_manager.get_accessible(self.decode_id(history_id), trans.user,
             current_history=trans.history)
 
@@ -901,9 +912,14 @@ class HistoryContentsController(BaseAPIController, UsesLibraryMixin, UsesLibrary
         if details and details != 'all':
             details = util.listify(details)
         view = serialization_params.pop('view')
+        expand_details = bool(details) or view not in (None, 'summary') or bool(serialization_params['keys'])
 
         contents = self.history_contents_manager.contents(history,
-            filters=filters, limit=limit, offset=offset, order_by=order_by)
+            filters=filters, limit=limit, offset=offset, order_by=order_by, expand_details=expand_details)
+        return self.__serialize_contents(trans, contents, view, details, serialization_params)
+
+    def __serialize_contents(self, trans, contents, view, details, serialization_params):
+        rval = []
         for content in contents:
 
             # TODO: remove split
@@ -923,6 +939,68 @@ class HistoryContentsController(BaseAPIController, UsesLibraryMixin, UsesLibrary
 
         return rval
 
+    @expose_api_anonymous
+    def changes(self, trans, history_id, since=None, **kwd):
+        """
+        changes( self, trans, history_id, since=None, **kwd )
+        * GET /api/histories/{history_id}/contents/changes
+            return the contents of the history with the given ``id`` that
+            changed since ``since``, to poll for changes
+        .. note:: Anonymous users are allowed to get their current history contents
+
+        :type   history_id: str
+        :param  history_id: encoded id string of the HDA's History
+        :type   since:      str
+        :param  since:      (optional) the ``next_since`` value returned by
+                            the previous poll. Without it, no contents are
+                            returned and polling can start with the returned
+                            ``next_since``.
+
+        :rtype:     dict
+        :returns:   dictionary with the serialized ``contents`` changed since
+                    ``since``, the ``next_since`` value to pass to the next
+                    poll, and the ``state_counts`` and ``active_counts`` of
+                    the history
+
+        Contents changed within a few seconds before a poll may be returned
+        again by the next poll. The ``view``, ``keys``, ``details``, ``q``/``qv`` and
+        ``order`` parameters are the same as for the v2 (``v=dev``) index.
+        Finding the changed contents takes time proportional to the number
+        of changed contents (and collections) of the history, and the counts
+        are only recalculated when the history changed.
+        """
+        history = self.history_manager.get_accessible(self.decode_id(history_id), trans.user,
+            current_history=trans.history)
+        next_since = self.history_contents_manager.next_since()
+        changes_token = self.history_contents_manager.changes_token(history)
+
+        contents = []
+        if since and changes_token is not None:
+            try:
+                since = datetime.datetime.strptime(since, CHANGES_TOKEN_FORMAT)
+            except ValueError:
+                raise exceptions.RequestParameterInvalidException("Invalid 'since' value '%s'" % since)
+            filter_params = self.parse_filter_params(kwd)
+            filters = self.history_contents_filters.parse_filters(filter_params)
+            order_by = self._parse_order_by(manager=self.history_contents_manager, order_by_string=kwd.get('order', 'hid-asc'))
+            serialization_params = self._parse_serialization_params(kwd, 'summary')
+            details = kwd.get('details', [])
+            if details and details != 'all':
+                details = util.listify(details)
+            view = serialization_params.pop('view')
+            expand_details = bool(details) or view not in (None, 'summary') or bool(serialization_params['keys'])
+            changed = self.history_contents_manager.changed_since(history, since,
+                filters=filters, order_by=order_by, expand_details=expand_details)
+            contents = self.__serialize_contents(trans, changed, view, details, serialization_params)
+
+        state_counts, active_counts = self.history_contents_manager.cached_counts(history, changes_token)
+        return {
+            'contents': contents,
+            'next_since': next_since.strftime(CHANGES_TOKEN_FORMAT),
+            'state_counts': state_counts,
+            'active_counts': active_counts,
+        }
+
     def encode_type_id(self, type_id):
         TYPE_ID_SEP = '-'
         split = type_id.split(TYPE_ID_SEP, 1)
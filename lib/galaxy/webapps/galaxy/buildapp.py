@@ -216,6 +216,12 @@ def populate_api_routes(webapp, app):
         'dataset_collection',
     ]
 
+    # Poll for the changes of history contents, before the resources below so 'changes' is not taken for an id
+    webapp.mapper.connect("history_contents_changes",
+                          "/api/histories/{history_id}/contents/changes",
+                          controller="history_contents",
+                          action="changes",
+                          conditions=dict(method=["GET"]))
     # Accesss HDA details via histories/{history_id}/contents/datasets/{hda_id}
     webapp.mapper.resource("content_typed",
                            "{type:%s}s" % "|".join(valid_history_contents_types),
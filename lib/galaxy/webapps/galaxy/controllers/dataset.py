@@ -836,7 +836,7 @@ class DatasetInterface(BaseUIController, UsesAnnotations, UsesItemRatings, UsesE
             # HDA is purgeable
             # Decrease disk usage first
             if user:
-                user.adjust_total_disk_usage(-hda.quota_amount(user))
+                user.adjust_total_disk_usage(-hda.quota_amount(user), hda.dataset.object_store_id)
             # Mark purged
             hda.purged = True
             trans.sa_session.add(hda)
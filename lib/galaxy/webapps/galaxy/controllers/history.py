@@ -1057,7 +1057,7 @@ class HistoryController(BaseUIController, SharableMixin, UsesAnnotations, UsesIt
                 if not hda.deleted or hda.purged:
                     continue
                 if trans.user:
-                    trans.user.adjust_total_disk_usage(-hda.quota_amount(trans.user))
+                    trans.user.adjust_total_disk_usage(-hda.quota_amount(trans.user), hda.dataset.object_store_id)
                 hda.purged = True
                 trans.sa_session.add(hda)
                 trans.log_event("HDA id %s has been purged" % hda.id)
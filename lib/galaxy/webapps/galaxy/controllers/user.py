@@ -228,9 +228,10 @@ class User(BaseUIController, UsesFormDefinitionsMixin, CreatesApiKeysMixin):
         message = trans.check_csrf_token(kwd)
         if message:
             return self.message_exception(trans, message)
-        if trans.user:
+        if trans.user and not trans.app.config.disk_usage_reconcile_interval:
             # Queue a quota recalculation (async) task -- this takes a
-            # while sometimes, so we don't want to block on logout.
+            # while sometimes, so we don't want to block on logout. Not
+            # needed if the disk usage is reconciled in the background.
             send_local_control_task(trans.app,
                                     "recalculate_user_disk_usage",
                                     kwargs={"user_id": trans.security.encode_id(trans.user.id)})
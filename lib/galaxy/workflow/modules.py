@@ -1909,8 +1909,13 @@ def load_module_sections(trans):
 
 class DelayedWorkflowEvaluation(Exception):
 
-    def __init__(self, why=None):
+    def __init__(self, why=None, job_ids=None, dataset_ids=None, awaits_step=False):
         self.why = why
+        # Jobs and datasets the evaluation waits on to finish, if known.
+        self.job_ids = job_ids or []
+        self.dataset_ids = dataset_ids or []
+        # Set if the evaluation waits on another step that is itself delayed.
+        self.awaits_step = awaits_step
 
 
 class CancelWorkflowEvaluation(Exception):
@@ -1,4 +1,5 @@
 import logging
+import time
 import uuid
 from collections import OrderedDict
 
@@ -24,8 +25,8 @@ def invoke(trans, workflow, workflow_run_config, workflow_invocation=None, popul
 
 
 # Entry point for core workflow scheduler.
-def schedule(trans, workflow, workflow_run_config, workflow_invocation):
-    return __invoke(trans, workflow, workflow_run_config, workflow_invocation)
+def schedule(trans, workflow, workflow_run_config, workflow_invocation, waits=None):
+    return __invoke(trans, workflow, workflow_run_config, workflow_invocation, waits=waits)
 
 
 BASIC_WORKFLOW_STEP_TYPES = [None, "tool", "data_input", "data_collection_input"]
@@ -67,8 +68,11 @@ def force_queue(trans, workflow):
     return False
 
 
-def __invoke(trans, workflow, workflow_run_config, workflow_invocation=None, populate_state=False):
+def __invoke(trans, workflow, workflow_run_config, workflow_invocation=None, populate_state=False, waits=None):
     """ Run the supplied workflow in the supplied target_history.
+
+    If supplied, ``waits`` (an ``InvocationWaits``) records what the delayed
+    steps of the invocation wait on.
     """
     if populate_state:
         modules.populate_module_and_state(trans, workflow, workflow_run_config.param_map, allow_tool_state_corrections=workflow_run_config.allow_tool_state_corrections)
@@ -78,6 +82,7 @@ def __invoke(trans, workflow, workflow_run_config, workflow_invocation=None, pop
         workflow,
         workflow_run_config,
         workflow_invocation=workflow_invocation,
+        waits=waits,
     )
     try:
         outputs = invoker.invoke()
@@ -116,7 +121,7 @@ def queue_invoke(trans, workflow, workflow_run_config, request_params={}, popula
 
 class WorkflowInvoker(object):
 
-    def __init__(self, trans, workflow, workflow_run_config, workflow_invocation=None, progress=None):
+    def __init__(self, trans, workflow, workflow_run_config, workflow_invocation=None, progress=None, waits=None):
         self.trans = trans
         self.workflow = workflow
         if progress is not None:
@@ -150,6 +155,7 @@ class WorkflowInvoker(object):
                 module_injector,
                 param_map=workflow_run_config.param_map,
                 jobs_per_scheduling_iteration=getattr(trans.app.config, "maximum_workflow_jobs_per_scheduling_iteration", -1),
+                waits=waits,
             )
         self.progress = progress
 
@@ -196,7 +202,7 @@ class WorkflowInvoker(object):
                     workflow_invocation_step.state = 'scheduled'
             except modules.DelayedWorkflowEvaluation as de:
                 step_delayed = delayed_steps = True
-                self.progress.mark_step_outputs_delayed(step, why=de.why)
+                self.progress.mark_step_outputs_delayed(step, why=de.why, delayed=de)
             except Exception:
                 log.exception(
                     "Failed to schedule %s, problem occurred on %s.",
@@ -237,11 +243,11 @@ class WorkflowInvoker(object):
         # No steps created yet - have to delay evaluation.
         if not step_invocation:
             delayed_why = "depends on step [%s] but that step has not been invoked yet" % output_id
-            raise modules.DelayedWorkflowEvaluation(why=delayed_why)
+            raise modules.DelayedWorkflowEvaluation(why=delayed_why, awaits_step=True)
 
         if step_invocation.state != 'scheduled':
             delayed_why = "depends on step [%s] job has not finished scheduling yet" % output_id
-            raise modules.DelayedWorkflowEvaluation(delayed_why)
+            raise modules.DelayedWorkflowEvaluation(delayed_why, awaits_step=True)
 
         for job_assoc in step_invocation.jobs:
             job = job_assoc.job
@@ -249,7 +255,7 @@ class WorkflowInvoker(object):
                 # At least one job in incomplete.
                 if not job.finished:
                     delayed_why = "depends on step [%s] but one or more jobs created from that step have not finished yet" % output_id
-                    raise modules.DelayedWorkflowEvaluation(why=delayed_why)
+                    raise modules.DelayedWorkflowEvaluation(why=delayed_why, job_ids=[job.id])
 
                 if job.state != job.states.OK:
                     raise modules.CancelWorkflowEvaluation()
@@ -270,9 +276,47 @@ class WorkflowInvoker(object):
 STEP_OUTPUT_DELAYED = object()
 
 
+class InvocationWaits(object):
+    """
+    Jobs and datasets the delayed steps of a workflow invocation wait on.
+
+    Scheduling the invocation again can only make progress once one of these
+    is finished - unless a step has been delayed for another reason, such as a
+    paused step or a tool step that has not scheduled all its jobs yet.
+    """
+
+    def __init__(self):
+        # Time the invocation was scheduled at
+        self.time = time.time()
+        self.job_ids = set()
+        self.dataset_ids = set()
+        self.unknown = False
+
+    def record(self, delayed):
+        """Record what a step delayed with DelayedWorkflowEvaluation `delayed` waits on."""
+        if delayed.job_ids or delayed.dataset_ids:
+            self.job_ids.update(delayed.job_ids)
+            self.dataset_ids.update(delayed.dataset_ids)
+        elif not delayed.awaits_step:
+            self.unknown = True
+
+    @property
+    def waiting(self):
+        """True if the invocation only needs to be scheduled again once a job or dataset it waits on is finished."""
+        return not self.unknown and bool(self.job_ids or self.dataset_ids)
+
+
+def _collection_job_ids(hdca):
+    if hdca.implicit_collection_jobs:
+        return [job.id for job in hdca.implicit_collection_jobs.job_list]
+    elif hdca.job_id:
+        return [hdca.job_id]
+    return []
+
+
 class WorkflowProgress(object):
 
-    def __init__(self, workflow_invocation, inputs_by_step_id, module_injector, param_map, jobs_per_scheduling_iteration=-1):
+    def __init__(self, workflow_invocation, inputs_by_step_id, module_injector, param_map, jobs_per_scheduling_iteration=-1, waits=None):
         self.outputs = OrderedDict()
         self.module_injector = module_injector
         self.workflow_invocation = workflow_invocation
@@ -280,6 +324,7 @@ class WorkflowProgress(object):
         self.param_map = param_map
         self.jobs_per_scheduling_iteration = jobs_per_scheduling_iteration
         self.jobs_scheduled_this_iteration = 0
+        self.waits = waits if waits is not None else InvocationWaits()
 
     @property
     def maximum_jobs_to_schedule_or_none(self):
@@ -347,7 +392,7 @@ class WorkflowProgress(object):
         step_outputs = self.outputs[output_step_id]
         if step_outputs is STEP_OUTPUT_DELAYED:
             delayed_why = "dependent step [%s] delayed, so this step must be delayed" % output_step_id
-            raise modules.DelayedWorkflowEvaluation(why=delayed_why)
+            raise modules.DelayedWorkflowEvaluation(why=delayed_why, awaits_step=True)
         output_name = connection.output_name
         try:
             replacement = step_outputs[output_name]
@@ -372,26 +417,27 @@ class WorkflowProgress(object):
                     raise modules.CancelWorkflowEvaluation()
 
                 delayed_why = "dependent collection [%s] not yet populated with datasets" % replacement.id
-                raise modules.DelayedWorkflowEvaluation(why=delayed_why)
+                raise modules.DelayedWorkflowEvaluation(why=delayed_why, job_ids=_collection_job_ids(replacement))
 
         data_inputs = (model.HistoryDatasetAssociation, model.HistoryDatasetCollectionAssociation, model.DatasetCollection)
         if not is_data and isinstance(replacement, data_inputs):
             if isinstance(replacement, model.HistoryDatasetAssociation):
                 if replacement.is_pending:
-                    raise modules.DelayedWorkflowEvaluation()
+                    raise modules.DelayedWorkflowEvaluation(dataset_ids=[replacement.dataset_id])
                 if not replacement.is_ok:
                     raise modules.CancelWorkflowEvaluation()
             else:
                 if not replacement.collection.populated:
-                    raise modules.DelayedWorkflowEvaluation()
-                pending = False
+                    job_ids = _collection_job_ids(replacement) if isinstance(replacement, model.HistoryDatasetCollectionAssociation) else []
+                    raise modules.DelayedWorkflowEvaluation(job_ids=job_ids)
+                pending_dataset_ids = []
                 for dataset_instance in replacement.dataset_instances:
                     if dataset_instance.is_pending:
-                        pending = True
+                        pending_dataset_ids.append(dataset_instance.dataset_id)
                     elif not dataset_instance.is_ok:
                         raise modules.CancelWorkflowEvaluation()
-                if pending:
-                    raise modules.DelayedWorkflowEvaluation()
+                if pending_dataset_ids:
+                    raise modules.DelayedWorkflowEvaluation(dataset_ids=pending_dataset_ids)
 
         return replacement
 
@@ -401,7 +447,7 @@ class WorkflowProgress(object):
         step_outputs = self.outputs[step.id]
         if step_outputs is STEP_OUTPUT_DELAYED:
             delayed_why = "depends on workflow output [%s] but that output has not been created yet" % output_name
-            raise modules.DelayedWorkflowEvaluation(why=delayed_why)
+            raise modules.DelayedWorkflowEvaluation(why=delayed_why, awaits_step=True)
         else:
             return step_outputs[output_name]
 
@@ -461,10 +507,18 @@ class WorkflowProgress(object):
     def _record_workflow_output(self, step, workflow_output, output):
         self.workflow_invocation.add_output(workflow_output, step, output)
 
-    def mark_step_outputs_delayed(self, step, why=None):
+    def mark_step_outputs_delayed(self, step, why=None, delayed=None):
+        """
+        Mark the outputs of `step` delayed, `delayed` is the
+        DelayedWorkflowEvaluation describing what the step waits on if known.
+        """
         if why:
             message = "Marking step %s outputs of invocation %s delayed (%s)" % (step.id, self.workflow_invocation.id, why)
             log.debug(message)
+        if delayed is not None:
+            self.waits.record(delayed)
+        else:
+            self.waits.unknown = True
         self.outputs[step.id] = STEP_OUTPUT_DELAYED
 
     def _subworkflow_invocation(self, step):
@@ -510,14 +564,15 @@ class WorkflowProgress(object):
             subworkflow_invocation,
             subworkflow_inputs,
             self.module_injector,
-            param_map=param_map
+            param_map=param_map,
+            waits=self.waits,
         )
 
     def _recover_mapping(self, step_invocation):
         try:
             step_invocation.workflow_step.module.recover_mapping(step_invocation, self)
         except modules.DelayedWorkflowEvaluation as de:
-            self.mark_step_outputs_delayed(step_invocation.workflow_step, de.why)
+            self.mark_step_outputs_delayed(step_invocation.workflow_step, de.why, delayed=de)
 
 
-__all__ = ('invoke', 'WorkflowRunConfig')
+__all__ = ('invoke', 'InvocationWaits', 'WorkflowRunConfig')
@@ -38,8 +38,12 @@ class WorkflowSchedulingPlugin(object):
 class ActiveWorkflowSchedulingPlugin(WorkflowSchedulingPlugin):
 
     @abstractmethod
-    def schedule(self, workflow_invocation):
+    def schedule(self, workflow_invocation, waits=None):
         """ Optionally return one or more commands to instrument job. These
         commands will be executed on the compute server prior to the job
         running.
+
+        If supplied, ``waits`` (a ``galaxy.workflow.run.InvocationWaits``)
+        should record the jobs and datasets the delayed steps of the
+        invocation wait on.
         """
@@ -22,7 +22,7 @@ class CoreWorkflowSchedulingPlugin(ActiveWorkflowSchedulingPlugin):
     def shutdown(self):
         pass
 
-    def schedule(self, workflow_invocation):
+    def schedule(self, workflow_invocation, waits=None):
         workflow = workflow_invocation.workflow
         history = workflow_invocation.history
         request_context = context.WorkRequestContext(
@@ -39,6 +39,7 @@ class CoreWorkflowSchedulingPlugin(ActiveWorkflowSchedulingPlugin):
             workflow=workflow,
             workflow_run_config=workflow_run_config,
             workflow_invocation=workflow_invocation,
+            waits=waits,
         )
 
 
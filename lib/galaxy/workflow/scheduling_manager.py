@@ -1,7 +1,14 @@
+import calendar
 import os
+import threading
+import time
+from collections import OrderedDict
 from functools import partial
+from multiprocessing.pool import ThreadPool
 from xml.etree import ElementTree
 
+from sqlalchemy import not_
+
 import galaxy.workflow.schedulers
 from galaxy import model
 from galaxy.exceptions import HandlerAssignmentError
@@ -10,11 +17,20 @@ from galaxy.util.logging import get_logger
 from galaxy.util.monitors import Monitors
 from galaxy.web_stack.handlers import ConfiguresHandlers, HANDLER_ASSIGNMENT_METHODS
 from galaxy.web_stack.message import WorkflowSchedulingMessage
+from galaxy.workflow.run import InvocationWaits
 
 log = get_logger(__name__)
 
 DEFAULT_SCHEDULER_ID = "default"  # well actually this should be called DEFAULT_DEFAULT_SCHEDULER_ID...
 DEFAULT_SCHEDULER_PLUGIN_TYPE = "core"
+FINISHED_QUERY_BATCH_SIZE = 500
+PENDING_DATASET_STATES = (
+    model.Dataset.states.NEW,
+    model.Dataset.states.UPLOAD,
+    model.Dataset.states.QUEUED,
+    model.Dataset.states.RUNNING,
+    model.Dataset.states.SETTING_METADATA,
+)
 
 EXCEPTION_MESSAGE_SHUTDOWN = "Exception raised while attempting to shutdown workflow scheduler."
 EXCEPTION_MESSAGE_NO_SCHEDULERS = "Failed to defined workflow schedulers - no workflow schedulers defined."
@@ -260,10 +276,35 @@ class WorkflowSchedulingManager(ConfiguresHandlers):
 
 
 class WorkflowRequestMonitor(Monitors):
+    """
+    Schedule the active workflow invocations assigned to this handler.
+
+    Invocations whose delayed steps only wait on jobs or datasets (see
+    ``InvocationWaits``) are not scheduled again until one of these is
+    finished or ``workflow_scheduling_sweep_interval`` seconds have passed.
+
+    With ``workflow_scheduling_workers`` greater than 1, invocations are
+    scheduled by a pool of worker threads, each using its own thread-local
+    database session. The invocations of a history are always scheduled one
+    after another by the same worker and free workers are handed histories of
+    the users that were served least recently first.
+    """
 
     def __init__(self, app, workflow_scheduling_manager):
         self.app = app
         self.workflow_scheduling_manager = workflow_scheduling_manager
+        self.sweep_interval = app.config.workflow_scheduling_sweep_interval
+        self.workers = app.config.workflow_scheduling_workers
+        # What the invocations of every scheduler wait on, by invocation id
+        self.invocation_waits = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        # Histories currently scheduled by a worker
+        self._in_flight_histories = set()
+        # The turn every user was last served on, to hand free workers to
+        # the users waiting the longest
+        self._user_turns = {}
+        self._turn = 0
         self._init_monitor_thread(name="WorkflowRequestMonitor.monitor_thread", target=self.__monitor, config=app.config)
 
     def __monitor(self):
@@ -277,26 +318,178 @@ class WorkflowRequestMonitor(Monitors):
                 if not self.monitor_running:
                     return
 
-                self.__schedule(workflow_scheduler_id, workflow_scheduler)
+                if self._pool is None:
+                    self.__schedule(workflow_scheduler_id, workflow_scheduler)
+                else:
+                    self.__schedule_parallel(workflow_scheduler_id, workflow_scheduler)
 
             log.trace(monitor_step_timer.to_str())
             self._monitor_sleep(1)
 
     def __schedule(self, workflow_scheduler_id, workflow_scheduler):
         invocation_ids = self.__active_invocation_ids(workflow_scheduler_id)
+        wake_times = self.__poll_wake_times(workflow_scheduler_id, invocation_ids)
         for invocation_id in invocation_ids:
-            log.debug("Attempting to schedule workflow invocation [%s]", invocation_id)
-            self.__attempt_schedule(invocation_id, workflow_scheduler)
+            if invocation_id not in wake_times:
+                continue
+            self.__schedule_invocation(workflow_scheduler_id, workflow_scheduler, invocation_id, wake_times[invocation_id])
             if not self.monitor_running:
                 return
 
+    def __schedule_parallel(self, workflow_scheduler_id, workflow_scheduler):
+        invocations = self.__active_invocations(workflow_scheduler_id)
+        wake_times = self.__poll_wake_times(workflow_scheduler_id, [invocation[0] for invocation in invocations])
+        for history_id, history_invocations in self._scheduling_batches(invocations, wake_times):
+            self._pool.apply_async(
+                self.__schedule_history,
+                (workflow_scheduler_id, workflow_scheduler, history_id, history_invocations)
+            )
+
+    def __poll_wake_times(self, workflow_scheduler_id, invocation_ids):
+        with self._lock:
+            waits_by_invocation_id = self.invocation_waits.setdefault(workflow_scheduler_id, {})
+            # Forget about invocations that are not active anymore
+            for invocation_id in set(waits_by_invocation_id) - set(invocation_ids):
+                del waits_by_invocation_id[invocation_id]
+            waits_by_invocation_id = dict(waits_by_invocation_id)
+        return self._wake_times(invocation_ids, waits_by_invocation_id)
+
+    def _scheduling_batches(self, invocations, wake_times):
+        """
+        Pick the histories to hand to the free scheduling workers.
+
+        `invocations` are ``(id, history_id, user_id)`` tuples. Returns a list
+        of ``(history_id, [(invocation_id, wake_time), ...])`` tuples, taking
+        one history of every user in turn, starting with the users that were
+        served least recently. The histories returned are marked in flight
+        until ``__schedule_history`` is done with them.
+        """
+        with self._lock:
+            free_workers = self.workers - len(self._in_flight_histories)
+            if free_workers <= 0:
+                return []
+            histories_by_user = OrderedDict()
+            invocations_by_history = OrderedDict()
+            for invocation_id, history_id, user_id in invocations:
+                if invocation_id not in wake_times or history_id in self._in_flight_histories:
+                    continue
+                if history_id not in invocations_by_history:
+                    invocations_by_history[history_id] = []
+                    histories_by_user.setdefault(user_id, []).append(history_id)
+                invocations_by_history[history_id].append((invocation_id, wake_times[invocation_id]))
+            users = sorted(histories_by_user, key=lambda user_id: self._user_turns.get(user_id, -1))
+            batches = []
+            while users and len(batches) < free_workers:
+                for user_id in list(users):
+                    if len(batches) == free_workers:
+                        break
+                    history_id = histories_by_user[user_id].pop(0)
+                    if not histories_by_user[user_id]:
+                        users.remove(user_id)
+                    self._turn += 1
+                    self._user_turns[user_id] = self._turn
+                    self._in_flight_histories.add(history_id)
+                    batches.append((history_id, invocations_by_history[history_id]))
+            return batches
+
+    def __schedule_history(self, workflow_scheduler_id, workflow_scheduler, history_id, history_invocations):
+        try:
+            for invocation_id, wake_time in history_invocations:
+                if not self.monitor_running:
+                    return
+                self.__schedule_invocation(workflow_scheduler_id, workflow_scheduler, invocation_id, wake_time)
+        except Exception:
+            log.exception("Exception raised while scheduling workflow invocations of history [%s]", history_id)
+        finally:
+            # Release this worker thread's database session
+            self.app.model.context.remove()
+            with self._lock:
+                self._in_flight_histories.discard(history_id)
+
+    def __schedule_invocation(self, workflow_scheduler_id, workflow_scheduler, invocation_id, wake_time):
+        log.debug("Attempting to schedule workflow invocation [%s]", invocation_id)
+        waits = self.__attempt_schedule(invocation_id, workflow_scheduler)
+        with self._lock:
+            waits_by_invocation_id = self.invocation_waits.setdefault(workflow_scheduler_id, {})
+            if waits is not None:
+                waits_by_invocation_id[invocation_id] = waits
+            else:
+                waits_by_invocation_id.pop(invocation_id, None)
+        if waits is not None:
+            self.__record_latency(invocation_id, wake_time)
+
+    def _wake_times(self, invocation_ids, waits_by_invocation_id):
+        """
+        Return the invocations of `invocation_ids` that should be scheduled.
+
+        The result maps invocation ids to the time the first job or dataset
+        the invocation waited on finished, or None if the invocation was not
+        waiting on any.
+        """
+        now = time.time()
+        wake_times = {}
+        waiting = {}
+        for invocation_id in invocation_ids:
+            waits = waits_by_invocation_id.get(invocation_id)
+            if waits is None or not waits.waiting or now - waits.time >= self.sweep_interval:
+                wake_times[invocation_id] = None
+            else:
+                waiting[invocation_id] = waits
+        if waiting:
+            finished_jobs = self.__finished(
+                model.Job,
+                set().union(*(waits.job_ids for waits in waiting.values())),
+                model.Job.non_ready_states,
+            )
+            finished_datasets = self.__finished(
+                model.Dataset,
+                set().union(*(waits.dataset_ids for waits in waiting.values())),
+                PENDING_DATASET_STATES,
+            )
+            for invocation_id, waits in waiting.items():
+                finish_times = [finished_jobs[job_id] for job_id in waits.job_ids if job_id in finished_jobs]
+                finish_times.extend(finished_datasets[dataset_id] for dataset_id in waits.dataset_ids if dataset_id in finished_datasets)
+                if finish_times:
+                    wake_times[invocation_id] = min(finish_times)
+        return wake_times
+
+    def __finished(self, model_class, ids, pending_states):
+        """Return the update times of the objects with `ids` that are not in `pending_states` by id."""
+        sa_session = self.app.model.context
+        ids = sorted(ids)
+        update_times = {}
+        for i in range(0, len(ids), FINISHED_QUERY_BATCH_SIZE):
+            query = sa_session.query(model_class.id, model_class.update_time).filter(
+                model_class.id.in_(ids[i:i + FINISHED_QUERY_BATCH_SIZE]),
+                not_(model_class.state.in_(pending_states)),
+            )
+            for object_id, update_time in query:
+                update_times[object_id] = calendar.timegm(update_time.utctimetuple()) if update_time else time.time()
+        return update_times
+
+    def __record_latency(self, invocation_id, wake_time):
+        if wake_time is None:
+            return
+        latency_timer = self.app.execution_timer_factory.get_timer(
+            'internal.galaxy.workflows.scheduling_manager.invocation_latency',
+            'Workflow invocation [${invocation_id}] scheduled after what it waited on finished.'
+        )
+        latency_timer.begin = wake_time
+        log.debug(latency_timer.to_str(invocation_id=invocation_id))
+
     def __attempt_schedule(self, invocation_id, workflow_scheduler):
+        """
+        Attempt to schedule the invocation with `invocation_id`.
+
+        Returns the ``InvocationWaits`` of the invocation if it was scheduled,
+        else None.
+        """
         sa_session = self.app.model.context
         workflow_invocation = sa_session.query(model.WorkflowInvocation).get(invocation_id)
 
         try:
             if not workflow_invocation or not workflow_invocation.active:
-                return False
+                return None
 
             # This ensures we're only ever working on the 'first' active
             # workflow invocation in a given history, to force sequential
@@ -304,18 +497,19 @@ class WorkflowRequestMonitor(Monitors):
             if self.app.config.history_local_serial_workflow_scheduling:
                 for i in workflow_invocation.history.workflow_invocations:
                     if i.active and i.id < workflow_invocation.id:
-                        return False
-            workflow_scheduler.schedule(workflow_invocation)
+                        return None
+            waits = InvocationWaits()
+            workflow_scheduler.schedule(workflow_invocation, waits=waits)
             log.debug("Workflow invocation [%s] scheduled", workflow_invocation.id)
         except Exception:
             # TODO: eventually fail this - or fail it right away?
             log.exception("Exception raised while attempting to schedule workflow request.")
-            return False
+            return None
         finally:
             sa_session.expunge_all()
 
         # A workflow was obtained and scheduled...
-        return True
+        return waits
 
     def __active_invocation_ids(self, scheduler_id):
         sa_session = self.app.model.context
@@ -326,8 +520,24 @@ class WorkflowRequestMonitor(Monitors):
             handler=handler,
         )
 
+    def __active_invocations(self, scheduler_id):
+        sa_session = self.app.model.context
+        handler = self.app.config.server_name
+        return model.WorkflowInvocation.poll_active_workflows(
+            sa_session,
+            scheduler=scheduler_id,
+            handler=handler,
+        )
+
     def start(self):
+        if self.workers > 1:
+            # Created here rather than in __init__ as threads do not survive forking
+            self._pool = ThreadPool(self.workers)
         self.monitor_thread.start()
 
     def shutdown(self):
         self.shutdown_monitor()
+        if self._pool is not None:
+            # Workers stop after the invocation they are scheduling
+            self._pool.close()
+            self._pool.join()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Benchmark user disk usage accounting against the number of HDAs of a user.
+
+For a user with an increasing number of HDAs (in a sqlite database unless
+--database-connection is given) this times a full recalculation of the disk
+usage, as done by ``calculate_and_set_disk_usage()``, and an incremental
+adjustment of it, as done when datasets are created or purged.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, 'lib')))
+
+from galaxy.model import mapping
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('--hdas', type=int, nargs='+', default=[1000, 10000, 100000], help='numbers of HDAs of the user')
+parser.add_argument('--object-stores', type=int, default=2, help='number of object stores holding the datasets')
+parser.add_argument('--repeat', type=int, default=3, help='number of times every benchmark is run')
+parser.add_argument('--database-connection', default='sqlite:///:memory:', help='database to create the model in, must be empty')
+args = parser.parse_args()
+
+
+def timed(label, func):
+    best = None
+    for _ in range(args.repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print("%-40s %8.3f seconds" % (label, best))
+
+
+def add_hdas(model, history, count, start):
+    dataset_table = model.Dataset.table
+    hda_table = model.HistoryDatasetAssociation.table
+    connection = model.session.connection()
+    connection.execute(dataset_table.insert(), [dict(
+        id=start + i,
+        state='ok',
+        deleted=False,
+        purged=False,
+        total_size=1024,
+        object_store_id='files%d' % (i % args.object_stores),
+    ) for i in range(count)])
+    connection.execute(hda_table.insert(), [dict(
+        history_id=history.id,
+        dataset_id=start + i,
+        hid=start + i,
+        deleted=False,
+        purged=False,
+        visible=True,
+    ) for i in range(count)])
+
+
+if __name__ == '__main__':
+    model = mapping.init(tempfile.gettempdir(), args.database_connection, create_tables=True)
+    sa_session = model.session
+    user = model.User(email='disk_usage_benchmark@example.com', password='password')
+    history = model.History(name='disk usage benchmark', user=user)
+    sa_session.add_all((user, history))
+    sa_session.flush()
+
+    def adjust():
+        user.adjust_total_disk_usage(1024, 'files0')
+        sa_session.flush()
+
+    hdas = 0
+    for count in sorted(args.hdas):
+        add_hdas(model, history, count - hdas, hdas + 1)
+        hdas = count
+        print("%d HDAs" % hdas)
+        timed("full recalculation", user.calculate_and_set_disk_usage)
+        timed("incremental adjustment", adjust)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Benchmark id encoding for large API payloads.
+
+Encodes the ids of a synthetic history contents payload (a list of dicts
+with nested objects and lists of ids) one by one and with
+``encode_ids()``/``encode_all_ids()``, and decodes them without and with a
+cold and a warm cache of decoded ids.
+"""
+from __future__ import print_function
+
+import argparse
+import copy
+import os
+import sys
+import time
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, 'lib')))
+
+from galaxy.security.idencoding import IdEncodingHelper
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('--items', type=int, default=10000, help='number of items in the payload')
+parser.add_argument('--repeat', type=int, default=3, help='number of times every benchmark is run')
+args = parser.parse_args()
+
+
+def build_payload(items):
+    return [dict(
+        id=i,
+        history_id=1,
+        dataset_id=i + 1000000,
+        job_source_id=i // 3,
+        tool_id='cat1',
+        name='dataset %d' % i,
+        collection_ids=[i, i + 1, i + 2],
+        object=dict(id=i, model_class='HistoryDatasetAssociation'),
+    ) for i in range(items)]
+
+
+def timed(label, func):
+    best = None
+    for _ in range(args.repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print("%-40s %8.3f seconds" % (label, best))
+
+
+if __name__ == '__main__':
+    payload = build_payload(args.items)
+    obj_ids = list(range(args.items))
+    uncached = IdEncodingHelper(id_secret='benchmarking id encoding', id_cache_size=0)
+
+    def cached_helper():
+        return IdEncodingHelper(id_secret='benchmarking id encoding')
+
+    print("%d items" % args.items)
+    timed("encode_id", lambda: [uncached.encode_id(i) for i in obj_ids])
+    timed("encode_ids", lambda: uncached.encode_ids(obj_ids))
+    payloads = [copy.deepcopy(payload) for _ in range(args.repeat)]
+    timed("encode_all_ids", lambda: uncached.encode_all_ids(dict(items=payloads.pop()), recursive=True))
+    encoded_ids = uncached.encode_ids(obj_ids)
+
+    def decode_all(helper):
+        return [helper.decode_id(i) for i in encoded_ids]
+    warm = cached_helper()
+    decode_all(warm)
+    cold = [cached_helper() for _ in range(args.repeat)]
+    timed("decode_id, no cache", lambda: decode_all(uncached))
+    timed("decode_id, cold cache", lambda: decode_all(cold.pop()))
+    timed("decode_id, warm cache", lambda: decode_all(warm))
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+Benchmark the object store cache index against a synthetic cache.
+
+The index is filled with entries for files that do not exist on disk, so
+large caches can be simulated without creating millions of files. Timings
+are reported for recording accesses and for evicting down to the low
+watermark.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, 'lib')))
+
+from galaxy.objectstore.caching import CacheManager
+
+FILE_SIZE = 1024 * 1024
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('--files', type=int, default=1000000, help='number of files in the synthetic cache')
+parser.add_argument('--accesses', type=int, default=10000, help='number of file accesses to record')
+parser.add_argument('--overcommit', type=float, default=0.95, help='fraction of the cache size in use before eviction')
+args = parser.parse_args()
+
+
+def populate(manager, count):
+    now = time.time()
+    rows = (('%d/%d/dataset_%d.dat' % (i // 1000000, i // 1000 % 1000, i), FILE_SIZE, now - count + i) for i in range(count))
+    manager._conn.execute("BEGIN")
+    manager._conn.executemany("INSERT INTO cache_entry (path, size, atime) VALUES (?, ?, ?)", rows)
+    manager._conn.execute("COMMIT")
+
+
+def timed(label, func, *args):
+    start = time.time()
+    result = func(*args)
+    print("%-30s %.3f seconds" % (label, time.time() - start))
+    return result
+
+
+if __name__ == '__main__':
+    staging_path = tempfile.mkdtemp()
+    try:
+        cache_size = int(args.files * FILE_SIZE / args.overcommit)
+        manager = CacheManager(staging_path, cache_size)
+        timed("populate %d entries" % args.files, populate, manager, args.files)
+
+        def access():
+            for _ in range(args.accesses):
+                i = random.randrange(args.files)
+                manager.file_accessed(os.path.join(staging_path, '%d/%d/dataset_%d.dat' % (i // 1000000, i // 1000 % 1000, i)))
+        timed("record %d accesses" % args.accesses, access)
+        freed = timed("evict to low watermark", manager.evict)
+        print("freed %d files, %d entries left" % (freed // FILE_SIZE, manager._conn.execute("SELECT COUNT(*) FROM cache_entry").fetchone()[0]))
+        manager.shutdown()
+    finally:
+        shutil.rmtree(staging_path)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Set the fingerprint of jobs created before job fingerprints were recorded,
+so that they can be found and reused by job searches (``use_cached_job``).
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, 'lib')))
+
+from sqlalchemy.orm import subqueryload
+
+import galaxy.config
+from galaxy.managers.jobs import fingerprint_job
+from galaxy.util.script import app_properties_from_args, populate_config_args
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('--all', dest='all', help='Recompute the fingerprint of jobs that already have one', action='store_true', default=False)
+parser.add_argument('--batch-size', dest='batch_size', help='Number of jobs loaded and updated at a time', type=int, default=1000)
+parser.add_argument('--dry-run', dest='dryrun', help='Dry run (count jobs that would be updated but do not save to database)', action='store_true', default=False)
+populate_config_args(parser)
+args = parser.parse_args()
+
+
+def init():
+    app_properties = app_properties_from_args(args)
+    config = galaxy.config.Configuration(**app_properties)
+    return galaxy.config.init_models_from_config(config)
+
+
+def job_batches(sa_session, model):
+    query = sa_session.query(model.Job).options(subqueryload(model.Job.parameters)).order_by(model.Job.id)
+    if not args.all:
+        query = query.filter(model.Job.fingerprint == None)  # noqa: E711
+    last_id = 0
+    while True:
+        jobs = query.filter(model.Job.id > last_id).limit(args.batch_size).all()
+        if not jobs:
+            return
+        last_id = jobs[-1].id
+        yield jobs
+
+
+if __name__ == '__main__':
+    print('Loading Galaxy model...')
+    model = init()
+    sa_session = model.context.current
+
+    job_count = sa_session.query(model.Job).count()
+    print('Processing up to %i jobs...' % job_count)
+    processed = updated = 0
+    for jobs in job_batches(sa_session, model):
+        for job in jobs:
+            fingerprint = fingerprint_job(sa_session, job)
+            if fingerprint is not None and fingerprint != job.fingerprint:
+                job.set_fingerprint(fingerprint)
+                updated += 1
+        processed += len(jobs)
+        if not args.dryrun:
+            sa_session.flush()
+        # Do not keep the jobs of past batches and their inputs around
+        sa_session.expunge_all()
+        print('\rProcessed %i jobs, %i fingerprints set' % (processed, updated), end=' ')
+        sys.stdout.flush()
+    print()
+    if args.dryrun:
+        print('Dry run, no fingerprints were saved')
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Benchmark datatype sniffing over a directory of test files.
+
+Every file is sniffed with the datatypes of the given datatypes configuration
+twice: with the sniffing engine (shared prefix views and signature pruning)
+and with a baseline that runs every sniffer in sniff order on a prefix that
+is re-parsed for every sniffer, like the engine before signatures were added.
+Per file timings and any files the two disagree on are reported.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, 'lib')))
+
+from galaxy.datatypes import sniff
+from galaxy.datatypes.registry import Registry
+
+GALAXY_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('--datatypes-config', default=os.path.join(GALAXY_ROOT, 'lib', 'galaxy', 'config', 'sample', 'datatypes_conf.xml.sample'),
+                    help='datatypes configuration to load sniffers from')
+parser.add_argument('--directory', default=os.path.join(GALAXY_ROOT, 'lib', 'galaxy', 'datatypes', 'test'),
+                    help='directory with the files to sniff')
+parser.add_argument('--repeat', type=int, default=3, help='number of times every file is sniffed')
+parser.add_argument('--slowest', type=int, default=10, help='number of slowest files to report')
+args = parser.parse_args()
+
+
+class BaselineFilePrefix(sniff.FilePrefix):
+    """A prefix that is split into lines again for every sniffer."""
+
+    def lines(self):
+        self._lines = None
+        self._split_lines = {}
+        return super(BaselineFilePrefix, self).lines()
+
+
+def baseline_sniff(filename, sniff_order):
+    file_prefix = BaselineFilePrefix(filename)
+    for datatype in sniff_order:
+        try:
+            if hasattr(datatype, "sniff_prefix"):
+                datatype_compressed = getattr(datatype, "compressed", False)
+                if datatype_compressed != bool(file_prefix.compressed_format):
+                    continue
+                if file_prefix.compressed_format and getattr(datatype, "compressed_format", None):
+                    if file_prefix.compressed_format != datatype.compressed_format:
+                        continue
+                if datatype.sniff_prefix(file_prefix):
+                    return datatype.file_ext
+            elif datatype.sniff(filename):
+                return datatype.file_ext
+        except Exception:
+            pass
+
+
+def engine_sniff(filename, sniff_order):
+    return sniff.run_sniffers_raw(filename, sniff_order)
+
+
+def timed(func, filename, sniff_order):
+    start = time.time()
+    for _ in range(args.repeat):
+        result = func(filename, sniff_order)
+    return result, (time.time() - start) / args.repeat
+
+
+if __name__ == '__main__':
+    registry = Registry()
+    registry.load_datatypes(root_dir=GALAXY_ROOT, config=args.datatypes_config)
+    filenames = sorted(os.path.join(args.directory, f) for f in os.listdir(args.directory))
+    filenames = [f for f in filenames if os.path.isfile(f)]
+    print("Sniffing %d files with %d sniffers" % (len(filenames), len(registry.sniff_order)))
+
+    totals = {'baseline': 0.0, 'engine': 0.0}
+    timings = []
+    mismatches = []
+    for filename in filenames:
+        baseline_ext, baseline_time = timed(baseline_sniff, filename, registry.sniff_order)
+        engine_ext, engine_time = timed(engine_sniff, filename, registry.sniff_order)
+        totals['baseline'] += baseline_time
+        totals['engine'] += engine_time
+        timings.append((baseline_time, engine_time, os.path.basename(filename)))
+        if baseline_ext != engine_ext:
+            mismatches.append((os.path.basename(filename), baseline_ext, engine_ext))
+
+    print("%-40s %10s %10s" % ("file", "baseline", "engine"))
+    for baseline_time, engine_time, name in sorted(timings, reverse=True)[:args.slowest]:
+        print("%-40s %8.2fms %8.2fms" % (name, baseline_time * 1000, engine_time * 1000))
+    print("%-40s %9.3fs %9.3fs" % ("total", totals['baseline'], totals['engine']))
+    if totals['engine']:
+        print("speedup: %.1fx" % (totals['baseline'] / totals['engine']))
+    for name, baseline_ext, engine_ext in mismatches:
+        print("%s sniffed as %s by the baseline and as %s by the engine" % (name, baseline_ext, engine_ext))
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+Benchmark Tabular.set_meta against the line by line implementation it replaced.
+
+A synthetic table is generated (or an existing one is used) and its metadata
+is set with both implementations, reporting the time taken and whether the
+resulting column types and line counts are identical.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, 'lib')))
+
+from galaxy.datatypes.tabular import Tabular
+from galaxy.util import compression_utils
+from galaxy.util.bunch import Bunch
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('--file', help='tabular file to use instead of a synthetic one')
+parser.add_argument('--lines', type=int, default=1000000, help='number of lines of the synthetic table')
+parser.add_argument('--max-data-lines', type=int, default=None, help='max_data_lines passed to set_meta, all lines by default')
+parser.add_argument('--max-guess-type-data-lines', type=int, default=None, help='max_guess_type_data_lines passed to set_meta')
+args = parser.parse_args()
+
+
+def legacy_set_meta(dataset, skip=None, max_data_lines=100000, max_guess_type_data_lines=None):
+    """Column type guessing as done before blocks were read, trying int() and float() on every field."""
+    requested_skip = skip
+    skip = skip or 0
+    column_type_order = ['str', 'list', 'float', 'int']
+
+    def overrules(type1, type2):
+        if type1 is None or type1 == type2:
+            return False
+        if type2 is None:
+            return True
+        return column_type_order.index(type1) < column_type_order.index(type2)
+
+    def guess(text):
+        for column_type, check in (('int', int), ('float', float)):
+            try:
+                check(text)
+                return column_type
+            except ValueError:
+                if column_type == 'float' and text.strip().lower() == 'na':
+                    return 'float'
+        if "," in text:
+            return 'list'
+        return 'str' if text else None
+
+    data_lines = comment_lines = 0
+    column_types = []
+    first_line_column_types = ['str']
+    with compression_utils.get_fileobj(dataset.file_name) as fh:
+        i = 0
+        while True:
+            line = fh.readline()
+            if not line:
+                break
+            line = line.rstrip('\r\n')
+            if i < skip or not line or line.startswith('#'):
+                comment_lines += 1
+            else:
+                data_lines += 1
+                if max_guess_type_data_lines is None or data_lines <= max_guess_type_data_lines:
+                    for field_count, field in enumerate(line.split('\t')):
+                        if field_count >= len(column_types):
+                            column_types.append(None)
+                        column_type = guess(field)
+                        if overrules(column_type, column_types[field_count]):
+                            column_types[field_count] = column_type
+                if i == 0 and requested_skip is None:
+                    first_line_column_types = column_types
+                    column_types = [None for col in first_line_column_types]
+            if max_data_lines is not None and data_lines >= max_data_lines:
+                if fh.tell() != dataset.get_size():
+                    data_lines = comment_lines = None
+                break
+            i += 1
+    column_types.extend(first_line_column_types[len(column_types):])
+    for i, column_type in enumerate(column_types):
+        if column_type is None:
+            column_types[i] = first_line_column_types[i] if i < len(first_line_column_types) and first_line_column_types[i] else 'str'
+    dataset.metadata.data_lines = data_lines
+    dataset.metadata.comment_lines = comment_lines
+    dataset.metadata.column_types = column_types
+
+
+def write_table(path, lines):
+    rng = random.Random(0)
+    with open(path, 'w') as fh:
+        fh.write('#chrom\tstart\tend\tname\tscore\tstrand\tblocks\n')
+        for i in range(lines):
+            fh.write('chr%d\t%d\t%d\tfeature_%d\t%.3f\t%s\t%s\n' % (
+                rng.randint(1, 22), i * 100, i * 100 + 50, i, rng.random() * 1000,
+                rng.choice('+-'), ','.join(str(rng.randint(1, 500)) for _ in range(3))))
+
+
+def timed(label, set_meta, dataset, **kwd):
+    start = time.time()
+    set_meta(dataset, **kwd)
+    print("%-10s %8.3f seconds" % (label, time.time() - start))
+    return (dataset.metadata.data_lines, dataset.metadata.comment_lines, dataset.metadata.column_types)
+
+
+if __name__ == '__main__':
+    path = args.file
+    if path is None:
+        path = tempfile.mkstemp(suffix='.tabular')[1]
+        write_table(path, args.lines)
+    try:
+        kwd = dict(max_data_lines=args.max_data_lines, max_guess_type_data_lines=args.max_guess_type_data_lines)
+
+        def dataset():
+            return Bunch(file_name=path, metadata=Bunch(), has_data=lambda: True, get_size=lambda: os.path.getsize(path))
+        print("%s (%d bytes)" % (path, os.path.getsize(path)))
+        legacy = timed("legacy", legacy_set_meta, dataset(), **kwd)
+        current = timed("current", Tabular().set_meta, dataset(), **kwd)
+        print("data_lines=%s comment_lines=%s column_types=%s" % current)
+        if legacy != current:
+            print("Results differ, legacy implementation found data_lines=%s comment_lines=%s column_types=%s" % legacy)
+    finally:
+        if args.file is None:
+            os.remove(path)
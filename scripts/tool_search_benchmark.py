@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Benchmark building and searching the toolbox search index for a synthetic toolbox.
+
+This times building the on-disk index from scratch, as done by the first
+Galaxy process starting, building it again for an unchanged toolbox, as done
+by every other process, updating it after a few tools have changed and
+searching it.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(1, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, 'lib')))
+
+from galaxy.tools.search import ToolBoxSearch
+from galaxy.util.bunch import Bunch
+
+WORDS = ('align', 'assembly', 'bam', 'convert', 'count', 'fasta', 'fastq', 'filter', 'genome', 'join',
+         'mapping', 'merge', 'peak', 'quality', 'reads', 'sequence', 'sort', 'split', 'table', 'variant')
+QUERIES = ('bowtie', 'fastq quality', 'sort table', 'variant calling genome', 'tool_42')
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('--tools', type=int, default=10000, help='number of tools in the toolbox')
+parser.add_argument('--changed-tools', type=int, default=10, help='number of tools changed between index updates')
+parser.add_argument('--help-words', type=int, default=200, help='number of words in the help of every tool')
+parser.add_argument('--no-index-help', dest='index_help', action='store_false', default=True, help='do not index the help of tools')
+parser.add_argument('--repeat', type=int, default=3, help='number of times every search is run')
+args = parser.parse_args()
+
+
+class BenchmarkToolCache(object):
+
+    def __init__(self, tools):
+        self._tools_by_id = {tool.id: tool for tool in tools}
+        self._tool_paths_by_id = {tool.id: tool.id for tool in tools}
+        self._new_tool_ids = set(self._tools_by_id)
+        self._removed_tool_ids = set()
+
+    def get_tool_by_id(self, tool_id):
+        return self._tools_by_id.get(tool_id)
+
+    def reset_status(self):
+        self._new_tool_ids = set()
+        self._removed_tool_ids = set()
+
+
+def synthetic_tool(i, rand):
+    section = 'Section %d' % (i % 50)
+    return Bunch(
+        id='tool_%d' % i,
+        name='%s %s %d' % (rand.choice(WORDS).capitalize(), rand.choice(WORDS), i),
+        description=' '.join(rand.choice(WORDS) for _ in range(5)),
+        tool_type='default',
+        guid='toolshed.g2.bx.psu.edu/repos/owner%d/repo%d/tool_%d/1.0' % (i % 100, i, i),
+        labels=[],
+        raw_help=' '.join(rand.choice(WORDS) for _ in range(args.help_words)),
+        is_latest_version=True,
+        get_panel_section=lambda: ('section', section),
+    )
+
+
+def timed(label, func):
+    start = time.time()
+    func()
+    print("%-40s %8.3f seconds" % (label, time.time() - start))
+
+
+def timed_search(label, toolbox_search, q):
+    best = None
+    for _ in range(args.repeat):
+        start = time.time()
+        toolbox_search.search(q, tool_name_boost=9.0, tool_section_boost=3.0, tool_description_boost=2.0,
+                              tool_label_boost=1.0, tool_stub_boost=5.0, tool_help_boost=0.5, tool_search_limit=20,
+                              tool_enable_ngram_search=False, tool_ngram_minsize=3, tool_ngram_maxsize=4)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print("%-40s %8.3f seconds" % (label, best))
+
+
+def build_index(toolbox_search, tool_cache):
+    toolbox_search.build_index(tool_cache, index_help=args.index_help)
+    tool_cache.reset_status()
+
+
+if __name__ == '__main__':
+    rand = random.Random(42)
+    tools = [synthetic_tool(i, rand) for i in range(args.tools)]
+    index_dir = tempfile.mkdtemp()
+    try:
+        print("%d tools" % args.tools)
+        tool_cache = BenchmarkToolCache(tools)
+        toolbox_search = ToolBoxSearch(None, index_dir=index_dir)
+        timed("build index", lambda: build_index(toolbox_search, tool_cache))
+        other_tool_cache = BenchmarkToolCache(tools)
+        other_toolbox_search = ToolBoxSearch(None, index_dir=index_dir)
+        timed("build index of unchanged toolbox", lambda: build_index(other_toolbox_search, other_tool_cache))
+        for tool in rand.sample(tools, args.changed_tools):
+            tool.description += ' changed'
+            tool_cache._new_tool_ids.add(tool.id)
+        timed("update %d changed tools" % args.changed_tools, lambda: build_index(toolbox_search, tool_cache))
+        in_memory_toolbox_search = ToolBoxSearch(None)
+        timed("build in-memory index", lambda: build_index(in_memory_toolbox_search, BenchmarkToolCache(tools)))
+        for q in QUERIES:
+            timed_search("search '%s'" % q, toolbox_search, q)
+    finally:
+        shutil.rmtree(index_dir)
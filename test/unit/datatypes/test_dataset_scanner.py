@@ -0,0 +1,143 @@
+import gzip
+
+import pytest
+
+from galaxy.datatypes.data import (
+    get_dataset_peek,
+    Text,
+)
+from galaxy.datatypes.sequence import Fasta
+from galaxy.datatypes.tabular import Tabular
+from galaxy.datatypes.util import dataset_scanner
+from galaxy.util import compression_utils
+from galaxy.util.bunch import Bunch
+from .util import get_tmp_path
+
+CONTENT = b'#comment\n1\t2\n\n  # indented\n3\t4\r\n5\t6'
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    opened = []
+    get_fileobj_raw = compression_utils.get_fileobj_raw
+
+    def counting_get_fileobj_raw(filename, *args, **kwd):
+        opened.append(filename)
+        return get_fileobj_raw(filename, *args, **kwd)
+    monkeypatch.setattr(compression_utils, 'get_fileobj_raw', counting_get_fileobj_raw)
+    return opened
+
+
+def get_dataset(path):
+    return Bunch(file_name=path, metadata=Bunch(), dataset=Bunch(purged=False), has_data=lambda: True, get_size=lambda: 100)
+
+
+def write(path, content, compress=False):
+    with (gzip.open if compress else open)(path, 'wb') as fh:
+        fh.write(content)
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_scanner_counts(compress):
+    with get_tmp_path() as path:
+        write(path, CONTENT, compress)
+        scanner = dataset_scanner.DatasetScanner(path, block_size=4, prefix_size=8)
+        assert scanner.finish().lines == 6
+        assert scanner.comment_lines == 2
+        assert scanner.data_lines == 3
+        assert scanner.compressed_format == ('gzip' if compress else None)
+        assert scanner.get_prefix() == ('#comment', False)
+        assert list(scanner.head_lines()) == ['#comment', '1\t2', '', '  # indented', '3\t4', '5\t6']
+
+
+def test_scanner_blocks_reread():
+    with get_tmp_path() as path:
+        write(path, CONTENT)
+        scanner = dataset_scanner.DatasetScanner(path, block_size=4)
+        shared = scanner.blocks()
+        assert next(shared) == '#comment'
+        assert '\n'.join(scanner.blocks()).split('\n')[:2] == ['#comment', '1\t2']
+        assert scanner.finish().lines == 6
+        assert list(shared) == []
+        assert scanner.get_prefix() == (CONTENT.decode('utf-8').replace('\r\n', '\n'), True)
+
+
+def test_get_dataset_scanner():
+    with get_tmp_path() as path:
+        write(path, CONTENT)
+        dataset = get_dataset(path)
+        assert dataset_scanner.get_dataset_scanner(dataset) is not dataset_scanner.get_dataset_scanner(dataset)
+        with dataset_scanner.shared_dataset_scan(dataset):
+            scanner = dataset_scanner.get_dataset_scanner(dataset)
+            with dataset_scanner.shared_dataset_scan(dataset):
+                assert dataset_scanner.get_dataset_scanner(dataset) is scanner
+            assert dataset_scanner.get_dataset_scanner(dataset) is scanner
+            assert dataset_scanner.get_dataset_scanner(get_dataset(path)) is not scanner
+            write(path, CONTENT + b'\n7\t8')
+            assert dataset_scanner.get_dataset_scanner(dataset) is not scanner
+        assert dataset_scanner.get_dataset_scanner(dataset) is not scanner
+
+
+def test_shared_dataset_scan_closes_file():
+    with get_tmp_path() as path:
+        write(path, CONTENT)
+        dataset = get_dataset(path)
+        with dataset_scanner.shared_dataset_scan(dataset):
+            scanner = dataset_scanner.get_dataset_scanner(dataset)
+            assert next(scanner.blocks()) is not None
+            fh = scanner._recorder.fh
+            assert not fh.closed
+        assert fh.closed
+
+
+def test_start_and_end_shared_dataset_scan():
+    with get_tmp_path() as path:
+        write(path, CONTENT)
+        dataset = get_dataset(path)
+        assert dataset_scanner.start_shared_dataset_scan(dataset)
+        scanner = dataset_scanner.get_dataset_scanner(dataset)
+        with dataset_scanner.shared_dataset_scan(dataset):
+            assert dataset_scanner.get_dataset_scanner(dataset) is scanner
+        assert not dataset_scanner.start_shared_dataset_scan(dataset)
+        assert next(scanner.blocks()) is not None
+        fh = scanner._recorder.fh
+        dataset_scanner.end_shared_dataset_scan(dataset)
+        assert fh.closed
+        assert dataset_scanner.get_dataset_scanner(dataset) is not scanner
+        # Nothing is shared anymore
+        dataset_scanner.end_shared_dataset_scan(dataset)
+
+
+def test_text_set_meta_and_peek_read_once(opened):
+    with get_tmp_path() as path:
+        write(path, CONTENT)
+        dataset = get_dataset(path)
+        with dataset_scanner.shared_dataset_scan(dataset):
+            Text().set_meta(dataset)
+            assert dataset.metadata.data_lines == 3
+            assert get_dataset_peek(dataset) == '#comment\n1\t2\n\n  # indented\n3\t4\n'
+        assert opened == [path]
+
+
+def test_tabular_set_meta_and_peek_read_once(opened):
+    with get_tmp_path() as path:
+        write(path, CONTENT)
+        dataset = get_dataset(path)
+        with dataset_scanner.shared_dataset_scan(dataset):
+            Tabular().set_meta(dataset, max_data_lines=1)
+            assert dataset.metadata.data_lines is None
+            assert get_dataset_peek(dataset, line_wrap=False) == '#comment\n1\t2\n\n  # indented\n3\t4\n'
+            assert Tabular().count_data_lines(dataset) == 3
+        assert opened == [path]
+
+
+def test_sequence_set_meta(opened):
+    with get_tmp_path() as path:
+        write(path, b'>seq1\nACGT\n# comment\n\n >seq2\nAC\n')
+        dataset = get_dataset(path)
+        with dataset_scanner.shared_dataset_scan(dataset):
+            Fasta().set_meta(dataset)
+            Fasta().set_peek(dataset)
+        assert dataset.metadata.data_lines == 5
+        assert dataset.metadata.sequences == 2
+        assert opened == [path]
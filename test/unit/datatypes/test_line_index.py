@@ -0,0 +1,184 @@
+import gzip
+import json
+import os
+from functools import partial
+
+import pysam
+import pytest
+
+from galaxy.datatypes import tabular
+from galaxy.datatypes.util import dataset_scanner
+from galaxy.datatypes.util.line_index import (
+    bgzf_blocks,
+    build_line_index,
+    find_line,
+    indexed_blocks,
+    LineIndex,
+    LineIndexBuilder,
+    read_chunk,
+)
+from galaxy.exceptions import RequestParameterInvalidException
+from galaxy.util import compression_utils
+from galaxy.util.bunch import Bunch
+from .util import get_tmp_path
+
+LINES = [('%d\t%s' % (i, 'x' * (i % 17))).encode() for i in range(20000)]
+CONTENT = b'\n'.join(LINES) + b'\n'
+
+
+def line_offset(line):
+    return sum(len(previous) + 1 for previous in LINES[:line])
+
+
+@pytest.fixture
+def plain_path():
+    with get_tmp_path() as path:
+        with open(path, 'wb') as fh:
+            fh.write(CONTENT)
+        yield path
+
+
+@pytest.fixture
+def bgzf_path(plain_path):
+    with get_tmp_path(suffix='.gz') as path:
+        pysam.tabix_compress(plain_path, path, force=True)
+        yield path
+
+
+@pytest.fixture
+def index_path():
+    with get_tmp_path(suffix='.lidx') as path:
+        yield path
+
+
+def test_line_index(plain_path, index_path):
+    builder = build_line_index(plain_path, spacing=1000)
+    assert builder.lines == len(LINES)
+    assert len(builder.entries) > 100
+    for line, offset in builder.entries:
+        assert offset == line_offset(line)
+    builder.write(index_path, indexed_blocks(plain_path))
+    with LineIndex(index_path) as line_index:
+        assert line_index.lines == len(LINES)
+        assert line_index.block(1000) is None
+        for line in (0, 1, 999, 5000, 19999):
+            assert line_index.line_entry(line)[0] <= line
+            assert find_line(plain_path, line, line_index) == find_line(plain_path, line) == line_offset(line)
+        assert find_line(plain_path, 30000, line_index) == len(CONTENT)
+
+
+def test_not_a_line_index(plain_path):
+    with pytest.raises(ValueError):
+        LineIndex(plain_path)
+
+
+def test_bgzf_blocks(plain_path, bgzf_path, index_path):
+    blocks = bgzf_blocks(bgzf_path)
+    assert len(blocks) > 1
+    assert indexed_blocks(bgzf_path) == blocks
+    assert bgzf_blocks(plain_path) is None
+    with get_tmp_path(suffix='.gz') as gzip_path:
+        with gzip.open(gzip_path, 'wb') as fh:
+            fh.write(CONTENT)
+        assert indexed_blocks(gzip_path) is None
+
+    build_line_index(bgzf_path, spacing=1000).write(index_path, blocks)
+    with LineIndex(index_path) as line_index:
+        assert line_index.block(0) == blocks[0]
+        assert line_index.block(blocks[-1][0] + 1) == blocks[-1]
+        for line in (0, 999, 12345, 19999):
+            offset = find_line(bgzf_path, line, line_index)
+            assert offset == line_offset(line)
+            chunk, next_offset = read_chunk(bgzf_path, offset, 100, line_index)
+            assert (chunk, next_offset) == read_chunk(plain_path, offset, 100)
+            assert chunk.startswith(LINES[line]) and chunk.endswith(b'\n')
+            assert next_offset == offset + len(chunk)
+
+
+def test_scanner_line_index(plain_path):
+    scanner = dataset_scanner.DatasetScanner(plain_path, block_size=1000)
+    assert scanner.finish().line_index is None
+    scanner = dataset_scanner.DatasetScanner(plain_path, block_size=1000)
+    assert scanner.index_lines()
+    assert scanner.line_index is None
+    assert scanner.finish().line_index.entries == build_line_index(plain_path).entries
+    # Too late to index the lines of a pass already started
+    scanner = dataset_scanner.DatasetScanner(plain_path, block_size=1000)
+    next(scanner.blocks())
+    assert not scanner.index_lines()
+    assert scanner.finish().line_index is None
+
+
+def _tabular_dataset(path, index_path):
+    index_file = Bunch(file_name=index_path)
+    spec = {'line_index': Bunch(param=Bunch(new_file=lambda dataset: index_file))}
+    return Bunch(id=1, file_name=path, metadata=Bunch(spec=spec, line_index=None), has_data=lambda: True)
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_tabular_get_chunk(monkeypatch, plain_path, bgzf_path, index_path, compress):
+    monkeypatch.setattr(tabular, 'MIN_INDEXED_SIZE', 1000)
+    monkeypatch.setattr(dataset_scanner, 'LineIndexBuilder', partial(LineIndexBuilder, spacing=1000))
+    dataset = _tabular_dataset(bgzf_path if compress else plain_path, index_path)
+    datatype = tabular.Tabular()
+    datatype.set_meta(dataset, max_data_lines=None, index_lines=True)
+    assert dataset.metadata.line_index.file_name == index_path
+    assert dataset.metadata.columns == 2
+
+    chunk = json.loads(datatype.get_chunk(None, dataset, ck_size=10, line=12345))
+    assert chunk['ck_data'] == LINES[12345].decode() + '\n'
+    chunk = json.loads(datatype.display_data(None, dataset, offset=chunk['offset'], ck_size=10))
+    assert chunk['ck_data'] == LINES[12346].decode() + '\n'
+    assert chunk['offset'] == line_offset(12347)
+
+
+def test_tabular_line_index_of_large_dataset(monkeypatch, index_path):
+    monkeypatch.setattr(tabular, 'MIN_INDEXED_SIZE', 1000)
+    opened = []
+    original_get_fileobj_raw = compression_utils.get_fileobj_raw
+
+    def get_fileobj_raw(file_name, *args, **kwds):
+        opened.append(file_name)
+        return original_get_fileobj_raw(file_name, *args, **kwds)
+
+    monkeypatch.setattr(dataset_scanner.compression_utils, 'get_fileobj_raw', get_fileobj_raw)
+    lines = [('%d\ty' % i).encode() for i in range(150000)]
+    datatype = tabular.Tabular()
+    with get_tmp_path() as path:
+        with open(path, 'wb') as fh:
+            fh.write(b'\n'.join(lines) + b'\n')
+        # Not indexed unless requested
+        dataset = _tabular_dataset(path, index_path)
+        datatype.set_meta(dataset)
+        assert dataset.metadata.line_index is None
+        assert not os.path.exists(index_path)
+        # Setting metadata stops at max_data_lines, the same pass continues to index all lines
+        del opened[:]
+        datatype.set_meta(dataset, index_lines=True)
+        assert opened == [path]
+        assert dataset.metadata.data_lines is None
+        with LineIndex(dataset.metadata.line_index.file_name) as line_index:
+            assert line_index.lines == len(lines)
+            offset = find_line(path, 123456, line_index)
+            assert read_chunk(path, offset, 1, line_index)[0] == lines[123456] + b'\n'
+
+
+def test_tabular_display_data_line(index_path):
+    datatype = tabular.Tabular()
+    with get_tmp_path() as path:
+        with open(path, 'wb') as fh:
+            fh.write(b'a\t1\rb\t2\r\nc\t3\n')
+        dataset = _tabular_dataset(path, index_path)
+        for line in ('x', '-1'):
+            with pytest.raises(RequestParameterInvalidException):
+                datatype.display_data(None, dataset, line=line)
+        assert json.loads(datatype.display_data(None, dataset, line='0', ck_size=1))['ck_data'] == 'a\t1\nb\t2\n'
+
+
+def test_display_data_line_unsupported(index_path):
+    datatype = tabular.ConnectivityTable()
+    with get_tmp_path() as path:
+        with open(path, 'wb') as fh:
+            fh.write(b'1\tenergy = -1.0\n1\tA\t0\t2\t0\t1\n')
+        with pytest.raises(RequestParameterInvalidException):
+            datatype.display_data(None, _tabular_dataset(path, index_path), line='0')
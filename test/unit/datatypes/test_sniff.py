@@ -2,11 +2,16 @@ import tempfile
 
 import pytest
 
+from galaxy.datatypes import sniff
 from galaxy.datatypes.sniff import (
     convert_newlines,
     convert_newlines_sep2tabs,
+    FilePrefix,
+    get_headers,
     get_test_fname,
+    run_sniffers_raw,
 )
+from galaxy.datatypes.tabular import TSV
 
 
 def assert_converts_to_1234_convert_sep2tabs(content, expected='1\t2\n3\t4\n'):
@@ -76,3 +81,62 @@ def test_convert_sep2tabs(source, expected):
         assert_converts_to_1234_convert_sep2tabs(source, expected=expected)
     else:
         assert_converts_to_1234_convert_sep2tabs(source)
+
+
+@pytest.mark.parametrize('content,truncated,expected', [
+    ("a\tb\nc\td\n", False, ["a\tb\n", "c\td\n"]),
+    ("a\tb\nc\td", False, ["a\tb\n", "c\td"]),
+    ("a\tb\nc\td", True, ["a\tb\n"]),
+    ("a\tb\r\nc\td\r", True, ["a\tb\r\n", "c\td\r"]),
+])
+def test_file_prefix_lines(content, truncated, expected):
+    with tempfile.NamedTemporaryFile(mode='w') as tf:
+        tf.write(content)
+        tf.flush()
+        file_prefix = FilePrefix(tf.name)
+        file_prefix.truncated = truncated
+        assert list(file_prefix.line_iterator()) == expected
+        rows = [row for _, row in file_prefix.split_lines('\t')]
+        assert rows == [line.rstrip('\r\n').split('\t') for line in expected]
+        # get_headers must hand out copies of the shared rows
+        get_headers(file_prefix, '\t')[0].append('x')
+        assert get_headers(file_prefix, '\t', count=1) == [['a', 'b']]
+
+
+class CountingSniffer(object):
+    file_ext = 'counted'
+    is_binary = True
+
+    def __init__(self, sniff_magic=None, sniff_tar=False):
+        self.sniff_magic = sniff_magic
+        self.sniff_tar = sniff_tar
+        self.calls = 0
+
+    def sniff(self, filename):
+        self.calls += 1
+        return True
+
+
+def test_sniffers_skipped_by_signature():
+    mismatch = [CountingSniffer(sniff_magic=b'\x1f\x8b'), CountingSniffer(sniff_tar=True)]
+    match = CountingSniffer(sniff_magic=(b'\x1f\x8b', b'chr'))
+    assert run_sniffers_raw(get_test_fname('1.bed'), mismatch + [match]) == 'counted'
+    assert [sniffer.calls for sniffer in mismatch] == [0, 0]
+    assert match.calls == 1
+    tar = CountingSniffer(sniff_tar=True)
+    assert run_sniffers_raw(get_test_fname('brukerbaf.d.tar'), [tar]) == 'counted'
+
+
+def test_strict_width_csv_checks_whole_file(monkeypatch):
+    monkeypatch.setattr(sniff, 'SNIFF_PREFIX_BYTES', 64)
+    with tempfile.NamedTemporaryFile(mode='w') as tf:
+        tf.write('"a"\t"b"\n' + '"1"\t"2"\n' * 20 + '"1"\t"2"\t"3"\n')
+        tf.flush()
+        file_prefix = FilePrefix(tf.name)
+        assert file_prefix.truncated
+        # The row of a different width is past the prefix
+        assert TSV().sniff_prefix(file_prefix) is False
+    with tempfile.NamedTemporaryFile(mode='w') as tf:
+        tf.write('"a"\t"b"\n' + '"1"\t"2"\n' * 21)
+        tf.flush()
+        assert TSV().sniff_prefix(FilePrefix(tf.name)) is True
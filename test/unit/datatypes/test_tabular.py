@@ -0,0 +1,64 @@
+from io import BytesIO
+
+import pytest
+
+from galaxy.datatypes.tabular import Tabular
+from galaxy.datatypes.util.line_reader import iter_line_blocks
+from galaxy.util.bunch import Bunch
+from .util import get_tmp_path
+
+
+def set_meta(content, **kwd):
+    with get_tmp_path(suffix='.tabular') as path:
+        with open(path, 'wb') as fh:
+            fh.write(content)
+        dataset = Bunch(file_name=path, metadata=Bunch(), has_data=lambda: True)
+        Tabular().set_meta(dataset, **kwd)
+        return dataset.metadata
+
+
+@pytest.mark.parametrize('block_size', [1, 3, 1024])
+def test_iter_line_blocks(block_size):
+    content = b'a\tb\r\n\r\n#c\rd\xc3\xa9\n'
+    lines = '\n'.join(iter_line_blocks(BytesIO(content), block_size=block_size)).split('\n')
+    assert lines == ['a\tb', '', '#c', u'd\xe9']
+
+
+def test_iter_line_blocks_decode_error():
+    blocks = iter_line_blocks(BytesIO(b'a\nb\n\xff\n'), block_size=2)
+    assert next(blocks) == 'a'
+    assert next(blocks) == 'b'
+    with pytest.raises(UnicodeDecodeError):
+        next(blocks)
+
+
+def test_set_meta_column_types():
+    metadata = set_meta(b'#header\n1\t1.5\tx\t1,2\t\n2\tnan\t3\t3,4\t\n\n-3\t.5\t \t5\t\n')
+    assert metadata.column_types == ['int', 'float', 'str', 'list', 'str']
+    assert metadata.data_lines == 3
+    assert metadata.comment_lines == 2
+
+
+def test_set_meta_first_line_header():
+    metadata = set_meta(b'a\tb\tc\n1\t2\n3\t4\n')
+    assert metadata.column_types == ['int', 'int', 'str']
+
+
+def test_set_meta_max_guess_type_data_lines():
+    content = b''.join(b'%d\t%d\n' % (i, i) for i in range(1000)) + b'#end\nx\t1.5\n'
+    metadata = set_meta(content, max_guess_type_data_lines=100, max_data_lines=None)
+    assert metadata.column_types == ['int', 'int']
+    assert metadata.data_lines == 1001
+    assert metadata.comment_lines == 1
+    metadata = set_meta(content, max_data_lines=None)
+    assert metadata.column_types == ['str', 'float']
+
+
+def test_set_meta_max_data_lines():
+    content = b''.join(b'%d\n' % i for i in range(10))
+    metadata = set_meta(content, max_data_lines=5)
+    assert metadata.data_lines is None
+    assert metadata.comment_lines is None
+    metadata = set_meta(content, max_data_lines=10)
+    assert metadata.data_lines == 10
+    assert metadata.comment_lines == 0
@@ -0,0 +1,103 @@
+from sqlalchemy import event
+
+from galaxy import model
+from galaxy.jobs.handler import (
+    JobHandlerQueue,
+    JobInputDependencyIndex,
+)
+from ..unittest_utils.galaxy_mock import MockApp
+
+
+def test_job_waits_until_all_inputs_change():
+    index = JobInputDependencyIndex()
+    index.add(1, 10)
+    index.add(1, 11)
+    index.add(2, 11)
+    assert index.is_waiting(1)
+    assert index.is_waiting(2)
+    assert sorted(index.dataset_ids) == [10, 11]
+
+    assert index.datasets_changed([11]) == [2]
+    assert index.is_waiting(1)
+    assert not index.is_waiting(2)
+    assert index.dataset_ids == [10]
+
+    assert index.datasets_changed([10]) == [1]
+    assert not index.is_waiting(1)
+    assert index.dataset_ids == []
+
+
+def test_retain_jobs_forgets_untracked_jobs():
+    index = JobInputDependencyIndex()
+    index.add(1, 10)
+    index.add(2, 10)
+    index.add(3, 12)
+    index.retain_jobs([2])
+    assert not index.is_waiting(1)
+    assert index.is_waiting(2)
+    assert not index.is_waiting(3)
+    assert index.dataset_ids == [10]
+    assert index.datasets_changed([10, 12]) == [2]
+
+
+def test_clear():
+    index = JobInputDependencyIndex()
+    index.add(1, 10)
+    index.clear()
+    assert not index.is_waiting(1)
+    assert index.dataset_ids == []
+
+
+def test_handler_checks_waiting_job_again_once_input_changes():
+    app = MockApp(
+        track_jobs_in_database=True,
+        job_handler_dependency_tracking=True,
+        job_handler_dependency_sweep_interval=3600,
+        job_count_cache_reconcile_interval=0,
+        cache_user_job_count=False,
+        user_activation_on=False,
+        server_name='handler0',
+        monitor_thread_join_timeout=0,
+    )
+    app.job_config.handler_assignment_methods = []
+    sa_session = app.model.context
+    history = model.History()
+    hda = model.HistoryDatasetAssociation(history=history, create_dataset=True, sa_session=sa_session)
+    hda.dataset.state = model.Dataset.states.QUEUED
+    job = model.Job()
+    job.state = model.Job.states.NEW
+    job.handler = 'handler0'
+    job.add_input_dataset('input1', hda)
+    sa_session.add_all([history, hda, job])
+    sa_session.flush()
+    job_id, dataset_id = job.id, hda.dataset.id
+    queue = JobHandlerQueue(app, None)
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    def new_jobs():
+        del statements[:]
+        sa_session.expunge_all()
+        return [new_job.id for new_job in queue._JobHandlerQueue__get_new_jobs_by_dependencies()]
+
+    def input_queries():
+        return [statement for statement in statements if 'job_to_input_dataset' in statement]
+
+    event.listen(app.model.engine, 'before_cursor_execute', count_statement)
+    try:
+        assert new_jobs() == []
+        assert queue.dependency_index.is_waiting(job_id)
+        assert input_queries()
+        # The inputs of a job known to be waiting are not queried again while they are unchanged
+        assert new_jobs() == []
+        assert not input_queries()
+
+        sa_session.query(model.Dataset).get(dataset_id).state = model.Dataset.states.OK
+        sa_session.flush()
+        assert new_jobs() == [job_id]
+        assert not queue.dependency_index.is_waiting(job_id)
+    finally:
+        event.remove(app.model.engine, 'before_cursor_execute', count_statement)
@@ -0,0 +1,128 @@
+"""
+Simulate many users and destinations to measure how many job count queries
+the handler queue runs per iteration when concurrency limits are configured.
+"""
+from galaxy.jobs.handler import JobHandlerQueue
+from galaxy.util.bunch import Bunch
+
+USER_COUNT = 5000
+DESTINATION_COUNT = 50
+STEPS = 10
+
+
+def test_job_counts_requeried_every_step_without_reconcile_interval():
+    queue, session = _queue(cache_user_job_count=True, job_count_cache_reconcile_interval=0)
+    for _ in range(STEPS):
+        _step(queue)
+    # One query per cached count and iteration
+    assert session.execute_count == 3 * STEPS
+
+
+def test_job_counts_reconciled_on_interval():
+    queue, session = _queue(cache_user_job_count=False, job_count_cache_reconcile_interval=3600)
+    for _ in range(STEPS):
+        _step(queue)
+    # Counts are loaded once and then kept across iterations
+    assert session.execute_count == 3
+
+
+def test_job_counts_updated_incrementally():
+    queue, session = _queue(cache_user_job_count=False, job_count_cache_reconcile_interval=3600)
+    _step(queue)
+    assert queue.get_user_job_count(7) == 2
+    assert queue.get_total_job_count_per_destination()['destination_7'] == 2 * USER_COUNT // DESTINATION_COUNT
+    queue.increase_running_job_count(7, 'destination_7')
+    assert queue.get_user_job_count(7) == 3
+    assert queue.get_user_job_count_per_destination(7)['destination_7'] == 2
+    queue.decrease_running_job_count(7, 'destination_7')
+    queue.decrease_running_job_count(7, 'destination_7')
+    queue.decrease_running_job_count(7, 'destination_7')
+    assert queue.get_user_job_count(7) == 0
+    assert queue.get_user_job_count_per_destination(7)['destination_7'] == 0
+    assert queue.get_total_job_count_per_destination()['destination_7'] == 2 * USER_COUNT // DESTINATION_COUNT - 2
+    _step(queue)
+    assert session.execute_count == 3
+
+
+def test_job_counts_only_decreased_for_counted_jobs():
+    queue, session = _queue(cache_user_job_count=False, job_count_cache_reconcile_interval=3600)
+    _step(queue)
+    # A job failing before it was ever dispatched was never counted
+    queue.decrease_running_job_count(7, 'destination_7', job_id=1, active=False)
+    assert queue.get_user_job_count(7) == 2
+    # A job dispatched by this handler is subtracted once, even if it fails while still new
+    queue.increase_running_job_count(7, 'destination_7', job_id=2)
+    assert queue.get_user_job_count(7) == 3
+    queue.decrease_running_job_count(7, 'destination_7', job_id=2, active=False)
+    queue.decrease_running_job_count(7, 'destination_7', job_id=2, active=False)
+    assert queue.get_user_job_count(7) == 2
+    # A running job loaded with the counts
+    queue.decrease_running_job_count(7, 'destination_7', job_id=3, active=True)
+    assert queue.get_user_job_count(7) == 1
+
+
+def _step(queue):
+    # Mirrors the job count handling of a single iteration of the handler
+    # queue with limits for every kind of count.
+    queue._JobHandlerQueue__clear_job_count()
+    for user_id in range(0, USER_COUNT, 100):
+        queue.get_user_job_count(user_id)
+        queue.get_user_job_count_per_destination(user_id)
+    queue.get_total_job_count_per_destination()
+
+
+def _queue(**config):
+    app = Bunch(
+        config=Bunch(
+            track_jobs_in_database=True,
+            job_handler_dependency_tracking=False,
+            server_name='handler0',
+            monitor_thread_join_timeout=0,
+            **config
+        ),
+        job_config=Bunch(
+            handler_assignment_methods=[],
+            limits=Bunch(
+                registered_user_concurrent_jobs=100,
+                anonymous_user_concurrent_jobs=None,
+                destination_user_concurrent_jobs={},
+                destination_total_concurrent_jobs={'destination_0': 1000},
+            ),
+        ),
+        model=Bunch(context=MockSession()),
+    )
+    return JobHandlerQueue(app, None), app.model.context
+
+
+class MockRow(dict):
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self.values())[key]
+        return dict.__getitem__(self, key)
+
+
+class MockSession(object):
+    """
+    Answers the job count queries with two queued or running jobs per user,
+    split over two destinations.
+    """
+
+    def __init__(self):
+        self.execute_count = 0
+
+    def execute(self, statement):
+        self.execute_count += 1
+        columns = statement.c.keys()
+        rows = []
+        if columns == ['destination_id', 'job_count']:
+            for destination in range(DESTINATION_COUNT):
+                rows.append(MockRow(destination_id='destination_%d' % destination, job_count=2 * USER_COUNT // DESTINATION_COUNT))
+        elif 'destination_id' in columns:
+            for user_id in range(USER_COUNT):
+                for destination in (user_id, user_id + 1):
+                    rows.append(MockRow(user_id=user_id, destination_id='destination_%d' % (destination % DESTINATION_COUNT), job_count=1))
+        else:
+            for user_id in range(USER_COUNT):
+                rows.append(MockRow(user_id=user_id, count=2))
+        return rows
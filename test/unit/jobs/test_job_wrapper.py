@@ -7,6 +7,8 @@ from galaxy.jobs import (
     TaskWrapper
 )
 from galaxy.model import (
+    Dataset,
+    HistoryDatasetAssociation,
     Job,
     Task,
     User
@@ -74,6 +76,16 @@ class JobWrapperTestCase(BaseWrapperTestCase, TestCase):
         with self._prepared_wrapper() as wrapper:
             assert TEST_VERSION_COMMAND in wrapper.write_version_cmd, wrapper.write_version_cmd
 
+    def test_inputs_pinned_until_cleanup(self):
+        dataset = Dataset()
+        self.job.add_input_dataset("input1", HistoryDatasetAssociation(dataset=dataset))
+        object_store = self.app.object_store
+        with self._prepared_wrapper() as wrapper:
+            assert object_store.pins == [(dataset, "job:345")]
+            assert object_store.unpinned_owners == []
+            wrapper.cleanup(delete_files=False)
+            assert object_store.unpinned_owners == ["job:345"]
+
 
 class TaskWrapperTestCase(BaseWrapperTestCase, TestCase):
 
@@ -186,6 +198,8 @@ class MockObjectStore(object):
 
     def __init__(self, working_directory):
         self.working_directory = working_directory
+        self.pins = []
+        self.unpinned_owners = []
         os.makedirs(working_directory)
 
     def create(self, *args, **kwds):
@@ -194,6 +208,12 @@ class MockObjectStore(object):
     def exists(self, *args, **kwargs):
         return True
 
+    def pin(self, obj, owner, **kwargs):
+        self.pins.append((obj, owner))
+
+    def unpin_owner(self, owner):
+        self.unpinned_owners.append(owner)
+
     def get_filename(self, *args, **kwds):
         if kwds.get("base_dir", "") == "job_work":
             return self.working_directory
@@ -0,0 +1,126 @@
+from six.moves.queue import Queue
+
+from galaxy.jobs.runners.cli import (
+    ShellJobRunner,
+    SUBMIT_RESULT_MARKER,
+)
+from galaxy.util.bunch import Bunch
+
+
+def test_queue_jobs_submits_batch_with_single_command():
+    runner = MockShellJobRunner(["Submitted batch job 101", "%s 0" % SUBMIT_RESULT_MARKER,
+                                 "Submitted batch job 102", "%s 0" % SUBMIT_RESULT_MARKER])
+    runner.queue_jobs(_job_wrappers("1", "2"))
+    assert len(runner.shell.commands) == 1
+    assert runner.shell.commands[0].count("sbatch") == 2
+    assert runner.individually_submitted == []
+    assert runner.failed == []
+    assert runner.handled == [("1", 0, "Submitted batch job 101"), ("2", 0, "Submitted batch job 102")]
+
+
+def test_queue_jobs_resubmits_failed_jobs_individually():
+    runner = MockShellJobRunner(["Submitted batch job 101", "%s 0" % SUBMIT_RESULT_MARKER,
+                                 "sbatch: error", "%s 1" % SUBMIT_RESULT_MARKER])
+    runner.queue_jobs(_job_wrappers("1", "2", "3"))
+    assert runner.individually_submitted == ["2"]
+    assert [h[0] for h in runner.handled] == ["1", "2"]
+    assert runner.handled[1] == ("2", 0, "Submitted batch job individual-2")
+    # The batch did not report whether job 3 was submitted, it must not be submitted again
+    assert runner.failed == ["3"]
+
+
+def test_queue_jobs_fails_only_jobs_that_cannot_be_prepared():
+    runner = MockShellJobRunner(["Submitted batch job 101", "%s 0" % SUBMIT_RESULT_MARKER])
+    runner.broken = ["1"]
+    runner.queue_jobs(_job_wrappers("1", "2"))
+    assert [h[0] for h in runner.handled] == ["2"]
+    assert _failed_by_worker(runner) == ["1"]
+
+
+def test_queue_jobs_fails_unconfirmed_jobs_if_batch_raises():
+    runner = MockShellJobRunner([], error=IOError("Connection reset by peer"))
+    runner.queue_jobs(_job_wrappers("1", "2"))
+    assert runner.handled == []
+    assert runner.failed == ["1", "2"]
+
+
+def test_queue_jobs_fails_only_jobs_whose_submission_cannot_be_handled():
+    runner = MockShellJobRunner(["Submitted batch job 101", "%s 0" % SUBMIT_RESULT_MARKER,
+                                 "Submitted batch job 102", "%s 0" % SUBMIT_RESULT_MARKER])
+    runner.unhandled = ["1"]
+    runner.queue_jobs(_job_wrappers("1", "2"))
+    assert [h[0] for h in runner.handled] == ["2"]
+    assert _failed_by_worker(runner) == ["1"]
+
+
+def _job_wrappers(*job_ids):
+    return [MockJobWrapper(job_id) for job_id in job_ids]
+
+
+def _failed_by_worker(runner):
+    failed = []
+    while not runner.work_queue.empty():
+        method, job_state = runner.work_queue.get_nowait()
+        assert method == runner.fail_job
+        failed.append(job_state.job_wrapper.get_id_tag())
+    return failed
+
+
+class MockShellJobRunner(ShellJobRunner):
+
+    def __init__(self, stdout_lines, error=None):
+        self.shell = MockShell(stdout_lines, error=error)
+        self.job_interface = MockJobInterface()
+        self.work_queue = Queue()
+        self.broken = []
+        self.unhandled = []
+        self.individually_submitted = []
+        self.handled = []
+        self.failed = []
+
+    def _prepare_submission(self, job_wrapper):
+        job_id = job_wrapper.get_id_tag()
+        if job_id in self.broken:
+            raise IOError("Unable to write job script")
+        job_wrapper.fail = lambda message: self.failed.append(job_id)
+        ajs = Bunch(job_file="%s.sh" % job_id, job_wrapper=job_wrapper)
+        return ajs, self.shell, self.job_interface
+
+    def submit(self, shell, job_interface, job_file, galaxy_id_tag, **kwds):
+        self.individually_submitted.append(galaxy_id_tag)
+        return 0, "Submitted batch job individual-%s" % galaxy_id_tag
+
+    def _handle_submission(self, ajs, returncode, stdout):
+        if ajs.job_wrapper.get_id_tag() in self.unhandled:
+            raise IOError("Database is locked")
+        self.handled.append((ajs.job_wrapper.get_id_tag(), returncode, stdout))
+
+
+class MockJobWrapper(object):
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.app = Bunch(config=Bunch(redact_email_in_job_name=True))
+
+    def get_id_tag(self):
+        return self.job_id
+
+
+class MockShell(object):
+
+    def __init__(self, stdout_lines, error=None):
+        self.stdout = "\n".join(stdout_lines)
+        self.error = error
+        self.commands = []
+
+    def execute(self, cmd, timeout=60):
+        self.commands.append(cmd)
+        if self.error:
+            raise self.error
+        return Bunch(returncode=0, stdout=self.stdout, stderr="")
+
+
+class MockJobInterface(object):
+
+    def submit(self, script_file):
+        return "sbatch %s" % script_file
@@ -0,0 +1,126 @@
+from six.moves.queue import Queue
+
+from galaxy.jobs.handler import (
+    DefaultJobDispatcher,
+    JobHandlerQueue
+)
+from galaxy.jobs.runners import (
+    BaseJobRunner,
+    STOP_SIGNAL
+)
+from galaxy.util.bunch import Bunch
+
+
+def test_runner_put_many_fails_only_jobs_that_cannot_be_queued():
+    runner = MockJobRunner()
+    job_wrappers = [MockJobWrapper(1), MockJobWrapper(2, error=IOError("Object store is full")), MockJobWrapper(3)]
+    assert runner.put_many(job_wrappers) == [job_wrappers[0], job_wrappers[2]]
+    assert runner.queued == [job_wrappers[0], job_wrappers[2]]
+    assert [job_wrapper.failed for job_wrapper in job_wrappers] == [None, "Object store is full", None]
+
+
+def test_runner_put_many_queues_jobs_one_at_a_time_if_flush_fails():
+    runner = MockJobRunner(flush_error=IOError("Database is locked"))
+    job_wrappers = [MockJobWrapper(1), MockJobWrapper(2, individual_error=IOError("Database is locked")), MockJobWrapper(3)]
+    assert runner.put_many(job_wrappers) == [job_wrappers[0], job_wrappers[2]]
+    assert runner.rollbacks == 2
+    assert runner.queued == [job_wrappers[0], job_wrappers[2]]
+    assert [job_wrapper.failed for job_wrapper in job_wrappers] == [None, "Database is locked", None]
+
+
+def test_failed_batch_fails_only_jobs_not_submitted():
+    runner = MockJobRunner()
+    job_wrappers = [MockJobWrapper(1, external_id="101"), MockJobWrapper(2)]
+
+    def queue_jobs(job_wrappers):
+        raise Exception("Connection to the cluster lost")
+
+    runner.work_queue.put((queue_jobs, job_wrappers))
+    runner.work_queue.put((STOP_SIGNAL, None))
+    runner.run_next()
+    method, job_state = runner.work_queue.get_nowait()
+    assert method == runner.fail_job
+    assert job_state.job_wrapper is job_wrappers[1]
+    assert runner.work_queue.empty()
+
+
+def test_handler_keeps_jobs_not_dispatched_waiting():
+    queue = JobHandlerQueue.__new__(JobHandlerQueue)
+    queue.job_wrappers = {}
+    job_wrappers = [MockJobWrapper(1, state="queued"), MockJobWrapper(2), MockJobWrapper(3, state="error")]
+    new_waiting_jobs = []
+    queue._JobHandlerQueue__keep_undispatched_jobs(job_wrappers, job_wrappers[:1], new_waiting_jobs)
+    assert new_waiting_jobs == [2]
+    assert queue.job_wrappers == {2: job_wrappers[1]}
+
+
+def test_dispatcher_put_many_returns_dispatched_jobs():
+    dispatcher = DefaultJobDispatcher.__new__(DefaultJobDispatcher)
+    dispatcher.job_runners = {'local': MockJobRunner(), 'broken': BrokenJobRunner()}
+    job_wrappers = [MockJobWrapper(1), MockJobWrapper(2, runner='broken'), MockJobWrapper(3, runner='missing'),
+                    MockJobWrapper(4, error=IOError("Object store is full")), MockJobWrapper(5)]
+    assert dispatcher.put_many(job_wrappers) == [job_wrappers[0], job_wrappers[4]]
+    assert job_wrappers[1].failed is None
+    assert job_wrappers[2].failed
+    assert job_wrappers[3].failed == "Object store is full"
+
+
+class MockJobRunner(BaseJobRunner):
+
+    def __init__(self, flush_error=None):
+        self.sa_session = Bunch(flush=self._flush, rollback=self._rollback)
+        self.app = Bunch(execution_timer_factory=Bunch(get_timer=lambda *args: Bunch(to_str=lambda **kwds: "")))
+        self.work_queue = Queue()
+        self.flush_error = flush_error
+        self.rollbacks = 0
+        self.queued = []
+
+    def _flush(self):
+        if self.flush_error:
+            raise self.flush_error
+
+    def _rollback(self):
+        self.rollbacks += 1
+
+    def mark_as_queued(self, job_wrapper):
+        self.queued.append(job_wrapper)
+
+
+class BrokenJobRunner(MockJobRunner):
+
+    def put_many(self, job_wrappers):
+        raise Exception("Runner unavailable")
+
+
+class MockJobWrapper(object):
+
+    def __init__(self, job_id, runner='local', error=None, individual_error=None, external_id=None, state="new"):
+        self.job_id = job_id
+        self.job_destination = Bunch(runner=runner)
+        self.error = error
+        self.individual_error = individual_error
+        self.external_id = external_id
+        self.state = state
+        self.failed = None
+        self.app = Bunch(config=Bunch(redact_email_in_job_name=True))
+
+    def can_split(self):
+        return False
+
+    def get_id_tag(self):
+        return str(self.job_id)
+
+    def enqueue(self, flush=True):
+        if self.error:
+            raise self.error
+        if flush and self.individual_error:
+            raise self.individual_error
+
+    def get_job(self):
+        return Bunch(job_runner_external_id=self.external_id)
+
+    def get_state(self):
+        return self.state
+
+    def fail(self, message, exception=False):
+        self.failed = message
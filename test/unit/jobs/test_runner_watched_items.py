@@ -0,0 +1,56 @@
+import time
+
+from galaxy.jobs.runners import AsynchronousJobRunner, drmaa
+from galaxy.util.bunch import Bunch
+
+
+def test_all_watched_items_due_without_max_poll_interval():
+    runner = MockAsynchronousJobRunner(0, [_job_state(), _job_state()])
+    due, not_due = runner.get_due_watched_items()
+    assert len(due) == 2
+    assert not_due == []
+
+
+def test_old_watched_items_checked_less_often():
+    now = time.time()
+    new_job = _job_state(watch_start_time=now - 1, last_check_time=now - 1)
+    old_job = _job_state(watch_start_time=now - 3600, last_check_time=now - 30)
+    stale_job = _job_state(watch_start_time=now - 3600, last_check_time=now - 61)
+    runner = MockAsynchronousJobRunner(60, [new_job, old_job, stale_job])
+    due, not_due = runner.get_due_watched_items()
+    assert due == [new_job, stale_job]
+    assert not_due == [old_job]
+    assert stale_job.last_check_time >= now
+
+
+def test_drmaa_bulk_state_resets_exception_retries(monkeypatch):
+    monkeypatch.setattr(drmaa, 'drmaa', Bunch(JobState=Bunch(RUNNING='running', FAILED='failed', DONE='done')))
+    ajs = Bunch(job_id='42', job_wrapper=Bunch(get_id_tag=lambda: '1'), old_state='queued_active', running=False,
+                check_limits=lambda: False, internalexception_retries=2, invalidjobexception_retries=1)
+    runner = MockDRMAAJobRunner(ajs)
+    runner.check_watched_items()
+    assert runner.watched == [ajs]
+    assert ajs.internalexception_retries == ajs.invalidjobexception_retries == 0
+
+
+def _job_state(watch_start_time=None, last_check_time=None):
+    return Bunch(watch_start_time=watch_start_time, last_check_time=last_check_time)
+
+
+class MockAsynchronousJobRunner(AsynchronousJobRunner):
+
+    def __init__(self, max_poll_interval, watched):
+        self.runner_params = Bunch(watched_item_max_poll_interval=max_poll_interval)
+        self.watched = watched
+
+
+class MockDRMAAJobRunner(drmaa.DRMAAJobRunner):
+
+    drmaa_job_state_strings = {'queued_active': 'job is queued and active'}
+
+    def __init__(self, ajs):
+        self.runner_params = Bunch(watched_item_max_poll_interval=0)
+        self.watched = [ajs]
+
+    def get_watched_item_states(self, job_states):
+        return {'42': 'queued_active'}
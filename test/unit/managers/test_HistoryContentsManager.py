@@ -2,14 +2,19 @@
 """
 """
 import datetime
+import json
 import random
 import unittest
 
-from sqlalchemy import column, desc, false, true
+import mock
+from sqlalchemy import column, desc, event, false, true
 from sqlalchemy.sql import text
 
+from galaxy import exceptions, model
 from galaxy.managers import base, collections, hdas, history_contents
 from galaxy.managers.histories import HistoryManager
+from galaxy.util.bunch import Bunch
+from galaxy.webapps.galaxy.api.history_contents import HistoryContentsController
 from .base import BaseTestCase
 from .base import CreatesCollectionsMixin
 
@@ -297,6 +302,80 @@ class HistoryAsContainerTestCase(HistoryAsContainerBaseTestCase):
         self.assertEqual(self.contents_manager.contents(history, filters=filters), [contents[1], contents[6]])
 
 
+class HistoryContentsChangesTestCase(HistoryAsContainerBaseTestCase):
+
+    def set_up_trans(self):
+        super(HistoryContentsChangesTestCase, self).set_up_trans()
+        self.history = self.history_manager.create(name='history', user=self.admin_user)
+        self.hdas = [self.add_hda_to_history(self.history, name=('hda-' + str(x))) for x in range(3)]
+        self.hdca = self.add_list_collection_to_history(self.history, self.hdas)
+        # pretend all contents were last updated an hour ago
+        self.an_hour_ago = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+        for item in self.hdas + [self.hdca, self.hdca.collection]:
+            item.update_time = self.an_hour_ago
+        self.app.model.context.flush()
+
+    def test_changes_token(self):
+        self.assertEqual(self.contents_manager.changes_token(self.history), self.an_hour_ago)
+        empty_history = self.history_manager.create(name='empty', user=self.admin_user)
+        self.assertIsNone(self.contents_manager.changes_token(empty_history))
+        self.hdas[1].name = 'renamed'
+        self.app.model.context.flush()
+        self.assertEqual(self.contents_manager.changes_token(self.history), self.hdas[1].update_time)
+
+    def test_next_since(self):
+        self.log("should look for changes committed shortly before the poll again")
+        before = datetime.datetime.utcnow()
+        next_since = self.contents_manager.next_since()
+        self.assertGreaterEqual(next_since, before - history_contents.CHANGES_OVERLAP)
+        self.assertLess(next_since, before)
+
+    def test_changed_since(self):
+        since = self.an_hour_ago
+        self.assertEqual(self.contents_manager.changed_since(self.history, since), self.hdas + [self.hdca])
+        since = self.an_hour_ago + datetime.timedelta(seconds=1)
+        self.assertEqual(self.contents_manager.changed_since(self.history, since), [])
+
+        since = datetime.datetime.utcnow()
+        self.assertEqual(self.contents_manager.changed_since(self.history, since), [])
+        self.hdas[1].name = 'renamed'
+        self.app.model.context.flush()
+        self.assertEqual(self.contents_manager.changed_since(self.history, since), [self.hdas[1]])
+
+        self.log("should return collections with a changed populated state")
+        self.hdca.collection.populated_state = 'failed'
+        self.app.model.context.flush()
+        self.assertEqual(self.contents_manager.changed_since(self.history, since), [self.hdas[1], self.hdca])
+
+        self.log("should apply filters to the changed contents")
+        filters = [parsed_filter("orm", column('history_content_type') == 'dataset')]
+        self.assertEqual(self.contents_manager.changed_since(self.history, since, filters=filters), [self.hdas[1]])
+
+    def test_cached_counts(self):
+        changes_token = self.contents_manager.changes_token(self.history)
+        state_counts, active_counts = self.contents_manager.cached_counts(self.history, changes_token)
+        self.assertEqual(active_counts, dict(active=4, deleted=0, hidden=0))
+        self.assertEqual(sum(state_counts.values()), 4)
+
+        statements = []
+
+        def count_statement(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(self.app.model.engine, 'before_cursor_execute', count_statement)
+        try:
+            self.assertEqual(self.contents_manager.cached_counts(self.history, changes_token), (state_counts, active_counts))
+        finally:
+            event.remove(self.app.model.engine, 'before_cursor_execute', count_statement)
+        self.assertEqual(statements, [])
+
+        self.hda_manager.delete(self.hdas[0])
+        self.app.model.context.flush()
+        changes_token = self.contents_manager.changes_token(self.history)
+        _, active_counts = self.contents_manager.cached_counts(self.history, changes_token)
+        self.assertEqual(active_counts, dict(active=3, deleted=1, hidden=0))
+
+
 class HistoryContentsFilterParserTestCase(HistoryAsContainerBaseTestCase):
 
     def set_up_managers(self):
@@ -341,6 +420,141 @@ class HistoryContentsFilterParserTestCase(HistoryAsContainerBaseTestCase):
         self.assertRaises(ValueError, self.filter_parser.parse_date, '2009-02-13 18:13:00.1234567')
 
 
+# =============================================================================
+# web.url_for doesn't work well in the framework
+def testable_url_for(*a, **k):
+    return '(fake url): %s, %s' % (a, k)
+
+
+class HistoryContentsIndexQueryCountTestCase(HistoryAsContainerBaseTestCase):
+    """
+    The number of queries indexing the contents of a history must not depend
+    on the number of contents.
+    """
+
+    def set_up_managers(self):
+        super(HistoryContentsIndexQueryCountTestCase, self).set_up_managers()
+        self.controller = HistoryContentsController(self.app)
+
+    def set_up_trans(self):
+        super(HistoryContentsIndexQueryCountTestCase, self).set_up_trans()
+        self.trans.user_is_admin = False
+        self.history = self.history_manager.create(name='history', user=self.admin_user)
+        self.trans.set_history(self.history)
+
+    def add_contents(self, count):
+        hdas = [self.add_hda_to_history(self.history, name=('hda-' + str(x))) for x in range(count)]
+        for hda in hdas[:2]:
+            self.app.tag_handler.apply_item_tag(self.trans.user, hda, 'name:tagged')
+        self.add_list_collection_to_history(self.history, hdas[:2])
+        self.app.model.context.flush()
+        return hdas
+
+    def index(self, action='index', **kwd):
+        """Return the contents indexed with `kwd` and the number of queries this took."""
+        sa_session = self.app.model.context
+        user_id, history_id = self.trans.user.id, self.history.id
+        # start with an empty session, as a new request would
+        sa_session.expunge_all()
+        self.trans.set_user(sa_session.query(model.User).get(user_id))
+        self.history = sa_session.query(model.History).get(history_id)
+        self.trans.set_history(self.history)
+
+        statements = []
+
+        def count_statement(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(self.app.model.engine, 'before_cursor_execute', count_statement)
+        try:
+            with mock.patch('galaxy.web.url_for', testable_url_for), \
+                    mock.patch.object(base.ModelSerializer, 'url_for', staticmethod(testable_url_for)):
+                contents = getattr(self.controller, action)(self.trans, self.app.security.encode_id(history_id), **kwd)
+        finally:
+            event.remove(self.app.model.engine, 'before_cursor_execute', count_statement)
+        return json.loads(contents), len(statements)
+
+    def assertConstantQueryCount(self, **kwd):
+        self.add_contents(2)
+        contents, query_count = self.index(**kwd)
+        contents_count = len(contents)
+        self.add_contents(20)
+        contents, more_contents_query_count = self.index(**kwd)
+        self.assertEqual(len(contents), contents_count + 21)
+        self.assertEqual(query_count, more_contents_query_count)
+        return contents
+
+    def test_index_v1(self):
+        contents = self.assertConstantQueryCount()
+        self.assertEqual([c['hid'] for c in contents], list(range(1, 25)))
+        self.assertEqual(contents[0]['tags'], ['name:tagged'])
+
+    def test_index_v1_details(self):
+        contents = self.assertConstantQueryCount(details='all')
+        self.assertEqual(len(contents[2]['elements']), 2)
+
+    def test_index_v1_filters(self):
+        hdas = self.add_contents(3)
+        self.hda_manager.delete(hdas[1])
+        self.app.model.context.flush()
+        ids = ','.join(self.app.security.encode_id(hda.id) for hda in hdas[1:])
+        contents, _ = self.index(deleted='false', types='dataset')
+        self.assertEqual([c['hid'] for c in contents], [1, 3])
+        contents, _ = self.index(ids=ids, types='dataset')
+        self.assertEqual([c['hid'] for c in contents], [2, 3])
+        self.assertIn('peek', contents[0])
+
+    def test_index_v2(self):
+        self.assertConstantQueryCount(v='dev')
+
+    def test_index_v2_detailed(self):
+        hdas = self.add_contents(2)
+        job = model.Job()
+        job.add_output_dataset('output', hdas[0])
+        job.state = model.Job.states.RESUBMITTED
+        self.app.model.context.add(model.JobStateHistory(job))
+        self.app.model.context.flush()
+        job_id = job.id
+        self.app.toolbox = Bunch(get_tool=lambda tool_id, tool_version=None: None)
+        contents = self.assertConstantQueryCount(v='dev', view='detailed')
+        self.assertTrue(contents[0]['resubmitted'])
+        self.assertFalse(contents[1]['resubmitted'])
+        self.assertEqual(contents[0]['creating_job'], self.app.security.encode_id(job_id))
+
+    def test_changes(self):
+        hdas = self.add_contents(20)
+        hda_id = hdas[5].id
+        changes, _ = self.index(action='changes')
+        self.assertEqual(changes['contents'], [])
+        self.assertEqual(changes['active_counts']['active'], 21)
+        since = changes['next_since']
+
+        # contents updated within the changes overlap before a poll are returned again
+        changes, _ = self.index(action='changes', since=since)
+        self.assertEqual(len(changes['contents']), 21)
+        self.assertGreater(changes['next_since'], since)
+        since = changes['next_since']
+        # pretend they are older, polls then no longer return them
+        for item in self.history.contents_iter(types=['dataset', 'dataset_collection']):
+            item.update_time -= 2 * history_contents.CHANGES_OVERLAP
+            if item.history_content_type == 'dataset_collection':
+                item.collection.update_time -= 2 * history_contents.CHANGES_OVERLAP
+        self.app.model.context.flush()
+        changes, _ = self.index(action='changes', since=since)
+        self.assertEqual(changes['contents'], [])
+        since = changes['next_since']
+
+        self.hda_manager.delete(self.app.model.context.query(model.HistoryDatasetAssociation).get(hda_id))
+        self.app.model.context.flush()
+        changes, _ = self.index(action='changes', since=since, view='detailed')
+        self.assertEqual([c['hid'] for c in changes['contents']], [6])
+        self.assertTrue(changes['contents'][0]['deleted'])
+        self.assertEqual(changes['active_counts']['deleted'], 1)
+        self.assertRaises(exceptions.RequestParameterInvalidException,
+                          self.controller.changes._orig, self.controller, self.trans,
+                          self.app.security.encode_id(self.history.id), since='yesterday')
+
+
 if __name__ == '__main__':
     # or more generally, nosetests test_resourcemanagers.py -s -v
     unittest.main()
@@ -0,0 +1,100 @@
+import json
+
+from galaxy import model
+from galaxy.managers.hdas import HDAManager
+from galaxy.managers.histories import HistoryManager
+from galaxy.managers.jobs import (
+    fingerprint_job,
+    JobSearch,
+)
+from .base import BaseTestCase
+
+
+class JobSearchTestCase(BaseTestCase):
+
+    def set_up_managers(self):
+        super(JobSearchTestCase, self).set_up_managers()
+        self.hda_manager = HDAManager(self.app)
+        self.history_manager = HistoryManager(self.app)
+        self.job_search = JobSearch(self.app)
+
+    def set_up_trans(self):
+        super(JobSearchTestCase, self).set_up_trans()
+        self.history = self.history_manager.create(user=self.admin_user)
+        self.hda = self._create_hda()
+
+    def _create_hda(self):
+        # Copies fill in default metadata, start from a copy so that it does not change when copied again
+        hda = self.hda_manager.create(history=self.history, name='input', extension='txt').copy()
+        self.history.add_dataset(hda)
+        self.trans.sa_session.flush()
+        return hda
+
+    def _param_dump(self, hda, lines='10'):
+        return {'input1': {'values': [{'id': hda.id, 'src': 'hda'}]}, 'lines': lines}
+
+    def _create_job(self, hda, lines='10', identifier=None):
+        job = model.Job()
+        job.tool_id = 'head'
+        job.tool_version = '1.0.0'
+        job.user = self.admin_user
+        job.state = model.Job.states.OK
+        for name, value in self._param_dump(hda, lines).items():
+            job.add_parameter(name, json.dumps(value, sort_keys=True))
+        # Recorded by tool actions but not part of the tool state
+        job.add_parameter('dbkey', '"?"')
+        job.add_parameter('__workflow_invocation_uuid__', '"b0b2a2c2"')
+        if identifier:
+            job.add_parameter('input1|__identifier__', json.dumps(identifier))
+        job.add_input_dataset('input1', hda)
+        job.set_fingerprint(fingerprint_job(self.trans.sa_session, job))
+        self.trans.sa_session.add(job)
+        self.trans.sa_session.flush()
+        return job
+
+    def _search(self, hda, lines='10'):
+        return self.job_search.by_tool_input(
+            trans=self.trans,
+            tool_id='head',
+            tool_version='1.0.0',
+            param={'input1': hda, 'lines': lines},
+            param_dump=self._param_dump(hda, lines),
+            job_state=None,
+        )
+
+    def test_by_tool_input(self):
+        job = self._create_job(self.hda)
+        assert job.fingerprint is not None
+        assert self._search(self.hda) is job
+        self.log('should find jobs run on copies of the inputs')
+        hda_copy = self.hda.copy()
+        self.history.add_dataset(hda_copy)
+        self.trans.sa_session.flush()
+        assert self._search(hda_copy) is job
+        self.log('should not find jobs with other parameters or inputs')
+        assert self._search(self.hda, lines='20') is None
+        other_hda = self._create_hda()
+        assert self._search(other_hda) is None
+
+    def test_by_tool_input_changed_inputs(self):
+        job = self._create_job(self.hda)
+        hda_copy = self.hda.copy()
+        self.history.add_dataset(hda_copy)
+        hda_copy.name = 'renamed'
+        self.trans.sa_session.flush()
+        assert self._search(hda_copy) is None
+        job.state = model.Job.states.ERROR
+        self.trans.sa_session.flush()
+        assert self._search(self.hda) is None
+
+    def test_by_tool_input_identifiers(self):
+        job = self._create_job(self.hda, identifier='sample1')
+        assert self._search(self.hda) is None
+        self.hda.element_identifier = 'sample1'
+        assert self._search(self.hda) is job
+
+    def test_fingerprint_job_unidentified_input(self):
+        job = model.Job()
+        job.tool_id = 'head'
+        job.add_parameter('input1', json.dumps({'values': [{'id': 1, 'src': 'dce'}]}))
+        assert fingerprint_job(self.trans.sa_session, job) is None
@@ -9,6 +9,7 @@ from sqlalchemy import inspect
 import galaxy.datatypes.registry
 import galaxy.model
 import galaxy.model.mapping as mapping
+import galaxy.quota
 
 datatypes_registry = galaxy.datatypes.registry.Registry()
 datatypes_registry.load_datatypes()
@@ -252,6 +253,155 @@ class MappingTests(unittest.TestCase):
         user_reload = model.session.query(model.User).get(u_id)
         assert user_reload.disk_usage == 1
 
+    def test_disk_usage_by_object_store(self):
+        model = self.model
+
+        u = model.User(email="disk_by_object_store@test.com", password="password")
+        self.persist(u)
+        u.adjust_total_disk_usage(10, "files1")
+        # Adjusted again before flushing
+        u.adjust_total_disk_usage(5, "files1")
+        u.adjust_total_disk_usage(3)
+        self.persist(u)
+        u.adjust_total_disk_usage(-5, "files1")
+        u_id = u.id
+        self.expunge()
+        user_reload = model.session.query(model.User).get(u_id)
+        assert user_reload.disk_usage == 13
+        assert user_reload.get_disk_usage_by_object_store() == {"files1": 10, None: 3}
+
+    def test_concurrent_disk_usage_adjustments_insert_one_row(self):
+        model = self.model
+
+        u = model.User(email="disk_concurrent@test.com", password="password")
+        self.persist(u)
+        u_id = u.id
+        # Two handlers finish jobs of the user, neither has seen a usage row
+        sessions = [model.session.session_factory() for _ in range(2)]
+        try:
+            users = [session.query(model.User).get(u_id) for session in sessions]
+            for user in users:
+                assert user.get_disk_usage_by_object_store() == {}
+            users[0].adjust_total_disk_usage(10, "files1")
+            users[1].adjust_total_disk_usage(5, "files1")
+            for session in sessions:
+                session.flush()
+        finally:
+            for session in sessions:
+                session.close()
+        self.expunge()
+        user_reload = model.session.query(model.User).get(u_id)
+        assert user_reload.disk_usage == 15
+        assert len(user_reload.object_store_usages) == 1
+        assert user_reload.get_disk_usage_by_object_store() == {"files1": 15}
+
+    def test_calculate_and_set_disk_usage_twice(self):
+        model = self.model
+
+        u = model.User(email="disk_recalculate@test.com", password="password")
+        h = model.History(name="History for recalculated disk usage", user=u)
+        self.persist(u, h)
+        for object_store_id, total_size in (("files1", 10), ("files2", 20)):
+            hda = self.new_hda(h)
+            hda.dataset.object_store_id = object_store_id
+            hda.dataset.total_size = total_size
+        self.persist(h)
+        u.calculate_and_set_disk_usage()
+        self.persist(u)
+        u.calculate_and_set_disk_usage()
+        self.persist(u)
+        u_id = u.id
+        self.expunge()
+        user_reload = model.session.query(model.User).get(u_id)
+        assert user_reload.get_disk_usage() == 30
+        assert len(user_reload.object_store_usages) == 2
+        assert user_reload.get_disk_usage_by_object_store() == {"files1": 10, "files2": 20}
+
+    def test_calculate_and_reconcile_disk_usage(self):
+        model = self.model
+
+        u = model.User(email="disk_reconcile@test.com", password="password")
+        h = model.History(name="History for disk usage", user=u)
+        self.persist(u, h)
+        for object_store_id, total_size in (("files1", 10), ("files2", 20), ("files2", 30)):
+            hda = self.new_hda(h)
+            hda.dataset.object_store_id = object_store_id
+            hda.dataset.total_size = total_size
+        self.persist(h)
+        assert u.calculate_disk_usage_by_object_store() == {"files1": 10, "files2": 50}
+        assert u.calculate_disk_usage() == 60
+
+        reconciler = galaxy.quota.DiskUsageReconciler(model, 3600, 1000)
+        try:
+            assert u in reconciler.reconcile_batch()
+            u_id = u.id
+            user_reload = model.session.query(model.User).get(u_id)
+            assert user_reload.get_disk_usage() == 60
+            assert user_reload.get_disk_usage_by_object_store() == {"files1": 10, "files2": 50}
+            # Users already verified are not corrected again
+            reconciler.last_user_id = 0
+            assert user_reload not in reconciler.reconcile_batch()
+        finally:
+            reconciler.shutdown_monitor()
+
+    def test_reconcile_disk_usage_rereads_stale_usage(self):
+        model = self.model
+
+        u = model.User(email="disk_reconcile_stale@test.com", password="password")
+        h = model.History(name="History for stale disk usage", user=u)
+        self.persist(u, h)
+        hda = self.new_hda(h)
+        hda.dataset.object_store_id = "files1"
+        hda.dataset.total_size = 10
+        self.persist(h)
+        u_id, dataset_id = u.id, hda.dataset.id
+
+        reconciler = galaxy.quota.DiskUsageReconciler(model, 3600, 1000)
+        try:
+            reconciler.last_user_id = u_id - 1
+            reconciler.reconcile_batch()
+            u = model.session.query(model.User).get(u_id)
+            assert u.get_disk_usage_by_object_store() == {"files1": 10}
+            # Another process grows the dataset and adjusts the usage, u is left stale
+            model.session.execute("UPDATE dataset SET total_size = total_size + 5 WHERE id = :id", {"id": dataset_id})
+            model.session.execute("UPDATE galaxy_user SET disk_usage = disk_usage + 5 WHERE id = :id", {"id": u_id})
+            model.session.execute("UPDATE user_object_store_usage SET total_disk_usage = total_disk_usage + 5 WHERE user_id = :id AND object_store_id = 'files1'", {"id": u_id})
+            assert u.get_disk_usage() == 10
+
+            reconciler.last_user_id = u_id - 1
+            assert u not in reconciler.reconcile_batch()
+            user_reload = model.session.query(model.User).get(u_id)
+            assert user_reload.get_disk_usage() == 15
+            assert user_reload.get_disk_usage_by_object_store() == {"files1": 15}
+        finally:
+            reconciler.shutdown_monitor()
+
+    def test_correct_disk_usage_keeps_concurrent_adjustments(self):
+        model = self.model
+
+        u = model.User(email="disk_correct@test.com", password="password")
+        u.set_disk_usage(10)
+        u.set_disk_usage_by_object_store({"files1": 10})
+        self.persist(u)
+        read_usage = u.get_disk_usage()
+        read_usage_by_object_store = u.get_disk_usage_by_object_store()
+        # Another process adjusts the usage after it was read
+        model.session.execute("UPDATE galaxy_user SET disk_usage = disk_usage + 5 WHERE id = :id", {"id": u.id})
+        model.session.execute("UPDATE user_object_store_usage SET total_disk_usage = total_disk_usage + 5 WHERE user_id = :id", {"id": u.id})
+        u.correct_disk_usage({"files1": 20, "files2": 30}, read_usage, read_usage_by_object_store)
+        self.persist(u)
+        u_id = u.id
+        model.session.expunge_all()
+        user_reload = model.session.query(model.User).get(u_id)
+        assert user_reload.get_disk_usage() == 55
+        assert user_reload.get_disk_usage_by_object_store() == {"files1": 25, "files2": 30}
+
+    def test_disk_usage_reconciler_runs_in_designated_process(self):
+        reconciler = galaxy.quota.DiskUsageReconciler(self.model, 3600, 1000, is_reconciler=lambda: False)
+        reconciler.monitor_thread.join(5)
+        assert not reconciler.monitor_thread.is_alive()
+        reconciler.shutdown_monitor()
+
     def test_basic(self):
         model = self.model
 
@@ -131,3 +131,50 @@ def test_encode_decode_guid():
     encoded_key = test_helper_1.encode_guid(session_key)
     decoded_key = test_helper_1.decode_guid(encoded_key)
     assert session_key == decoded_key, "%s != %s" % (session_key, decoded_key)
+
+
+def test_encode_ids():
+    obj_ids = [1, 2, 12345678901, "3", 1]
+    assert test_helper_1.encode_ids(obj_ids) == [test_helper_1.encode_id(i) for i in obj_ids]
+    assert test_helper_1.encode_ids(obj_ids, kind="k1") == [test_helper_1.encode_id(i, kind="k1") for i in obj_ids]
+    assert test_helper_1.encode_ids([]) == []
+    threw_exception = False
+    try:
+        test_helper_1.encode_ids([1, None])
+    except Exception:
+        threw_exception = True
+    assert threw_exception
+
+
+def test_id_cache():
+    helper = idencoding.IdEncodingHelper(id_secret="secu1", id_cache_size=2)
+    uncached_helper = idencoding.IdEncodingHelper(id_secret="secu1", id_cache_size=0)
+    encoded_ids = dict((obj_id, uncached_helper.encode_id(obj_id)) for obj_id in [1, 2, 3])
+    for obj_id in [1, 2, 3, 1]:
+        assert helper.decode_id(encoded_ids[obj_id]) == obj_id
+    assert list(helper._decoded_ids[None]._values.keys()) == [encoded_ids[3], encoded_ids[1]]
+    assert helper.decode_id(uncached_helper.encode_id(1, kind="k1"), kind="k1") == 1
+    assert helper._decoded_ids["k1"]._values
+    assert uncached_helper.decode_id(encoded_ids[1]) == 1
+    assert not uncached_helper._decoded_ids
+
+
+def test_nested_encoding_lists():
+    rval = dict(
+        id=1,
+        history_ids=[1, None],
+        elements=[dict(id=2, object=dict(id=3)), "not a dict"],
+    )
+    encoded = test_helper_1.encode_all_ids(rval, recursive=True)
+    assert encoded["id"] == test_helper_1.encode_id(1)
+    assert encoded["history_ids"] == [1, None]
+    assert encoded["elements"][0]["id"] == test_helper_1.encode_id(2)
+    assert encoded["elements"][0]["object"]["id"] == test_helper_1.encode_id(3)
+    assert encoded["elements"][1] == "not a dict"
+
+
+def test_nested_encoding_dict_under_id_key():
+    rval = dict(job_id=dict(id=1, history_id=2), dataset_id="3")
+    encoded = test_helper_1.encode_all_ids(rval, recursive=True)
+    assert encoded["job_id"] == dict(id=test_helper_1.encode_id(1), history_id=test_helper_1.encode_id(2))
+    assert encoded["dataset_id"] == test_helper_1.encode_id("3")
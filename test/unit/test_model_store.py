@@ -1,8 +1,11 @@
 """Unit tests for importing and exporting data from model stores."""
 import json
 import os
+import tarfile
 from tempfile import mkdtemp, NamedTemporaryFile
 
+import pytest
+
 from galaxy import model
 from galaxy.model import store
 from galaxy.model.metadata import MetadataTempFile
@@ -32,6 +35,83 @@ def test_import_export_history_failed_job():
     _assert_simple_cat_job_imported(imported_history, state='error')
 
 
+def test_import_export_history_compress_threads():
+    app = _mock_app()
+
+    u, h, d1, d2, j = _setup_simple_cat_job(app)
+
+    imported_history = _import_export_history(app, h, export_files="copy", compress_threads=2)
+
+    _assert_simple_cat_job_imported(imported_history)
+
+
+def test_import_export_history_resume():
+    """Test completing a partially written archive."""
+    app = _mock_app()
+
+    u, h, d1, d2, j = _setup_simple_cat_job(app)
+
+    dest_export = os.path.join(mkdtemp(), "moo.tar")
+    with store.TarModelExportStore(dest_export, app=app, export_files="copy", gzip=False) as export_store:
+        export_store.export_history(h)
+    with tarfile.open(dest_export) as archive:
+        members = archive.getmembers()
+    dataset_members = [m for m in members if m.name.startswith("datasets/") and m.isfile()]
+    assert len(dataset_members) == 2
+    # Interrupt writing the archive in the middle of the second dataset file
+    with open(dest_export, "r+b") as f:
+        f.truncate(dataset_members[1].offset_data + 10)
+
+    with store.TarModelExportStore(dest_export, app=app, export_files="copy", gzip=False, resume=True) as export_store:
+        export_store.export_history(h)
+    with tarfile.open(dest_export) as archive:
+        names = archive.getnames()
+    assert names.count(dataset_members[0].name) == 1
+    assert names.count(dataset_members[1].name) == 1
+
+    imported_history = import_archive(dest_export, app, u)
+    _assert_simple_cat_job_imported(imported_history)
+
+
+def test_export_pins_datasets_until_done():
+    app = _mock_app()
+
+    u, h, d1, d2, j = _setup_simple_cat_job(app)
+    events = []
+    app.object_store.pin = lambda obj, owner, **kwds: events.append(("pin", obj.id))
+    app.object_store.unpin_owner = lambda owner: events.append(("unpin", owner))
+
+    dest_export = os.path.join(mkdtemp(), "moo.tar")
+    with store.TarModelExportStore(dest_export, app=app, export_files="copy", gzip=False) as export_store:
+        export_store.export_history(h)
+    # Files are pinned when they are serialized and released once the archive is written
+    assert sorted(events[:-1]) == sorted([("pin", d1.dataset.id), ("pin", d2.dataset.id)])
+    assert events[-1] == ("unpin", export_store.pin_owner)
+
+
+def test_import_history_in_batches():
+    """Test importing datasets and jobs in batches, copying files with several threads."""
+    app = _mock_app()
+
+    u, h, d1, d2, j = _setup_simple_cat_job(app)
+    _create_composite_dataset(app, h)
+    dest_export = os.path.join(mkdtemp(), "moo.tgz")
+    with store.TarModelExportStore(dest_export, app=app, export_files="copy") as export_store:
+        export_store.export_history(h)
+
+    imported_history = import_archive(dest_export, app, u, batch_size=2, copy_threads=3)
+
+    datasets = imported_history.datasets
+    assert sorted(d.hid for d in datasets) == [1, 2, 3]
+    assert all(d.dataset.total_size > 0 for d in datasets)
+    composite = [d for d in datasets if d.extension == "html"][0]
+    _assert_composite_dataset_imported(composite)
+    output = [d for d in datasets if d.creating_job][0]
+    assert output.creating_job.input_datasets[0].dataset in datasets
+    with open(output.file_name, "r") as f:
+        assert f.read().startswith("chr1\t147962192\t147962580\tNM_005997_cds_0_0_chr1_147962193_r\t0\t-")
+
+
 def test_import_export_bag_archive():
     """Test a simple job import/export using a BagIt archive."""
     dest_parent = mkdtemp()
@@ -293,6 +373,75 @@ def test_import_export_composite_datasets():
     u = model.User(email="collection@example.com", password="password")
     h = model.History(name="Test History", user=u)
 
+    d1 = _create_composite_dataset(app, h)
+
+    temp_directory = mkdtemp()
+    with store.DirectoryModelExportStore(temp_directory, app=app, export_files="copy") as export_store:
+        export_store.add_dataset(d1)
+
+    import_history = model.History(name="Test History for Import", user=u)
+    sa_session.add(import_history)
+    sa_session.flush()
+    _perform_import_from_directory(temp_directory, app, u, import_history)
+    assert len(import_history.datasets) == 1
+    import_dataset = import_history.datasets[0]
+    _assert_composite_dataset_imported(import_dataset)
+
+
+def test_export_hardlink_composite_datasets():
+    app = _mock_app()
+    sa_session = app.model.context
+
+    u = model.User(email="collection@example.com", password="password")
+    h = model.History(name="Test History", user=u)
+
+    d1 = _create_composite_dataset(app, h)
+
+    temp_directory = mkdtemp()
+    with store.DirectoryModelExportStore(temp_directory, app=app, export_files="hardlink") as export_store:
+        export_store.add_dataset(d1)
+    # Exporting again to the same directory only keeps the files already exported when resuming
+    with pytest.raises(OSError):
+        with store.DirectoryModelExportStore(temp_directory, app=app, export_files="copy") as export_store:
+            export_store.add_dataset(d1)
+    with store.DirectoryModelExportStore(temp_directory, app=app, export_files="hardlink", resume=True) as export_store:
+        export_store.add_dataset(d1)
+    with open(os.path.join(temp_directory, store.ATTRS_FILENAME_DATASETS)) as f:
+        file_name = json.load(f)[0]["file_name"]
+    assert os.path.samefile(os.path.join(temp_directory, file_name), d1.file_name)
+
+    import_history = model.History(name="Test History for Import", user=u)
+    sa_session.add(import_history)
+    sa_session.flush()
+    _perform_import_from_directory(temp_directory, app, u, import_history)
+    assert len(import_history.datasets) == 1
+    _assert_composite_dataset_imported(import_history.datasets[0])
+
+
+def test_copy_tree_resume():
+    src_directory, dest_directory = mkdtemp(), mkdtemp()
+    src, dest = os.path.join(src_directory, "a"), os.path.join(dest_directory, "a")
+    with open(src, "w") as f:
+        f.write("first")
+    store.copy_tree(src, dest)
+    with pytest.raises(OSError):
+        store.copy_tree(src, dest)
+
+    # An exported file with the size of its source is only kept if it is not older
+    with open(src, "w") as f:
+        f.write("again")
+    os.utime(src, (1, 1))
+    store.copy_tree(src, dest, resume=True)
+    with open(dest) as f:
+        assert f.read() == "first"
+    os.utime(dest, (0, 0))
+    store.copy_tree(src, dest, resume=True)
+    with open(dest) as f:
+        assert f.read() == "again"
+
+
+def _create_composite_dataset(app, h):
+    sa_session = app.model.context
     d1 = _create_datasets(sa_session, h, 1, extension="html")[0]
     d1.dataset.create_extra_files_path()
     sa_session.add_all((h, d1))
@@ -320,17 +469,10 @@ def test_import_export_composite_datasets():
         create=True,
         preserve_symlinks=True
     )
+    return d1
 
-    temp_directory = mkdtemp()
-    with store.DirectoryModelExportStore(temp_directory, app=app, export_files="copy") as export_store:
-        export_store.add_dataset(d1)
 
-    import_history = model.History(name="Test History for Import", user=u)
-    sa_session.add(import_history)
-    sa_session.flush()
-    _perform_import_from_directory(temp_directory, app, u, import_history)
-    assert len(import_history.datasets) == 1
-    import_dataset = import_history.datasets[0]
+def _assert_composite_dataset_imported(import_dataset):
     root_extra_files_path = import_dataset.extra_files_path
     assert len(os.listdir(root_extra_files_path)) == 1
     assert os.listdir(root_extra_files_path)[0] == "parent_dir"
@@ -460,12 +602,12 @@ def _setup_simple_cat_job(app, state='ok'):
     return u, h, d1, d2, j
 
 
-def _import_export_history(app, h, dest_export=None, export_files=None):
+def _import_export_history(app, h, dest_export=None, export_files=None, **export_kwds):
     if dest_export is None:
         dest_parent = mkdtemp()
         dest_export = os.path.join(dest_parent, "moo.tgz")
 
-    with store.TarModelExportStore(dest_export, app=app, export_files=export_files) as export_store:
+    with store.TarModelExportStore(dest_export, app=app, export_files=export_files, **export_kwds) as export_store:
         export_store.export_history(h)
 
     imported_history = import_archive(dest_export, app, h.user)
@@ -479,7 +621,7 @@ def _perform_import_from_directory(directory, app, user, import_history, import_
         import_model_store.perform_import(import_history)
 
 
-def import_archive(archive_path, app, user):
+def import_archive(archive_path, app, user, **import_kwds):
     dest_parent = mkdtemp()
     dest_dir = os.path.join(dest_parent, 'dest')
 
@@ -492,7 +634,7 @@ def import_archive(archive_path, app, user):
     unpack_tar_gz_archive.main(options, args)
 
     new_history = None
-    model_store = store.get_import_model_store_for_directory(dest_dir, app=app, user=user)
+    model_store = store.get_import_model_store_for_directory(dest_dir, app=app, user=user, **import_kwds)
     with model_store.target_history(default_history=None) as new_history:
         model_store.perform_import(new_history)
 
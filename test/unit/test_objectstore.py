@@ -6,12 +6,17 @@ from tempfile import mkdtemp
 from uuid import uuid4
 from xml.etree import ElementTree
 
+import mock
 import yaml
 from six import StringIO
 
 from galaxy import objectstore
 from galaxy.exceptions import ObjectInvalid
 from galaxy.objectstore.azure_blob import AzureBlobObjectStore
+from galaxy.objectstore.caching import (
+    CACHE_INDEX_FILENAME,
+    NullCacheManager,
+)
 from galaxy.objectstore.cloud import Cloud
 from galaxy.objectstore.pithos import PithosObjectStore
 from galaxy.objectstore.s3 import S3ObjectStore
@@ -287,6 +292,41 @@ def test_hierarchical_store():
             _assert_key_has_value(as_dict, "type", "hierarchical")
 
 
+HIERARCHICAL_LOCATION_CACHE_TEST_CONFIG = """<?xml version="1.0"?>
+<object_store type="hierarchical">
+    <location_cache size="1000" negative_ttl="3600"/>
+    <backends>
+        <backend id="files1" type="disk" weight="1" order="0">
+            <files_dir path="${temp_directory}/files1"/>
+        </backend>
+        <backend id="files2" type="disk" weight="1" order="1">
+            <files_dir path="${temp_directory}/files2"/>
+        </backend>
+    </backends>
+</object_store>
+"""
+
+
+def test_hierarchical_store_location_cache():
+    with TestConfig(HIERARCHICAL_LOCATION_CACHE_TEST_CONFIG) as (directory, object_store):
+        directory.write("Hello World!", "files2/000/dataset_2.dat")
+        assert object_store.exists(MockDataset(2))
+        # Backends are always checked in order
+        directory.write("Hello World!", "files1/000/dataset_2.dat")
+        assert object_store.get_filename(MockDataset(2)).find("files1") > 0
+        assert object_store.location_cache.get("MockDataset:2") is None
+
+        # Objects not found are remembered until they are created
+        assert not object_store.exists(MockDataset(3))
+        directory.write("Hello World!", "files2/000/dataset_3.dat")
+        assert not object_store.exists(MockDataset(3))
+        object_store.create(MockDataset(3))
+        assert object_store.exists(MockDataset(3))
+
+        as_dict = object_store.to_dict()
+        _assert_key_has_value(as_dict["location_cache"], "negative_ttl", 3600)
+
+
 def test_mixed_store_by():
     with TestConfig(MIXED_STORE_BY_HIERARCHICAL_TEST_CONFIG) as (directory, object_store):
         as_dict = object_store.to_dict()
@@ -360,6 +400,28 @@ def test_distributed_store():
             assert len(extra_dirs) == 2
 
 
+def test_distributed_store_probes_remembered_backend_first():
+    with TestConfig(DISTRIBUTED_TEST_CONFIG) as (directory, object_store):
+        probed = []
+        for backend_id, backend in object_store.backends.items():
+            backend.exists = _recording_exists(backend.exists, backend_id, probed)
+        directory.write("Hello World!", "files2/000/dataset_2.dat")
+        with __stubbed_persistence():
+            assert object_store.get_filename(MockDataset(2)).find("files2") > 0
+            del probed[:]
+            # A remembered location is still checked, but no other backend is
+            assert object_store.exists(MockDataset(2))
+        assert "files2" in probed
+        assert "files1" not in probed
+
+
+def _recording_exists(exists, backend_id, probed):
+    def recording_exists(obj, **kwargs):
+        probed.append(backend_id)
+        return exists(obj, **kwargs)
+    return recording_exists
+
+
 # Unit testing the cloud and advanced infrastructure object stores is difficult, but
 # we can at least stub out initializing and test the configuration of these things from
 # XML and dicts.
@@ -454,7 +516,7 @@ def test_config_parse_pithos():
 S3_TEST_CONFIG = """<object_store type="s3">
      <auth access_key="access_moo" secret_key="secret_cow" />
      <bucket name="unique_bucket_name_all_lowercase" use_reduced_redundancy="False" />
-     <cache path="database/object_store_cache" size="1000" />
+     <cache path="database/object_store_cache" size="1000" high_watermark="0.95" low_watermark="0.7" />
      <extra_dir type="job_work" path="database/job_working_directory_s3"/>
      <extra_dir type="temp" path="database/tmp_s3"/>
 </object_store>
@@ -474,6 +536,8 @@ bucket:
 cache:
   path: database/object_store_cache
   size: 1000
+  high_watermark: 0.95
+  low_watermark: 0.7
 
 extra_dirs:
 - type: job_work
@@ -497,9 +561,15 @@ def test_config_parse_s3():
             assert object_store.multipart is True
             assert object_store.is_secure is True
             assert object_store.conn_path == "/"
+            assert object_store.download_part_size == 100
+            assert object_store.download_threads == 4
+            assert object_store.range_read_max_size == 0
 
             assert object_store.cache_size == 1000
             assert object_store.staging_path == "database/object_store_cache"
+            assert object_store.cache_high_watermark == 0.95
+            assert object_store.cache_low_watermark == 0.7
+            assert object_store.write_behind is False
             assert object_store.extra_dirs["job_work"] == "database/job_working_directory_s3"
             assert object_store.extra_dirs["temp"] == "database/tmp_s3"
 
@@ -523,14 +593,87 @@ def test_config_parse_s3():
             _assert_key_has_value(connection_dict, "port", 6000)
             _assert_key_has_value(connection_dict, "multipart", True)
             _assert_key_has_value(connection_dict, "is_secure", True)
+            _assert_key_has_value(connection_dict, "download_threads", 4)
 
             _assert_key_has_value(cache_dict, "size", 1000)
             _assert_key_has_value(cache_dict, "path", "database/object_store_cache")
+            _assert_key_has_value(cache_dict, "high_watermark", 0.95)
+            _assert_key_has_value(cache_dict, "low_watermark", 0.7)
 
             extra_dirs = as_dict["extra_dirs"]
             assert len(extra_dirs) == 2
 
 
+def test_s3_no_cache_index_without_monitor():
+    with TestConfig(S3_TEST_CONFIG, clazz=UnitializeS3ObjectStore) as (directory, object_store):
+        object_store.staging_path = os.path.join(directory.temp_directory, "cache")
+        object_store.enable_cache_monitor = False
+        object_store.start_cache_monitor()
+        assert isinstance(object_store.cache_manager, NullCacheManager)
+        assert not os.path.exists(os.path.join(object_store.staging_path, CACHE_INDEX_FILENAME))
+        # Processes built from the dictionary convert the configured size themselves
+        _assert_key_has_value(object_store.to_dict()["cache"], "size", 1000)
+
+
+def test_s3_cache_index_path():
+    with TestConfig(S3_TEST_CONFIG, clazz=UnitializeS3ObjectStore) as (directory, object_store):
+        object_store.staging_path = os.path.join(directory.temp_directory, "cache")
+        object_store.cache_index_path = os.path.join(directory.temp_directory, "local", "index.sqlite")
+        object_store.start_cache_monitor()
+        cache_manager = object_store.cache_manager
+        try:
+            assert cache_manager.cache_size == 1000 * 1073741824
+            assert cache_manager.high_watermark == 0.95
+            assert cache_manager.low_watermark == 0.7
+            assert os.path.exists(object_store.cache_index_path)
+            assert not os.path.exists(os.path.join(object_store.staging_path, CACHE_INDEX_FILENAME))
+            cache_file = os.path.join(object_store.staging_path, "000", "dataset_1.dat")
+            os.makedirs(os.path.dirname(cache_file))
+            open(cache_file, "w").write("moo cow")
+            cache_manager.file_added(cache_file)
+            assert cache_manager.total_size == 7
+            _assert_key_has_value(object_store.to_dict()["cache"], "index_path", object_store.cache_index_path)
+        finally:
+            cache_manager.shutdown()
+
+
+def test_s3_range_read_stops_at_character_boundary():
+    with TestConfig(S3_TEST_CONFIG, clazz=UnitializeS3ObjectStore) as (directory, object_store):
+        key = mock.Mock()
+        key.get_contents_as_string.return_value = u"a\u00f1".encode("utf-8")[:-1]
+        object_store._bucket = mock.Mock()
+        object_store._bucket.get_key.return_value = key
+        assert object_store._get_range("000/dataset_1.dat", 0, 2) == u"a"
+        key.get_contents_as_string.assert_called_once_with(headers={"Range": "bytes=0-1"})
+
+
+def test_s3_range_read_matches_cached_read():
+    content = u"a\u00f1b\u20acc".encode("utf-8")
+
+    def get_contents_as_string(headers):
+        start, end = headers["Range"][len("bytes="):].split("-")
+        return content[int(start):int(end) + 1]
+
+    with TestConfig(S3_TEST_CONFIG, clazz=UnitializeS3ObjectStore) as (directory, object_store):
+        object_store.staging_path = os.path.join(directory.temp_directory, "cache")
+        object_store.cache_manager = NullCacheManager()
+        rel_path = "000/dataset_1.dat"
+        os.makedirs(os.path.join(object_store.staging_path, "000"))
+        with open(object_store._get_cache_path(rel_path), "wb") as f:
+            f.write(content)
+        key = mock.Mock()
+        key.get_contents_as_string.side_effect = get_contents_as_string
+        object_store._bucket = mock.Mock()
+        object_store._bucket.get_key.return_value = key
+        object_store._construct_path = mock.Mock(return_value=rel_path)
+        for start in range(len(content)):
+            for count in range(1, len(content) - start + 1):
+                cached = object_store.get_data(None, start=start, count=count)
+                assert object_store._get_range(rel_path, start, count) == cached
+                assert u"\ufffd" not in cached
+        assert object_store.get_data(None, start=1, count=3) == u"\u00f1b"
+
+
 CLOUD_AWS_TEST_CONFIG = """<object_store type="cloud" provider="aws">
      <auth access_key="access_moo" secret_key="secret_cow" />
      <bucket name="unique_bucket_name_all_lowercase" use_reduced_redundancy="False" />
@@ -697,7 +840,7 @@ def test_config_parse_cloud():
 AZURE_BLOB_TEST_CONFIG = """<object_store type="azure_blob">
     <auth account_name="azureact" account_key="password123" />
     <container name="unique_container_name" max_chunk_size="250"/>
-    <cache path="database/object_store_cache" size="100" />
+    <cache path="database/object_store_cache" size="100" high_watermark="0.95" low_watermark="0.7" />
     <extra_dir type="job_work" path="database/job_working_directory_azure"/>
     <extra_dir type="temp" path="database/tmp_azure"/>
 </object_store>
@@ -717,6 +860,8 @@ container:
 cache:
   path: database/object_store_cache
   size: 100
+  high_watermark: 0.95
+  low_watermark: 0.7
 
 extra_dirs:
 - type: job_work
@@ -757,6 +902,8 @@ def test_config_parse_azure():
 
             _assert_key_has_value(cache_dict, "size", 100)
             _assert_key_has_value(cache_dict, "path", "database/object_store_cache")
+            _assert_key_has_value(cache_dict, "high_watermark", 0.95)
+            _assert_key_has_value(cache_dict, "low_watermark", 0.7)
 
             extra_dirs = as_dict["extra_dirs"]
             assert len(extra_dirs) == 2
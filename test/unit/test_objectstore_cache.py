@@ -0,0 +1,162 @@
+import os
+import shutil
+import socket
+import tempfile
+import time
+from contextlib import contextmanager
+
+from galaxy.objectstore import caching
+from galaxy.objectstore.caching import CacheManager
+
+
+def test_evicts_least_recently_used_until_low_watermark():
+    with _cache_manager() as (manager, staging_path):
+        paths = _add_files(manager, staging_path, 10)
+        manager.file_accessed(paths[0])
+        assert manager.total_size == 1000
+        assert manager.evict() == 200
+        assert manager.total_size == 800
+        assert os.path.exists(paths[0])
+        assert not os.path.exists(paths[1])
+        assert not os.path.exists(paths[2])
+        assert os.path.exists(paths[3])
+
+
+def test_no_eviction_below_high_watermark():
+    with _cache_manager() as (manager, staging_path):
+        _add_files(manager, staging_path, 9)
+        assert manager.evict() == 0
+        assert manager.total_size == 900
+
+
+def test_pinned_files_are_not_evicted():
+    with _cache_manager() as (manager, staging_path):
+        paths = _add_files(manager, staging_path, 10)
+        with manager.pinned(paths[0]):
+            manager.evict()
+        assert os.path.exists(paths[0])
+        assert not os.path.exists(paths[1])
+        assert not os.path.exists(paths[2])
+
+
+def test_eviction_pages_past_pinned_files(monkeypatch):
+    monkeypatch.setattr(caching, 'EVICTION_BATCH_SIZE', 2)
+    with _cache_manager() as (manager, staging_path):
+        paths = _add_files(manager, staging_path, 10)
+        with manager.pinned(paths[0]), manager.pinned(paths[1]):
+            assert manager.evict() == 200
+        assert os.path.exists(paths[0])
+        assert os.path.exists(paths[1])
+        assert not os.path.exists(paths[2])
+        assert not os.path.exists(paths[3])
+
+
+def test_files_are_removed_outside_the_eviction_transaction(monkeypatch):
+    with _cache_manager() as (manager, staging_path):
+        paths = _add_files(manager, staging_path, 10)
+        original_remove = os.remove
+        in_transaction = []
+
+        def remove(path):
+            in_transaction.append(manager._conn.in_transaction)
+            original_remove(path)
+
+        monkeypatch.setattr(caching.os, 'remove', remove)
+        assert manager.evict() == 200
+        assert in_transaction == [False, False]
+        assert not os.path.exists(paths[0])
+
+
+def test_processes_sharing_a_cache_share_size_and_pins():
+    with _cache_manager() as (manager, staging_path):
+        other_manager = CacheManager(staging_path, 1000)
+        paths = _add_files(other_manager, staging_path, 5) + _add_files(manager, staging_path, 5, start=5)
+        assert manager.total_size == other_manager.total_size == 1000
+        other_manager.pin(paths[0])
+        assert manager.evict() == 200
+        assert os.path.exists(paths[0])
+        assert not os.path.exists(paths[1])
+        assert other_manager.total_size == 800
+        other_manager.unpin(paths[0])
+        other_manager.shutdown()
+
+
+def test_rescan_drops_pins_of_dead_processes(monkeypatch):
+    with _cache_manager() as (manager, staging_path):
+        paths = _add_files(manager, staging_path, 10)
+        monkeypatch.setattr(manager, '_owner', lambda: '%s:%d' % (socket.gethostname(), 2 ** 22 + 1))
+        manager.pin(paths[0])
+        manager.rescan()
+        assert manager.evict() == 200
+        assert not os.path.exists(paths[0])
+
+
+def test_rescan_drops_tagged_pins_of_dead_processes():
+    with _cache_manager() as (manager, staging_path):
+        paths = _add_files(manager, staging_path, 10)
+        manager.pin(paths[0], owner='%s:%d:export-1' % (socket.gethostname(), 2 ** 22 + 1))
+        manager.pin(paths[1], owner=caching.process_pin_owner('export-2'))
+        manager.rescan()
+        assert manager.evict() == 200
+        assert not os.path.exists(paths[0])
+        assert os.path.exists(paths[1])
+
+
+def test_job_pins_outlive_the_pinning_process(monkeypatch):
+    with _cache_manager() as (manager, staging_path):
+        paths = _add_files(manager, staging_path, 10)
+        monkeypatch.setattr(manager, '_owner', lambda: '%s:%d' % (socket.gethostname(), 2 ** 22 + 1))
+        manager.pin(paths[0], owner="job:1")
+        manager.pin(paths[1], owner="job:1")
+        manager.rescan()
+        assert manager.evict() == 200
+        assert os.path.exists(paths[0])
+        assert os.path.exists(paths[1])
+        manager.unpin_owner("job:1")
+        for path in paths[2:4]:
+            with open(path, "w") as f:
+                f.write("x" * 100)
+            manager.file_added(path)
+        assert manager.total_size == 1000
+        assert manager.evict() == 200
+        assert not os.path.exists(paths[0])
+        assert not os.path.exists(paths[1])
+
+
+def test_removals_and_rescan_update_size():
+    with _cache_manager() as (manager, staging_path):
+        paths = _add_files(manager, staging_path, 4)
+        os.remove(paths[0])
+        manager.file_removed(paths[0])
+        assert manager.total_size == 300
+        manager.dir_removed(os.path.join(staging_path, "000"))
+        assert manager.total_size == 0
+        manager.rescan()
+        assert manager.total_size == 300
+        # A new manager picks up the index left by the previous one
+        manager.shutdown()
+        assert CacheManager(staging_path, 1000).total_size == 300
+
+
+def _add_files(manager, staging_path, count, start=0):
+    paths = []
+    for i in range(start, start + count):
+        path = os.path.join(staging_path, "000", "dataset_%d.dat" % i)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            f.write("x" * 100)
+        manager.file_added(path)
+        paths.append(path)
+        # Make sure access times differ
+        time.sleep(0.01)
+    return paths
+
+
+@contextmanager
+def _cache_manager():
+    staging_path = tempfile.mkdtemp()
+    try:
+        yield CacheManager(staging_path, 1000), staging_path
+    finally:
+        shutil.rmtree(staging_path)
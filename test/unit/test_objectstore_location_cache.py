@@ -0,0 +1,42 @@
+import os
+import time
+from tempfile import mkdtemp
+
+from galaxy.objectstore.location_cache import ObjectLocationCache
+
+
+def test_locations_are_lru():
+    cache = ObjectLocationCache(max_size=2)
+    cache.set("Dataset:1", "files1")
+    cache.set("Dataset:2", "files2")
+    assert cache.get("Dataset:1") == "files1"
+    cache.set("Dataset:3", 0)
+    assert cache.get("Dataset:2") is None
+    assert cache.get("Dataset:1") == "files1"
+    assert cache.get("Dataset:3") == "0"
+
+
+def test_missing_objects_expire():
+    cache = ObjectLocationCache(negative_ttl=0.1)
+    cache.set_missing("Dataset:1", {})
+    assert cache.is_missing("Dataset:1", {})
+    assert not cache.is_missing("Dataset:1", {"extra_dir": "dataset_1_files"})
+    time.sleep(0.2)
+    assert not cache.is_missing("Dataset:1", {})
+
+
+def test_invalidate():
+    cache = ObjectLocationCache(negative_ttl=60)
+    cache.set("Dataset:1", "files1")
+    cache.set_missing("Dataset:1", {"alt_name": "foo"})
+    cache.invalidate("Dataset:1")
+    assert cache.get("Dataset:1") is None
+    assert not cache.is_missing("Dataset:1", {"alt_name": "foo"})
+
+
+def test_locations_persisted():
+    path = os.path.join(mkdtemp(), "locations.sqlite")
+    cache = ObjectLocationCache(path=path)
+    cache.set("Dataset:1", "files1")
+    cache.shutdown()
+    assert ObjectLocationCache(path=path).get("Dataset:1") == "files1"
@@ -0,0 +1,94 @@
+from collections import Counter
+
+from galaxy.objectstore.placement import BackendPlacement
+
+GB = 1024 ** 3
+
+
+def test_full_backends_are_skipped():
+    backends = {"files1": MockBackend(100 * GB, 5 * GB), "files2": MockBackend(100 * GB, 50 * GB)}
+    placement = BackendPlacement(backends, {"files1": 1, "files2": 1}, {"files1": 90, "files2": 90})
+    placement.refresh()
+    assert placement.is_full("files1")
+    assert set(placement.choose() for _ in range(100)) == {"files2"}
+
+
+def test_objects_created_since_refresh_are_projected():
+    backends = {"files1": MockBackend(100 * GB, 30 * GB), "files2": MockBackend(100 * GB, 50 * GB)}
+    placement = BackendPlacement(backends, {"files1": 1, "files2": 1}, {}, global_max_percent_full=85)
+    placement.refresh()
+    # 10 objects of 1 GB each were written since
+    for _ in range(10):
+        placement.record_create("files1")
+    backends["files1"].free -= 10 * GB
+    placement.stats["files1"].measure_time -= 120
+    placement.refresh()
+    assert not placement.is_full("files1")
+    # Another 6 objects of the same size would fill it beyond 85%
+    for _ in range(6):
+        placement.record_create("files1")
+    assert placement.is_full("files1")
+
+
+def test_balance_by_free_space():
+    backends = {"files1": MockBackend(100 * GB, 10 * GB), "files2": MockBackend(100 * GB, 90 * GB)}
+    placement = BackendPlacement(backends, {"files1": 1, "files2": 1}, {}, balance_by_free_space=True)
+    placement.refresh()
+    counts = Counter(placement.choose() for _ in range(1000))
+    assert counts["files2"] > 3 * counts["files1"]
+    placement.shutdown()
+
+
+def test_backends_reporting_only_usage_percent():
+    backends = {"files1": MockBackend(100 * GB, 50 * GB), "pulsar": MockPercentBackend(95.0), "irods": UnmeasuredBackend()}
+    placement = BackendPlacement(backends, {"files1": 1, "pulsar": 1, "irods": 1}, {}, global_max_percent_full=90)
+    placement.refresh()
+    assert not placement.stats["pulsar"].in_bytes
+    assert placement.is_full("pulsar")
+    assert not placement.is_full("irods")
+    assert set(placement.choose() for _ in range(100)) == {"files1", "irods"}
+    placement.shutdown()
+
+
+def test_balance_by_free_space_with_unmeasured_backends():
+    backends = {"files1": MockBackend(100 * GB, 10 * GB), "files2": MockBackend(100 * GB, 30 * GB),
+                "pulsar": MockPercentBackend(20.0), "irods": UnmeasuredBackend()}
+    weights = {"files1": 1, "files2": 1, "pulsar": 1, "irods": 1}
+    placement = BackendPlacement(backends, weights, {}, balance_by_free_space=True)
+    placement.refresh()
+    counts = Counter(placement.choose() for _ in range(2000))
+    # Backends without a free space in bytes get the mean free space of the others
+    assert counts["files2"] > counts["pulsar"] > counts["files1"]
+    assert counts["files2"] > counts["irods"] > counts["files1"]
+    placement.shutdown()
+
+
+class MockBackend(object):
+
+    def __init__(self, total, free):
+        self.total = total
+        self.free = free
+
+    def get_store_space(self):
+        return self.total, self.free
+
+
+class MockPercentBackend(object):
+
+    def __init__(self, percent_used):
+        self.percent_used = percent_used
+
+    def get_store_space(self):
+        raise NotImplementedError()
+
+    def get_store_usage_percent(self):
+        return self.percent_used
+
+
+class UnmeasuredBackend(MockPercentBackend):
+
+    def __init__(self):
+        pass
+
+    def get_store_usage_percent(self):
+        raise NotImplementedError()
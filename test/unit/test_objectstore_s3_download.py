@@ -0,0 +1,52 @@
+import os
+import re
+from tempfile import mkdtemp
+
+import pytest
+
+from galaxy.objectstore.s3_multipart_download import multipart_download
+
+RANGE_HEADER = re.compile(r"bytes=(\d+)-(\d+)")
+
+
+def test_multipart_download_reassembles_object():
+    data = os.urandom(1000003)
+    key = MockKey(data)
+    local_path = os.path.join(mkdtemp(), "dataset_1.dat")
+    multipart_download(lambda: key, len(data), local_path, 100000, 4)
+    with open(local_path, "rb") as fh:
+        assert fh.read() == data
+    assert os.listdir(os.path.dirname(local_path)) == ["dataset_1.dat"]
+    assert len(key.requested_ranges) == 11
+    assert sorted(key.requested_ranges)[-1] == (1000000, 1000002)
+
+
+def test_multipart_download_empty_object():
+    local_path = os.path.join(mkdtemp(), "dataset_1.dat")
+    multipart_download(lambda: MockKey(b""), 0, local_path, 100000, 4)
+    assert os.path.getsize(local_path) == 0
+
+
+def test_multipart_download_failure_leaves_no_file():
+    data = os.urandom(1000003)
+    cache_dir = mkdtemp()
+    local_path = os.path.join(cache_dir, "dataset_1.dat")
+    with pytest.raises(IOError):
+        multipart_download(lambda: MockKey(data, fail_at=500000), len(data), local_path, 100000, 4)
+    assert os.listdir(cache_dir) == []
+
+
+class MockKey(object):
+    """Serves ranged GETs of an in-memory object like S3 does."""
+
+    def __init__(self, data, fail_at=None):
+        self.data = data
+        self.fail_at = fail_at
+        self.requested_ranges = []
+
+    def get_contents_to_file(self, fh, headers=None):
+        start, end = map(int, RANGE_HEADER.match(headers["Range"]).groups())
+        self.requested_ranges.append((start, end))
+        if self.fail_at is not None and start <= self.fail_at <= end:
+            raise IOError("Connection reset by peer")
+        fh.write(self.data[start:end + 1])
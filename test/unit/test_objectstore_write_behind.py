@@ -0,0 +1,174 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from galaxy.objectstore.caching import CacheManager
+from galaxy.objectstore.write_behind import WriteBehindUploader
+
+
+def test_uploads_in_background():
+    with _staging_path() as staging_path:
+        push = MockPush()
+        uploader = WriteBehindUploader(push, staging_path, threads=2)
+        uploader.start()
+        uploader.enqueue("000/dataset_1.dat", _cache_file(staging_path))
+        assert push.wait_for(1)
+        uploader.shutdown()
+        assert push.pushed == ["000/dataset_1.dat"]
+        assert not _is_pending(staging_path, "000/dataset_1.dat")
+        assert uploader.status()["uploaded"] == 1
+        assert uploader.status()["bytes_uploaded"] == 100
+
+
+def test_failed_uploads_are_retried():
+    with _staging_path() as staging_path:
+        push = MockPush(failures=2)
+        uploader = WriteBehindUploader(push, staging_path, threads=1, retry_delay=0)
+        uploader.start()
+        uploader.enqueue("000/dataset_1.dat", _cache_file(staging_path))
+        assert push.wait_for(1)
+        uploader.shutdown()
+        assert push.attempts == 3
+        assert uploader.status()["failed"] == 0
+
+
+def test_failing_uploads_are_retried_in_background():
+    with _staging_path() as staging_path:
+        push = MockPush(failures=5)
+        uploader = WriteBehindUploader(push, staging_path, threads=1, max_retries=1, retry_delay=0)
+        uploader.start()
+        uploader.enqueue("000/dataset_1.dat", _cache_file(staging_path))
+        assert push.wait_for(1)
+        uploader.shutdown()
+        assert push.attempts == 6
+        assert uploader.status()["failed"] == 2
+        assert uploader.status()["retrying"] == 0
+        assert not _is_pending(staging_path, "000/dataset_1.dat")
+
+
+def test_status_is_logged(caplog):
+    caplog.set_level(logging.INFO)
+    with _staging_path() as staging_path:
+        push = MockPush()
+        uploader = WriteBehindUploader(push, staging_path, threads=1, status_interval=0)
+        uploader.start()
+        uploader.enqueue("000/dataset_1.dat", _cache_file(staging_path))
+        assert push.wait_for(1)
+        uploader.shutdown()
+        assert "Write-behind uploads: " in caplog.text
+
+
+def test_uploads_raising_exceptions_are_retried():
+    with _staging_path() as staging_path:
+        push = MockPush(failures=2, error=IOError("Connection reset by peer"))
+        uploader = WriteBehindUploader(push, staging_path, threads=1, retry_delay=0)
+        uploader.start()
+        uploader.enqueue("000/dataset_1.dat", _cache_file(staging_path))
+        assert push.wait_for(1)
+        uploader.shutdown()
+        assert push.attempts == 3
+        assert not _is_pending(staging_path, "000/dataset_1.dat")
+
+
+def test_pending_uploads_are_shared_between_servers():
+    with _staging_path() as staging_path:
+        uploader = WriteBehindUploader(MockPush(), staging_path, server_name="handler0")
+        uploader.enqueue("000/dataset_1.dat", _cache_file(staging_path))
+        push = MockPush()
+        other_uploader = WriteBehindUploader(push, staging_path, server_name="web0")
+        other_uploader.start()
+        assert other_uploader.is_pending("000/dataset_1.dat")
+        # Only the server that enqueued the file uploads it
+        assert not push.wait_for(1, timeout=0.5)
+        assert other_uploader.cancel("000/dataset_1.dat")
+        assert not uploader.is_pending("000/dataset_1.dat")
+        other_uploader.shutdown()
+        uploader.shutdown()
+
+
+def test_pending_uploads_are_not_evicted():
+    with _staging_path() as staging_path:
+        cache_file = _cache_file(staging_path)
+        cache_manager = CacheManager(staging_path, 100)
+        cache_manager.file_added(cache_file)
+        uploader = WriteBehindUploader(MockPush(), staging_path)
+        uploader.enqueue("000/dataset_1.dat", cache_file)
+        assert cache_manager.evict() == 0
+        assert os.path.exists(cache_file)
+        uploader.cancel("000/dataset_1.dat")
+        assert cache_manager.evict() == 100
+        uploader.shutdown()
+        cache_manager.shutdown()
+
+
+def test_pending_uploads_survive_restart():
+    with _staging_path() as staging_path:
+        uploader = WriteBehindUploader(MockPush(), staging_path)
+        uploader.enqueue("000/dataset_1.dat", _cache_file(staging_path))
+        uploader.enqueue("000/dataset_2.dat", _cache_file(staging_path))
+        uploader.cancel("000/dataset_2.dat")
+        assert uploader.is_pending("000/dataset_1.dat")
+        # Never started, as if Galaxy was stopped before uploading
+        uploader.shutdown()
+        push = MockPush()
+        uploader = WriteBehindUploader(push, staging_path)
+        uploader.start()
+        assert push.wait_for(1)
+        uploader.shutdown()
+        assert push.pushed == ["000/dataset_1.dat"]
+
+
+def _is_pending(staging_path, rel_path):
+    uploader = WriteBehindUploader(MockPush(), staging_path)
+    try:
+        return uploader.is_pending(rel_path)
+    finally:
+        uploader.shutdown()
+
+
+def _cache_file(staging_path):
+    path = os.path.join(staging_path, "000", "dataset_1.dat")
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            f.write("x" * 100)
+    return path
+
+
+@contextmanager
+def _staging_path():
+    staging_path = tempfile.mkdtemp()
+    try:
+        yield staging_path
+    finally:
+        shutil.rmtree(staging_path)
+
+
+class MockPush(object):
+
+    def __init__(self, failures=0, error=None):
+        self.failures = failures
+        self.error = error
+        self.attempts = 0
+        self.pushed = []
+        self.condition = threading.Condition()
+
+    def __call__(self, rel_path, source_file):
+        with self.condition:
+            self.attempts += 1
+            if self.attempts <= self.failures:
+                if self.error:
+                    raise self.error
+                return False
+            self.pushed.append(rel_path)
+            self.condition.notify_all()
+            return True
+
+    def wait_for(self, count, timeout=10):
+        with self.condition:
+            if len(self.pushed) < count:
+                self.condition.wait(timeout)
+            return len(self.pushed) >= count
@@ -72,6 +72,12 @@ def test_galaxy_routes():
         type="dataset_collection"
     )
 
+    test_webapp.assert_maps(
+        "/api/histories/123/contents/changes",
+        controller="history_contents",
+        action="changes"
+    )
+
     assert_url_is(
         url_for("history_content", history_id="123", id="456"),
         "/api/histories/123/contents/456"
@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+from xml.etree import ElementTree
+
+import mock
+
+from galaxy.tools.data import (
+    ToolDataPathFiles,
+    ToolDataTable,
+)
+
+TABLE_XML = """<table name="all_fasta" comment_char="#">
+    <columns>value, dbkey, name, path</columns>
+    <file path="%s" />
+</table>"""
+
+URL_TABLE_XML = """<table name="all_fasta" comment_char="#">
+    <columns>value, dbkey, name, path</columns>
+    <file url="https://example.org/all_fasta.loc" />
+</table>"""
+
+LOC_CONTENT = """#value\tdbkey\tname\tpath
+hg19\thg19\tHuman hg19\t/data/hg19.fa
+mm10\tmm10\tMouse mm10\t/data/mm10.fa
+hg19_alt\thg19\tHuman hg19 alt\t/data/hg19_alt.fa
+"""
+
+
+class TestTabularToolDataTable(unittest.TestCase):
+
+    def setUp(self):
+        self.tool_data_path = tempfile.mkdtemp()
+        self.loc_path = os.path.join(self.tool_data_path, 'all_fasta.loc')
+        with open(self.loc_path, 'w') as fh:
+            fh.write(LOC_CONTENT)
+
+    def tearDown(self):
+        shutil.rmtree(self.tool_data_path)
+
+    def _table(self, lazy_load=False):
+        elem = ElementTree.fromstring(TABLE_XML % self.loc_path)
+        return ToolDataTable.from_elem(elem, self.tool_data_path, False, None, ToolDataPathFiles(self.tool_data_path), lazy_load=lazy_load)
+
+    def test_get_entries(self):
+        table = self._table()
+        assert table.get_entry('value', 'mm10', 'path') == '/data/mm10.fa'
+        assert table.get_entry('value', 'mm9', 'path') is None
+        assert table.get_entries('value', 'mm10', 'unknown', default=[]) == []
+        assert table.get_entries('dbkey', 'hg19', 'value') == ['hg19', 'hg19_alt']
+        assert table.get_entries('dbkey', 'hg19', 'value', limit=1) == ['hg19']
+        assert table.get_entries('dbkey', 'hg19', None)[1] == dict(value='hg19_alt', dbkey='hg19', name='Human hg19 alt', path='/data/hg19_alt.fa')
+        assert table.get_entries('dbkey', ['unhashable'], 'value') is None
+        assert table.get_field('mm10').get_base_path() == '/data/mm10.fa'
+        assert table.get_field('mm9') is None
+
+    def test_index_invalidated_on_changes(self):
+        table = self._table()
+        assert table.get_entry('value', 'dm6', 'path') is None
+        table.add_entry(dict(value='dm6', dbkey='dm6', name='Fly dm6', path='/data/dm6.fa'), persist=True)
+        assert table.get_entry('value', 'dm6', 'path') == '/data/dm6.fa'
+        table.remove_entry(['hg19', 'hg19', 'Human hg19', '/data/hg19.fa'])
+        assert table.get_entries('dbkey', 'hg19', 'value') == ['hg19_alt']
+        with open(self.loc_path, 'a') as fh:
+            fh.write('hg38\thg38\tHuman hg38\t/data/hg38.fa\n')
+        table.reload_from_files()
+        assert table.get_entry('value', 'hg38', 'path') == '/data/hg38.fa'
+        table.data.append(['ce11', 'ce11', 'Worm ce11', '/data/ce11.fa'])
+        assert table.get_entry('value', 'ce11', 'path') == '/data/ce11.fa'
+
+    def test_lazy_load(self):
+        table = self._table(lazy_load=True)
+        assert table.filenames[self.loc_path]['found']
+        with open(self.loc_path, 'a') as fh:
+            fh.write('hg38\thg38\tHuman hg38\t/data/hg38.fa\n')
+        # The file is only read when the table is first used
+        assert table.get_entry('value', 'hg38', 'path') == '/data/hg38.fa'
+        assert len(table.get_fields()) == 4
+        table.reload_from_files()
+        assert len(table.get_fields()) == 4
+
+    def test_lazy_load_keeps_files_that_cannot_be_read(self):
+        table = self._table(lazy_load=True)
+        with mock.patch.object(table, 'extend_data_with', side_effect=IOError("Stale file handle")):
+            assert table.get_fields() == []
+        # The file was not dropped and is read once it can be
+        assert len(table.get_fields()) == 3
+
+    def test_lazy_load_reads_urls_right_away(self):
+        elem = ElementTree.fromstring(URL_TABLE_XML)
+        with mock.patch('galaxy.tools.data.requests.get', return_value=mock.Mock(text=LOC_CONTENT)):
+            table = ToolDataTable.from_elem(elem, self.tool_data_path, False, None, ToolDataPathFiles(self.tool_data_path), lazy_load=True)
+        assert len(table.get_fields()) == 3
@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import mock
+
+from galaxy.tool_util.loader import load_tool_with_refereces
+from galaxy.tools.cache import (
+    cache_tool_document,
+    ToolDocumentCache,
+)
+from galaxy.util import xml_to_string
+from ..unittest_utils.sample_data import SIMPLE_MACRO, SIMPLE_TOOL_WITH_MACRO
+
+
+class TestToolDocumentCache(unittest.TestCase):
+
+    def setUp(self):
+        self.test_directory = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.test_directory, 'tool_cache')
+        self.tool_path = os.path.join(self.test_directory, 'tool_with_macro.xml')
+        self.macro_path = os.path.join(self.test_directory, 'external.xml')
+        with open(self.tool_path, 'w') as fh:
+            fh.write(SIMPLE_TOOL_WITH_MACRO)
+        self._write_macro("2.0")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_directory)
+
+    def _write_macro(self, tool_version):
+        with open(self.macro_path, 'w') as fh:
+            fh.write(SIMPLE_MACRO.substitute(tool_version=tool_version))
+
+    def _touch(self, path):
+        # Make sure the modification time changes on file systems with a coarse resolution
+        mtime = os.path.getmtime(path) + 2
+        os.utime(path, (time.time(), mtime))
+
+    def test_cache_tool_document(self):
+        cache = ToolDocumentCache(self.cache_dir)
+        assert not cache.has_tool_document(self.tool_path)
+        assert cache.get_tool_document(self.tool_path) is None
+        tree, macro_paths = cache.cache_tool_document(self.tool_path)
+        assert macro_paths == [self.macro_path]
+        assert cache.has_tool_document(self.tool_path)
+        cached_tree, cached_macro_paths = cache.get_tool_document(self.tool_path)
+        assert cached_macro_paths == [self.macro_path]
+        expected_tree, _ = load_tool_with_refereces(self.tool_path)
+        assert xml_to_string(cached_tree.getroot()) == xml_to_string(expected_tree.getroot())
+        assert cached_tree.getroot().get('version') == '2.0'
+        # Entries are shared with other cache instances using the same directory
+        assert ToolDocumentCache(self.cache_dir).has_tool_document(self.tool_path)
+
+    def test_invalidated_on_changes(self):
+        cache = ToolDocumentCache(self.cache_dir)
+        cache.cache_tool_document(self.tool_path)
+        self._write_macro("3.0")
+        self._touch(self.macro_path)
+        assert cache.get_tool_document(self.tool_path) is None
+        cache.cache_tool_document(self.tool_path)
+        assert cache.get_tool_document(self.tool_path)[0].getroot().get('version') == '3.0'
+        self._touch(self.tool_path)
+        assert not cache.has_tool_document(self.tool_path)
+        os.remove(self.macro_path)
+        assert not cache.has_tool_document(self.tool_path)
+
+    def test_cache_tool_document_function(self):
+        assert cache_tool_document(self.cache_dir, self.tool_path)
+        assert ToolDocumentCache(self.cache_dir).has_tool_document(self.tool_path)
+        broken_path = os.path.join(self.test_directory, 'broken.xml')
+        with open(broken_path, 'w') as fh:
+            fh.write('<tool id="broken"')
+        assert not cache_tool_document(self.cache_dir, broken_path)
+        assert os.listdir(self.cache_dir) == [os.path.basename(ToolDocumentCache(self.cache_dir)._cache_path(self.tool_path))]
+
+    def test_cache_write_failure(self):
+        cache = ToolDocumentCache(self.cache_dir)
+        with mock.patch("galaxy.tools.cache.tempfile.mkstemp", side_effect=OSError(28, "No space left on device")):
+            tree, macro_paths = cache.cache_tool_document(self.tool_path)
+            assert not cache_tool_document(self.cache_dir, self.tool_path)
+        assert tree.getroot().get('version') == '2.0'
+        assert macro_paths == [self.macro_path]
+        assert not cache.has_tool_document(self.tool_path)
@@ -0,0 +1,112 @@
+import shutil
+import tempfile
+import unittest
+
+from galaxy.tools.search import ToolBoxSearch
+from galaxy.util.bunch import Bunch
+
+SEARCH_KWDS = dict(
+    tool_name_boost=9.0,
+    tool_section_boost=3.0,
+    tool_description_boost=2.0,
+    tool_label_boost=1.0,
+    tool_stub_boost=5.0,
+    tool_help_boost=0.5,
+    tool_search_limit=20,
+    tool_enable_ngram_search=False,
+    tool_ngram_minsize=3,
+    tool_ngram_maxsize=4,
+)
+
+
+def mock_tool(tool_id, name, description=''):
+    return Bunch(
+        id=tool_id,
+        name=name,
+        description=description,
+        tool_type='default',
+        guid=None,
+        labels=[],
+        raw_help='Help of %s' % name,
+        is_latest_version=True,
+        get_panel_section=lambda: ('sid', 'Section'),
+    )
+
+
+class MockToolCache(object):
+
+    def __init__(self, tools):
+        self._tools_by_id = {tool.id: tool for tool in tools}
+        self._tool_paths_by_id = {tool.id: tool.id for tool in tools}
+        self._new_tool_ids = set(self._tools_by_id)
+        self._removed_tool_ids = set()
+
+    def get_tool_by_id(self, tool_id):
+        return self._tools_by_id.get(tool_id)
+
+    def add_tool(self, tool):
+        self._tools_by_id[tool.id] = self._tool_paths_by_id[tool.id] = tool
+        self._new_tool_ids.add(tool.id)
+
+    def remove_tool(self, tool_id):
+        del self._tools_by_id[tool_id]
+        del self._tool_paths_by_id[tool_id]
+        self._removed_tool_ids.add(tool_id)
+
+    def reset_status(self):
+        self._new_tool_ids = set()
+        self._removed_tool_ids = set()
+
+
+class TestToolBoxSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        self.tool_cache = MockToolCache([mock_tool('bowtie2', 'Bowtie2', 'map reads'), mock_tool('cat1', 'Concatenate', 'datasets')])
+
+    def tearDown(self):
+        shutil.rmtree(self.index_dir)
+
+    def _search(self, toolbox_search, q):
+        return toolbox_search.search(q, **SEARCH_KWDS)
+
+    def _build_index(self, toolbox_search):
+        toolbox_search.build_index(self.tool_cache)
+        self.tool_cache.reset_status()
+
+    def test_in_memory_index(self):
+        toolbox_search = ToolBoxSearch(None)
+        self._build_index(toolbox_search)
+        assert self._search(toolbox_search, 'bowtie') == ['bowtie2']
+        self.tool_cache.remove_tool('bowtie2')
+        self._build_index(toolbox_search)
+        assert self._search(toolbox_search, 'bowtie') == []
+
+    def test_index_shared_between_processes(self):
+        toolbox_search = ToolBoxSearch(None, index_dir=self.index_dir)
+        self._build_index(toolbox_search)
+        generation = toolbox_search.index.latest_generation()
+        assert self._search(toolbox_search, 'concat') == ['cat1']
+        # Building the index of an unchanged toolbox in another process reuses the index
+        self.tool_cache = MockToolCache(self.tool_cache._tools_by_id.values())
+        other_toolbox_search = ToolBoxSearch(None, index_dir=self.index_dir)
+        self._build_index(other_toolbox_search)
+        assert other_toolbox_search.index.latest_generation() == generation
+        assert self._search(other_toolbox_search, 'bowtie') == ['bowtie2']
+
+    def test_incremental_updates(self):
+        toolbox_search = ToolBoxSearch(None, index_dir=self.index_dir)
+        self._build_index(toolbox_search)
+        self.tool_cache.add_tool(mock_tool('sort1', 'Sort', 'data'))
+        self.tool_cache.add_tool(mock_tool('cat1', 'Concatenate', 'datasets tail-to-head'))
+        self.tool_cache.remove_tool('bowtie2')
+        self._build_index(toolbox_search)
+        assert self._search(toolbox_search, 'sort') == ['sort1']
+        assert self._search(toolbox_search, 'tail') == ['cat1']
+        assert self._search(toolbox_search, 'bowtie') == []
+        # Tools removed while no Galaxy process was running are removed on startup
+        self.tool_cache = MockToolCache([tool for tool in self.tool_cache._tools_by_id.values() if tool.id != 'sort1'])
+        toolbox_search = ToolBoxSearch(None, index_dir=self.index_dir)
+        self._build_index(toolbox_search)
+        assert self._search(toolbox_search, 'sort') == []
+        assert self._search(toolbox_search, 'concat') == ['cat1']
@@ -14,7 +14,10 @@ from galaxy.config_watchers import ConfigWatchers
 from galaxy.model import tool_shed_install
 from galaxy.model.tool_shed_install import mapping
 from galaxy.tools import ToolBox
-from galaxy.tools.cache import ToolCache
+from galaxy.tools.cache import (
+    ToolCache,
+    ToolDocumentCache,
+)
 from .test_toolbox_filters import mock_trans
 from ..tools_support import UsesApp, UsesTools
 from ..unittest_utils.sample_data import SIMPLE_MACRO, SIMPLE_TOOL_WITH_MACRO
@@ -189,6 +192,31 @@ class ToolBoxTestCase(BaseToolBoxTestCase):
         assert tool is not None
         assert len(tool._macro_paths) == 1
 
+    def test_load_from_tool_document_cache(self):
+        self._init_tool()
+        self._init_tool(filename="tool_with_macro.xml",
+                        tool_contents=SIMPLE_TOOL_WITH_MACRO,
+                        extra_file_contents=SIMPLE_MACRO.substitute(tool_version="2.0"),
+                        extra_file_path="external.xml")
+        self._add_config("""<toolbox><section id="sid" name="Section"><tool file="tool_with_macro.xml"/></section><tool file="tool.xml" /></toolbox>""")
+        self.app.tool_document_cache = ToolDocumentCache(os.path.join(self.test_directory, "tool_cache"))
+        self.app.config.tool_parse_processes = 2
+        toolbox = self.toolbox
+        for path in (self._tool_path(), self._tool_path("tool_with_macro.xml")):
+            assert self.app.tool_document_cache.has_tool_document(path)
+        tool = toolbox.get_tool("tool_with_macro")
+        assert tool.version == "2.0"
+        assert len(tool._macro_paths) == 1
+        assert toolbox.get_tool("test_tool") is not None
+
+    def test_load_tool_location_from_tool_document_cache(self):
+        self._init_tool()
+        self._add_config("""<toolbox></toolbox>""")
+        self.app.tool_document_cache = ToolDocumentCache(os.path.join(self.test_directory, "tool_cache"))
+        tool = self.toolbox.load_tool("file://%s" % self._tool_path())
+        assert tool.id == "test_tool"
+        assert self.app.tool_document_cache.has_tool_document(self._tool_path())
+
     def test_tool_reload_when_macro_is_altered(self):
         self._init_tool(filename="tool_with_macro.xml",
                         tool_contents=SIMPLE_TOOL_WITH_MACRO,
@@ -150,6 +150,7 @@ class MockAppConfig(Bunch):
         self.auth_config_file = "config/auth_conf.xml.sample"
         self.error_email_to = "admin@email.to"
         self.password_expiration_period = 0
+        self.history_import_copy_threads = 1
 
         self.umask = 0o77
 
@@ -0,0 +1,99 @@
+import time
+import unittest
+
+from galaxy import model
+from galaxy.workflow.run import InvocationWaits
+from galaxy.workflow.scheduling_manager import WorkflowRequestMonitor
+from .workflow_support import TestApp
+
+
+class WorkflowRequestMonitorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = TestApp()
+        self.app.config.workflow_scheduling_sweep_interval = 60
+        self.app.config.workflow_scheduling_workers = 1
+        self.monitor = WorkflowRequestMonitor(self.app, None)
+        self.sa_session = self.app.model.context
+
+    def _job(self, state):
+        job = model.Job()
+        job.state = state
+        self.sa_session.add(job)
+        self.sa_session.flush()
+        return job
+
+    def _dataset(self, state):
+        dataset = model.Dataset(state=state)
+        self.sa_session.add(dataset)
+        self.sa_session.flush()
+        return dataset
+
+    def _waits(self, jobs=(), datasets=()):
+        waits = InvocationWaits()
+        waits.job_ids.update(job.id for job in jobs)
+        waits.dataset_ids.update(dataset.id for dataset in datasets)
+        return waits
+
+    def test_wake_times(self):
+        running_job = self._job(model.Job.states.RUNNING)
+        finished_job = self._job(model.Job.states.OK)
+        queued_dataset = self._dataset(model.Dataset.states.QUEUED)
+        unknown_waits = InvocationWaits()
+        unknown_waits.unknown = True
+        waits_by_invocation_id = {
+            1: self._waits(jobs=[running_job], datasets=[queued_dataset]),
+            2: self._waits(jobs=[running_job, finished_job]),
+            3: unknown_waits,
+        }
+        # Invocation 4 has not been scheduled by this process yet
+        wake_times = self.monitor._wake_times([1, 2, 3, 4], waits_by_invocation_id)
+        assert sorted(wake_times) == [2, 3, 4]
+        assert abs(wake_times[2] - time.time()) < 60
+        assert wake_times[3] is None and wake_times[4] is None
+
+        queued_dataset.state = model.Dataset.states.OK
+        self.sa_session.flush()
+        assert sorted(self.monitor._wake_times([1], waits_by_invocation_id)) == [1]
+
+    def test_sweep(self):
+        running_job = self._job(model.Job.states.RUNNING)
+        waits = self._waits(jobs=[running_job])
+        assert self.monitor._wake_times([1], {1: waits}) == {}
+        waits.time -= 60
+        assert self.monitor._wake_times([1], {1: waits}) == {1: None}
+
+
+class ParallelWorkflowRequestMonitorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = TestApp()
+        self.app.config.workflow_scheduling_sweep_interval = 60
+        self.app.config.workflow_scheduling_workers = 3
+        self.monitor = WorkflowRequestMonitor(self.app, None)
+
+    def _batches(self, invocations):
+        wake_times = {invocation[0]: None for invocation in invocations}
+        return self.monitor._scheduling_batches(invocations, wake_times)
+
+    def test_users_take_turns(self):
+        # (invocation id, history id, user id) - user 1 has many busy histories
+        invocations = [(1, 10, 1), (2, 11, 1), (3, 12, 1), (4, 10, 1), (5, 20, 2), (6, 30, 3)]
+        batches = self._batches(invocations)
+        assert batches == [(10, [(1, None), (4, None)]), (20, [(5, None)]), (30, [(6, None)])]
+        # No free workers until histories are done
+        assert self._batches(invocations) == []
+        self.monitor._in_flight_histories.clear()
+        # Users 2 and 3 were served after user 1 and go last now
+        batches = self._batches([(2, 11, 1), (3, 12, 1), (5, 20, 2), (6, 30, 3)])
+        assert [history_id for history_id, _ in batches] == [11, 20, 30]
+
+    def test_in_flight_histories_skipped(self):
+        self.monitor._in_flight_histories.add(10)
+        batches = self._batches([(1, 10, 1), (2, 11, 1), (3, 12, 1), (4, 13, 1)])
+        assert [history_id for history_id, _ in batches] == [11, 12]
+        assert self.monitor._in_flight_histories == {10, 11, 12}
+
+    def test_sleeping_invocations_skipped(self):
+        batches = self.monitor._scheduling_batches([(1, 10, 1), (2, 20, 2)], {2: None})
+        assert batches == [(20, [(2, None)])]
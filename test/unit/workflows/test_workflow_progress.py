@@ -1,6 +1,7 @@
 import unittest
 
 from galaxy import model
+from galaxy.workflow import modules
 from galaxy.workflow.run import WorkflowProgress
 from .workflow_support import TestApp, yaml_to_model
 
@@ -170,6 +171,36 @@ class WorkflowProgressTestCase(unittest.TestCase):
         replacement = progress.replacement_for_input(self._step(4), step_dict)
         assert replacement is hda3
 
+    def test_delays_record_what_steps_wait_on(self):
+        self._setup_workflow(TEST_WORKFLOW_YAML)
+        hda3 = model.HistoryDatasetAssociation()
+        hda3.dataset = model.Dataset(id=7, state=model.Dataset.states.RUNNING)
+        hda3.dataset_id = 7
+        self._set_previous_progress([
+            (100, {"output": model.HistoryDatasetAssociation()}),
+            (101, {"output": model.HistoryDatasetAssociation()}),
+            (102, {"out_file1": hda3}),
+            (103, UNSCHEDULED_STEP),
+            (104, UNSCHEDULED_STEP),
+        ])
+        progress = self._new_workflow_progress()
+        progress.remaining_steps()
+        connection = self._step(4).input_connections[0]
+        try:
+            progress.replacement_for_connection(connection, is_data=False)
+        except modules.DelayedWorkflowEvaluation as de:
+            progress.mark_step_outputs_delayed(self._step(4), delayed=de)
+        else:
+            raise AssertionError("Expected a delayed evaluation")
+        assert progress.waits.dataset_ids == {7}
+        assert progress.waits.waiting
+        # Steps consuming outputs of delayed steps wait on what these wait on
+        progress.mark_step_outputs_delayed(self._step(3), delayed=modules.DelayedWorkflowEvaluation(awaits_step=True))
+        assert progress.waits.waiting
+        # Steps delayed for reasons not known to the scheduler
+        progress.mark_step_outputs_delayed(self._step(3), why="executing pause step")
+        assert not progress.waits.waiting
+
     # TODO: Replace multiple true HDA with HDCA
     # TODO: Test explicit delay
     # TODO: Test cancel on collection invalid